@@ -0,0 +1,289 @@
+"""
+Adaptive practice
+
+Random practice exams can be weighted towards what the user does not know
+yet. Every submitted test updates the user's row per question in
+user_question_mastery, and the adaptive generator draws questions with
+probability proportional to
+
+    weight = WEIGHT_FLOOR + error_rate * recency
+
+    error_rate = (attempts - correct + 1) / (attempts + 2)    (0.5 when never seen)
+    recency    = 1 - exp(-days_since_seen / ADAPTIVE_RECENCY_DAYS)  (1 when never seen)
+
+Weights of a (user, section name) pool are kept in a Fenwick tree, so
+drawing k questions without replacement costs O(k log n) and a submission
+updates the cached pool with O(log n) point updates. Samplers live in a
+bounded per-process LRU and are rebuilt after ADAPTIVE_SAMPLER_TTL seconds,
+which also picks up new questions and the passing of time.
+"""
+
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app
+from nihongo.models import db
+from nihongo.models.user_question_mastery import UserQuestionMastery
+from nihongo.models.utils import upsert_insert
+from nihongo.catalogue import get_section_pool
+from nihongo.metrics import CACHE_LOOKUPS
+
+WEIGHT_FLOOR = 0.05  # Mastered questions still come up now and then
+
+
+class FenwickTree:
+    """Binary indexed tree over non-negative weights with prefix-sum search"""
+
+    def __init__(self, weights):
+        self.size = len(weights)
+        self.weights = list(weights)
+        self._tree = [0.0] * (self.size + 1)
+        for i, weight in enumerate(self.weights, start=1):
+            self._tree[i] += weight
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self._tree[parent] += self._tree[i]
+        self._top_bit = 1 << (self.size.bit_length() - 1) if self.size else 0
+
+    def set(self, index, weight):
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        i = index + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def total(self):
+        total = 0.0
+        i = self.size
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, value):
+        """Index of the weight containing the cumulative position value (0 <= value < total)"""
+        position = 0
+        step = self._top_bit
+        while step:
+            candidate = position + step
+            if candidate <= self.size and self._tree[candidate] <= value:
+                position = candidate
+                value -= self._tree[candidate]
+            step >>= 1
+        return min(position, self.size - 1)
+
+
+def mastery_weight(attempts, correct_count, last_seen_at, now, recency_days):
+    """Sampling weight of a question for a user (see module docstring)"""
+    if not attempts:
+        return WEIGHT_FLOOR + 0.5
+    error_rate = (attempts - correct_count + 1) / (attempts + 2)
+    days_since_seen = max((now - last_seen_at).total_seconds(), 0) / 86400
+    recency = 1 - math.exp(-days_since_seen / recency_days)
+    return WEIGHT_FLOOR + error_rate * recency
+
+
+class AdaptiveSampler:
+    """Weighted sampler over one user's pool of questions"""
+
+    def __init__(self, question_ids, weights):
+        self.question_ids = list(question_ids)
+        self._index = {question_id: i for i, question_id in enumerate(self.question_ids)}
+        self._tree = FenwickTree(weights)
+        self._lock = threading.Lock()
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def weight(self, question_id):
+        return self._tree.weights[self._index[question_id]]
+
+    def update(self, question_id, weight):
+        index = self._index.get(question_id)
+        if index is not None:
+            with self._lock:
+                self._tree.set(index, weight)
+
+    def sample(self, k, rng=random):
+        """
+        Draw up to k distinct questions, each draw proportional to the remaining weights.
+
+        Args:
+            k: Number of questions
+            rng: Random source (random module or random.Random)
+
+        Returns:
+            list: Question ids
+        """
+        with self._lock:
+            drawn = []
+            removed = []
+            try:
+                for _ in range(min(k, len(self.question_ids))):
+                    total = self._tree.total()
+                    if total <= 0:
+                        break
+                    index = self._tree.find(rng.random() * total)
+                    if self._tree.weights[index] <= 0:
+                        # Rounding at the end of the range: take the last remaining item
+                        index = max(i for i, weight in enumerate(self._tree.weights) if weight > 0)
+                    drawn.append(self.question_ids[index])
+                    removed.append((index, self._tree.weights[index]))
+                    self._tree.set(index, 0.0)
+            finally:
+                for index, weight in removed:
+                    self._tree.set(index, weight)
+            return drawn
+
+
+class SamplerCache:
+    """Bounded in-process LRU of AdaptiveSampler objects with a time to live"""
+
+    def __init__(self, max_size=1024, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._samplers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            sampler = self._samplers.get(key)
+            if sampler is None:
+                return None
+            if time.monotonic() - sampler.built_at > self.ttl:
+                del self._samplers[key]
+                return None
+            self._samplers.move_to_end(key)
+            return sampler
+
+    def put(self, key, sampler):
+        with self._lock:
+            self._samplers[key] = sampler
+            self._samplers.move_to_end(key)
+            while len(self._samplers) > self.max_size:
+                self._samplers.popitem(last=False)
+
+    def for_user(self, user_id):
+        with self._lock:
+            return [sampler for (owner, _), sampler in self._samplers.items() if owner == user_id]
+
+    def __len__(self):
+        return len(self._samplers)
+
+
+def init_sampler_cache(app):
+    """Create the per-process adaptive sampler cache"""
+    cache = SamplerCache(
+        app.config.get('ADAPTIVE_SAMPLER_CACHE_SIZE', 1024),
+        app.config.get('ADAPTIVE_SAMPLER_TTL', 600)
+    )
+    app.extensions['adaptive_samplers'] = cache
+    return cache
+
+
+def build_sampler(user_id, question_ids, now=None):
+    """Build a sampler over question_ids from the user's mastery rows"""
+    now = now or datetime.utcnow()
+    recency_days = current_app.config['ADAPTIVE_RECENCY_DAYS']
+    mastery = {}
+    if question_ids:
+        mastery = {
+            row.question_id: row
+            for row in UserQuestionMastery.query.filter(
+                UserQuestionMastery.user_id == user_id,
+                UserQuestionMastery.question_id.in_(question_ids)
+            )
+        }
+    weights = []
+    for question_id in question_ids:
+        row = mastery.get(question_id)
+        if row is None:
+            weights.append(mastery_weight(0, 0, None, now, recency_days))
+        else:
+            weights.append(mastery_weight(row.attempts, row.correct_count, row.last_seen_at, now, recency_days))
+    return AdaptiveSampler(question_ids, weights)
+
+
+def get_sampler(user_id, section_name):
+    """Cached sampler of a user's pool for a section name, built on a miss"""
+    cache = current_app.extensions['adaptive_samplers']
+    key = (user_id, section_name)
+    sampler = cache.get(key)
+    CACHE_LOOKUPS.inc(cache='adaptive_sampler', result='miss' if sampler is None else 'hit')
+    if sampler is None:
+        sampler = build_sampler(user_id, get_section_pool(section_name))
+        cache.put(key, sampler)
+    return sampler
+
+
+def select_adaptive_questions(user_id, section_name, k, rng=random):
+    """
+    Pick k questions of a section name for a user, weighted towards their weak points.
+
+    Returns:
+        list: Question ids (fewer than k if the pool is smaller)
+    """
+    return get_sampler(user_id, section_name).sample(k, rng)
+
+
+def record_mastery(user_id, question_ids, answer_dict, answer_key, seen_at):
+    """
+    Update a user's mastery rows from a completed test. The caller commits.
+
+    One INSERT ... ON CONFLICT DO UPDATE for the whole test, so two tests of
+    the same user submitted at once do not race to insert the same rows.
+    Cached samplers of the user are updated in place.
+
+    Args:
+        user_id: ID of the user
+        question_ids: Question ids of the test's exam
+        answer_dict: {question_id: selected_answer}
+        answer_key: {question_id: correct_answer}
+        seen_at: Completion time of the test
+    """
+    outcomes = {
+        question_id: answer_dict.get(question_id) == answer_key[question_id]
+        for question_id in dict.fromkeys(question_ids)
+        if question_id in answer_key
+    }
+    if not outcomes:
+        return
+
+    table = UserQuestionMastery.__table__
+    insert = upsert_insert(table)
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['user_id', 'question_id'],
+        set_={
+            'attempts': table.c.attempts + 1,
+            'correct_count': table.c.correct_count + insert.excluded.correct_count,
+            'last_correct': insert.excluded.last_correct,
+            'last_seen_at': insert.excluded.last_seen_at,
+        },
+    ), [
+        # Sorted, so concurrent submits lock the rows in the same order
+        {'user_id': user_id, 'question_id': question_id, 'attempts': 1, 'correct_count': int(outcomes[question_id]),
+         'last_correct': outcomes[question_id], 'last_seen_at': seen_at}
+        for question_id in sorted(outcomes)
+    ])
+
+    # Refresh the weights of this user's cached pools
+    samplers = current_app.extensions['adaptive_samplers'].for_user(user_id)
+    if samplers:
+        recency_days = current_app.config['ADAPTIVE_RECENCY_DAYS']
+        rows = UserQuestionMastery.query.filter(
+            UserQuestionMastery.user_id == user_id,
+            UserQuestionMastery.question_id.in_(list(outcomes))
+        ).with_entities(
+            UserQuestionMastery.question_id, UserQuestionMastery.attempts,
+            UserQuestionMastery.correct_count, UserQuestionMastery.last_seen_at
+        ).all()
+        now = datetime.utcnow()
+        for question_id, attempts, correct_count, last_seen_at in rows:
+            weight = mastery_weight(attempts, correct_count, last_seen_at, now, recency_days)
+            for sampler in samplers:
+                sampler.update(question_id, weight)
@@ -1,7 +1,7 @@
 from flask_admin import Admin, BaseView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_login import current_user
-from flask import redirect, url_for, request, flash
+from flask import redirect, url_for, request, flash, current_app, abort, Response
 from wtforms import TextAreaField
 from wtforms.widgets import TextArea
 from markupsafe import Markup
@@ -192,6 +192,15 @@ class TestAdmin(SecureModelView):
     can_edit = False
 
 
+class JobAdmin(SecureModelView):
+    """Background jobs of all users (see jobs.py), read-only"""
+    column_list = ['id', 'kind', 'status', 'progress', 'attempts', 'created_by', 'created_at', 'finished_at', 'worker', 'error']
+    column_filters = ['kind', 'status', 'created_by', 'created_at']
+    column_default_sort = ('id', True)
+    can_create = False
+    can_edit = False
+
+
 class ImportExamView(BaseView):
     """Custom admin view for importing exams from JSON"""
     
@@ -228,15 +237,16 @@ class ImportExamView(BaseView):
                 json_content = file.read().decode('utf-8')
                 json_data = json.loads(json_content)
                 
-                # Import the exam
-                from nihongo.import_exam import import_exam_from_json
-                success, message, exam = import_exam_from_json(json_data, current_user.id)
+                # Check the structure now, import in the background
+                from nihongo.import_exam import validate_exam_json
+                from nihongo.jobs import enqueue_job
+                valid, errors = validate_exam_json(json_data)
                 
-                if success:
-                    flash(message, 'success')
-                    return redirect(url_for('exam.index_view'))
+                if valid:
+                    job = enqueue_job('import_exam', {'exam': json_data}, user_id=current_user.id)
+                    return redirect(url_for('mycontent.job', id=job.id))
                 else:
-                    flash(message, 'danger')
+                    flash('; '.join(errors[:5]), 'danger')
                     
             except json.JSONDecodeError as e:
                 flash(f'Invalid JSON format: {str(e)}', 'danger')
@@ -247,6 +257,71 @@ class ImportExamView(BaseView):
         return self.render('admin/import_exam.html')
 
 
+class SecureBaseView(BaseView):
+    """Base class for custom (non-model) admin views with admin access"""
+    
+    def is_accessible(self):
+        return current_user.is_authenticated and current_user.is_admin
+    
+    def inaccessible_callback(self, name, **kwargs):
+        if not current_user.is_authenticated:
+            return redirect(url_for('login', next=request.url))
+        else:
+            flash('You do not have permission to access the admin panel.', 'danger')
+            return redirect(url_for('index'))
+
+
+class AnalyticsView(SecureBaseView):
+    """Pass rates per exam, section and day, read from the daily rollups"""
+    
+    @expose('/')
+    def index(self):
+        from datetime import datetime, timedelta
+        from nihongo.rollups import exam_summary, section_summary, daily_trend
+        
+        days = request.args.get('days', 30, type=int)
+        days = max(1, min(days, 3650))
+        end_day = datetime.utcnow().date()
+        start_day = end_day - timedelta(days=days - 1)
+        
+        return self.render('admin/analytics.html',
+                           days=days,
+                           start_day=start_day,
+                           end_day=end_day,
+                           exams=exam_summary(start_day, end_day),
+                           sections=section_summary(start_day, end_day),
+                           trend=daily_trend(start_day, end_day))
+
+
+class ProfilesView(SecureBaseView):
+    """Recent request profiles taken with ?_profile=1 (see profiling.py)"""
+    
+    def _load(self, profile_id):
+        profile = current_app.extensions['profiles'].load(profile_id)
+        if profile is None:
+            abort(404)
+        return profile
+    
+    @expose('/')
+    def index(self):
+        return self.render('admin/profiles.html', profiles=current_app.extensions['profiles'].recent())
+    
+    @expose('/<profile_id>')
+    def detail(self, profile_id):
+        from nihongo.profiling import top_frames
+        
+        profile = self._load(profile_id)
+        return self.render('admin/profile.html', profile=profile, frames=top_frames(profile))
+    
+    @expose('/<profile_id>/folded')
+    def folded(self, profile_id):
+        from nihongo.profiling import folded
+        
+        return Response(folded(self._load(profile_id)), mimetype='text/plain', headers={
+            'Content-Disposition': f'attachment; filename=profile-{profile_id}.folded'
+        })
+
+
 class UserImportExamView(BaseView):
     """Import exams view for regular users"""
     
@@ -512,6 +587,7 @@ def init_admin(app, db):
     from nihongo.models.exam_section import ExamSection
     from nihongo.models.test import Test
     from nihongo.models.test_answer import TestAnswer
+    from nihongo.models.job import Job
     
     # Main admin interface (admin users only)
     admin = Admin(app, name='JLPT Admin', template_mode='bootstrap4', endpoint='admin', url='/admin')
@@ -525,9 +601,16 @@ def init_admin(app, db):
     admin.add_view(ExamSectionAdmin(ExamSection, db.session, name='Exam Sections', endpoint='admin_exam_sections'))
     admin.add_view(TestAdmin(Test, db.session, name='Tests', endpoint='admin_tests'))
     admin.add_view(SecureModelView(TestAnswer, db.session, name='Test Answers', endpoint='admin_test_answers'))
+    admin.add_view(JobAdmin(Job, db.session, name='Jobs', endpoint='admin_jobs'))
     
     # Add custom import view (admin only)
     admin.add_view(ImportExamView(name='Import Exam', endpoint='import_exam'))
     
+    # Analytics dashboard over the daily rollups (admin only)
+    admin.add_view(AnalyticsView(name='Analytics', endpoint='analytics'))
+    
+    # Request profiles taken on demand (admin only)
+    admin.add_view(ProfilesView(name='Profiles', endpoint='profiles'))
+    
     return admin
 
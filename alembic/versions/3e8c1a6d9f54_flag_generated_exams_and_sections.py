@@ -0,0 +1,51 @@
+"""Flag generated exams and sections
+
+Revision ID: 3e8c1a6d9f54
+Revises: 7b2e9d4f6a31
+Create Date: 2026-10-19 21:18:44.907215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8c1a6d9f54'
+down_revision: Union[str, Sequence[str], None] = '7b2e9d4f6a31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+GENERATED_EXAM_NAMES = "(exams.name LIKE 'Random Practice Exam - %' OR exams.name LIKE 'Adaptive Practice Exam - %' " \
+                       "OR exams.name LIKE 'Review Session - %')"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('exams', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_generated', sa.Boolean(), server_default=sa.false(), nullable=False))
+    with op.batch_alter_table('sections', schema=None) as batch_op:
+        batch_op.alter_column('is_review', new_column_name='is_generated',
+                              existing_type=sa.Boolean(), existing_nullable=False, existing_server_default=sa.false())
+
+    # Random, adaptive and review exams already created, and their sections
+    op.execute(f'UPDATE exams SET is_generated = true WHERE {GENERATED_EXAM_NAMES}')
+    op.execute(
+        'UPDATE sections SET is_generated = true WHERE id IN ('
+        'SELECT exam_sections.section_id FROM exam_sections '
+        'JOIN exams ON exams.id = exam_sections.exam_id '
+        'WHERE exams.is_generated = true)'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        "UPDATE sections SET is_generated = false WHERE name != 'Review'"
+    )
+    with op.batch_alter_table('sections', schema=None) as batch_op:
+        batch_op.alter_column('is_generated', new_column_name='is_review',
+                              existing_type=sa.Boolean(), existing_nullable=False, existing_server_default=sa.false())
+    with op.batch_alter_table('exams', schema=None) as batch_op:
+        batch_op.drop_column('is_generated')
@@ -0,0 +1,38 @@
+"""Add store_entries table for server-side sessions
+
+Revision ID: 48be407cc01d
+Revises: b6d35ad241cc
+Create Date: 2026-10-18 10:12:41.305117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '48be407cc01d'
+down_revision: Union[str, Sequence[str], None] = 'b6d35ad241cc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('store_entries',
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('value', sa.LargeBinary(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('store_entries', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_store_entries_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('store_entries', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_store_entries_expires_at'))
+
+    op.drop_table('store_entries')
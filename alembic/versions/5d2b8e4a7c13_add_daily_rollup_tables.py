@@ -0,0 +1,46 @@
+"""Add daily analytics rollup tables
+
+Revision ID: 5d2b8e4a7c13
+Revises: e7a3d5c91f20
+Create Date: 2026-10-18 13:27:04.518392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2b8e4a7c13'
+down_revision: Union[str, Sequence[str], None] = 'e7a3d5c91f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('exam_daily_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('exam_id', sa.Integer(), nullable=False),
+    sa.Column('tests_completed', sa.Integer(), nullable=False),
+    sa.Column('tests_passed', sa.Integer(), nullable=False),
+    sa.Column('score_sum', sa.Float(), nullable=False),
+    sa.Column('questions_total', sa.Integer(), nullable=False),
+    sa.Column('correct_total', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['exam_id'], ['exams.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('day', 'exam_id')
+    )
+    op.create_table('section_daily_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('section_name', sa.String(length=200), nullable=False),
+    sa.Column('questions_total', sa.Integer(), nullable=False),
+    sa.Column('correct_total', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'section_name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('section_daily_rollups')
+    op.drop_table('exam_daily_rollups')
@@ -0,0 +1,38 @@
+"""Add is_review flag to sections
+
+Revision ID: 7b2e9d4f6a31
+Revises: a5c93e71d2b8
+Create Date: 2026-10-19 16:42:08.215307
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2e9d4f6a31'
+down_revision: Union[str, Sequence[str], None] = 'a5c93e71d2b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('sections', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_review', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    # Sections already created by review sessions
+    op.execute(
+        "UPDATE sections SET is_review = true WHERE name = 'Review' AND id IN ("
+        "SELECT exam_sections.section_id FROM exam_sections "
+        "JOIN exams ON exams.id = exam_sections.exam_id "
+        "WHERE exams.name LIKE 'Review Session - %')"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('sections', schema=None) as batch_op:
+        batch_op.drop_column('is_review')
@@ -0,0 +1,32 @@
+"""Add stored score columns to tests
+
+Revision ID: 9f61c0b3e8a4
+Revises: 5d2b8e4a7c13
+Create Date: 2026-10-18 14:05:39.664120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f61c0b3e8a4'
+down_revision: Union[str, Sequence[str], None] = '5d2b8e4a7c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('tests', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('correct_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('total_questions', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('tests', schema=None) as batch_op:
+        batch_op.drop_column('total_questions')
+        batch_op.drop_column('correct_count')
@@ -0,0 +1,35 @@
+"""Unique test_answers per test and question
+
+Revision ID: a5c93e71d2b8
+Revises: f3a8c2d17e45
+Create Date: 2026-10-19 00:12:47.604128
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5c93e71d2b8'
+down_revision: Union[str, Sequence[str], None] = 'f3a8c2d17e45'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Concurrent autosaves could insert the same answer twice; keep the latest row
+    op.execute(sa.text(
+        'DELETE FROM test_answers WHERE id NOT IN '
+        '(SELECT MAX(id) FROM test_answers GROUP BY test_id, question_id)'
+    ))
+    with op.batch_alter_table('test_answers', schema=None) as batch_op:
+        batch_op.create_index('uq_test_answers_test_question', ['test_id', 'question_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('test_answers', schema=None) as batch_op:
+        batch_op.drop_index('uq_test_answers_test_question')
@@ -0,0 +1,30 @@
+"""Add answers_packed column to tests
+
+Revision ID: c4e1f0a9b2d7
+Revises: 48be407cc01d
+Create Date: 2026-10-18 11:03:17.842290
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e1f0a9b2d7'
+down_revision: Union[str, Sequence[str], None] = '48be407cc01d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('tests', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('answers_packed', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('tests', schema=None) as batch_op:
+        batch_op.drop_column('answers_packed')
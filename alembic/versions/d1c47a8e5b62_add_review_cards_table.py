@@ -0,0 +1,45 @@
+"""Add review_cards table
+
+Revision ID: d1c47a8e5b62
+Revises: b83e2f6d1a95
+Create Date: 2026-10-18 15:22:47.117203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1c47a8e5b62'
+down_revision: Union[str, Sequence[str], None] = 'b83e2f6d1a95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('review_cards',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('question_id', sa.Integer(), nullable=False),
+    sa.Column('ease', sa.Float(), nullable=False),
+    sa.Column('interval_days', sa.Float(), nullable=False),
+    sa.Column('repetitions', sa.Integer(), nullable=False),
+    sa.Column('lapses', sa.Integer(), nullable=False),
+    sa.Column('due_at', sa.DateTime(), nullable=False),
+    sa.Column('last_reviewed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['question_id'], ['questions.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'question_id')
+    )
+    with op.batch_alter_table('review_cards', schema=None) as batch_op:
+        batch_op.create_index('ix_review_cards_user_due', ['user_id', 'due_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('review_cards', schema=None) as batch_op:
+        batch_op.drop_index('ix_review_cards_user_due')
+
+    op.drop_table('review_cards')
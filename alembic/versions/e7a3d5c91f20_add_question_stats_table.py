@@ -0,0 +1,42 @@
+"""Add question_stats table
+
+Revision ID: e7a3d5c91f20
+Revises: c4e1f0a9b2d7
+Create Date: 2026-10-18 12:41:55.203817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3d5c91f20'
+down_revision: Union[str, Sequence[str], None] = 'c4e1f0a9b2d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('question_stats',
+    sa.Column('question_id', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('correct_count', sa.Integer(), nullable=False),
+    sa.Column('picks_1', sa.Integer(), nullable=False),
+    sa.Column('picks_2', sa.Integer(), nullable=False),
+    sa.Column('picks_3', sa.Integer(), nullable=False),
+    sa.Column('picks_4', sa.Integer(), nullable=False),
+    sa.Column('score_sum', sa.Float(), nullable=False),
+    sa.Column('score_sq_sum', sa.Float(), nullable=False),
+    sa.Column('correct_score_sum', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['question_id'], ['questions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('question_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('question_stats')
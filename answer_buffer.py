@@ -0,0 +1,394 @@
+"""
+Write-behind answer buffer
+
+With ANSWER_BUFFER_ENABLED an autosave is acknowledged once the answer is
+appended to a local log (fsynced with ANSWER_BUFFER_FSYNC) instead of after
+a database write. A flusher thread writes the buffered answers every
+ANSWER_BUFFER_FLUSH_INTERVAL seconds as one bulk upsert, keeping only the
+latest answer per question, so a student who changes an answer five times
+between flushes costs one row write.
+
+Each process appends to its own segment files in ANSWER_BUFFER_DIR. A flush
+seals the current segment, starts a new one, and deletes the sealed segments
+once their answers are committed, so an acknowledged answer is always in a
+segment file or in test_answers. While flushes fail (the database is down),
+the next ones retry without sealing another segment, so an outage does not
+leave a file per flush interval behind:
+- A process that starts replays the segments of processes that died (a
+  live process holds an flock on its segments).
+- Submitting a test, and rebuilding a test's state after a cache miss, first
+  write that test's answers from every segment in the directory, so answers
+  autosaved by another worker of the same host are not missed.
+
+The upsert keeps the newer answer (answered_at), so flushes of several
+workers may land in any order. Answers of tests that were completed or
+deleted in the meantime are dropped.
+
+Usage:
+    buffer = current_app.extensions['answer_buffer']  # None when disabled
+    buffer.append(test_id, user_id, question_id, selected_answer, datetime.utcnow())
+"""
+
+import atexit
+import logging
+import os
+import re
+import secrets
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.models.utils import upsert_insert
+from nihongo.metrics import ANSWER_ROWS_WRITTEN
+from nihongo.structured_log import get_logger, log_event
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process, so every segment found at start is from an earlier run
+    fcntl = None
+
+_RECORD = struct.Struct('<IIIBq')  # test_id, user_id, question_id, selected_answer, answered_at (µs)
+_CHECKSUM = struct.Struct('<I')
+RECORD_SIZE = _RECORD.size + _CHECKSUM.size
+SEGMENT_RE = re.compile(r'^answers-\d+-[0-9a-f]+-\d+\.log$')
+_EPOCH = datetime(1970, 1, 1)
+
+logger = get_logger('answers')
+
+
+def encode_record(test_id, user_id, question_id, selected_answer, answered_at):
+    """One log record: the packed answer followed by its CRC32"""
+    micros = (answered_at - _EPOCH) // timedelta(microseconds=1)
+    data = _RECORD.pack(test_id, user_id, question_id, selected_answer, micros)
+    return data + _CHECKSUM.pack(zlib.crc32(data))
+
+
+def read_segment(path):
+    """
+    Records of a segment file, up to the first torn or corrupt one.
+
+    Returns:
+        list: (test_id, user_id, question_id, selected_answer, answered_at) tuples
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []  # Flushed and deleted meanwhile
+
+    records = []
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        payload = data[offset:offset + _RECORD.size]
+        (checksum,) = _CHECKSUM.unpack_from(data, offset + _RECORD.size)
+        if zlib.crc32(payload) != checksum:
+            break  # A write cut short by a crash; it was never acknowledged
+        test_id, user_id, question_id, selected_answer, micros = _RECORD.unpack(payload)
+        records.append((test_id, user_id, question_id, selected_answer, _EPOCH + timedelta(microseconds=micros)))
+    return records
+
+
+def _merge(answers, record):
+    # Latest answer per (test, question)
+    test_id, user_id, question_id, selected_answer, answered_at = record
+    key = (test_id, question_id)
+    current = answers.get(key)
+    if current is None or current[2] <= answered_at:
+        answers[key] = (user_id, selected_answer, answered_at)
+
+
+def _try_lock(f):
+    """Take an exclusive lock on an open file; False if another process holds it"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def segment_paths(directory):
+    """Paths of all segment files in a directory, oldest first within each process"""
+    try:
+        names = sorted(name for name in os.listdir(directory) if SEGMENT_RE.match(name))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names]
+
+
+def answer_upsert(dialect=None):
+    """
+    INSERT into test_answers that, for a question already answered, updates
+    the stored answer instead, unless the stored one is newer.
+
+    Args:
+        dialect: Dialect name, default that of db.engine
+
+    Returns:
+        Insert: Executed with rows of test_id, question_id, user_id, selected_answer, answered_at
+    """
+    table = TestAnswer.__table__
+    insert = upsert_insert(table, dialect)
+    return insert.on_conflict_do_update(
+        index_elements=[table.c.test_id, table.c.question_id],
+        set_={'selected_answer': insert.excluded.selected_answer, 'answered_at': insert.excluded.answered_at},
+        where=table.c.answered_at <= insert.excluded.answered_at,
+    )
+
+
+def write_answers(answers):
+    """
+    Upsert buffered answers in one transaction, keeping the newer answer per question.
+
+    Answers of tests that are no longer in progress are dropped. If the batch
+    hits an integrity error (a question deleted meanwhile), the rows are
+    written one by one and the failing ones are dropped.
+
+    Args:
+        answers: {(test_id, question_id): (user_id, selected_answer, answered_at)}
+
+    Returns:
+        int: Rows written
+    """
+    if not answers:
+        return 0
+    open_tests = set(db.session.execute(
+        db.select(Test.id).where(Test.id.in_({test_id for test_id, _ in answers}), Test.completed_at.is_(None))
+    ).scalars())
+    rows = [
+        {'test_id': test_id, 'question_id': question_id, 'user_id': user_id,
+         'selected_answer': selected_answer, 'answered_at': answered_at}
+        for (test_id, question_id), (user_id, selected_answer, answered_at) in answers.items()
+        if test_id in open_tests
+    ]
+    if not rows:
+        db.session.commit()
+        return 0
+
+    upsert = answer_upsert()
+    try:
+        db.session.execute(upsert, rows)
+        db.session.commit()
+        written = len(rows)
+    except IntegrityError:
+        db.session.rollback()
+        written = 0
+        for row in rows:
+            try:
+                db.session.execute(upsert, [row])
+                db.session.commit()
+                written += 1
+            except IntegrityError as e:
+                db.session.rollback()
+                log_event(logger, 'answer_dropped', level=logging.WARNING, error=str(e.orig), **row)
+    ANSWER_ROWS_WRITTEN.inc(written)
+    return written
+
+
+def replay_segments(directory, skip=()):
+    """
+    Write the answers of segments left by processes that are gone, then delete them.
+
+    Segments locked by a live process, and those in skip, are left alone.
+
+    Returns:
+        tuple: (segments replayed, rows written)
+    """
+    answers = {}
+    claimed = []
+    for path in segment_paths(directory):
+        if path in skip:
+            continue
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            continue
+        if not _try_lock(f):
+            f.close()
+            continue
+        claimed.append((path, f))
+        for record in read_segment(path):
+            _merge(answers, record)
+
+    try:
+        written = write_answers(answers)
+    finally:
+        for _, f in claimed:
+            f.close()
+    for path, _ in claimed:
+        _remove(path)
+    if claimed:
+        log_event(logger, 'answer_log_replayed', segments=len(claimed), rows=written)
+    return len(claimed), written
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class _Segment:
+    """An open, locked segment file of this process"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        _try_lock(self.file)
+
+    def append(self, data, fsync):
+        self.file.write(data)
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def remove(self):
+        self.file.close()
+        _remove(self.path)
+
+
+class AnswerBuffer:
+    """
+    Per-process write-behind buffer of autosaved answers.
+
+    Starts lazily in each process (after a fork the parent's flusher thread
+    and files are not ours), on the first append.
+
+    Args:
+        app: Flask application (the flusher runs in its app context)
+        directory: Directory of the segment files, shared by the workers of a host
+        flush_interval: Seconds between flushes
+        fsync: fsync each append before acknowledging it
+    """
+
+    def __init__(self, app, directory, flush_interval=0.25, fsync=True):
+        self.app = app
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._token = secrets.token_hex(4)
+        self._sequence = 0
+        self._pending = {}
+        self._sealed = []
+        os.makedirs(self.directory, exist_ok=True)
+        self._segment = self._open_segment()
+        with self.app.app_context():
+            replay_segments(self.directory, skip={self._segment.path})
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='answer-buffer-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _open_segment(self):
+        self._sequence += 1
+        name = f'answers-{self._pid}-{self._token}-{self._sequence:06d}.log'
+        return _Segment(os.path.join(self.directory, name))
+
+    def append(self, test_id, user_id, question_id, selected_answer, answered_at):
+        """Log an answer durably; it reaches test_answers with the next flush"""
+        record = encode_record(test_id, user_id, question_id, selected_answer, answered_at)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            self._segment.append(record, self.fsync)
+            self._pending[(test_id, question_id)] = (user_id, selected_answer, answered_at)
+
+    def flush(self):
+        """
+        Write this process's buffered answers and delete the segments they came from.
+
+        Returns:
+            int: Rows written
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._pid != os.getpid() or not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                # Segments are only left sealed by a failed flush: while flushes fail, keep
+                # appending to the current segment rather than opening one per retry
+                if not self._sealed:
+                    self._sealed.append(self._segment)
+                    self._segment = self._open_segment()
+                sealed = list(self._sealed)
+
+            start = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    written = write_answers(batch)
+            except Exception as e:
+                # Kept for the next flush, unless a newer answer arrived meanwhile
+                with self._lock:
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                log_event(logger, 'answer_flush_failed', level=logging.WARNING, answers=len(batch), error=str(e))
+                return 0
+
+            with self._lock:
+                self._sealed = [segment for segment in self._sealed if segment not in sealed]
+            for segment in sealed:
+                segment.remove()
+            log_event(logger, 'answer_flush', level=logging.DEBUG, answers=len(batch), rows=written,
+                      duration_ms=round((time.perf_counter() - start) * 1000, 2))
+            return written
+
+    def flush_test(self, test_id):
+        """
+        Write the buffered answers of one test, from every segment in the directory.
+
+        Returns:
+            int: Rows written
+        """
+        answers = {}
+        for path in segment_paths(self.directory):
+            for record in read_segment(path):
+                if record[0] == test_id:
+                    _merge(answers, record)
+        return write_answers(answers)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Stop the flusher and write what is still buffered (also run at exit)"""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        with self._lock:
+            if not self._pending and not self._sealed:
+                self._segment.remove()  # Empty: every answer is in the database
+            self._pid = None
+
+
+def init_answer_buffer(app):
+    """
+    Create the answer buffer when ANSWER_BUFFER_ENABLED is set.
+
+    Returns:
+        AnswerBuffer or None
+    """
+    buffer = None
+    if app.config['ANSWER_BUFFER_ENABLED']:
+        buffer = AnswerBuffer(
+            app,
+            app.config['ANSWER_BUFFER_DIR'],
+            flush_interval=app.config['ANSWER_BUFFER_FLUSH_INTERVAL'],
+            fsync=app.config['ANSWER_BUFFER_FSYNC'],
+        )
+    app.extensions['answer_buffer'] = buffer
+    return buffer
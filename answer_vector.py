@@ -0,0 +1,196 @@
+"""
+Compact answer vectors for completed tests
+
+A completed test's answers can be archived into a single column
+(tests.answers_packed) instead of one test_answers row per question.
+
+Format (version 1):
+    1 byte   format version
+    varint   number of answered questions
+    varints  answered question ids, ascending, delta-encoded
+    bytes    2-bit answer codes (selected_answer - 1), four per byte,
+             aligned with the question ids above
+
+Readers go through get_test_answers(), which understands both the packed
+column and test_answers rows.
+"""
+
+import logging
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.structured_log import get_logger, log_event
+
+FORMAT_VERSION = 1
+
+logger = get_logger('answers')
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def pack_answers(answer_dict):
+    """
+    Pack answers into the compact vector format.
+
+    Args:
+        answer_dict: {question_id: selected_answer}; unanswered (None) entries are skipped
+
+    Returns:
+        bytes: Packed answer vector
+    """
+    answered = sorted((question_id, answer) for question_id, answer in answer_dict.items() if answer)
+
+    out = bytearray([FORMAT_VERSION])
+    _write_varint(out, len(answered))
+
+    previous_id = 0
+    for question_id, _ in answered:
+        _write_varint(out, question_id - previous_id)
+        previous_id = question_id
+
+    codes = bytearray((len(answered) + 3) // 4)
+    for i, (_, answer) in enumerate(answered):
+        if answer not in (1, 2, 3, 4):
+            raise ValueError(f"Invalid answer {answer} for question {answered[i][0]}")
+        codes[i // 4] |= (answer - 1) << ((i % 4) * 2)
+    out.extend(codes)
+
+    return bytes(out)
+
+
+def unpack_answers(data):
+    """
+    Unpack a compact answer vector.
+
+    Args:
+        data: Packed answer vector
+
+    Returns:
+        dict: {question_id: selected_answer}
+    """
+    if not data or data[0] != FORMAT_VERSION:
+        raise ValueError('Unsupported answer vector format')
+
+    count, offset = _read_varint(data, 1)
+
+    question_ids = []
+    question_id = 0
+    for _ in range(count):
+        delta, offset = _read_varint(data, offset)
+        question_id += delta
+        question_ids.append(question_id)
+
+    return {
+        question_id: ((data[offset + i // 4] >> ((i % 4) * 2)) & 0b11) + 1
+        for i, question_id in enumerate(question_ids)
+    }
+
+
+def get_test_answers(test):
+    """
+    Get a test's answers from whichever representation it uses.
+
+    Args:
+        test: Test
+
+    Returns:
+        dict: {question_id: selected_answer}
+    """
+    if test.answers_packed is not None:
+        return unpack_answers(test.answers_packed)
+
+    rows = TestAnswer.query.filter_by(test_id=test.id).with_entities(
+        TestAnswer.question_id, TestAnswer.selected_answer
+    ).all()
+    return {question_id: selected_answer for question_id, selected_answer in rows}
+
+
+def store_packed_answers(test, answer_dict):
+    """
+    Archive a completed test's answers into its packed column and drop its rows.
+    The caller commits.
+
+    Args:
+        test: Completed Test
+        answer_dict: {question_id: selected_answer}
+
+    Returns:
+        int: Number of test_answers rows removed
+    """
+    test.answers_packed = pack_answers(answer_dict)
+    return TestAnswer.query.filter_by(test_id=test.id).delete(synchronize_session=False)
+
+
+def compact_completed_tests(completed_before=None, batch_size=500):
+    """
+    Migrate completed tests from test_answers rows to packed answer vectors.
+
+    A test with an answer the format cannot hold (legacy rows outside 1-4)
+    keeps its rows and is logged, and the run goes on with the next tests.
+
+    Args:
+        completed_before: Only compact tests completed before this datetime (None = all)
+        batch_size: Tests compacted per transaction
+
+    Returns:
+        tuple: (tests_compacted: int, rows_removed: int)
+    """
+    tests_compacted = 0
+    rows_removed = 0
+    last_id = 0
+
+    while True:
+        # Keyset pagination, so tests left unpacked are not read again
+        query = Test.query.filter(
+            Test.id > last_id,
+            Test.completed_at.isnot(None),
+            Test.answers_packed.is_(None)
+        )
+        if completed_before is not None:
+            query = query.filter(Test.completed_at < completed_before)
+        tests = query.order_by(Test.id).limit(batch_size).all()
+        if not tests:
+            break
+        last_id = tests[-1].id
+
+        # Load the answers of the whole batch in one query
+        answers_by_test = {test.id: {} for test in tests}
+        rows = TestAnswer.query.filter(TestAnswer.test_id.in_(list(answers_by_test))).with_entities(
+            TestAnswer.test_id, TestAnswer.question_id, TestAnswer.selected_answer
+        ).all()
+        for test_id, question_id, selected_answer in rows:
+            answers_by_test[test_id][question_id] = selected_answer
+
+        packed_ids = []
+        for test in tests:
+            try:
+                test.answers_packed = pack_answers(answers_by_test[test.id])
+            except ValueError as e:
+                log_event(logger, 'answers_not_compacted', level=logging.WARNING, test_id=test.id, error=str(e))
+                continue
+            packed_ids.append(test.id)
+        if packed_ids:
+            rows_removed += TestAnswer.query.filter(
+                TestAnswer.test_id.in_(packed_ids)
+            ).delete(synchronize_session=False)
+        db.session.commit()
+        tests_compacted += len(packed_ids)
+
+    return tests_compacted, rows_removed
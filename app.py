@@ -7,22 +7,50 @@ if _parent not in sys.path:
 
 from flask import Flask, render_template, redirect, url_for, request, flash, send_file, session  # noqa: E402
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user  # noqa: E402
-from flask_babel import Babel, gettext, get_locale  # noqa: E402
+from flask_babel import Babel  # noqa: E402
+from sqlalchemy.engine import make_url  # noqa: E402
+from sqlalchemy.exc import IntegrityError  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
 from nihongo.models import db  # noqa: E402
 from nihongo.models.user import User  # noqa: E402
 from nihongo.models.exam import Exam  # noqa: E402
 from nihongo.models.test import Test  # noqa: E402
-from nihongo.models.test_answer import TestAnswer  # noqa: E402
 from nihongo.models.exam_section import ExamSection  # noqa: E402
 from nihongo.models.section_question import SectionQuestion  # noqa: E402
 from nihongo.models.section import Section  # noqa: E402
 from nihongo.models.utils import get_explanation  # noqa: E402
+from nihongo.media_manifest import build_media_manifest  # noqa: E402
+from nihongo.i18n import gettext, get_locale_name  # noqa: E402
+from nihongo.server_sessions import init_server_sessions  # noqa: E402
+from nihongo.test_state import (  # noqa: E402
+    init_test_state_cache, get_test_state, save_test_state, discard_test_state, load_state_questions
+)
 from nihongo.admin import init_admin  # noqa: E402
 from nihongo.mycontent_routes import mycontent_bp  # noqa: E402
+from nihongo.answer_vector import get_test_answers, store_packed_answers, compact_completed_tests  # noqa: E402
+from nihongo.item_stats import record_test_stats, rebuild_question_stats  # noqa: E402
+from nihongo.rollups import record_test_rollups, recompute_rollups  # noqa: E402
+from nihongo.scoring import get_answer_key, score_answers, get_percentage, rescore_tests  # noqa: E402
+from nihongo.adaptive import init_sampler_cache, select_adaptive_questions, record_mastery  # noqa: E402
+from nihongo.srs import record_reviews, get_due_question_ids, count_due  # noqa: E402
+from nihongo.catalogue import init_catalogue, get_exams, get_section_catalogue, get_section_pool  # noqa: E402
+from nihongo.http_cache import results_validators, history_validators  # noqa: E402
+from nihongo.page_cache import init_page_cache, cached_page  # noqa: E402
+from nihongo.profiling import init_profiling  # noqa: E402
+from nihongo.structured_log import init_logging, get_logger, log_event  # noqa: E402
+from nihongo.metrics import init_metrics, ANSWERS_SAVED, TESTS_STARTED, TESTS_SUBMITTED  # noqa: E402
+from nihongo.export_exam import find_exam, export_exam_to_file  # noqa: E402
+from nihongo.snapshot import create_snapshot_file, load_snapshot_file  # noqa: E402
+from nihongo.synthetic import generate_synthetic  # noqa: E402
+from nihongo.jobs import enqueue_job, run_workers, work, JOB_HANDLERS  # noqa: E402
+from nihongo.answer_buffer import init_answer_buffer, replay_segments, answer_upsert  # noqa: E402
+from nihongo.replicas import init_replicas, replica_read  # noqa: E402
 from nihongo.config import get_config  # noqa: E402
-from datetime import datetime  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+import click  # noqa: E402
 import json  # noqa: E402
 import random  # noqa: E402
+import sqlite3  # noqa: E402
 from io import BytesIO  # noqa: E402
 
 
@@ -35,12 +63,23 @@ app.config.from_object(config_class)
 # Initialize app with configuration (validates production config)
 config_class.init_app(app)
 
-# Log current environment
-print(f"🚀 Starting application in {config_name.upper()} mode")
-print(f"📊 Database: {app.config['SQLALCHEMY_DATABASE_URI'][:50]}...")
+# Structured logs (one JSON line per request), then log the current environment
+init_logging(app)
+log_event(get_logger(), 'app_start', env=config_name,
+          database=make_url(app.config['SQLALCHEMY_DATABASE_URI']).render_as_string(hide_password=True),
+          replicas=len(app.config['DATABASE_REPLICA_URLS']))
 
 # Initialize extensions
 db.init_app(app)
+init_replicas(app)
+session_store = init_server_sessions(app)
+init_test_state_cache(app)
+init_answer_buffer(app)
+init_sampler_cache(app)
+init_catalogue(app)
+init_page_cache(app)
+init_profiling(app)
+init_metrics(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -52,19 +91,24 @@ def get_locale_func():
     # Check if user manually selected language
     if 'language' in session:
         return session['language']
-    # Try to get from browser
-    return request.accept_languages.best_match(['es', 'en']) or 'es'
+    # Try to get from browser (parsed once per session, not on every request)
+    if 'browser_language' not in session:
+        session['browser_language'] = request.accept_languages.best_match(['es', 'en']) or 'es'
+    return session['browser_language']
 
 babel.init_app(app, locale_selector=get_locale_func)
 
+# Babel functions for templates (built once, not per render)
+babel_template_context = dict(
+    get_locale=get_locale_name,
+    _=gettext
+)
+
 # Make Babel functions available in templates
 @app.context_processor
 def inject_babel():
     """Inject Babel functions into template context."""
-    return dict(
-        get_locale=lambda: str(get_locale()),
-        _=gettext
-    )
+    return babel_template_context
 
 # Initialize admin
 init_admin(app, db)
@@ -95,6 +139,7 @@ def set_language(lang):
 
 
 @app.route('/register', methods=['GET', 'POST'])
+@cached_page
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('exams'))
@@ -130,6 +175,7 @@ def register():
 
 
 @app.route('/login', methods=['GET', 'POST'])
+@cached_page
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('exams'))
@@ -160,54 +206,45 @@ def logout():
 
 @app.route('/exams')
 @login_required
+@replica_read
 def exams():
-    all_exams = Exam.query.all()
+    all_exams = get_exams()
     
     # For each exam, get the most recent incomplete test OR the most recent completed test
+    # (two queries over the user's tests instead of two per exam)
     test_dict = {}
-    for exam in all_exams:
-        # First, check for incomplete tests (highest priority)
-        incomplete_test = Test.query.filter_by(
-            user_id=current_user.id,
-            exam_id=exam.id,
-            completed_at=None
-        ).order_by(Test.started_at.desc()).first()
-        
-        if incomplete_test:
-            test_dict[exam.id] = incomplete_test
-        else:
-            # Get most recent completed test
-            completed_test = Test.query.filter_by(
-                user_id=current_user.id,
-                exam_id=exam.id
-            ).filter(
-                Test.completed_at.isnot(None)
-            ).order_by(Test.completed_at.desc()).first()
-            
-            if completed_test:
-                test_dict[exam.id] = completed_test
-    
-    # Get available sections for random exam generation
-    # Aggregate sections by name to avoid duplicates
-    all_sections = Section.query.all()
-    section_aggregated = {}
-    
-    for section in all_sections:
-        count = SectionQuestion.query.filter_by(section_id=section.id).count()
-        if count > 0:
-            if section.name not in section_aggregated:
-                section_aggregated[section.name] = {
-                    'name': section.name,
-                    'count': 0,
-                    'section_ids': []
-                }
-            section_aggregated[section.name]['count'] += count
-            section_aggregated[section.name]['section_ids'].append(section.id)
+    incomplete_tests = Test.query.filter_by(
+        user_id=current_user.id,
+        completed_at=None
+    ).order_by(Test.started_at.desc()).all()
+    completed_tests = Test.query.filter_by(
+        user_id=current_user.id
+    ).filter(
+        Test.completed_at.isnot(None)
+    ).order_by(Test.completed_at.desc())
+    for tests in (incomplete_tests, completed_tests):
+        for test in tests:
+            test_dict.setdefault(test.exam_id, test)
+    
+    # Generated exams are not in the catalogue: list the user's unfinished ones so they can be resumed
+    listed = {exam.id for exam in all_exams}
+    unfinished = {test.exam_id for test in incomplete_tests} - listed
+    if unfinished:
+        all_exams = all_exams + Exam.query.filter(Exam.id.in_(unfinished)).options(
+            joinedload(Exam.creator)
+        ).order_by(Exam.id).all()
+    
+    # Sections available for random exam generation, aggregated by name
+    section_aggregated = get_section_catalogue()
+    
+    # Spaced-repetition cards due now
+    review_due = count_due(current_user.id, datetime.utcnow())
     
     return render_template('exams.html', 
                          exams=all_exams, 
                          test_dict=test_dict,
-                         section_aggregated=section_aggregated)
+                         section_aggregated=section_aggregated,
+                         review_due=review_due)
 
 
 @app.route('/exam/random/create', methods=['POST'])
@@ -228,42 +265,39 @@ def create_random_exam():
             flash(gettext('Please select at least one section with questions'), 'warning')
             return redirect(url_for('exams'))
         
+        # Adaptive mode weights questions towards the user's weak points
+        adaptive = request.form.get('adaptive') == 'on'
+        
         # Create the exam
-        exam_name = f"Random Practice Exam - {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}"
-        exam = Exam(name=exam_name, created_by=current_user.id)
+        exam_title = 'Adaptive Practice Exam' if adaptive else 'Random Practice Exam'
+        exam_name = f"{exam_title} - {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}"
+        exam = Exam(name=exam_name, created_by=current_user.id, is_generated=True)
         db.session.add(exam)
         db.session.flush()
         
         # For each selected section type, aggregate questions from all sections with that name
         for order, (section_name, num_questions) in enumerate(section_configs.items(), start=1):
-            # Get all sections with this name
-            sections_with_name = Section.query.filter_by(name=section_name).all()
-            
-            if not sections_with_name:
-                continue
-            
-            # Collect all available questions from all sections with this name
-            available_question_ids = []
-            for section in sections_with_name:
-                section_questions = SectionQuestion.query.filter_by(
-                    section_id=section.id
-                ).all()
-                available_question_ids.extend([sq.question_id for sq in section_questions])
-            
-            # Remove duplicates (in case same question is in multiple sections)
-            available_question_ids = list(set(available_question_ids))
-            
-            if not available_question_ids:
-                continue
-            
-            # Randomly select questions
-            num_to_select = min(num_questions, len(available_question_ids))
-            selected_question_ids = random.sample(available_question_ids, num_to_select)
+            if adaptive:
+                selected_question_ids = select_adaptive_questions(current_user.id, section_name, num_questions)
+                if not selected_question_ids:
+                    continue
+                num_to_select = len(selected_question_ids)
+            else:
+                # Distinct questions of all sections with this name
+                available_question_ids = get_section_pool(section_name)
+                
+                if not available_question_ids:
+                    continue
+                
+                # Randomly select questions
+                num_to_select = min(num_questions, len(available_question_ids))
+                selected_question_ids = random.sample(available_question_ids, num_to_select)
             
             # Create a new section for this random exam
             new_section = Section(
                 name=section_name,
-                number_of_questions=num_to_select
+                number_of_questions=num_to_select,
+                is_generated=True
             )
             db.session.add(new_section)
             db.session.flush()
@@ -291,6 +325,7 @@ def create_random_exam():
         test = Test(exam_id=exam.id, user_id=current_user.id)
         db.session.add(test)
         db.session.commit()
+        TESTS_STARTED.inc(kind='adaptive' if adaptive else 'random')
         
         flash(gettext('Random exam created successfully with %(count)d questions!', count=sum(section_configs.values())), 'success')
         return redirect(url_for('take_exam', test_id=test.id))
@@ -301,6 +336,34 @@ def create_random_exam():
         return redirect(url_for('exams'))
 
 
+@app.route('/review', methods=['POST'])
+@login_required
+def start_review():
+    """Start a practice test with the user's due spaced-repetition cards"""
+    question_ids = get_due_question_ids(current_user.id, datetime.utcnow(), app.config['REVIEW_SESSION_SIZE'])
+    if not question_ids:
+        flash(gettext('Nothing to review right now'), 'info')
+        return redirect(url_for('exams'))
+    
+    # Flagged so they stay out of the exam catalogue, the section lists and the random exam pools
+    exam = Exam(name=f"Review Session - {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}", created_by=current_user.id,
+                is_generated=True)
+    section = Section(name='Review', number_of_questions=len(question_ids), is_generated=True)
+    db.session.add_all([exam, section])
+    db.session.flush()
+    
+    for q_order, question_id in enumerate(question_ids, start=1):
+        db.session.add(SectionQuestion(section_id=section.id, question_id=question_id, order=q_order))
+    db.session.add(ExamSection(exam_id=exam.id, section_id=section.id, order=1))
+    
+    test = Test(exam_id=exam.id, user_id=current_user.id)
+    db.session.add(test)
+    db.session.commit()
+    TESTS_STARTED.inc(kind='review')
+    
+    return redirect(url_for('take_exam', test_id=test.id))
+
+
 @app.route('/exam/<int:exam_id>/start', methods=['POST'])
 @login_required
 def start_exam(exam_id):
@@ -321,10 +384,35 @@ def start_exam(exam_id):
     test = Test(exam_id=exam_id, user_id=current_user.id)
     db.session.add(test)
     db.session.commit()
+    TESTS_STARTED.inc(kind='exam')
     
     return redirect(url_for('take_exam', test_id=test.id))
 
 
+def get_exam_questions(exam_id):
+    """
+    Get the ordered questions of an exam.
+    
+    Args:
+        exam_id: ID of the exam
+    
+    Returns:
+        list: Dicts with 'section' (section name) and 'question' (Question), in exam order
+    """
+    # One query for the whole exam (a query per section and per question does not scale)
+    rows = db.session.query(SectionQuestion, Section.name).join(
+        ExamSection, ExamSection.section_id == SectionQuestion.section_id
+    ).join(
+        Section, Section.id == ExamSection.section_id
+    ).filter(
+        ExamSection.exam_id == exam_id
+    ).options(
+        joinedload(SectionQuestion.question)
+    ).order_by(ExamSection.order, ExamSection.id, SectionQuestion.order, SectionQuestion.id).all()
+    
+    return [{'section': section_name, 'question': sq.question} for sq, section_name in rows]
+
+
 @app.route('/test/<int:test_id>')
 @login_required
 def take_exam(test_id):
@@ -339,69 +427,122 @@ def take_exam(test_id):
     if test.completed_at:
         return redirect(url_for('test_results', test_id=test_id))
     
-    # Get all questions for this exam
-    exam_sections = ExamSection.query.filter_by(exam_id=test.exam_id).order_by(ExamSection.order).all()
-    
-    questions = []
-    for exam_section in exam_sections:
-        section_questions = SectionQuestion.query.filter_by(
-            section_id=exam_section.section_id
-        ).order_by(SectionQuestion.order).all()
-        
-        for sq in section_questions:
-            questions.append({
-                'section': exam_section.section.name,
-                'question': sq.question
-            })
+    # Question order and saved answers come from the cached test state
+    state = get_test_state(test_id, test)
+    questions = load_state_questions(state)
+    answer_dict = state.answer_dict()
     
-    # Get existing answers
-    existing_answers = TestAnswer.query.filter_by(test_id=test_id).all()
-    answer_dict = {ans.question_id: ans.selected_answer for ans in existing_answers}
+    # Ordered audio/image list so the page can prefetch ahead of the student
+    media_manifest = build_media_manifest(questions)
     
-    return render_template('take_exam.html', test=test, questions=questions, answer_dict=answer_dict)
+    return render_template('take_exam.html',
+                         test=test,
+                         questions=questions,
+                         answer_dict=answer_dict,
+                         media_manifest=media_manifest,
+                         media_prefetch_ahead=app.config['MEDIA_PREFETCH_AHEAD'])
 
 
-@app.route('/test/<int:test_id>/answer', methods=['POST'])
+@app.route('/test/<int:test_id>/media-manifest')
 @login_required
-def submit_answer(test_id):
+def get_media_manifest(test_id):
+    """Return the ordered audio/image manifest for a test as JSON"""
     test = Test.query.get_or_404(test_id)
     
     # Security check
     if test.user_id != current_user.id:
         return {'error': 'Unauthorized'}, 403
     
-    if test.completed_at:
+    questions = get_exam_questions(test.exam_id)
+    return {
+        'test_id': test.id,
+        'prefetch_ahead': app.config['MEDIA_PREFETCH_AHEAD'],
+        'items': build_media_manifest(questions)
+    }
+
+
+@app.route('/test/<int:test_id>/answer', methods=['POST'])
+@login_required
+def submit_answer(test_id):
+    # Cached state of an in-progress test (None if missing or completed)
+    state = get_test_state(test_id)
+    
+    if state is None:
+        test = Test.query.get_or_404(test_id)
+        
+        # Security check
+        if test.user_id != current_user.id:
+            return {'error': 'Unauthorized'}, 403
+        
         return {'error': 'Test already completed'}, 400
     
+    # Security check
+    if state.user_id != current_user.id:
+        return {'error': 'Unauthorized'}, 403
+    
     question_id = request.form.get('question_id', type=int)
     selected_answer = request.form.get('selected_answer', type=int)
     
-    if not question_id or not selected_answer:
+    if not question_id or selected_answer not in (1, 2, 3, 4) or state.position(question_id) is None:
         return {'error': 'Invalid data'}, 400
     
-    # Check if answer already exists
-    existing_answer = TestAnswer.query.filter_by(
-        test_id=test_id,
-        question_id=question_id
-    ).first()
-    
-    if existing_answer:
-        existing_answer.selected_answer = selected_answer
-        existing_answer.answered_at = datetime.utcnow()
+    answer_buffer = app.extensions['answer_buffer']
+    if answer_buffer is not None:
+        # Write behind: logged locally now, written to test_answers by the next flush
+        # (which drops the answers of tests submitted meanwhile)
+        answer_buffer.append(test_id, current_user.id, question_id, selected_answer, datetime.utcnow())
     else:
-        answer = TestAnswer(
-            test_id=test_id,
-            user_id=current_user.id,
-            question_id=question_id,
-            selected_answer=selected_answer
-        )
-        db.session.add(answer)
+        # The test may have been submitted through another worker, whose cache this one
+        # does not share; the row lock keeps a concurrent submit from grading in between
+        still_open = db.session.query(Test.id).filter(
+            Test.id == test_id,
+            Test.completed_at.is_(None)
+        ).with_for_update().first()
+        if still_open is None:
+            db.session.rollback()
+            discard_test_state(test_id)
+            return {'error': 'Test already completed'}, 400
+        
+        # Write through: insert the answer, or update the stored one (one upsert, so a
+        # double-clicked autosave cannot collide on the unique (test, question) index)
+        db.session.execute(answer_upsert(), [{
+            'test_id': test_id,
+            'question_id': question_id,
+            'user_id': current_user.id,
+            'selected_answer': selected_answer,
+            'answered_at': datetime.utcnow()
+        }])
+        db.session.commit()
     
-    db.session.commit()
+    state.set_answer(question_id, selected_answer)
+    save_test_state(state)
+    ANSWERS_SAVED.inc()
     
     return {'success': True}
 
 
+@app.route('/test/<int:test_id>/state')
+@login_required
+def saved_test_state(test_id):
+    """Saved answers of an in-progress test as JSON (to resync a page after a reconnect)"""
+    state = get_test_state(test_id)
+    
+    if state is None:
+        test = Test.query.get_or_404(test_id)
+        
+        # Security check
+        if test.user_id != current_user.id:
+            return {'error': 'Unauthorized'}, 403
+        
+        return {'error': 'Test already completed'}, 400
+    
+    # Security check
+    if state.user_id != current_user.id:
+        return {'error': 'Unauthorized'}, 403
+    
+    return state.summary()
+
+
 @app.route('/test/<int:test_id>/submit', methods=['POST'])
 @login_required
 def submit_exam(test_id):
@@ -416,9 +557,46 @@ def submit_exam(test_id):
         flash('Test already completed', 'warning')
         return redirect(url_for('test_results', test_id=test_id))
     
-    # Mark test as completed
-    test.completed_at = datetime.utcnow()
+    # Answers still in the write-behind buffer (of any worker on this host) go to test_answers first
+    answer_buffer = app.extensions['answer_buffer']
+    if answer_buffer is not None:
+        answer_buffer.flush_test(test_id)
+    
+    # Mark test as completed; of two concurrent submits only the one that claims
+    # the test adds it to the aggregates (later autosaves are rejected)
+    claimed = db.session.execute(
+        db.update(Test)
+        .where(Test.id == test_id, Test.completed_at.is_(None))
+        .values(completed_at=datetime.utcnow())
+    ).rowcount
+    if claimed != 1:
+        db.session.rollback()
+        flash('Test already completed', 'warning')
+        return redirect(url_for('test_results', test_id=test_id))
+    
+    # Graded from test_answers (buffered answers were flushed above): the cached state
+    # of this worker may miss answers autosaved through another one
+    answer_dict = get_test_answers(test)
+    
+    # Question order from the cached state when available
+    state = get_test_state(test_id, test)
+    if state:
+        question_ids, section_names = list(state.question_ids), state.section_names()
+    else:
+        exam_questions = get_exam_questions(test.exam_id)
+        question_ids = [q['question'].id for q in exam_questions]
+        section_names = [q['section'] for q in exam_questions]
+    answer_key = get_answer_key(question_ids)
+    test.correct_count, test.total_questions = score_answers(question_ids, answer_dict, answer_key)
+    record_test_stats(question_ids, answer_dict, answer_key)
+    record_test_rollups(test, question_ids, section_names, answer_dict, answer_key)
+    record_mastery(test.user_id, question_ids, answer_dict, answer_key, test.completed_at)
+    record_reviews(test.user_id, question_ids, answer_dict, answer_key, test.completed_at)
+    if app.config['COMPACT_ANSWERS_ON_SUBMIT']:
+        store_packed_answers(test, answer_dict)
     db.session.commit()
+    discard_test_state(test_id)
+    TESTS_SUBMITTED.inc()
     
     flash('Test submitted successfully!', 'success')
     return redirect(url_for('test_results', test_id=test_id))
@@ -426,35 +604,44 @@ def submit_exam(test_id):
 
 @app.route('/my-exams')
 @login_required
+@replica_read
 def my_exam_history():
     """Display user's exam history with all completed tests"""
+    validators = history_validators(current_user.id)
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    
     # Get all user's tests, ordered by completion date (most recent first)
     completed_tests = Test.query.filter_by(
         user_id=current_user.id
     ).filter(
         Test.completed_at.isnot(None)
-    ).order_by(Test.completed_at.desc()).all()
+    ).options(joinedload(Test.exam)).order_by(Test.completed_at.desc()).all()
     
     # Calculate scores for each test
     test_history = []
     for test in completed_tests:
-        # Get all questions for this exam
-        exam_sections = ExamSection.query.filter_by(exam_id=test.exam_id).order_by(ExamSection.order).all()
+        # Stored score (set on submit, refreshed by flask rescore)
+        if test.total_questions is not None:
+            test_history.append({
+                'test': test,
+                'exam_name': test.exam.name,
+                'total_questions': test.total_questions,
+                'correct': test.correct_count,
+                'percentage': get_percentage(test),
+                'started_at': test.started_at,
+                'completed_at': test.completed_at
+            })
+            continue
         
-        questions = []
-        for exam_section in exam_sections:
-            section_questions = SectionQuestion.query.filter_by(
-                section_id=exam_section.section_id
-            ).order_by(SectionQuestion.order).all()
-            
-            for sq in section_questions:
-                questions.append(sq.question)
+        # Get all questions for this exam
+        questions = [item['question'] for item in get_exam_questions(test.exam_id)]
         
         total_questions = len(questions)
         
-        # Get user's answers
-        user_answers = TestAnswer.query.filter_by(test_id=test.id).all()
-        answer_dict = {ans.question_id: ans.selected_answer for ans in user_answers}
+        # Get user's answers (rows or packed vector)
+        answer_dict = get_test_answers(test)
         
         # Calculate correct answers by comparing with question's correct_answer
         correct = 0
@@ -475,11 +662,12 @@ def my_exam_history():
             'completed_at': test.completed_at
         })
     
-    return render_template('exam_history.html', test_history=test_history)
+    return validators.apply(render_template('exam_history.html', test_history=test_history))
 
 
 @app.route('/test/<int:test_id>/results')
 @login_required
+@replica_read
 def test_results(test_id):
     test = Test.query.get_or_404(test_id)
     
@@ -492,21 +680,17 @@ def test_results(test_id):
         flash('Test not yet completed', 'warning')
         return redirect(url_for('take_exam', test_id=test_id))
     
-    # Get all questions for this exam
-    exam_sections = ExamSection.query.filter_by(exam_id=test.exam_id).order_by(ExamSection.order).all()
+    # Revisits of an unchanged page end here
+    validators = results_validators(test)
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
     
-    questions = []
-    for exam_section in exam_sections:
-        section_questions = SectionQuestion.query.filter_by(
-            section_id=exam_section.section_id
-        ).order_by(SectionQuestion.order).all()
-        
-        for sq in section_questions:
-            questions.append(sq.question)
+    # Get all questions for this exam
+    questions = [item['question'] for item in get_exam_questions(test.exam_id)]
     
-    # Get user's answers
-    user_answers = TestAnswer.query.filter_by(test_id=test_id).all()
-    answer_dict = {ans.question_id: ans.selected_answer for ans in user_answers}
+    # Get user's answers (rows or packed vector)
+    answer_dict = get_test_answers(test)
     
     # Calculate score
     correct = 0
@@ -528,16 +712,21 @@ def test_results(test_id):
     
     percentage = (correct / total * 100) if total > 0 else 0
     
-    return render_template('results.html', 
+    # Stored score (set on submit, refreshed by flask rescore), as in the exam history
+    if test.total_questions is not None:
+        correct, total, percentage = test.correct_count, test.total_questions, get_percentage(test)
+    
+    return validators.apply(render_template('results.html', 
                          test=test, 
                          results=results, 
                          correct=correct, 
                          total=total, 
-                         percentage=percentage)
+                         percentage=percentage))
 
 
 @app.cli.command()
-def init_db():
+@click.option('--snapshot', 'snapshot_path', default=None, help='Load sample exams from a content snapshot instead of the JSON files.')
+def init_db(snapshot_path):
     """Initialize the database and load sample exams."""
     from nihongo.import_exam import import_exam_from_json
     
@@ -558,6 +747,14 @@ def init_db():
     else:
         print(f'ℹ️  Default user already exists: {default_email}')
     
+    if snapshot_path:
+        counts = load_snapshot_file(snapshot_path, user_id=default_user.id, skip_existing=True)
+        print(f"✅ Loaded {counts['exams']} exam(s) and {counts['questions']} question(s) from {snapshot_path}")
+        if counts['skipped_exams']:
+            print(f"ℹ️  {counts['skipped_exams']} exam(s) already existed")
+        print('\n🎉 Database initialization complete!')
+        return
+    
     # Load exam JSON files
     exam_files = [
         'exam_easy.json',
@@ -646,6 +843,260 @@ def create_admin():
     print('   Admin: Yes')
 
 
+@app.cli.command('sessions-sweep')
+def sessions_sweep():
+    """Delete expired server-side sessions."""
+    if session_store is None:
+        print('ℹ️  SESSION_BACKEND is "cookie", no server-side sessions to sweep')
+        return
+    
+    removed = session_store.sweep()
+    print(f'✅ Removed {removed} expired session(s)')
+
+
+@app.cli.command('answers-replay')
+def answers_replay():
+    """Write answers left in the answer buffer's log by stopped processes to test_answers."""
+    segments, rows = replay_segments(app.config['ANSWER_BUFFER_DIR'])
+    print(f'✅ Replayed {segments} log segment(s), wrote {rows} answer(s)')
+
+
+@app.cli.command('replicas-sync')
+def replicas_sync():
+    """Copy a SQLite primary database into its SQLite replicas (local testing of read replicas)."""
+    primary = db.engine.url
+    replicas = [make_url(url) for url in app.config['DATABASE_REPLICA_URLS']]
+    if not replicas:
+        print('ℹ️  DATABASE_REPLICA_URLS is not set, no replicas to sync')
+        return
+    if any(url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:'
+           for url in [primary, *replicas]):
+        print('❌ replicas-sync copies SQLite database files only; replicate PostgreSQL with streaming replication')
+        return
+    
+    # The backup API copies a consistent snapshot, even while the app writes
+    source = sqlite3.connect(primary.database)
+    try:
+        for url in replicas:
+            target = sqlite3.connect(url.database)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+            print(f'✅ Copied {primary.database} to {url.database}')
+    finally:
+        source.close()
+
+
+@app.cli.command('compact-answers')
+@click.option('--older-than-days', type=int, default=None, help='Only compact tests completed more than N days ago.')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='Tests compacted per transaction.')
+def compact_answers(older_than_days, batch_size):
+    """Archive completed tests' answers into packed answer vectors."""
+    completed_before = None
+    if older_than_days is not None:
+        completed_before = datetime.utcnow() - timedelta(days=older_than_days)
+    
+    tests_compacted, rows_removed = compact_completed_tests(completed_before, batch_size)
+    print(f'✅ Compacted {tests_compacted} test(s), removed {rows_removed} test_answers row(s)')
+
+
+@app.cli.command('rebuild-question-stats')
+def rebuild_question_stats_command():
+    """Recompute per-question statistics from all completed tests."""
+    tests_processed, questions_written = rebuild_question_stats()
+    print(f'✅ Rebuilt statistics for {questions_written} question(s) from {tests_processed} completed test(s)')
+
+
+@app.cli.command('recompute-rollups')
+@click.option('--from', 'start_day', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='First day (UTC) to rebuild.')
+@click.option('--to', 'end_day', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Last day (UTC) to rebuild, inclusive.')
+def recompute_rollups_command(start_day, end_day):
+    """Rebuild the daily analytics rollups of a date range."""
+    tests_processed, exam_rows, section_rows = recompute_rollups(
+        start_day.date() if start_day else None,
+        end_day.date() if end_day else None
+    )
+    print(f'✅ Rebuilt {exam_rows} exam and {section_rows} section rollup row(s) from {tests_processed} completed test(s)')
+
+
+@app.cli.command('rescore')
+@click.option('--question', 'question_ids', type=int, multiple=True, help='Rescore tests whose exam contains this question (repeatable).')
+@click.option('--exam', 'exam_ids', type=int, multiple=True, help='Rescore tests of this exam (repeatable).')
+@click.option('--from', 'start_day', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Only tests completed on or after this day (UTC).')
+@click.option('--to', 'end_day', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Only tests completed on or before this day (UTC).')
+@click.option('--batch-size', type=int, default=2000, show_default=True, help='Tests scored per batch.')
+@click.option('--background', is_flag=True, help='Queue a job for the jobs worker instead of rescoring now.')
+def rescore(question_ids, exam_ids, start_day, end_day, batch_size, background):
+    """Recompute stored test scores after an answer key fix."""
+    if background:
+        job = enqueue_job('rescore', {
+            'question_ids': list(question_ids) or None,
+            'exam_ids': list(exam_ids) or None,
+            'start_day': start_day.date().isoformat() if start_day else None,
+            'end_day': end_day.date().isoformat() if end_day else None,
+        })
+        print(f'✅ Queued job {job.id} ({job.status})')
+        return
+    result = rescore_tests(
+        question_ids=list(question_ids),
+        exam_ids=list(exam_ids),
+        start_day=start_day.date() if start_day else None,
+        end_day=end_day.date() if end_day else None,
+        batch_size=batch_size
+    )
+    rate = result['tests'] / result['seconds'] if result['seconds'] > 0 else 0
+    print(f"✅ Rescored {result['tests']} test(s) in {result['seconds']:.2f}s ({rate:.0f} tests/s), {result['changed']} score(s) changed")
+    
+    # Keep the analytics rollups of the affected days consistent
+    if result['changed']:
+        recompute_rollups(result['first_day'], result['last_day'])
+        print(f"✅ Rebuilt rollups from {result['first_day']} to {result['last_day']}")
+        print('ℹ️  Run flask rebuild-question-stats to refresh per-question discrimination')
+
+
+@app.cli.command('export-exams')
+@click.option('--exam', 'exams', multiple=True, help='Name or ID of an exam to export (repeatable). Default: all exams.')
+@click.option('--output-dir', default='exports', show_default=True, help='Directory for the exam-<id>.json files.')
+def export_exams(exams, output_dir):
+    """Export exams as JSON files in the import format."""
+    if exams:
+        targets = [int(exam) if exam.isdigit() else exam for exam in exams]
+    else:
+        targets = [exam_id for (exam_id,) in db.session.query(Exam.id).order_by(Exam.id)]
+    
+    os.makedirs(output_dir, exist_ok=True)
+    exported = 0
+    for target in targets:
+        exam = find_exam(target)
+        if not exam:
+            print(f"❌ Exam '{target}' not found")
+            continue
+        file_path = os.path.join(output_dir, f'exam-{exam.id}.json')
+        success, message, _ = export_exam_to_file(exam.id, file_path)
+        print(f"{'✅' if success else '❌'} {message} -> {file_path}")
+        exported += success
+        db.session.expunge_all()  # Keep memory flat over the whole bank
+    print(f'✅ Exported {exported} exam(s) to {output_dir}')
+
+
+@app.cli.command('jobs-worker')
+@click.option('--processes', type=int, default=2, show_default=True, help='Worker processes.')
+@click.option('--poll-interval', type=float, default=1.0, show_default=True, help='Seconds between polls of an empty queue.')
+@click.option('--once', is_flag=True, help='Run the due jobs in this process, then exit.')
+def jobs_worker(processes, poll_interval, once):
+    """Run queued background jobs (imports, reloads, rescoring, exports)."""
+    if once:
+        ran = work(app, once=True)
+        print(f'✅ Ran {ran} job(s)')
+        return
+    print(f'ℹ️  Starting {processes} worker process(es), Ctrl-C to stop after the current jobs')
+    run_workers(processes, poll_interval)
+
+
+@app.cli.command('jobs-enqueue')
+@click.argument('kind', type=click.Choice(sorted(JOB_HANDLERS)))
+@click.option('--payload', default='{}', show_default=True, help='JSON arguments of the job.')
+@click.option('--exam-file', default=None, help='Exam JSON file, passed as the "exam" argument (import_exam, reload_exam).')
+@click.option('--user', 'user_email', default=None, help='Email of the user the job runs as.')
+def jobs_enqueue(kind, payload, exam_file, user_email):
+    """Queue a background job."""
+    try:
+        payload = json.loads(payload)
+        if exam_file:
+            with open(exam_file, 'r', encoding='utf-8') as f:
+                payload['exam'] = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f'❌ {e}')
+        return
+    user = User.query.filter_by(email=user_email).first() if user_email else None
+    if user_email and not user:
+        print(f'❌ User not found: {user_email}')
+        return
+    job = enqueue_job(kind, payload, user_id=user.id if user else None)
+    print(f'✅ Queued job {job.id} ({job.status})')
+
+
+@app.cli.command('snapshot-create')
+@click.argument('output')
+@click.option('--from-json', 'json_files', multiple=True, help='Build the snapshot from exam JSON files instead of the database (repeatable).')
+def snapshot_create(output, json_files):
+    """Write the content tables to a binary snapshot file."""
+    exams_json = None
+    if json_files:
+        exams_json = []
+        for json_file in json_files:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                exams_json.append(json.load(f))
+    counts = create_snapshot_file(output, exams_json)
+    print(f"✅ Wrote {counts['exams']} exam(s), {counts['sections']} section(s) and {counts['questions']} question(s) "
+          f"to {output} ({os.path.getsize(output) / 1024:.0f} KB)")
+
+
+@app.cli.command('snapshot-load')
+@click.argument('snapshot')
+@click.option('--user', 'user_email', default=None, help='Assign the content to this user (default: keep the snapshot creators).')
+@click.option('--skip-existing', is_flag=True, help='Leave out exams whose name already exists.')
+def snapshot_load(snapshot, user_email, skip_existing):
+    """Bulk-load a content snapshot into the database."""
+    user_id = None
+    if user_email:
+        user = User.query.filter_by(email=user_email).first()
+        if not user:
+            print(f'❌ User not found: {user_email}')
+            return
+        user_id = user.id
+    start = datetime.utcnow()
+    try:
+        counts = load_snapshot_file(snapshot, user_id=user_id, skip_existing=skip_existing)
+    except ValueError as e:
+        print(f'❌ {e}')
+        return
+    except IntegrityError as e:
+        db.session.rollback()
+        print(f'❌ Snapshot conflicts with the database: {e.orig}')
+        return
+    seconds = (datetime.utcnow() - start).total_seconds()
+    print(f"✅ Loaded {counts['exams']} exam(s) and {counts['questions']} question(s) in {seconds:.2f}s")
+
+
+@app.cli.command('seed-synthetic')
+@click.option('--users', type=int, default=100, show_default=True, help='Students to create.')
+@click.option('--exams', type=int, default=10, show_default=True, help='Exams to create.')
+@click.option('--sections', 'sections_per_exam', type=int, default=5, show_default=True, help='Sections per exam.')
+@click.option('--questions', 'questions_per_section', type=int, default=40, show_default=True, help='Questions per section.')
+@click.option('--tests-per-user', type=int, default=5, show_default=True, help='Tests started by each student.')
+@click.option('--completed-ratio', type=click.FloatRange(0, 1), default=0.9, show_default=True, help='Share of tests that were submitted.')
+@click.option('--days', type=int, default=90, show_default=True, help='Days of activity to spread the tests over.')
+@click.option('--end-day', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Last day of activity (default: today UTC). Fix it for identical reruns.')
+@click.option('--seed', type=int, default=0, show_default=True, help='Random seed.')
+@click.option('--skip-derived', is_flag=True, help='Do not rebuild the analytics rollups and question statistics.')
+def seed_synthetic(users, exams, sections_per_exam, questions_per_section, tests_per_user,
+                   completed_ratio, days, end_day, seed, skip_derived):
+    """Bulk-generate a deterministic synthetic dataset for benchmarks."""
+    start = datetime.utcnow()
+    try:
+        counts = generate_synthetic(
+            users=users, exams=exams, sections_per_exam=sections_per_exam,
+            questions_per_section=questions_per_section, tests_per_user=tests_per_user,
+            completed_ratio=completed_ratio, days=days, seed=seed,
+            end_day=end_day.date() if end_day else None
+        )
+    except ValueError as e:
+        print(f'❌ {e}')
+        return
+    seconds = (datetime.utcnow() - start).total_seconds()
+    print(f"✅ Generated {counts['users']} user(s), {counts['exams']} exam(s), {counts['questions']} question(s), "
+          f"{counts['tests']} test(s) and {counts['test_answers']} answer(s) in {seconds:.2f}s")
+    print('ℹ️  Synthetic users log in with password "synthetic"')
+    
+    if not skip_derived and counts['first_day']:
+        recompute_rollups(counts['first_day'], counts['last_day'])
+        tests_processed, questions_written = rebuild_question_stats()
+        print(f"✅ Rebuilt rollups from {counts['first_day']} to {counts['last_day']} "
+              f"and statistics for {questions_written} question(s)")
+
+
 @app.cli.command()
 def db_migrate():
     """Generate a new migration."""
@@ -686,86 +1137,82 @@ def db_history():
         print(result.stderr)
 
 
+EXAMPLE_EXAM = {
+    "name": "JLPT N5 Practice Test - Example",
+    "sections": [
+        {
+            "name": "Vocabulary",
+            "questions": [
+                {
+                    "question_text": "彼は___な性格です。",
+                    "answer_1": "まじめ",
+                    "answer_2": "まじめだ",
+                    "answer_3": "まじめの",
+                    "answer_4": "まじめで",
+                    "correct_answer": 1,
+                    "explanation": "「まじめな性格」is the correct form. な-adjectives use な before nouns."
+                },
+                {
+                    "question_text": "毎日___勉強します。",
+                    "answer_1": "いっしょうけんめい",
+                    "answer_2": "いっしょうけんめいに",
+                    "answer_3": "いっしょうけんめいで",
+                    "answer_4": "いっしょうけんめいな",
+                    "correct_answer": 2,
+                    "explanation": "いっしょうけんめいに is an adverb modifying the verb 勉強します."
+                }
+            ]
+        },
+        {
+            "name": "Grammar",
+            "questions": [
+                {
+                    "question_text": "雨が___きました。",
+                    "answer_1": "ふり",
+                    "answer_2": "ふって",
+                    "answer_3": "ふった",
+                    "answer_4": "ふる",
+                    "correct_answer": 2,
+                    "explanation": "ふってきました indicates the rain has started falling. Use て-form + くる."
+                },
+                {
+                    "question_text": "先生___相談したいことがあります。",
+                    "answer_1": "に",
+                    "answer_2": "を",
+                    "answer_3": "が",
+                    "answer_4": "へ",
+                    "correct_answer": 1,
+                    "explanation": "相談する takes に particle to indicate the person being consulted."
+                }
+            ]
+        },
+        {
+            "name": "Reading Comprehension",
+            "questions": [
+                {
+                    "question_text": "「彼女は日本語が上手です」の意味は？",
+                    "answer_1": "She is good at Japanese",
+                    "answer_2": "She is teaching Japanese",
+                    "answer_3": "She likes Japanese",
+                    "answer_4": "She is from Japan",
+                    "correct_answer": 1,
+                    "explanation": "上手（じょうず）means skillful or good at something."
+                }
+            ]
+        }
+    ]
+}
+
+# Serialized once at startup, every download sends the same bytes
+EXAMPLE_EXAM_JSON = json.dumps(EXAMPLE_EXAM, ensure_ascii=False, indent=2).encode('utf-8')
+
+
 @app.route('/download-example-json')
 @login_required
 def download_example_json():
     """Download an example JSON file for exam import"""
-    example_data = {
-        "name": "JLPT N5 Practice Test - Example",
-        "sections": [
-            {
-                "name": "Vocabulary",
-                "questions": [
-                    {
-                        "question_text": "彼は___な性格です。",
-                        "answer_1": "まじめ",
-                        "answer_2": "まじめだ",
-                        "answer_3": "まじめの",
-                        "answer_4": "まじめで",
-                        "correct_answer": 1,
-                        "explanation": "「まじめな性格」is the correct form. な-adjectives use な before nouns."
-                    },
-                    {
-                        "question_text": "毎日___勉強します。",
-                        "answer_1": "いっしょうけんめい",
-                        "answer_2": "いっしょうけんめいに",
-                        "answer_3": "いっしょうけんめいで",
-                        "answer_4": "いっしょうけんめいな",
-                        "correct_answer": 2,
-                        "explanation": "いっしょうけんめいに is an adverb modifying the verb 勉強します."
-                    }
-                ]
-            },
-            {
-                "name": "Grammar",
-                "questions": [
-                    {
-                        "question_text": "雨が___きました。",
-                        "answer_1": "ふり",
-                        "answer_2": "ふって",
-                        "answer_3": "ふった",
-                        "answer_4": "ふる",
-                        "correct_answer": 2,
-                        "explanation": "ふってきました indicates the rain has started falling. Use て-form + くる."
-                    },
-                    {
-                        "question_text": "先生___相談したいことがあります。",
-                        "answer_1": "に",
-                        "answer_2": "を",
-                        "answer_3": "が",
-                        "answer_4": "へ",
-                        "correct_answer": 1,
-                        "explanation": "相談する takes に particle to indicate the person being consulted."
-                    }
-                ]
-            },
-            {
-                "name": "Reading Comprehension",
-                "questions": [
-                    {
-                        "question_text": "「彼女は日本語が上手です」の意味は？",
-                        "answer_1": "She is good at Japanese",
-                        "answer_2": "She is teaching Japanese",
-                        "answer_3": "She likes Japanese",
-                        "answer_4": "She is from Japan",
-                        "correct_answer": 1,
-                        "explanation": "上手（じょうず）means skillful or good at something."
-                    }
-                ]
-            }
-        ]
-    }
-    
-    # Create JSON string with nice formatting
-    json_str = json.dumps(example_data, ensure_ascii=False, indent=2)
-    
-    # Create BytesIO object
-    buffer = BytesIO()
-    buffer.write(json_str.encode('utf-8'))
-    buffer.seek(0)
-    
     return send_file(
-        buffer,
+        BytesIO(EXAMPLE_EXAM_JSON),
         as_attachment=True,
         download_name='exam_example.json',
         mimetype='application/json'
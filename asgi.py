@@ -0,0 +1,285 @@
+"""
+ASGI serving mode
+
+Serves the answer autosave (POST /test/<id>/answer) and the saved test state
+(GET /test/<id>/state) as async handlers with an async database driver
+(aiosqlite or asyncpg), and every other request through the unchanged Flask
+app in a thread pool (a2wsgi). An autosave is tiny but frequent: on sync
+workers each one holds a thread while it waits on the database, here it only
+holds a coroutine.
+
+The async handlers only take the common case: a logged-in session, the
+test's state already in the test state cache (take_exam puts it there) and a
+small url-encoded form. Anything else (no session, a cache miss, another
+content type) goes to Flask before the body is read, and Flask answers it as
+it does under WSGI. Both run in the same process, so they share the 'local'
+test state cache.
+
+Install requirements-asgi.txt, then:
+    uvicorn asgi:application --workers 4
+"""
+
+# Setup path for package imports (as in app.py, for `uvicorn asgi:application`)
+import sys
+import os
+_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _parent not in sys.path:
+    sys.path.insert(0, _parent)
+
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import re  # noqa: E402
+import time  # noqa: E402
+from datetime import datetime  # noqa: E402
+from urllib.parse import parse_qs  # noqa: E402
+from a2wsgi import WSGIMiddleware  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.engine import make_url  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+from werkzeug.wrappers import Request  # noqa: E402
+from nihongo.app import app  # noqa: E402
+from nihongo.models import db  # noqa: E402
+from nihongo.models.test import Test  # noqa: E402
+from nihongo.answer_buffer import answer_upsert  # noqa: E402
+from nihongo.metrics import ANSWERS_SAVED, CACHE_LOOKUPS, record_request  # noqa: E402
+from nihongo.structured_log import get_logger, log_event  # noqa: E402
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+MAX_FORM_BYTES = 4096  # Larger autosave bodies go to Flask
+
+_ANSWER_PATH = re.compile(r'^/test/(\d+)/answer$')
+_STATE_PATH = re.compile(r'^/test/(\d+)/state$')
+
+logger = get_logger('request')
+
+
+def async_database_url(url):
+    """
+    Async driver URL of a database URL (sqlite -> aiosqlite, postgresql -> asyncpg).
+
+    Args:
+        url: SQLAlchemy database URL
+
+    Returns:
+        sqlalchemy.engine.URL
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver for {backend} databases; set ASGI_DATABASE_URL')
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        raise ValueError('ASGI mode needs a database file; an in-memory SQLite database is not shared')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return ''
+
+
+def _form_int(form, key):
+    # Same as request.form.get(key, type=int)
+    try:
+        return int(form[key][0])
+    except (KeyError, ValueError):
+        return None
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+class AutosaveASGI:
+    """
+    ASGI application: async autosave and test state, Flask for everything else.
+
+    Args:
+        flask_app: The Flask app, served as is for the other routes
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_THREADS'])
+        self.engine = None
+        # Stores other than the cookie / in-process LRU block, so they run in a thread
+        self.offload_sessions = flask_app.config.get('SESSION_BACKEND', 'cookie') != 'cookie'
+        self.offload_state = flask_app.config.get('TEST_STATE_BACKEND', 'local') != 'local'
+        self.routes = (
+            ('POST', _ANSWER_PATH, 'submit_answer', self.submit_answer),
+            ('GET', _STATE_PATH, 'saved_test_state', self.saved_test_state),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http':
+            for method, pattern, endpoint, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match and scope['method'] == method:
+                    start = time.perf_counter()
+                    result = await handler(scope, receive, int(match[1]))
+                    if result is not None:
+                        return await self._respond(scope, send, endpoint, start, *result)
+                    break
+        await self.wsgi(scope, receive, send)
+
+    def get_engine(self):
+        """Async engine, created in the event loop that first uses it"""
+        if self.engine is None:
+            config = self.flask_app.config
+            # Derived from the URL of Flask's engine, which is created once and does not
+            # follow later changes of SQLALCHEMY_DATABASE_URI
+            url = config['ASGI_DATABASE_URL'] or async_database_url(
+                self._in_app_context(lambda: db.engine.url)
+            )
+            self.engine = create_async_engine(url, pool_size=config['ASGI_DB_POOL_SIZE'])
+        return self.engine
+
+    async def close(self):
+        """Close the async engine's connections"""
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _in_app_context(self, function, *args):
+        with self.flask_app.app_context():
+            return function(*args)
+
+    async def _call(self, offload, function, *args):
+        if offload:
+            return await asyncio.to_thread(self._in_app_context, function, *args)
+        return function(*args)
+
+    def _session_user_id(self, cookie):
+        app = self.flask_app
+        environ = {'HTTP_COOKIE': cookie, 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80'}
+        session = app.session_interface.open_session(app, Request(environ))
+        return session.get('_user_id') if session is not None else None
+
+    async def _load(self, scope, test_id):
+        """
+        Session user and cached state of a test.
+
+        Returns:
+            tuple or None: (user id, TestState), None to leave the request to Flask
+        """
+        cookie = _header(scope, b'cookie')
+        if not cookie:
+            return None
+        user_id = await self._call(self.offload_sessions, self._session_user_id, cookie)
+        if user_id is None:
+            return None  # Flask redirects to the login page (or logs in from the remember cookie)
+        cache = self.flask_app.extensions['test_state_cache']
+        state = await self._call(self.offload_state, cache.get, test_id)
+        if state is None:
+            return None  # Flask builds the state from the database and caches it
+        CACHE_LOOKUPS.inc(cache='test_state', result='hit')
+        return user_id, state
+
+    async def submit_answer(self, scope, receive, test_id):
+        """POST /test/<id>/answer, as app.submit_answer"""
+        content_type = _header(scope, b'content-type').split(';')[0].strip()
+        length = _header(scope, b'content-length')
+        if content_type != 'application/x-www-form-urlencoded' or not length.isdigit() \
+                or int(length) > MAX_FORM_BYTES:
+            return None
+        loaded = await self._load(scope, test_id)
+        if loaded is None:
+            return None
+        user_id, state = loaded
+
+        # Security check
+        if str(state.user_id) != user_id:
+            return 403, {'error': 'Unauthorized'}, user_id
+
+        form = parse_qs((await _read_body(receive)).decode('utf-8', 'replace'))
+        question_id = _form_int(form, 'question_id')
+        selected_answer = _form_int(form, 'selected_answer')
+        if not question_id or selected_answer not in (1, 2, 3, 4) or state.position(question_id) is None:
+            return 400, {'error': 'Invalid data'}, user_id
+
+        answer_buffer = self.flask_app.extensions['answer_buffer']
+        if answer_buffer is not None:
+            # Write behind (see answer_buffer.py); the append waits for fsync, so it runs in a thread
+            await asyncio.to_thread(answer_buffer.append, test_id, state.user_id, question_id, selected_answer,
+                                    datetime.utcnow())
+        elif not await self._write_through(test_id, state.user_id, question_id, selected_answer):
+            # Submitted through another worker meanwhile
+            await self._call(self.offload_state, self.flask_app.extensions['test_state_cache'].discard, test_id)
+            return 400, {'error': 'Test already completed'}, user_id
+
+        state.set_answer(question_id, selected_answer)
+        await self._call(self.offload_state, self.flask_app.extensions['test_state_cache'].put, state)
+        ANSWERS_SAVED.inc()
+        return 200, {'success': True}, user_id
+
+    async def _write_through(self, test_id, user_id, question_id, selected_answer):
+        # Upsert the answer as app.submit_answer does; False if the test is no longer in progress
+        tests = Test.__table__
+        engine = self.get_engine()
+        async with engine.begin() as conn:
+            still_open = (await conn.execute(
+                select(tests.c.id).where(tests.c.id == test_id, tests.c.completed_at.is_(None)).with_for_update()
+            )).first()
+            if still_open is None:
+                return False
+            await conn.execute(answer_upsert(engine.dialect.name), [{
+                'test_id': test_id,
+                'question_id': question_id,
+                'user_id': user_id,
+                'selected_answer': selected_answer,
+                'answered_at': datetime.utcnow(),
+            }])
+        return True
+
+    async def saved_test_state(self, scope, receive, test_id):
+        """GET /test/<id>/state, as app.saved_test_state"""
+        loaded = await self._load(scope, test_id)
+        if loaded is None:
+            return None
+        user_id, state = loaded
+
+        # Security check
+        if str(state.user_id) != user_id:
+            return 403, {'error': 'Unauthorized'}, user_id
+        return 200, state.summary(), user_id
+
+    async def _respond(self, scope, send, endpoint, start, status, payload, user_id):
+        body = json.dumps(payload).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+        seconds = time.perf_counter() - start
+        config = self.flask_app.config
+        if config['METRICS_ENABLED']:
+            record_request(self.flask_app, endpoint, scope['method'], status, seconds)
+        if config['REQUEST_LOG_ENABLED']:
+            log_event(logger, 'request', method=scope['method'], path=scope['path'], endpoint=endpoint,
+                      status=status, duration_ms=round(seconds * 1000, 2), user_id=user_id, server='asgi')
+
+
+application = AutosaveASGI(app)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Autosave Benchmark: WSGI vs ASGI
+
+Measures concurrent answer-autosave throughput of running servers, usually
+the same database served by gunicorn (app:app) and by uvicorn
+(asgi:application), side by side. Each student logs in, starts the exam and
+opens it (not measured); then all students post --answers autosaves each,
+back to back, and the autosaves are timed.
+
+Reuses the HTTP client and scenario helpers of loadtest.py, and like it does
+not start the servers; see "Autosave: WSGI vs ASGI" in docs/BENCHMARKS.md.
+
+Usage:
+    python benchmarks/bench_autosave.py --url http://127.0.0.1:5000 --url http://127.0.0.1:5001
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from loadtest import (
+    DEFAULT_EXAM, TEST_PATH_RE, Client, LoadTestError, Stats, question_ids, setup, timed
+)
+
+ROUTE = 'POST /test/<id>/answer'
+
+
+async def open_exam(args, email, exam_id):
+    """Log in, start and open the exam (not measured); returns (client, test id, question ids)"""
+    client = Client(args.url, args.timeout)
+    stats = Stats()
+    await timed(stats, 'login', client.request('POST', '/login', {'email': email, 'password': args.password}), {302})
+    headers, _ = await timed(stats, 'start', client.request('POST', f'/exam/{exam_id}/start'), {302})
+    match = TEST_PATH_RE.search(headers.get('location', ''))
+    if not match:
+        raise LoadTestError('POST /exam/<id>/start: no test in redirect')
+    test_id = int(match.group(1))
+    _, body = await timed(stats, 'open', client.request('GET', f'/test/{test_id}'), {200})
+    return client, test_id, question_ids(body.decode('utf-8'))
+
+
+async def autosave(args, stats, student, seed):
+    client, test_id, questions = student
+    rng = random.Random(seed)
+    for n in range(args.answers):
+        await timed(stats, ROUTE, client.request('POST', f'/test/{test_id}/answer', {
+            'question_id': questions[n % len(questions)], 'selected_answer': rng.randint(1, 4)
+        }), {200})
+
+
+async def run(args):
+    emails = [f'loadtest-{n}@example.com' for n in range(args.users)]
+    exam_id = await setup(args, emails)
+    gate = asyncio.Semaphore(args.setup_concurrency)
+
+    async def prepare(email):
+        async with gate:
+            return await open_exam(args, email, exam_id)
+
+    students = await asyncio.gather(*(prepare(email) for email in emails))
+
+    stats = Stats()
+    failures = []
+
+    async def student(n, state):
+        try:
+            await autosave(args, stats, state, args.seed * 1_000_003 + n)
+        except LoadTestError as e:
+            failures.append(str(e))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(student(n, state) for n, state in enumerate(students)))
+    elapsed = time.perf_counter() - start
+    return stats.report(elapsed).get(ROUTE), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare concurrent autosave throughput of running servers')
+    parser.add_argument('--url', action='append', required=True, help='Server base URL (repeat to compare)')
+    parser.add_argument('--users', type=int, default=200, help='Concurrent students')
+    parser.add_argument('--answers', type=int, default=50, help='Autosaves per student')
+    parser.add_argument('--exam', default=DEFAULT_EXAM, help='Exam name as shown on /exams')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the answers each student picks')
+    parser.add_argument('--password', default='loadtest', help='Password of the student accounts')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds before a request fails')
+    parser.add_argument('--setup-concurrency', type=int, default=20, help='Parallel registrations and logins')
+    args = parser.parse_args()
+
+    print(f"Autosave: {args.users} students x {args.answers} answers")
+    print(f"{'server':<28}{'count':>8}{'errors':>8}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'req/s':>9}")
+    baseline = None
+    for url in args.url:
+        try:
+            row, failures = asyncio.run(run(argparse.Namespace(**{**vars(args), 'url': url})))
+        except (LoadTestError, OSError) as e:
+            print(f"❌ {url}: {e}")
+            sys.exit(1)
+        if row is None:
+            print(f"❌ {url}: no autosave completed ({len(failures)} student(s) failed)")
+            continue
+        baseline = baseline or row['rps']
+        print(f"{url:<28}{row['count']:>8}{row['errors']:>8}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['rps']:>9.1f}"
+              f"  ({row['rps'] / baseline:.2f}x)")
+        for failure in sorted(set(failures))[:5]:
+            print(f"  ❌ {failure}")
+
+
+if __name__ == '__main__':
+    main()
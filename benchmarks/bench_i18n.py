@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Template Render Benchmark per Locale
+
+Times rendering of the anonymous pages with the Spanish and English locales,
+comparing the in-memory catalogue gettext with Flask-Babel's gettext.
+
+Usage:
+    python benchmarks/bench_i18n.py [iterations]
+"""
+
+# Setup path for package imports
+import sys
+import os
+_parent = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _parent not in sys.path:
+    sys.path.insert(0, _parent)
+
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+import time  # noqa: E402
+from flask import render_template, session  # noqa: E402
+import flask_babel  # noqa: E402
+from nihongo.app import app  # noqa: E402
+from nihongo.i18n import gettext  # noqa: E402
+
+TEMPLATES = ['login.html', 'register.html']
+
+
+def time_renders(locale, iterations, translate):
+    """
+    Render each template repeatedly in a fresh request per render.
+
+    Args:
+        locale: 'es' or 'en'
+        iterations: Number of renders per template
+        translate: gettext function injected as '_'
+
+    Returns:
+        float: Mean render time in microseconds
+    """
+    total = 0.0
+    renders = 0
+    for template in TEMPLATES:
+        for _ in range(iterations):
+            with app.app_context(), app.test_request_context('/login'):
+                session['language'] = locale
+                start = time.perf_counter()
+                render_template(template, _=translate)
+                total += time.perf_counter() - start
+                renders += 1
+    return total / renders * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    # Warm up template compilation and catalogue loading
+    time_renders('es', 5, gettext)
+    time_renders('es', 5, flask_babel.gettext)
+
+    print(f"Template render benchmark ({iterations} renders x {len(TEMPLATES)} templates)")
+    print(f"{'locale':<8}{'catalogue (us)':>16}{'flask-babel (us)':>18}")
+    for locale in ('es', 'en'):
+        catalogue_us = time_renders(locale, iterations, gettext)
+        babel_us = time_renders(locale, iterations, flask_babel.gettext)
+        print(f"{locale:<8}{catalogue_us:>16.1f}{babel_us:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Analytics Rollup Benchmark
+
+Seeds synthetic completed tests spread over a number of days, builds the
+daily rollups and compares the dashboard queries (per exam, per section
+name, per day) on the rollup tables with the same aggregates computed by
+scanning tests and test_answers.
+
+Usage:
+    python benchmarks/bench_rollups.py [tests] [days]
+"""
+
+# Setup path for package imports
+import sys
+import os
+_parent = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _parent not in sys.path:
+    sys.path.insert(0, _parent)
+
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+import random  # noqa: E402
+import time  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from nihongo.app import app  # noqa: E402
+from nihongo.models import db  # noqa: E402
+from nihongo.models.user import User  # noqa: E402
+from nihongo.models.question import Question  # noqa: E402
+from nihongo.models.section import Section  # noqa: E402
+from nihongo.models.exam import Exam  # noqa: E402
+from nihongo.models.exam_section import ExamSection  # noqa: E402
+from nihongo.models.section_question import SectionQuestion  # noqa: E402
+from nihongo.models.test import Test  # noqa: E402
+from nihongo.models.test_answer import TestAnswer  # noqa: E402
+from nihongo.rollups import recompute_rollups, exam_summary, section_summary, daily_trend  # noqa: E402
+
+EXAMS = 5
+SECTIONS_PER_EXAM = 3
+QUESTIONS_PER_SECTION = 10
+SECTION_NAMES = ['Vocabulary', 'Grammar', 'Reading', 'Listening']
+
+RAW_TEST_SCORES = text("""
+    SELECT t.exam_id, date(t.completed_at) AS day, COUNT(q.id) AS correct
+    FROM tests t
+    LEFT JOIN test_answers ta ON ta.test_id = t.id
+    LEFT JOIN questions q ON q.id = ta.question_id AND q.correct_answer = ta.selected_answer
+    WHERE t.completed_at >= :start AND t.completed_at < :end
+    GROUP BY t.id, t.exam_id, date(t.completed_at)
+""")
+
+RAW_EXAM_LENGTHS = text("""
+    SELECT es.exam_id, COUNT(sq.id)
+    FROM exam_sections es JOIN section_questions sq ON sq.section_id = es.section_id
+    GROUP BY es.exam_id
+""")
+
+RAW_SECTION_CORRECT = text("""
+    SELECT s.name, COUNT(*)
+    FROM tests t
+    JOIN test_answers ta ON ta.test_id = t.id
+    JOIN questions q ON q.id = ta.question_id AND q.correct_answer = ta.selected_answer
+    JOIN section_questions sq ON sq.question_id = q.id
+    JOIN exam_sections es ON es.section_id = sq.section_id AND es.exam_id = t.exam_id
+    JOIN sections s ON s.id = es.section_id
+    WHERE t.completed_at >= :start AND t.completed_at < :end
+    GROUP BY s.name
+""")
+
+RAW_SECTION_TOTALS = text("""
+    SELECT s.name, COUNT(*)
+    FROM tests t
+    JOIN exam_sections es ON es.exam_id = t.exam_id
+    JOIN section_questions sq ON sq.section_id = es.section_id
+    JOIN sections s ON s.id = es.section_id
+    WHERE t.completed_at >= :start AND t.completed_at < :end
+    GROUP BY s.name
+""")
+
+
+def seed(n_tests, days):
+    """Create exams and n_tests completed tests with answer rows"""
+    rng = random.Random(42)
+    user = User(email='bench@example.com')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.flush()
+
+    exam_questions = {}
+    for e in range(EXAMS):
+        exam = Exam(name=f'Exam {e}', created_by=user.id)
+        db.session.add(exam)
+        db.session.flush()
+        exam_questions[exam.id] = []
+        for s in range(SECTIONS_PER_EXAM):
+            section = Section(name=SECTION_NAMES[(e + s) % len(SECTION_NAMES)], number_of_questions=QUESTIONS_PER_SECTION)
+            db.session.add(section)
+            db.session.flush()
+            db.session.add(ExamSection(exam_id=exam.id, section_id=section.id, order=s))
+            for q in range(QUESTIONS_PER_SECTION):
+                question = Question(question_text='?', answer_1='a', answer_2='b', answer_3='c', answer_4='d',
+                                    correct_answer=rng.randint(1, 4), created_by=user.id)
+                db.session.add(question)
+                db.session.flush()
+                db.session.add(SectionQuestion(section_id=section.id, question_id=question.id, order=q))
+                exam_questions[exam.id].append(question.id)
+    db.session.commit()
+
+    now = datetime.utcnow()
+    exam_ids = list(exam_questions)
+    tests = []
+    for i in range(n_tests):
+        completed_at = now - timedelta(days=rng.randrange(days), seconds=rng.randrange(86400))
+        tests.append({'id': i + 1, 'exam_id': rng.choice(exam_ids), 'user_id': user.id,
+                      'started_at': completed_at - timedelta(hours=1), 'completed_at': completed_at})
+    db.session.execute(db.insert(Test), tests)
+
+    answers = [
+        {'test_id': test['id'], 'user_id': user.id, 'question_id': question_id, 'selected_answer': rng.randint(1, 4)}
+        for test in tests
+        for question_id in exam_questions[test['exam_id']]
+        if rng.random() < 0.9
+    ]
+    db.session.execute(db.insert(TestAnswer), answers)
+    db.session.commit()
+    return len(answers)
+
+
+def raw_scan(start, end):
+    """The dashboard aggregates computed from tests and test_answers"""
+    params = {'start': start, 'end': end}
+    lengths = dict(db.session.execute(RAW_EXAM_LENGTHS).all())
+    exams = {}
+    days = {}
+    for exam_id, day, correct in db.session.execute(RAW_TEST_SCORES, params):
+        percentage = correct / lengths[exam_id] * 100
+        for totals in (exams.setdefault(exam_id, [0, 0]), days.setdefault(day, [0, 0])):
+            totals[0] += 1
+            totals[1] += percentage >= 60
+    correct = dict(db.session.execute(RAW_SECTION_CORRECT, params).all())
+    sections = {name: (total, correct.get(name, 0)) for name, total in db.session.execute(RAW_SECTION_TOTALS, params)}
+    return exams, sections, days
+
+
+def rollup_queries(start_day, end_day):
+    return exam_summary(start_day, end_day), section_summary(start_day, end_day), daily_trend(start_day, end_day)
+
+
+def time_call(function, *args, repeat=5):
+    """Best of repeat runs, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    n_tests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+
+    with app.app_context():
+        db.create_all()
+        n_answers = seed(n_tests, days)
+
+        start = time.perf_counter()
+        recompute_rollups()
+        build_ms = (time.perf_counter() - start) * 1000
+
+        print(f"Analytics rollup benchmark ({n_tests} tests, {n_answers} answers over {days} days)")
+        print(f"Full rollup rebuild: {build_ms:.0f} ms")
+        print(f"{'range':<10}{'rollups (ms)':>14}{'raw scan (ms)':>16}")
+        today = datetime.utcnow().date()
+        for window in (7, 30, days):
+            start_day = today - timedelta(days=window - 1)
+            start_dt = datetime.combine(start_day, datetime.min.time())
+            end_dt = datetime.combine(today + timedelta(days=1), datetime.min.time())
+            rollup_ms = time_call(rollup_queries, start_day, today)
+            raw_ms = time_call(raw_scan, start_dt, end_dt)
+            print(f"{str(window) + ' days':<10}{rollup_ms:>14.2f}{raw_ms:>16.2f}")
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
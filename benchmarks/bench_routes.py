@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Route Benchmark
+
+Times the main pages against synthetic datasets of increasing size (see
+synthetic.py) and counts the SQL statements of each request. A statement
+count that grows with the dataset is an N+1; tests/test_query_budgets.py
+fails the test suite on those, this script shows what they cost.
+
+Usage:
+    python benchmarks/bench_routes.py [repeats] [sizes...]
+
+    sizes: small, medium, large (default: all three)
+"""
+
+# Setup path for package imports
+import sys
+import os
+_parent = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _parent not in sys.path:
+    sys.path.insert(0, _parent)
+
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+import time  # noqa: E402
+from datetime import date  # noqa: E402
+from flask import url_for  # noqa: E402
+from nihongo.app import app  # noqa: E402
+from nihongo.models import db  # noqa: E402
+from nihongo.models.user import User  # noqa: E402
+from nihongo.models.exam import Exam  # noqa: E402
+from nihongo.models.test import Test  # noqa: E402
+from nihongo.synthetic import generate_synthetic, SYNTHETIC_PASSWORD  # noqa: E402
+from nihongo.query_counter import QueryCounter  # noqa: E402
+from nihongo.catalogue import init_catalogue  # noqa: E402
+from nihongo.page_cache import init_page_cache  # noqa: E402
+from nihongo.test_state import init_test_state_cache  # noqa: E402
+from nihongo.adaptive import init_sampler_cache  # noqa: E402
+
+SIZES = {
+    'small': dict(users=50, exams=5, sections_per_exam=5, questions_per_section=20, tests_per_user=3),
+    'medium': dict(users=500, exams=20, sections_per_exam=5, questions_per_section=40, tests_per_user=10),
+    'large': dict(users=2000, exams=50, sections_per_exam=5, questions_per_section=40, tests_per_user=25),
+}
+
+
+def routes(ids):
+    """(label, method, url, form) of the benchmarked requests"""
+    with app.test_request_context():
+        admin_urls = [(endpoint, url_for(endpoint)) for endpoint in (
+            'admin_users.index_view', 'admin_questions.index_view', 'admin_sections.index_view',
+            'admin_exams.index_view', 'admin_tests.index_view', 'analytics.index'
+        )]
+    return [
+        ('exams', 'GET', '/exams', None),
+        ('take_exam', 'GET', f"/test/{ids['open_test']}", None),
+        ('test_results', 'GET', f"/test/{ids['completed_test']}/results", None),
+        ('my_exam_history', 'GET', '/my-exams', None),
+        ('create_random_exam', 'POST', '/exam/random/create', {'section_Vocabulary': '10', 'section_Grammar': '10'}),
+        ('mycontent.questions', 'GET', '/mycontent/questions', None),
+        ('mycontent.sections', 'GET', '/mycontent/sections', None),
+        ('mycontent.exams', 'GET', '/mycontent/exams', None),
+        ('mycontent.edit_exam', 'GET', f"/mycontent/exams/{ids['exam']}/edit", None),
+    ] + [(endpoint, 'GET', url, None) for endpoint, url in admin_urls]
+
+
+def seed(shape):
+    """Fresh database with one synthetic dataset; returns the ids the routes need"""
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    for init in (init_catalogue, init_page_cache, init_test_state_cache, init_sampler_cache):
+        init(app)
+    generate_synthetic(seed=1, end_day=date(2026, 1, 31), **shape)
+    user = User.query.filter_by(email='synthetic-1-0@example.com').one()
+    user.is_admin = True
+    db.session.commit()
+    exam = Exam.query.filter_by(created_by=user.id).order_by(Exam.id).first()
+    return user.email, {
+        'exam': exam.id,
+        'completed_test': Test.query.filter(Test.user_id == user.id, Test.completed_at.isnot(None)).first().id,
+    }
+
+
+def request(client, method, url, form=None):
+    with app.app_context():
+        return client.open(url, method=method, data=form)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    sizes = sys.argv[2:] or list(SIZES)
+
+    for size in sizes:
+        with app.app_context():
+            email, ids = seed(SIZES[size])
+            client = app.test_client()
+            request(client, 'POST', '/login', {'email': email, 'password': SYNTHETIC_PASSWORD})
+            response = request(client, 'POST', f"/exam/{ids['exam']}/start")
+            ids['open_test'] = int(response.headers['Location'].rstrip('/').split('/')[-1])
+
+            print(f"\n{size}: {SIZES[size]}")
+            print(f"{'route':<28}{'statements':>12}{'mean (ms)':>12}{'p95 (ms)':>11}")
+            for label, method, url, form in routes(ids):
+                with QueryCounter(db.engine) as queries:
+                    request(client, method, url, form)  # Cold: caches empty
+                timings = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    request(client, method, url, form)
+                    timings.append(time.perf_counter() - start)
+                timings.sort()
+                mean = sum(timings) / len(timings)
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                print(f"{label:<28}{queries.count:>12}{mean * 1000:>12.2f}{p95 * 1000:>11.2f}")
+
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Content Bootstrap Benchmark
+
+Fills an empty database with the same synthetic exams two ways: parsing
+exam JSON documents with import_exam_from_json (the init_db path), and
+loading one binary content snapshot with bulk INSERTs.
+
+Usage:
+    python benchmarks/bench_snapshot.py [exams] [questions_per_section]
+"""
+
+# Setup path for package imports
+import sys
+import os
+_parent = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _parent not in sys.path:
+    sys.path.insert(0, _parent)
+
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+import io  # noqa: E402
+import json  # noqa: E402
+import time  # noqa: E402
+from nihongo.app import app  # noqa: E402
+from nihongo.models import db  # noqa: E402
+from nihongo.models.user import User  # noqa: E402
+from nihongo.models.question import Question  # noqa: E402
+from nihongo.import_exam import import_exam_from_json  # noqa: E402
+from nihongo.snapshot import snapshot_from_exam_json, write_snapshot, read_snapshot, load_snapshot  # noqa: E402
+
+SECTIONS = ('Vocabulary', 'Grammar', 'Reading', 'Listening', 'Kanji')
+
+
+def make_exams(n_exams, per_section):
+    """Synthetic exams with bilingual explanations, as JSON text"""
+    documents = []
+    for e in range(n_exams):
+        documents.append(json.dumps({
+            'name': f'Synthetic Exam {e}',
+            'sections': [{
+                'name': name,
+                'questions': [{
+                    'question_text': f'{name} {e}-{q}: わたしは まいにち ___ べんきょうします。',
+                    'answer_1': 'にほんご', 'answer_2': 'えいご', 'answer_3': 'すうがく', 'answer_4': 'れきし',
+                    'correct_answer': q % 4 + 1,
+                    'explanation': {'EN': f'Explanation {q}', 'ES': f'Explicación {q}'},
+                } for q in range(per_section)]
+            } for name in SECTIONS]
+        }, ensure_ascii=False))
+    return documents
+
+
+def fresh_database():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    user = User(email='bench@example.com')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def main():
+    n_exams = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    per_section = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    documents = make_exams(n_exams, per_section)
+    json_bytes = sum(len(document.encode('utf-8')) for document in documents)
+
+    with app.app_context():
+        out = io.BytesIO()
+        write_snapshot(snapshot_from_exam_json([json.loads(document) for document in documents]), out)
+        snapshot = out.getvalue()
+
+        user_id = fresh_database()
+        start = time.perf_counter()
+        for document in documents:
+            import_exam_from_json(json.loads(document), user_id)
+        json_seconds = time.perf_counter() - start
+        questions = Question.query.count()
+
+        user_id = fresh_database()
+        start = time.perf_counter()
+        load_snapshot(read_snapshot(snapshot), user_id=user_id)
+        snapshot_seconds = time.perf_counter() - start
+        assert Question.query.count() == questions
+
+        print(f"Content bootstrap ({n_exams} exams, {questions} questions)")
+        print(f"{'path':<22}{'size (KB)':>12}{'load (s)':>12}{'questions/s':>14}")
+        print(f"{'JSON import':<22}{json_bytes / 1024:>12.0f}{json_seconds:>12.3f}{questions / json_seconds:>14.0f}")
+        print(f"{'binary snapshot':<22}{len(snapshot) / 1024:>12.0f}{snapshot_seconds:>12.3f}{questions / snapshot_seconds:>14.0f}")
+        print(f"Speedup: {json_seconds / snapshot_seconds:.1f}x")
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Spaced-Repetition Queue Benchmark
+
+Loads synthetic review cards (1M by default, 100 per user) and times the
+review queue query of random users with the (user_id, due_at) index, with
+only the primary key, and as a full table scan, plus the cost of applying
+a 40-question submission to the cards.
+
+Usage:
+    python benchmarks/bench_srs.py [cards] [cards_per_user]
+"""
+
+# Setup path for package imports
+import sys
+import os
+_parent = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _parent not in sys.path:
+    sys.path.insert(0, _parent)
+
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+import random  # noqa: E402
+import statistics  # noqa: E402
+import time  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from nihongo.app import app  # noqa: E402
+from nihongo.models import db  # noqa: E402
+from nihongo.models.review_card import ReviewCard  # noqa: E402
+from nihongo.srs import get_due_question_ids, record_reviews  # noqa: E402
+
+SESSION_SIZE = 20
+
+FULL_SCAN = text("""
+    SELECT question_id FROM review_cards NOT INDEXED
+    WHERE user_id = :user_id AND due_at <= :now
+    ORDER BY due_at LIMIT :limit
+""")
+
+
+def seed(n_cards, per_user, now):
+    """Insert n_cards review cards with due dates spread over +-30 days"""
+    rng = random.Random(42)
+    chunk = []
+    for i in range(n_cards):
+        user_id, question_id = divmod(i, per_user)
+        due_at = now + timedelta(minutes=rng.randint(-30 * 1440, 30 * 1440))
+        chunk.append({
+            'user_id': user_id + 1, 'question_id': question_id + 1, 'ease': 2.5, 'interval_days': 1.0,
+            'repetitions': 1, 'lapses': 1, 'due_at': due_at, 'last_reviewed_at': now - timedelta(days=1),
+        })
+        if len(chunk) == 50000:
+            db.session.execute(db.insert(ReviewCard), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(db.insert(ReviewCard), chunk)
+    db.session.commit()
+
+
+def time_queries(function, users, now):
+    """Latencies of function(user_id, now) in microseconds: (mean, p95)"""
+    timings = []
+    for user_id in users:
+        start = time.perf_counter()
+        function(user_id, now)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return statistics.mean(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    n_cards = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    n_users = n_cards // per_user
+    now = datetime.utcnow()
+    rng = random.Random(7)
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed(n_cards, per_user, now)
+        print(f"Spaced-repetition benchmark ({n_cards} cards, {n_users} users, loaded in {time.perf_counter() - start:.1f}s)")
+
+        def queue(user_id, at):
+            return get_due_question_ids(user_id, at, SESSION_SIZE)
+
+        def full_scan(user_id, at):
+            return db.session.execute(FULL_SCAN, {'user_id': user_id, 'now': at, 'limit': SESSION_SIZE}).all()
+
+        users = [rng.randint(1, n_users) for _ in range(1000)]
+        print(f"{'due queue':<28}{'mean (us)':>12}{'p95 (us)':>12}")
+        mean, p95 = time_queries(queue, users, now)
+        print(f"{'(user_id, due_at) index':<28}{mean:>12.0f}{p95:>12.0f}")
+
+        db.session.execute(text('DROP INDEX ix_review_cards_user_due'))
+        mean, p95 = time_queries(queue, users, now)
+        print(f"{'primary key + sort':<28}{mean:>12.0f}{p95:>12.0f}")
+
+        mean, p95 = time_queries(full_scan, users[:20], now)
+        print(f"{'full table scan':<28}{mean:>12.0f}{p95:>12.0f}")
+
+        db.session.execute(text('CREATE INDEX ix_review_cards_user_due ON review_cards (user_id, due_at)'))
+
+        # One 40-question submission, half of it wrong, for random users
+        timings = []
+        key = {question_id: 1 for question_id in range(1, 41)}
+        for user_id in users[:200]:
+            answers = {question_id: rng.choice((1, 2)) for question_id in key}
+            start = time.perf_counter()
+            record_reviews(user_id, list(key), answers, key, now)
+            db.session.commit()
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"Submission update (40 questions): {statistics.mean(timings):.2f} ms mean")
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Load Test: Concurrent Exam Takers
+
+Drives a running server with many simulated students taking the same exam
+at once, over plain HTTP with asyncio (standard library only):
+
+    login -> /exams -> start exam -> one /answer per question -> submit -> results
+
+Student accounts (loadtest-<n>@example.com) are registered through /register
+before the measured run. Each student picks its answers from a random
+generator seeded with --seed, so runs are reproducible. Reports request
+count, errors, p50/p95/p99 latency and requests/second per route.
+
+Unlike the bench_*.py scripts this does not start the application; see
+"Load Testing" in docs/BENCHMARKS.md for seeding and starting gunicorn.
+
+Usage:
+    python benchmarks/loadtest.py --url http://127.0.0.1:5000 --users 500
+"""
+
+import argparse
+import asyncio
+import html
+import json
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_EXAM = 'JLPT N5 Practice Test - Long (Comprehensive)'
+
+QUESTION_ID_RE = re.compile(r'data-question-id="(\d+)"')
+TEST_PATH_RE = re.compile(r'/test/(\d+)')
+
+
+class LoadTestError(Exception):
+    """A step of the scenario got an unexpected response"""
+
+
+class Stats:
+    """Latencies and errors per route"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, ok):
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+    def report(self, elapsed):
+        """
+        Summarise the run.
+
+        Args:
+            elapsed: Wall-clock seconds of the measured run
+
+        Returns:
+            dict: route -> count, errors, p50/p95/p99 (ms) and req/s
+        """
+        report = {}
+        for route, samples in self.latencies.items():
+            samples = sorted(samples)
+            report[route] = {
+                'count': len(samples),
+                'errors': self.errors[route],
+                'p50_ms': percentile(samples, 50) * 1000,
+                'p95_ms': percentile(samples, 95) * 1000,
+                'p99_ms': percentile(samples, 99) * 1000,
+                'rps': len(samples) / elapsed if elapsed else 0.0,
+            }
+        return report
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of sorted samples"""
+    if not samples:
+        return 0.0
+    rank = max(1, -(-len(samples) * pct // 100))
+    return samples[int(rank) - 1]
+
+
+class Client:
+    """
+    Minimal HTTP/1.1 client for one simulated student.
+
+    Opens a connection per request (Connection: close), keeps the session
+    cookie and does not follow redirects, so each hop is timed on its own.
+    """
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        if parts.scheme != 'http':
+            raise ValueError('Only http:// URLs are supported')
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.cookies = {}
+
+    async def request(self, method, path, form=None):
+        """
+        Send one request.
+
+        Returns:
+            tuple: (status, headers dict with lower-case names, body bytes)
+        """
+        body = urlencode(form).encode() if form is not None else b''
+        lines = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            'Connection: close',
+            'Accept-Language: en',
+        ]
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{k}={v}' for k, v in self.cookies.items()))
+        if form is not None:
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+            lines.append(f'Content-Length: {len(body)}')
+
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+            await writer.drain()
+            data = await asyncio.wait_for(reader.read(), self.timeout)
+        finally:
+            writer.close()
+
+        head, _, payload = data.partition(b'\r\n\r\n')
+        head_lines = head.decode('latin-1').split('\r\n')
+        status = int(head_lines[0].split()[1])
+        headers = {}
+        for line in head_lines[1:]:
+            name, _, value = line.partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                cookie_name, _, cookie_value = value.split(';', 1)[0].partition('=')
+                self.cookies[cookie_name] = cookie_value
+            else:
+                headers[name] = value
+        if headers.get('transfer-encoding') == 'chunked':
+            payload = dechunk(payload)
+        return status, headers, payload
+
+
+def dechunk(payload):
+    """Decode a chunked transfer-encoded body"""
+    out = bytearray()
+    while payload:
+        size_line, _, payload = payload.partition(b'\r\n')
+        size = int(size_line.split(b';')[0], 16)
+        if size == 0:
+            break
+        out += payload[:size]
+        payload = payload[size + 2:]
+    return bytes(out)
+
+
+async def timed(stats, route, call, expect):
+    """Run one request, record its latency under route and check the status"""
+    start = time.perf_counter()
+    try:
+        status, headers, body = await call
+    except (OSError, asyncio.TimeoutError, ValueError) as e:
+        stats.record(route, time.perf_counter() - start, False)
+        raise LoadTestError(f'{route}: {e!r}') from e
+    stats.record(route, time.perf_counter() - start, status in expect)
+    if status not in expect:
+        raise LoadTestError(f'{route}: HTTP {status}')
+    return headers, body
+
+
+def find_exam_id(page, exam_name):
+    """
+    Find the start action of an exam on the /exams dashboard.
+
+    Returns:
+        int or None: Exam ID
+    """
+    title = f'<h5 class="card-title">{html.escape(exam_name)}</h5>'
+    position = page.find(title)
+    if position < 0:
+        return None
+    match = re.search(r'/exam/(\d+)/start', page[position:])
+    return int(match.group(1)) if match else None
+
+
+def question_ids(page):
+    """Question IDs on the take-exam page, in exam order"""
+    return list(dict.fromkeys(int(qid) for qid in QUESTION_ID_RE.findall(page)))
+
+
+async def take_exam(args, stats, email, exam_id, seed):
+    """One student's full exam, from login to results"""
+    client = Client(args.url, args.timeout)
+    rng = random.Random(seed)
+
+    await timed(stats, 'POST /login', client.request(
+        'POST', '/login', {'email': email, 'password': args.password}), {302})
+    await timed(stats, 'GET /exams', client.request('GET', '/exams'), {200})
+
+    headers, _ = await timed(stats, 'POST /exam/<id>/start', client.request(
+        'POST', f'/exam/{exam_id}/start'), {302})
+    match = TEST_PATH_RE.search(headers.get('location', ''))
+    if not match:
+        raise LoadTestError('POST /exam/<id>/start: no test in redirect')
+    test_id = int(match.group(1))
+
+    _, body = await timed(stats, 'GET /test/<id>', client.request('GET', f'/test/{test_id}'), {200})
+    for question_id in question_ids(body.decode('utf-8')):
+        if args.think:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think))
+        await timed(stats, 'POST /test/<id>/answer', client.request(
+            'POST', f'/test/{test_id}/answer',
+            {'question_id': question_id, 'selected_answer': rng.randint(1, 4)}), {200})
+
+    await timed(stats, 'POST /test/<id>/submit', client.request(
+        'POST', f'/test/{test_id}/submit'), {302})
+    await timed(stats, 'GET /test/<id>/results', client.request(
+        'GET', f'/test/{test_id}/results'), {200})
+
+
+async def setup(args, emails):
+    """
+    Register the student accounts and look up the exam (not measured).
+
+    Returns:
+        int: Exam ID
+    """
+    gate = asyncio.Semaphore(args.setup_concurrency)
+
+    async def register(email):
+        async with gate:
+            client = Client(args.url, args.timeout)
+            # 302 for a new account, 200 with a flash when it already exists
+            await timed(Stats(), 'register', client.request('POST', '/register', {
+                'email': email, 'password': args.password, 'password_confirm': args.password,
+            }), {200, 302})
+
+    await asyncio.gather(*(register(email) for email in emails))
+
+    client = Client(args.url, args.timeout)
+    await timed(Stats(), 'login', client.request(
+        'POST', '/login', {'email': emails[0], 'password': args.password}), {302})
+    _, body = await timed(Stats(), 'exams', client.request('GET', '/exams'), {200})
+    exam_id = find_exam_id(body.decode('utf-8'), args.exam)
+    if exam_id is None:
+        raise LoadTestError(f"Exam '{args.exam}' is not on /exams; seed the database first")
+    return exam_id
+
+
+async def run(args):
+    emails = [f'loadtest-{n}@example.com' for n in range(args.users)]
+    exam_id = await setup(args, emails)
+
+    stats = Stats()
+    failures = []
+
+    async def student(n, email):
+        if args.ramp:
+            await asyncio.sleep(args.ramp * n / args.users)
+        try:
+            await take_exam(args, stats, email, exam_id, args.seed * 1_000_003 + n)
+        except LoadTestError as e:
+            failures.append(str(e))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(student(n, email) for n, email in enumerate(emails)))
+    elapsed = time.perf_counter() - start
+    return stats.report(elapsed), elapsed, failures
+
+
+def print_report(report, elapsed, users, failures):
+    print(f"Load test: {users} students, {elapsed:.1f} s")
+    print(f"{'route':<28}{'count':>8}{'errors':>8}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'req/s':>9}")
+    for route, row in report.items():
+        print(f"{route:<28}{row['count']:>8}{row['errors']:>8}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['rps']:>9.1f}")
+    total = sum(row['count'] for row in report.values())
+    print(f"Total: {total} requests, {total / elapsed:.1f} req/s, {len(failures)} student(s) failed")
+    for failure in sorted(set(failures))[:10]:
+        print(f"  ❌ {failure}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate concurrent exam takers against a running server')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Server base URL')
+    parser.add_argument('--users', type=int, default=500, help='Concurrent students')
+    parser.add_argument('--exam', default=DEFAULT_EXAM, help='Exam name as shown on /exams')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the answers each student picks')
+    parser.add_argument('--ramp', type=float, default=0.0, help='Seconds over which students start')
+    parser.add_argument('--think', type=float, default=0.0, help='Mean seconds between answers')
+    parser.add_argument('--password', default='loadtest', help='Password of the student accounts')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds before a request fails')
+    parser.add_argument('--setup-concurrency', type=int, default=20, help='Parallel registrations')
+    parser.add_argument('--json', metavar='PATH', help='Also write the report as JSON')
+    args = parser.parse_args()
+
+    try:
+        report, elapsed, failures = asyncio.run(run(args))
+    except (LoadTestError, OSError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print_report(report, elapsed, args.users, failures)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'users': args.users, 'seed': args.seed, 'elapsed': elapsed,
+                       'failed_students': len(failures), 'routes': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
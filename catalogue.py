@@ -0,0 +1,257 @@
+"""
+Exam catalogue cache
+
+The exam list and the per-section-name question pools are read on every
+dashboard and random exam request but only change when content is edited.
+They are cached under a global content generation: any committed ORM write
+to exams, sections, questions or their links (importer, reload, mycontent,
+admin) bumps the generation, which makes every entry of the old generation
+unreachable. Random, adaptive and review exams generated for one student
+(is_generated) are not part of the catalogue, so creating them does not.
+
+Two layers:
+    per process - the last value of each entry together with its generation
+    shared      - optional store from stores.py, so one worker's rebuild
+                  serves the others and a bump is seen by every process
+
+Backends (CATALOGUE_BACKEND):
+    local            - generation and entries in the process only; writes
+                       made by other processes show up after CATALOGUE_TTL
+    memory/sql/redis - generation and entries in a shared store; the
+                       generation is re-read at most every
+                       CATALOGUE_GENERATION_CHECK seconds
+"""
+
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from nihongo.models import db
+from nihongo.models.exam import Exam
+from nihongo.models.user import User
+from nihongo.models.question import Question
+from nihongo.models.section import Section
+from nihongo.models.exam_section import ExamSection
+from nihongo.models.section_question import SectionQuestion
+from nihongo.stores import create_store
+from nihongo.metrics import CACHE_LOOKUPS
+from nihongo.replicas import primary_reads
+
+CATALOGUE_KEY_PREFIX = 'catalogue:'
+CONTENT_MODELS = (Exam, Section, Question, ExamSection, SectionQuestion)
+
+
+class Catalogue:
+    """Generation-keyed cache of catalogue entries (JSON-serializable values)"""
+
+    def __init__(self, store=None, ttl=300, check_interval=1.0):
+        self.store = store
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._generation = None
+        self._checked_at = 0.0
+        self._entries = {}  # name -> (generation, value, loaded_at)
+        self._lock = threading.Lock()
+
+    def generation(self):
+        """Current content generation"""
+        with self._lock:
+            if self.store is None:
+                if self._generation is None:
+                    self._generation = uuid.uuid4().hex
+                return self._generation
+            if self._generation is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._generation
+
+        generation = self.store.get(f'{CATALOGUE_KEY_PREFIX}generation')
+        if generation is None:
+            generation = self.bump()
+        else:
+            generation = generation.decode('ascii')
+            with self._lock:
+                self._generation = generation
+                self._checked_at = time.monotonic()
+        return generation
+
+    def bump(self):
+        """Start a new generation (after a content write). Returns the new generation."""
+        generation = uuid.uuid4().hex
+        if self.store is not None:
+            self.store.set(f'{CATALOGUE_KEY_PREFIX}generation', generation.encode('ascii'))
+        with self._lock:
+            self._generation = generation
+            self._checked_at = time.monotonic()
+            self._entries.clear()
+        return generation
+
+    def get(self, name, loader):
+        """
+        Get an entry of the current generation, loading it on a miss.
+
+        Args:
+            name: Entry name
+            loader: Callable returning the JSON-serializable value from the database
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        # Read the generation before loading, so a write committed during the
+        # load leaves the value under the old generation
+        generation = self.generation()
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is not None and entry[0] == generation and time.monotonic() - entry[2] < self.ttl:
+            CACHE_LOOKUPS.inc(cache='catalogue', result='hit')
+            return entry[1]
+
+        value = None
+        key = f'{CATALOGUE_KEY_PREFIX}{generation}:{name}'
+        if self.store is not None:
+            data = self.store.get(key)
+            if data is not None:
+                value = json.loads(data.decode('utf-8'))
+        CACHE_LOOKUPS.inc(cache='catalogue', result='miss' if value is None else 'hit')
+        if value is None:
+            with primary_reads():  # A lagging replica would store old content under this generation
+                value = loader()
+            if self.store is not None:
+                data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                self.store.set(key, data, ttl=self.ttl)
+
+        with self._lock:
+            self._entries[name] = (generation, value, time.monotonic())
+        return value
+
+
+def init_catalogue(app):
+    """
+    Create the catalogue cache selected by CATALOGUE_BACKEND.
+
+    Args:
+        app: Flask application
+
+    Returns:
+        Catalogue
+    """
+    backend = app.config.get('CATALOGUE_BACKEND', 'local')
+    store = None if backend == 'local' else create_store(backend, app)
+    catalogue = Catalogue(
+        store,
+        app.config.get('CATALOGUE_TTL', 300),
+        app.config.get('CATALOGUE_GENERATION_CHECK', 1.0)
+    )
+    app.extensions['catalogue'] = catalogue
+    return catalogue
+
+
+def bump_content_generation():
+    """Invalidate the catalogue after content writes that bypass the ORM unit of work (bulk statements)"""
+    if has_app_context() and 'catalogue' in current_app.extensions:
+        current_app.extensions['catalogue'].bump()
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_content_writes(session, flush_context):
+    # Sections of generated exams written in this transaction, so their links are
+    # recognised without a query (the links are usually flushed after the section)
+    generated_sections = session.info.setdefault('generated_sections', set())
+    changed = False
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(instance, CONTENT_MODELS):
+            continue
+        if isinstance(instance, (Exam, Section)) and instance.is_generated:
+            if isinstance(instance, Section):
+                generated_sections.add(instance.id)
+        elif not (isinstance(instance, (ExamSection, SectionQuestion)) and instance.section_id in generated_sections):
+            changed = True
+    if changed:
+        session.info['catalogue_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_on_commit(session):
+    session.info.pop('generated_sections', None)
+    if session.info.pop('catalogue_changed', False):
+        bump_content_generation()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('catalogue_changed', None)
+    session.info.pop('generated_sections', None)
+
+
+def _load_exams():
+    rows = db.session.query(
+        Exam.id, Exam.name, Exam.created_at, User.email
+    ).outerjoin(User, User.id == Exam.created_by).filter(
+        Exam.is_generated.is_(False)
+    ).order_by(Exam.id).all()
+    return [
+        {'id': exam_id, 'name': name, 'created_at': created_at.isoformat(), 'creator_email': email}
+        for exam_id, name, created_at, email in rows
+    ]
+
+
+def _load_sections():
+    rows = db.session.query(
+        Section.name, SectionQuestion.section_id, SectionQuestion.question_id
+    ).join(
+        Section, Section.id == SectionQuestion.section_id
+    ).filter(
+        Section.is_generated.is_(False)
+    ).order_by(Section.id, SectionQuestion.id).all()
+
+    sections = {}
+    for name, section_id, question_id in rows:
+        entry = sections.setdefault(name, {'count': 0, 'section_ids': [], 'question_ids': set()})
+        entry['count'] += 1
+        if not entry['section_ids'] or entry['section_ids'][-1] != section_id:
+            entry['section_ids'].append(section_id)
+        entry['question_ids'].add(question_id)
+    for entry in sections.values():
+        entry['question_ids'] = sorted(entry['question_ids'])
+    return sections
+
+
+def get_exams():
+    """
+    All exams for the dashboard except generated ones, without touching the database on a hit.
+
+    Returns:
+        list: Objects with id, name, created_at and creator.email (like Exam), by id
+    """
+    return [
+        SimpleNamespace(
+            id=exam['id'], name=exam['name'], created_at=datetime.fromisoformat(exam['created_at']),
+            creator=SimpleNamespace(email=exam['creator_email'])
+        )
+        for exam in current_app.extensions['catalogue'].get('exams', _load_exams)
+    ]
+
+
+def get_section_catalogue():
+    """
+    Sections with questions, aggregated by name.
+
+    Returns:
+        dict: {name: {'name', 'count', 'section_ids'}}; count includes
+        questions linked to several sections of the same name
+    """
+    sections = current_app.extensions['catalogue'].get('sections', _load_sections)
+    return {
+        name: {'name': name, 'count': entry['count'], 'section_ids': entry['section_ids']}
+        for name, entry in sections.items()
+    }
+
+
+def get_section_pool(section_name):
+    """Distinct question ids of all sections with this name, ascending"""
+    sections = current_app.extensions['catalogue'].get('sections', _load_sections)
+    entry = sections.get(section_name)
+    return list(entry['question_ids']) if entry else []
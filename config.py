@@ -32,9 +32,85 @@ class Config:
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     
+    # Session storage: 'cookie' (signed cookie), or a server-side store: 'memory', 'sql', 'redis'
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cookie')
+    STORE_REDIS_URL = os.environ.get('STORE_REDIS_URL', 'redis://localhost:6379/0')
+    
     # Application settings
     QUESTIONS_PER_PAGE = 50
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file upload
+    MEDIA_PREFETCH_AHEAD = 3  # Audio/image items to prefetch ahead of the current question
+    
+    # In-progress test state cache: 'local' (per-process LRU) or a shared store: 'memory', 'sql', 'redis'
+    TEST_STATE_BACKEND = os.environ.get('TEST_STATE_BACKEND', 'local')
+    TEST_STATE_CACHE_SIZE = 1024  # Tests kept by the 'local' LRU
+    TEST_STATE_TTL = 6 * 3600  # Seconds a state is kept in a shared store
+    
+    # Exam catalogue cache: 'local' (per process) or a shared store: 'memory', 'sql', 'redis'
+    CATALOGUE_BACKEND = os.environ.get('CATALOGUE_BACKEND', 'local')
+    CATALOGUE_TTL = 300  # Seconds an entry is kept (also bounds staleness of 'local' across processes)
+    CATALOGUE_GENERATION_CHECK = 1.0  # Seconds between reads of the shared generation
+    
+    # Full-page cache of anonymous pages (login, register), per process
+    PAGE_CACHE_TTL = 300  # Seconds a rendered page is served
+    PAGE_CACHE_MAX_BYTES = 4 * 1024 * 1024  # Total size of cached pages
+    
+    # On-demand request profiling by admins with ?_profile=1 (see profiling.py)
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'True').lower() == 'true'
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(basedir, 'profiles')
+    PROFILE_KEEP = 50  # Newest profiles kept on disk
+    PROFILE_INTERVAL = 0.001  # Seconds between stack samples
+    
+    # Background jobs run by `flask jobs-worker` (see jobs.py)
+    JOBS_INLINE = os.environ.get('JOBS_INLINE', 'False').lower() == 'true'  # Run jobs in the request instead
+    JOB_MAX_ATTEMPTS = 3  # Runs before a job fails
+    JOB_RETRY_DELAY = 30  # Seconds before the first retry, doubled per attempt
+    JOB_STALE_AFTER = 1800  # Seconds without a heartbeat before a running job is requeued
+    JOB_PROGRESS_INTERVAL = 0.5  # Seconds between progress writes
+    JOB_HEARTBEAT_INTERVAL = 60  # Seconds between heartbeats of a running job (well below JOB_STALE_AFTER)
+    JOB_OUTPUT_DIR = os.environ.get('JOB_OUTPUT_DIR') or os.path.join(basedir, 'job_output')  # Export files
+    
+    # Write-behind buffer for autosaved answers (see answer_buffer.py)
+    ANSWER_BUFFER_ENABLED = os.environ.get('ANSWER_BUFFER_ENABLED', 'False').lower() == 'true'
+    ANSWER_BUFFER_DIR = os.environ.get('ANSWER_BUFFER_DIR') or os.path.join(basedir, 'answer_log')  # Local disk
+    ANSWER_BUFFER_FLUSH_INTERVAL = 0.25  # Seconds between bulk writes to test_answers
+    ANSWER_BUFFER_FSYNC = os.environ.get('ANSWER_BUFFER_FSYNC', 'True').lower() == 'true'  # fsync before acknowledging
+    
+    # ASGI mode: async autosave and test state, Flask for the rest (see asgi.py)
+    ASGI_DATABASE_URL = os.environ.get('ASGI_DATABASE_URL')  # Async driver URL, derived from the app's when unset
+    ASGI_DB_POOL_SIZE = 10  # Connections of the async engine
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 10))  # Threads serving the Flask routes
+
+    # Read replicas for the read-only pages (see replicas.py); comma-separated URLs, none by default
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    REPLICA_STICKY_SECONDS = 10  # Reads stay on the primary this long after a user's own write
+    REPLICA_RETRY_AFTER = 30  # Seconds a failed replica is left out of rotation
+
+    # Structured logs through a background writer thread (see structured_log.py)
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # 'json' or 'text'
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FILE = os.environ.get('LOG_FILE')  # stderr when not set
+    REQUEST_LOG_ENABLED = os.environ.get('REQUEST_LOG_ENABLED', 'True').lower() == 'true'
+    
+    # Prometheus metrics at GET /metrics (see metrics.py)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')  # Shared by all gunicorn workers
+    METRICS_FLUSH_INTERVAL = 5.0  # Seconds between writes of a worker's metrics file
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token required to scrape, if set
+    
+    # Archive answers of submitted tests as packed vectors instead of test_answers rows
+    COMPACT_ANSWERS_ON_SUBMIT = os.environ.get('COMPACT_ANSWERS_ON_SUBMIT', 'False').lower() == 'true'
+    
+    # Minimum percentage counted as a pass in the analytics rollups
+    PASS_PERCENTAGE = 60
+    
+    # Adaptive practice (see adaptive.py)
+    ADAPTIVE_RECENCY_DAYS = 3  # Questions seen this recently are drawn less often
+    ADAPTIVE_SAMPLER_CACHE_SIZE = 1024  # (user, section name) samplers kept per process
+    ADAPTIVE_SAMPLER_TTL = 600  # Seconds before a sampler is rebuilt from the database
+    
+    # Spaced-repetition review (see srs.py)
+    REVIEW_SESSION_SIZE = 20  # Due cards per review session
     
     @classmethod
     def init_app(cls, app):
@@ -54,6 +130,10 @@ class DevelopmentConfig(Config):
     
     # More verbose logging
     SQLALCHEMY_ECHO = os.environ.get('SQL_ECHO', 'False').lower() == 'true'
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # Readable in a terminal
+    
+    # Imports run in the request unless a jobs worker is started
+    JOBS_INLINE = os.environ.get('JOBS_INLINE', 'True').lower() == 'true'
     
     # Disable CSRF for easier development (re-enable for production)
     WTF_CSRF_ENABLED = True
@@ -68,6 +148,10 @@ class ProductionConfig(Config):
     # PostgreSQL for production
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     
+    # Several workers: test state shared through the database, so a reload served by
+    # another worker shows every autosaved answer
+    TEST_STATE_BACKEND = os.environ.get('TEST_STATE_BACKEND', 'sql')
+    
     # Handle Heroku's postgres:// URL format (should be postgresql://)
     if SQLALCHEMY_DATABASE_URI and SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace('postgres://', 'postgresql://', 1)
@@ -104,6 +188,9 @@ class TestingConfig(Config):
     
     # Faster password hashing for tests
     BCRYPT_LOG_ROUNDS = 4
+    
+    # Keep request and import logs out of the test output
+    LOG_LEVEL = 'WARNING'
 
 
 # Configuration dictionary
@@ -0,0 +1,151 @@
+"""
+JSON Exam Exporter for JLPT Test Manager
+
+Writes exams back out in the format import_exam_from_json consumes, so
+content can be backed up or moved between databases. Exams are streamed:
+the questions of an exam are read with a server-side cursor and the JSON
+is produced piece by piece by a generator, so memory use does not depend
+on the size of the exam or of the question bank.
+"""
+
+import json
+import os
+from nihongo.models import db
+from nihongo.models.question import Question
+from nihongo.models.section import Section
+from nihongo.models.section_question import SectionQuestion
+from nihongo.models.exam import Exam
+from nihongo.models.exam_section import ExamSection
+
+EXPORT_BATCH_SIZE = 500  # Rows fetched per round trip from the server-side cursor
+OPTIONAL_FIELDS = ('question_image', 'question_audio')
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def question_to_json(row):
+    """
+    Question in import format.
+
+    Args:
+        row: Object with the Question columns
+
+    Returns:
+        dict: Question fields; empty optional fields are left out and
+        multi-language explanations are returned as dicts
+    """
+    data = {'question_text': row.question_text}
+    for field in OPTIONAL_FIELDS:
+        if getattr(row, field):
+            data[field] = getattr(row, field)
+    for field in ('answer_1', 'answer_2', 'answer_3', 'answer_4', 'correct_answer'):
+        data[field] = getattr(row, field)
+
+    if row.explanation:
+        try:
+            explanation = json.loads(row.explanation)
+        except ValueError:
+            explanation = row.explanation
+        data['explanation'] = explanation if isinstance(explanation, dict) else row.explanation
+    return data
+
+
+def iter_exam_json(exam):
+    """
+    Generate the JSON document of an exam in chunks.
+
+    Sections without questions are left out, as the importer rejects them.
+
+    Args:
+        exam: Exam (or any object with id and name)
+
+    Yields:
+        str: Consecutive pieces of the document
+    """
+    yield f'{{\n  "name": {_dumps(exam.name)},\n  "sections": ['
+
+    rows = db.session.execute(
+        db.select(
+            ExamSection.id.label('exam_section_id'), Section.name.label('section_name'),
+            Question.question_text, Question.question_image, Question.question_audio,
+            Question.answer_1, Question.answer_2, Question.answer_3, Question.answer_4,
+            Question.correct_answer, Question.explanation
+        ).select_from(ExamSection).join(
+            Section, Section.id == ExamSection.section_id
+        ).join(
+            SectionQuestion, SectionQuestion.section_id == ExamSection.section_id
+        ).join(
+            Question, Question.id == SectionQuestion.question_id
+        ).where(
+            ExamSection.exam_id == exam.id
+        ).order_by(
+            ExamSection.order, ExamSection.id, SectionQuestion.order, SectionQuestion.id
+        ).execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    current_section = None
+    for row in rows:
+        if row.exam_section_id != current_section:
+            if current_section is not None:
+                yield '\n      ]\n    },'
+            yield f'\n    {{\n      "name": {_dumps(row.section_name)},\n      "questions": ['
+            separator = '\n'
+            current_section = row.exam_section_id
+        question = json.dumps(question_to_json(row), ensure_ascii=False, indent=2)
+        yield separator + '\n'.join('        ' + line for line in question.split('\n'))
+        separator = ',\n'
+
+    if current_section is not None:
+        yield '\n      ]\n    }\n  '
+    yield ']\n}\n'
+
+
+def find_exam(exam_name_or_id):
+    """Exam by ID (int) or name, or None"""
+    if isinstance(exam_name_or_id, int):
+        return db.session.get(Exam, exam_name_or_id)
+    return Exam.query.filter_by(name=exam_name_or_id).first()
+
+
+def export_exam_to_json(exam_name_or_id, out):
+    """
+    Export an exam as JSON to a text stream.
+
+    Args:
+        exam_name_or_id: Name or ID of the exam
+        out: Writable text stream
+
+    Returns:
+        tuple: (success: bool, message: str, exam: Exam or None)
+    """
+    exam = find_exam(exam_name_or_id)
+    if not exam:
+        return False, f"Exam '{exam_name_or_id}' not found", None
+
+    for chunk in iter_exam_json(exam):
+        out.write(chunk)
+    return True, f"Exported exam '{exam.name}'", exam
+
+
+def export_exam_to_file(exam_name_or_id, file_path):
+    """
+    Export an exam to a JSON file.
+
+    Args:
+        exam_name_or_id: Name or ID of the exam
+        file_path: Path of the file to write
+
+    Returns:
+        tuple: (success: bool, message: str, exam: Exam or None)
+    """
+    try:
+        with open(file_path, 'w', encoding='utf-8') as f:
+            success, message, exam = export_exam_to_json(exam_name_or_id, f)
+    except OSError as e:
+        return False, f"Error writing file: {str(e)}", None
+
+    if not success:
+        os.remove(file_path)
+    return success, message, exam
@@ -0,0 +1,113 @@
+"""
+HTTP conditional GET for pages that only change on known events
+
+The results page of a completed test and the exam history of a user are
+rendered from data that changes rarely: the test itself is immutable once
+submitted, and the page only changes when a question is edited, the exam
+is renamed, the user submits another test or switches language. Each page
+derives a strong ETag and a Last-Modified date from those inputs with
+narrow queries, so a revisit is answered with 304 Not Modified before any
+question loading or template rendering.
+
+Responses are marked ``Cache-Control: private, no-cache``: browsers keep
+them but revalidate on every visit, and shared caches never store them.
+"""
+
+import hashlib
+from flask import request, session, make_response
+from sqlalchemy import func
+from werkzeug.http import is_resource_modified
+from nihongo.models import db
+from nihongo.metrics import CACHE_LOOKUPS
+from nihongo.models.exam import Exam
+from nihongo.models.test import Test
+from nihongo.models.question import Question
+from nihongo.models.exam_section import ExamSection
+from nihongo.models.section_question import SectionQuestion
+from nihongo.i18n import get_locale_name
+
+CACHE_CONTROL = 'private, no-cache'
+_VALIDATOR_VERSION = '1'  # Bump when the pages change in ways the validators do not cover
+
+
+class Validators:
+    """ETag and Last-Modified of one page"""
+
+    def __init__(self, parts, last_modified):
+        digest = hashlib.sha1(repr((_VALIDATOR_VERSION, get_locale_name(), *parts)).encode('utf-8'))
+        self.etag = digest.hexdigest()
+        # HTTP dates have second precision
+        self.last_modified = last_modified.replace(microsecond=0) if last_modified else None
+
+    def not_modified(self):
+        """
+        304 response if the client's copy is current, else None.
+
+        Pending flash messages always get a full page, since they are only
+        shown when the page is rendered.
+        """
+        if session.get('_flashes'):
+            return None
+        if is_resource_modified(request.environ, etag=self.etag, last_modified=self.last_modified):
+            CACHE_LOOKUPS.inc(cache='http', result='miss')
+            return None
+        CACHE_LOOKUPS.inc(cache='http', result='hit')
+        response = make_response('', 304)
+        return self.apply(response)
+
+    def apply(self, response):
+        """Attach the validators to a response"""
+        response = make_response(response)
+        response.set_etag(self.etag)
+        if self.last_modified:
+            response.last_modified = self.last_modified
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
+
+
+def _exam_content(exam_ids):
+    """(link count, link id sum, latest question edit) of the questions of some exams"""
+    count, id_sum, updated_at = db.session.query(
+        func.count(SectionQuestion.id), func.sum(SectionQuestion.id), func.max(Question.updated_at)
+    ).select_from(ExamSection).join(
+        SectionQuestion, SectionQuestion.section_id == ExamSection.section_id
+    ).join(
+        Question, Question.id == SectionQuestion.question_id
+    ).filter(ExamSection.exam_id.in_(exam_ids)).one()
+    return count, id_sum, updated_at
+
+
+def results_validators(test):
+    """
+    Validators of the results page of a completed test.
+
+    Covers the test and its stored score, the exam name, which questions the
+    exam has and their latest edit (text, answer key, explanation).
+    """
+    count, id_sum, updated_at = _exam_content([test.exam_id])
+    exam_name = db.session.query(Exam.name).filter(Exam.id == test.exam_id).scalar()
+    parts = ('results', test.user_id, test.id, test.completed_at, test.correct_count, test.total_questions,
+             exam_name, count, id_sum, updated_at)
+    return Validators(parts, max(filter(None, (test.completed_at, updated_at))))
+
+
+def history_validators(user_id):
+    """
+    Validators of a user's exam history.
+
+    Covers the user's completed tests (count, latest completion, stored
+    scores) and the exam names. Tests without a stored score are scored from
+    their exam's questions, so their questions' latest edit is included too.
+    """
+    rows = db.session.query(
+        Test.id, Test.correct_count, Test.total_questions, Test.exam_id, Exam.name, Test.completed_at
+    ).join(Exam, Exam.id == Test.exam_id).filter(
+        Test.user_id == user_id,
+        Test.completed_at.isnot(None)
+    ).order_by(Test.id).all()
+
+    unscored = [row.exam_id for row in rows if row.total_questions is None]
+    content = _exam_content(unscored) if unscored else None
+    last_modified = max((row.completed_at for row in rows), default=None)
+    parts = ('history', user_id, [tuple(row) for row in rows], content)
+    return Validators(parts, last_modified)
@@ -0,0 +1,106 @@
+"""
+Translation catalogue cache
+
+Compiled .mo catalogues are read once per process into immutable in-memory
+tables, so gettext lookups are a dict access instead of going through
+Flask-Babel's per-request translation loading.
+"""
+
+import os
+import threading
+from types import MappingProxyType
+from babel.messages.mofile import read_mo
+from flask import current_app, g, has_request_context
+from flask_babel import get_locale
+
+# Translation directory -> {locale: {msgid: msgstr}}, filled once per process
+_catalogue_cache = {}
+_catalogue_lock = threading.Lock()
+
+
+def load_catalogues(translations_dir):
+    """
+    Load all compiled catalogues from a translations directory.
+
+    Args:
+        translations_dir: Directory laid out as <locale>/LC_MESSAGES/messages.mo
+
+    Returns:
+        MappingProxyType: Read-only mapping of locale -> read-only {msgid: msgstr}
+    """
+    catalogues = {}
+    if os.path.isdir(translations_dir):
+        for locale in sorted(os.listdir(translations_dir)):
+            mo_path = os.path.join(translations_dir, locale, 'LC_MESSAGES', 'messages.mo')
+            if not os.path.isfile(mo_path):
+                continue
+
+            with open(mo_path, 'rb') as f:
+                catalog = read_mo(f)
+
+            messages = {}
+            for message in catalog:
+                # Skip the header entry and plural forms (not used by the app)
+                if not message.id or not isinstance(message.id, str):
+                    continue
+                if message.string:
+                    messages[message.id] = message.string
+            catalogues[locale] = MappingProxyType(messages)
+
+    return MappingProxyType(catalogues)
+
+
+def get_catalogues():
+    """
+    Get the catalogues for the current app, loading them on first use.
+
+    Returns:
+        MappingProxyType: Read-only mapping of locale -> read-only {msgid: msgstr}
+    """
+    translations_dir = os.path.join(
+        current_app.root_path,
+        current_app.config.get('BABEL_TRANSLATION_DIRECTORIES', 'translations')
+    )
+
+    catalogues = _catalogue_cache.get(translations_dir)
+    if catalogues is None:
+        with _catalogue_lock:
+            catalogues = _catalogue_cache.get(translations_dir)
+            if catalogues is None:
+                catalogues = load_catalogues(translations_dir)
+                _catalogue_cache[translations_dir] = catalogues
+    return catalogues
+
+
+def get_locale_name():
+    """
+    Get the current locale as a string, resolved at most once per request.
+
+    Returns:
+        Locale name such as 'es' or 'en'
+    """
+    if not has_request_context():
+        return current_app.config.get('BABEL_DEFAULT_LOCALE', 'es')
+
+    locale_name = g.get('locale_name')
+    if locale_name is None:
+        locale_name = str(get_locale())
+        g.locale_name = locale_name
+    return locale_name
+
+
+def gettext(string, **variables):
+    """
+    Translate a string into the current locale.
+
+    Args:
+        string: Message id
+        **variables: Values interpolated with %-formatting after translation
+
+    Returns:
+        Translated string (the message id itself if there is no translation)
+    """
+    messages = get_catalogues().get(get_locale_name())
+    if messages is not None:
+        string = messages.get(string, string)
+    return string % variables if variables else string
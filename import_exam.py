@@ -5,6 +5,8 @@ This module provides functionality to import exams from JSON files.
 """
 
 import json
+import logging
+import time
 from nihongo.models import db
 from nihongo.models.user import User
 from nihongo.models.question import Question
@@ -12,15 +14,42 @@ from nihongo.models.section import Section
 from nihongo.models.section_question import SectionQuestion
 from nihongo.models.exam import Exam
 from nihongo.models.exam_section import ExamSection
+from nihongo.metrics import EXAM_IMPORTS, EXAM_IMPORT_SECONDS
+from nihongo.query_counter import QueryCounter
+from nihongo.structured_log import get_logger, log_event, timed_phase
 
+logger = get_logger('import')
 
-def import_exam_from_json(json_data, user_id):
+
+def _log_result(event, result, seconds, queries, phases, json_data, **fields):
+    """Log an import or reload with its phase timings and SQL statement count"""
+    success, message, exam = result
+    sections = json_data.get('sections') if isinstance(json_data, dict) else None
+    if not success:
+        fields['error'] = message
+    log_event(
+        logger, event, level=logging.INFO if success else logging.WARNING,
+        result='success' if success else 'error',
+        exam_id=exam.id if exam else None,
+        sections=len(sections) if isinstance(sections, list) else None,
+        duration_ms=round(seconds * 1000, 2),
+        sql_count=queries.count,
+        **phases,
+        **fields,
+    )
+
+
+def import_exam_from_json(json_data, user_id, phases=None, progress=None, raise_errors=False):
     """
     Import an exam from JSON data.
     
     Args:
         json_data: Dictionary containing exam data (can be from JSON file)
         user_id: ID of the user creating the exam
+        phases: Timings of earlier phases (e.g. read_ms) to log with the import
+        progress: Called as progress(fraction, message) after each section
+        raise_errors: Re-raise unexpected errors (after the rollback and the log
+            line) instead of returning them as the message
     
     Returns:
         tuple: (success: bool, message: str, exam: Exam or None)
@@ -48,7 +77,24 @@ def import_exam_from_json(json_data, user_id):
         ]
     }
     """
-    
+    phases = dict(phases or {})
+    start = time.perf_counter()
+    with QueryCounter(db.engine, current_thread=True) as queries:
+        try:
+            result = _import_exam_from_json(json_data, user_id, phases, progress, raise_errors)
+        except Exception as e:
+            result = (False, f"Error importing exam: {str(e)}", None)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            EXAM_IMPORT_SECONDS.observe(seconds)
+            EXAM_IMPORTS.inc(result='success' if result[0] else 'error')
+            _log_result('exam_import', result, seconds, queries, phases, json_data, user_id=user_id)
+    return result
+
+
+def _import_exam_from_json(json_data, user_id, phases, progress, raise_errors):
+    """Body of import_exam_from_json, timed by the wrapper"""
     try:
         # Validate user exists
         user = User.query.get(user_id)
@@ -151,9 +197,13 @@ def import_exam_from_json(json_data, user_id):
                 order=section_order
             )
             db.session.add(exam_section)
+            if progress:
+                progress(section_order / len(json_data['sections']),
+                         f"Section {section_order} of {len(json_data['sections'])} imported")
         
         # Commit all changes
-        db.session.commit()
+        with timed_phase(phases, 'commit'):
+            db.session.commit()
         
         total_questions = sum(len(s['questions']) for s in json_data['sections'])
         message = f"Successfully imported exam '{exam.name}' with {len(json_data['sections'])} sections and {total_questions} questions"
@@ -162,6 +212,8 @@ def import_exam_from_json(json_data, user_id):
         
     except Exception as e:
         db.session.rollback()
+        if raise_errors:
+            raise
         return False, f"Error importing exam: {str(e)}", None
 
 
@@ -177,9 +229,10 @@ def import_exam_from_file(file_path, user_id):
         tuple: (success: bool, message: str, exam: Exam or None)
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
+        phases = {}
+        with timed_phase(phases, 'read'), open(file_path, 'r', encoding='utf-8') as f:
             json_data = json.load(f)
-        return import_exam_from_json(json_data, user_id)
+        return import_exam_from_json(json_data, user_id, phases)
     except FileNotFoundError:
         return False, f"File not found: {file_path}", None
     except json.JSONDecodeError as e:
@@ -188,7 +241,7 @@ def import_exam_from_file(file_path, user_id):
         return False, f"Error reading file: {str(e)}", None
 
 
-def reload_exam_from_json(json_data, exam_name_or_id, user_id):
+def reload_exam_from_json(json_data, exam_name_or_id, user_id, phases=None, progress=None, raise_errors=False):
     """
     Reload/update an existing exam from JSON data.
     This updates questions and sections while preserving user test data.
@@ -197,10 +250,30 @@ def reload_exam_from_json(json_data, exam_name_or_id, user_id):
         json_data: Dictionary containing exam data
         exam_name_or_id: Name or ID of the exam to reload
         user_id: ID of the user performing the reload
+        phases: Timings of earlier phases (e.g. read_ms) to log with the reload
+        progress: Called as progress(fraction, message) after each section
+        raise_errors: Re-raise unexpected errors (after the rollback and the log
+            line) instead of returning them as the message
     
     Returns:
         tuple: (success: bool, message: str, exam: Exam or None)
     """
+    phases = dict(phases or {})
+    start = time.perf_counter()
+    with QueryCounter(db.engine, current_thread=True) as queries:
+        try:
+            result = _reload_exam_from_json(json_data, exam_name_or_id, user_id, phases, progress, raise_errors)
+        except Exception as e:
+            result = (False, f"Error reloading exam: {str(e)}", None)
+            raise
+        finally:
+            _log_result('exam_reload', result, time.perf_counter() - start, queries, phases, json_data,
+                        user_id=user_id, target=str(exam_name_or_id))
+    return result
+
+
+def _reload_exam_from_json(json_data, exam_name_or_id, user_id, phases, progress, raise_errors):
+    """Body of reload_exam_from_json, timed by the wrapper"""
     try:
         # Find the exam
         if isinstance(exam_name_or_id, int):
@@ -338,6 +411,9 @@ def reload_exam_from_json(json_data, exam_name_or_id, user_id):
                     section_question = existing_questions[question_order]
                     # Note: Question is preserved in DB (for test history), just unlinked from section
                     db.session.delete(section_question)
+            if progress:
+                progress(section_order / len(json_data['sections']),
+                         f"Section {section_order} of {len(json_data['sections'])} reloaded")
         
         # Remove sections that no longer exist in JSON
         for section_name, exam_section in existing_exam_sections.items():
@@ -346,7 +422,8 @@ def reload_exam_from_json(json_data, exam_name_or_id, user_id):
                 db.session.delete(exam_section)
         
         # Commit all changes
-        db.session.commit()
+        with timed_phase(phases, 'commit'):
+            db.session.commit()
         
         total_questions = sum(len(s['questions']) for s in json_data['sections'])
         message = f"Successfully reloaded exam '{exam.name}' with {len(json_data['sections'])} sections and {total_questions} questions"
@@ -355,6 +432,8 @@ def reload_exam_from_json(json_data, exam_name_or_id, user_id):
         
     except Exception as e:
         db.session.rollback()
+        if raise_errors:
+            raise
         return False, f"Error reloading exam: {str(e)}", None
 
 
@@ -371,9 +450,10 @@ def reload_exam_from_file(file_path, exam_name_or_id, user_id):
         tuple: (success: bool, message: str, exam: Exam or None)
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
+        phases = {}
+        with timed_phase(phases, 'read'), open(file_path, 'r', encoding='utf-8') as f:
             json_data = json.load(f)
-        return reload_exam_from_json(json_data, exam_name_or_id, user_id)
+        return reload_exam_from_json(json_data, exam_name_or_id, user_id, phases)
     except FileNotFoundError:
         return False, f"File not found: {file_path}", None
     except json.JSONDecodeError as e:
@@ -0,0 +1,316 @@
+"""
+Per-question item statistics
+
+Maintains the question_stats table (attempts, correct count, option pick
+counts and the sums needed for point-biserial discrimination) so authors can
+see which questions are too easy or broken without aggregating test_answers.
+
+- record_test_stats() updates the table in batch when a test is submitted.
+- rebuild_question_stats() recomputes everything in one vectorized NumPy pass
+  over the exported answers of all completed tests.
+"""
+
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.models.question import Question
+from nihongo.models.exam_section import ExamSection
+from nihongo.models.section_question import SectionQuestion
+from nihongo.models.question_stat import QuestionStat
+from nihongo.models.utils import upsert_insert
+from nihongo.answer_vector import unpack_answers
+from nihongo.scoring import get_answer_key
+
+PICK_COLUMNS = ('picks_1', 'picks_2', 'picks_3', 'picks_4')
+
+
+def _ensure_stat_rows(question_ids):
+    """
+    Insert zeroed question_stats rows for questions that have none yet, then
+    lock the test's rows in question id order.
+
+    Concurrent submits of the same exam both insert without an integrity
+    error (ON CONFLICT DO NOTHING), and taking the row locks in one order
+    keeps their grouped UPDATEs from deadlocking (PostgreSQL).
+    """
+    question_ids = sorted(question_ids)
+    insert = upsert_insert(QuestionStat.__table__)
+    db.session.execute(
+        insert.on_conflict_do_nothing(index_elements=['question_id']),
+        [{'question_id': question_id, 'attempts': 0, 'correct_count': 0,
+          'picks_1': 0, 'picks_2': 0, 'picks_3': 0, 'picks_4': 0,
+          'score_sum': 0.0, 'score_sq_sum': 0.0, 'correct_score_sum': 0.0}
+         for question_id in question_ids]
+    )
+    db.session.execute(
+        db.select(QuestionStat.question_id)
+        .where(QuestionStat.question_id.in_(question_ids))
+        .order_by(QuestionStat.question_id)
+        .with_for_update()
+    ).all()
+
+
+def record_test_stats(question_ids, answer_dict, answer_key=None):
+    """
+    Add one completed test to the item statistics. The caller commits.
+
+    Questions are grouped by (picked option, correct) so the whole test is
+    applied with at most nine atomic UPDATE ... SET x = x + n statements
+    (options 1-4 right or wrong, and unanswered), whatever the number of
+    questions.
+
+    Args:
+        question_ids: Ordered question ids of the test's exam
+        answer_dict: {question_id: selected_answer}
+        answer_key: {question_id: correct_answer} (loaded when not given)
+    """
+    question_ids = list(dict.fromkeys(question_ids))
+    if not question_ids:
+        return
+
+    correct_answers = answer_key if answer_key is not None else get_answer_key(question_ids)
+    question_ids = [question_id for question_id in question_ids if question_id in correct_answers]
+
+    groups = {}
+    correct_total = 0
+    for question_id in question_ids:
+        pick = answer_dict.get(question_id) or 0
+        is_correct = pick == correct_answers[question_id]
+        correct_total += is_correct
+        groups.setdefault((pick, is_correct), []).append(question_id)
+
+    score = correct_total / len(question_ids) if question_ids else 0.0
+
+    _ensure_stat_rows(question_ids)
+
+    for (pick, is_correct), ids in groups.items():
+        values = {
+            'attempts': QuestionStat.attempts + 1,
+            'score_sum': QuestionStat.score_sum + score,
+            'score_sq_sum': QuestionStat.score_sq_sum + score * score,
+        }
+        if is_correct:
+            values['correct_count'] = QuestionStat.correct_count + 1
+            values['correct_score_sum'] = QuestionStat.correct_score_sum + score
+        if pick:
+            column = PICK_COLUMNS[pick - 1]
+            values[column] = getattr(QuestionStat, column) + 1
+
+        QuestionStat.query.filter(QuestionStat.question_id.in_(ids)).update(values, synchronize_session=False)
+
+
+def export_answer_arrays(tests=None):
+    """
+    Export completed tests as columnar NumPy arrays, one entry per (test, question).
+
+    Every question of the test's exam is an attempt; unanswered questions
+    have selected == 0. Questions that no longer exist are left out. Answers
+    are read from test_answers rows or packed vectors.
+
+    Args:
+        tests: Completed Test objects to export (default: all completed tests)
+
+    Returns:
+        dict: {
+            'test_ids': int64[n_tests],
+            'test_index': int64[n_attempts] (index into test_ids),
+            'question_ids': int64[n_attempts],
+            'section_ids': int64[n_attempts] (section the question belongs to in the exam),
+            'selected': int8[n_attempts],
+            'correct': int8[n_attempts] (current correct_answer of the question),
+        }
+    """
+    import numpy as np
+
+    if tests is None:
+        tests = Test.query.filter(Test.completed_at.isnot(None)).order_by(Test.id).all()
+
+    test_ids = np.array([test.id for test in tests], dtype=np.int64)
+    empty = np.zeros(0, dtype=np.int64)
+    if not len(test_ids):
+        return {'test_ids': test_ids, 'test_index': empty, 'question_ids': empty, 'section_ids': empty,
+                'selected': empty.astype(np.int8), 'correct': empty.astype(np.int8)}
+
+    # Exam structure: exam_id -> ordered {question_id: section_id}
+    exam_ids = sorted({test.exam_id for test in tests})
+    structure = db.session.query(
+        ExamSection.exam_id, SectionQuestion.question_id, ExamSection.section_id
+    ).join(
+        SectionQuestion, SectionQuestion.section_id == ExamSection.section_id
+    ).filter(
+        ExamSection.exam_id.in_(exam_ids)
+    ).order_by(
+        ExamSection.exam_id, ExamSection.order, SectionQuestion.order, SectionQuestion.id
+    ).all()
+    exam_questions = {exam_id: {} for exam_id in exam_ids}
+    for exam_id, question_id, section_id in structure:
+        exam_questions[exam_id].setdefault(question_id, section_id)  # A question counts once per test
+    exam_arrays = {
+        exam_id: (np.array(list(ids), dtype=np.int64), np.array(list(ids.values()), dtype=np.int64))
+        for exam_id, ids in exam_questions.items()
+    }
+
+    # One attempt per (test, exam question)
+    per_test = [exam_arrays[test.exam_id] for test in tests]
+    lengths = np.array([len(ids) for ids, _ in per_test], dtype=np.int64)
+    test_index = np.repeat(np.arange(len(tests), dtype=np.int64), lengths)
+    question_ids = np.concatenate([ids for ids, _ in per_test])
+    section_ids = np.concatenate([sections for _, sections in per_test])
+
+    # Answers from rows and packed vectors, as parallel arrays
+    index_by_test_id = {test_id: i for i, test_id in enumerate(test_ids.tolist())}
+    answer_test, answer_question, answer_value = [], [], []
+    row_test_ids = [test.id for test in tests if test.answers_packed is None]
+    if row_test_ids:
+        rows = TestAnswer.query.filter(
+            TestAnswer.test_id.in_(row_test_ids),
+            TestAnswer.selected_answer.isnot(None)
+        ).with_entities(TestAnswer.test_id, TestAnswer.question_id, TestAnswer.selected_answer)
+        for test_id, question_id, selected_answer in rows:
+            answer_test.append(index_by_test_id[test_id])
+            answer_question.append(question_id)
+            answer_value.append(selected_answer)
+    for test in tests:
+        if test.answers_packed is not None:
+            for question_id, selected_answer in unpack_answers(test.answers_packed).items():
+                answer_test.append(index_by_test_id[test.id])
+                answer_question.append(question_id)
+                answer_value.append(selected_answer)
+
+    # Join answers onto attempts with a sorted (test, question) key
+    key_base = int(max(question_ids.max(initial=0), max(answer_question, default=0))) + 1
+    attempt_keys = test_index * key_base + question_ids
+    answer_keys = np.array(answer_test, dtype=np.int64) * key_base + np.array(answer_question, dtype=np.int64)
+    answer_values = np.array(answer_value, dtype=np.int8)
+    order = np.argsort(answer_keys, kind='stable')
+    answer_keys = answer_keys[order]
+    answer_values = answer_values[order]
+
+    selected = np.zeros(len(attempt_keys), dtype=np.int8)
+    if len(answer_keys):
+        positions = np.searchsorted(answer_keys, attempt_keys)
+        positions_clipped = np.minimum(positions, len(answer_keys) - 1)
+        found = answer_keys[positions_clipped] == attempt_keys
+        selected[found] = answer_values[positions_clipped[found]]
+
+    # Current answer keys
+    unique_questions = np.unique(question_ids)
+    key_rows = Question.query.filter(
+        Question.id.in_(unique_questions.tolist())
+    ).with_entities(Question.id, Question.correct_answer).all()
+    key_ids = np.array([row[0] for row in key_rows], dtype=np.int64)
+    key_values = np.array([row[1] for row in key_rows], dtype=np.int8)
+    key_order = np.argsort(key_ids)
+    key_ids, key_values = key_ids[key_order], key_values[key_order]
+    # Questions without a key (dangling ids of deleted questions) are not attempts
+    if len(key_ids):
+        positions = np.minimum(np.searchsorted(key_ids, question_ids), len(key_ids) - 1)
+        keyed = key_ids[positions] == question_ids
+        correct = key_values[positions]
+    else:
+        keyed = np.zeros(len(question_ids), dtype=bool)
+        correct = np.zeros(len(question_ids), dtype=np.int8)
+    if not keyed.all():
+        test_index, question_ids, section_ids = test_index[keyed], question_ids[keyed], section_ids[keyed]
+        selected, correct = selected[keyed], correct[keyed]
+
+    return {
+        'test_ids': test_ids,
+        'test_index': test_index,
+        'question_ids': question_ids,
+        'section_ids': section_ids,
+        'selected': selected,
+        'correct': correct,
+    }
+
+
+def compute_question_stats(arrays):
+    """
+    Compute item statistics for every question from exported answer arrays.
+
+    Args:
+        arrays: Output of export_answer_arrays()
+
+    Returns:
+        list: One dict per question with the question_stats column values
+    """
+    import numpy as np
+
+    question_ids = arrays['question_ids']
+    if not len(question_ids):
+        return []
+
+    is_correct = (arrays['selected'] == arrays['correct']).astype(np.float64)
+
+    # Test score = fraction of the test's questions answered correctly
+    n_tests = len(arrays['test_ids'])
+    test_lengths = np.bincount(arrays['test_index'], minlength=n_tests)
+    test_correct = np.bincount(arrays['test_index'], weights=is_correct, minlength=n_tests)
+    scores = np.divide(test_correct, test_lengths, out=np.zeros(n_tests), where=test_lengths > 0)
+    attempt_scores = scores[arrays['test_index']]
+
+    unique_ids, question_index = np.unique(question_ids, return_inverse=True)
+    n_questions = len(unique_ids)
+
+    def per_question(weights=None):
+        return np.bincount(question_index, weights=weights, minlength=n_questions)
+
+    attempts = per_question()
+    correct_count = per_question(is_correct)
+    picks = [per_question((arrays['selected'] == option).astype(np.float64)) for option in (1, 2, 3, 4)]
+    score_sum = per_question(attempt_scores)
+    score_sq_sum = per_question(attempt_scores * attempt_scores)
+    correct_score_sum = per_question(attempt_scores * is_correct)
+
+    return [
+        {
+            'question_id': int(unique_ids[i]),
+            'attempts': int(attempts[i]),
+            'correct_count': int(correct_count[i]),
+            'picks_1': int(picks[0][i]),
+            'picks_2': int(picks[1][i]),
+            'picks_3': int(picks[2][i]),
+            'picks_4': int(picks[3][i]),
+            'score_sum': float(score_sum[i]),
+            'score_sq_sum': float(score_sq_sum[i]),
+            'correct_score_sum': float(correct_score_sum[i]),
+        }
+        for i in range(n_questions)
+    ]
+
+
+def rebuild_question_stats():
+    """
+    Recompute the whole question_stats table from all completed tests.
+
+    Returns:
+        tuple: (tests_processed: int, questions_written: int)
+    """
+    arrays = export_answer_arrays()
+    rows = compute_question_stats(arrays)
+
+    QuestionStat.query.delete(synchronize_session=False)
+    if rows:
+        db.session.execute(db.insert(QuestionStat), rows)
+    db.session.commit()
+
+    return len(arrays['test_ids']), len(rows)
+
+
+def get_question_stats(question_ids):
+    """
+    Get the stored statistics of several questions in one query.
+
+    Args:
+        question_ids: Iterable of question ids
+
+    Returns:
+        dict: {question_id: QuestionStat}
+    """
+    question_ids = list(question_ids)
+    if not question_ids:
+        return {}
+    return {
+        stat.question_id: stat
+        for stat in QuestionStat.query.filter(QuestionStat.question_id.in_(question_ids)).all()
+    }
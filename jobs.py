@@ -0,0 +1,426 @@
+"""
+Background jobs
+
+Slow work (exam imports and reloads, rescoring, exports) is queued as a row
+of the jobs table and run by `flask jobs-worker`, a pool of local worker
+processes polling the table. No broker is needed: a worker claims a job
+with a conditional UPDATE (status 'queued' -> 'running'), so two workers
+never run the same job, on SQLite and PostgreSQL alike.
+
+A handler is a function registered with @job_handler(kind). It gets the job,
+its payload and a progress callback, and returns a JSON-serializable result.
+Raising JobFailed fails the job for good (invalid input); any other
+exception is retried after JOB_RETRY_DELAY seconds, doubling per attempt,
+until the job's max_attempts is used up. A job whose worker died (no
+heartbeat for JOB_STALE_AFTER seconds) goes back to the queue.
+
+While a job runs, a thread writes its heartbeat every JOB_HEARTBEAT_INTERVAL
+seconds through its own connection, so a slow job is not mistaken for a dead
+one. Progress is written through its own connection too, so it is visible
+while the job's transaction is still open. SQLite allows one writer at a
+time, so there progress is only written between transactions (heartbeats
+wait for the lock). Every write of a worker about its job, the final status
+included, only applies while that worker still holds the claim: a worker
+whose job was requeued meanwhile cannot overwrite the new run.
+
+With JOBS_INLINE set (the default in development) a job runs in the request
+that queued it, so a worker is not needed to try the app out.
+
+Usage:
+    job = enqueue_job('export_exam', {'exam_id': 3}, user_id=current_user.id)
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError
+from nihongo.models import db
+from nihongo.models.job import Job
+from nihongo.structured_log import get_logger, log_event
+
+JOB_HANDLERS = {}
+
+logger = get_logger('jobs')
+
+
+class JobFailed(Exception):
+    """Raised by a handler for a failure that retrying cannot fix"""
+
+
+def job_handler(kind):
+    """Register a function as the handler of a job kind"""
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def enqueue_job(kind, payload, user_id=None, max_attempts=None):
+    """
+    Queue a job (or run it right away with JOBS_INLINE).
+
+    Args:
+        kind: Registered handler name
+        payload: JSON-serializable arguments of the handler
+        user_id: User the job belongs to
+        max_attempts: Runs before the job fails, default JOB_MAX_ATTEMPTS
+
+    Returns:
+        Job: The queued (or, inline, finished) job
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload, ensure_ascii=False),
+        created_by=user_id,
+        max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_after=datetime.utcnow(),
+    )
+    db.session.add(job)
+    db.session.commit()
+    log_event(logger, 'job_queued', job_id=job.id, kind=kind, user_id=user_id)
+
+    if current_app.config['JOBS_INLINE']:
+        _run_inline(job)
+    return job
+
+
+def _run_inline(job):
+    # JOBS_INLINE: run the job in this request, retries included (unless delayed)
+    while not job.finished and _claim(job.id, 'inline'):
+        job = run_job(db.session.get(Job, job.id))
+
+
+def _owned(job_id, worker, attempt):
+    """WHERE clause matching a job only while this run (worker and attempt) still holds it"""
+    return (Job.id == job_id, Job.status == 'running', Job.worker == worker, Job.attempts == attempt)
+
+
+class JobProgress:
+    """Progress callback of a running job: progress(fraction, message)"""
+
+    def __init__(self, job, interval):
+        self.job_id = job.id
+        self.worker = job.worker
+        self.attempt = job.attempts
+        self.interval = interval
+        self._written_at = 0.0
+
+    def __call__(self, fraction, message=None, force=False):
+        now = time.monotonic()
+        if not force and now - self._written_at < self.interval:
+            return
+        if db.engine.dialect.name == 'sqlite' and db.session().in_transaction():
+            return  # The job's own transaction holds the only write lock
+        self._written_at = now
+        values = {'heartbeat_at': datetime.utcnow()}
+        if fraction is not None:
+            values['progress'] = max(0.0, min(1.0, fraction))
+        if message is not None:
+            values['progress_message'] = message[:255]
+        with db.engine.begin() as conn:
+            conn.execute(db.update(Job).where(*_owned(self.job_id, self.worker, self.attempt)).values(**values))
+
+
+class _Heartbeat:
+    """Thread writing a running job's heartbeat every interval seconds, through its own connection"""
+
+    def __init__(self, app, job, interval):
+        self.app = app
+        self.owned = _owned(job.id, job.worker, job.attempts)
+        self.job_id = job.id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'job-{job.id}-heartbeat', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stop.wait(self.interval):
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(db.update(Job).where(*self.owned).values(heartbeat_at=datetime.utcnow()))
+                except OperationalError as e:
+                    # SQLite: the job's open transaction holds the write lock; try again next time
+                    log_event(logger, 'job_heartbeat_skipped', level=logging.DEBUG, job_id=self.job_id, error=str(e))
+
+
+def _worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'[:64]
+
+
+def _claim(job_id, worker):
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        db.update(Job)
+        .where(Job.id == job_id, Job.status == 'queued', Job.run_after <= now)
+        .values(status='running', worker=worker, started_at=now, heartbeat_at=now, attempts=Job.attempts + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    db.session.commit()
+    return claimed
+
+
+def requeue_stale_jobs():
+    """Put running jobs whose worker stopped sending heartbeats back in the queue"""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['JOB_STALE_AFTER'])
+    count = db.session.execute(
+        db.update(Job)
+        .where(Job.status == 'running', Job.heartbeat_at < cutoff)
+        .values(status='queued', run_after=datetime.utcnow(), worker=None, error='Worker stopped responding')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if count:
+        log_event(logger, 'jobs_requeued', count=count)
+    return count
+
+
+def claim_next_job(worker=None):
+    """
+    Claim the oldest job that is due.
+
+    Returns:
+        Job or None: The claimed job, now 'running'
+    """
+    worker = worker or _worker_name()
+    while True:
+        job_id = db.session.execute(
+            db.select(Job.id)
+            .where(Job.status == 'queued', Job.run_after <= datetime.utcnow())
+            .order_by(Job.run_after, Job.id)
+            .limit(1)
+        ).scalar()
+        db.session.commit()
+        if job_id is None:
+            return None
+        if _claim(job_id, worker):
+            return db.session.get(Job, job_id)
+        # Another worker was faster, try the next one
+
+
+def _finish(job_id, kind, worker, attempt, values, started, event, level=logging.INFO, **fields):
+    """Record the outcome of a run, unless the job was requeued and claimed again meanwhile"""
+    finished = db.session.execute(
+        db.update(Job)
+        .where(*_owned(job_id, worker, attempt))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    db.session.commit()
+    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    if finished:
+        log_event(logger, event, level=level, job_id=job_id, kind=kind, attempt=attempt,
+                  duration_ms=duration_ms, **fields)
+    else:
+        log_event(logger, 'job_run_superseded', level=logging.WARNING, job_id=job_id, kind=kind,
+                  attempt=attempt, worker=worker, outcome=event, duration_ms=duration_ms)
+    return db.session.get(Job, job_id)
+
+
+def run_job(job):
+    """Run a claimed job and record its result, or its error and the retry"""
+    config = current_app.config
+    job_id, kind, worker, attempt, max_attempts = job.id, job.kind, job.worker, job.attempts, job.max_attempts
+    progress = JobProgress(job, config['JOB_PROGRESS_INTERVAL'])
+    started = time.perf_counter()
+    try:
+        with _Heartbeat(current_app._get_current_object(), job, config['JOB_HEARTBEAT_INTERVAL']):
+            result = JOB_HANDLERS[kind](job, job.payload_data, progress)
+    except Exception as e:
+        db.session.rollback()
+        error = str(e) or e.__class__.__name__
+        retry = not isinstance(e, JobFailed) and attempt < max_attempts
+        if retry:
+            delay = config['JOB_RETRY_DELAY'] * 2 ** (attempt - 1)
+            values = {'status': 'queued', 'run_after': datetime.utcnow() + timedelta(seconds=delay)}
+        else:
+            values = {'status': 'failed', 'finished_at': datetime.utcnow()}
+        return _finish(job_id, kind, worker, attempt, {**values, 'error': error}, started,
+                       'job_retry' if retry else 'job_failed', level=logging.WARNING, error=error)
+
+    return _finish(job_id, kind, worker, attempt, {
+        'status': 'succeeded',
+        'result': json.dumps(result, ensure_ascii=False),
+        'progress': 1.0,
+        'finished_at': datetime.utcnow(),
+    }, started, 'job_succeeded')
+
+
+def run_next_job(worker=None):
+    """Claim and run one job; None when the queue is empty"""
+    job = claim_next_job(worker)
+    return run_job(job) if job else None
+
+
+def retry_job(job):
+    """Queue a failed job again with a fresh set of attempts (or, with JOBS_INLINE, run it)"""
+    job.status = 'queued'
+    job.attempts = 0
+    job.run_after = datetime.utcnow()
+    job.finished_at = None
+    job.progress = 0.0
+    job.progress_message = None
+    db.session.commit()
+    if current_app.config['JOBS_INLINE']:
+        _run_inline(job)
+
+
+def work(app, stop=None, poll_interval=1.0, once=False):
+    """
+    Worker loop: run due jobs until stop is set (or the queue is empty, with once).
+
+    Args:
+        app: Flask app
+        stop: multiprocessing.Event that ends the loop between jobs
+        poll_interval: Seconds to sleep when the queue is empty
+        once: Return when the queue is empty
+
+    Returns:
+        int: Jobs run
+    """
+    ran = 0
+    worker = _worker_name()
+    with app.app_context():
+        log_event(logger, 'worker_started', worker=worker)
+        while stop is None or not stop.is_set():
+            requeue_stale_jobs()
+            job = run_next_job(worker)
+            db.session.remove()
+            if job is not None:
+                ran += 1
+            elif once:
+                break
+            elif stop is not None:
+                stop.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+        log_event(logger, 'worker_stopped', worker=worker, jobs=ran)
+    return ran
+
+
+def _worker_process(stop, poll_interval):
+    # Ctrl-C reaches the whole process group; the parent decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from nihongo.app import app
+    with app.app_context():
+        db.engine.dispose(close=False)  # Connections inherited through fork belong to the parent
+    work(app, stop, poll_interval)
+    logging.shutdown()  # Child processes skip the exit handlers that write out queued log lines
+
+
+def run_workers(processes, poll_interval=1.0):
+    """Run worker processes until SIGINT/SIGTERM; each finishes its current job first"""
+    stop = multiprocessing.Event()
+    children = [
+        multiprocessing.Process(target=_worker_process, args=(stop, poll_interval), name=f'jobs-worker-{n}')
+        for n in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    def request_stop(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for child in children:
+            child.join()
+
+
+# Handlers
+
+@contextmanager
+def _permanent_database_errors():
+    """Fail the job for good on errors of the data itself; others (a lost connection) are retried"""
+    try:
+        yield
+    except (IntegrityError, DataError) as e:
+        raise JobFailed(str(e.orig)) from e
+
+
+@job_handler('import_exam')
+def _import_exam_job(job, payload, progress):
+    from nihongo.import_exam import import_exam_from_json, validate_exam_json
+    from nihongo.metrics import CONTENT_CHANGES
+
+    valid, errors = validate_exam_json(payload['exam'])
+    if not valid:
+        raise JobFailed('; '.join(errors))
+    with _permanent_database_errors():
+        success, message, exam = import_exam_from_json(payload['exam'], job.created_by, progress=progress,
+                                                       raise_errors=True)
+    if not success:
+        raise JobFailed(message)  # Rejected content (or a missing user): the same payload fails again
+    CONTENT_CHANGES.inc(kind='exam', action='import')
+    return {'exam_id': exam.id, 'message': message}
+
+
+@job_handler('reload_exam')
+def _reload_exam_job(job, payload, progress):
+    from nihongo.import_exam import reload_exam_from_json, validate_exam_json
+
+    valid, errors = validate_exam_json(payload['exam'])
+    if not valid:
+        raise JobFailed('; '.join(errors))
+    with _permanent_database_errors():
+        success, message, exam = reload_exam_from_json(payload['exam'], payload['target'], job.created_by,
+                                                       progress=progress, raise_errors=True)
+    if not success:
+        raise JobFailed(message)
+    return {'exam_id': exam.id, 'message': message}
+
+
+@job_handler('rescore')
+def _rescore_job(job, payload, progress):
+    from datetime import date
+    from nihongo.scoring import rescore_tests
+    from nihongo.rollups import recompute_rollups
+
+    days = {key: date.fromisoformat(payload[key]) if payload.get(key) else None for key in ('start_day', 'end_day')}
+    result = rescore_tests(question_ids=payload.get('question_ids'), exam_ids=payload.get('exam_ids'),
+                           progress=progress, **days)
+    if result['changed']:
+        progress(1.0, 'Rebuilding rollups', force=True)
+        recompute_rollups(result['first_day'], result['last_day'])
+    return {
+        'tests': result['tests'],
+        'changed': result['changed'],
+        'first_day': result['first_day'].isoformat() if result['first_day'] else None,
+        'last_day': result['last_day'].isoformat() if result['last_day'] else None,
+    }
+
+
+@job_handler('export_exam')
+def _export_exam_job(job, payload, progress):
+    from nihongo.export_exam import export_exam_to_file
+
+    directory = current_app.config['JOB_OUTPUT_DIR']
+    os.makedirs(directory, exist_ok=True)
+    file_name = f"job-{job.id}-exam-{payload['exam_id']}.json"
+    success, message, exam = export_exam_to_file(payload['exam_id'], os.path.join(directory, file_name))
+    if not success:
+        if 'not found' in message:
+            raise JobFailed(message)
+        raise RuntimeError(message)
+    return {'exam_id': exam.id, 'file': file_name, 'message': message}
@@ -0,0 +1,91 @@
+"""
+Media manifest for the exam-taking page
+
+This module builds the ordered list of audio and image files used by a test,
+so take_exam.html can prefetch the next few items as the student advances
+instead of letting the browser fetch every <audio> tag at once.
+"""
+
+import os
+from urllib.parse import urlparse
+from flask import current_app
+
+
+def _local_media_path(url):
+    """
+    Resolve a media URL to a file under the app's static folder.
+
+    Args:
+        url: Media URL as stored on the question
+
+    Returns:
+        Absolute file path, or None if the URL is not served from /static
+    """
+    parsed = urlparse(url)
+    if parsed.scheme or parsed.netloc:
+        return None
+
+    static_url_path = current_app.static_url_path.rstrip('/') + '/'
+    if not parsed.path.startswith(static_url_path):
+        return None
+
+    static_folder = current_app.static_folder
+    if not static_folder:
+        return None
+
+    relative_path = parsed.path[len(static_url_path):]
+    file_path = os.path.normpath(os.path.join(static_folder, relative_path))
+
+    # Never resolve outside of the static folder
+    if not file_path.startswith(os.path.normpath(static_folder) + os.sep):
+        return None
+    return file_path
+
+
+def get_media_size(url):
+    """
+    Get the size in bytes of a media file.
+
+    Args:
+        url: Media URL as stored on the question
+
+    Returns:
+        Size in bytes for local static files, None for remote or missing files
+    """
+    file_path = _local_media_path(url)
+    if not file_path:
+        return None
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return None
+
+
+def build_media_manifest(questions):
+    """
+    Build the ordered media manifest for a test.
+
+    Args:
+        questions: Ordered list of dicts with a 'question' key, as built by take_exam
+
+    Returns:
+        list: One dict per media item in page order:
+              {'index', 'question_id', 'question_number', 'kind', 'url', 'size'}
+    """
+    manifest = []
+    for question_number, item in enumerate(questions, start=1):
+        question = item['question']
+
+        for kind, url in (('image', question.question_image), ('audio', question.question_audio)):
+            if not url:
+                continue
+            manifest.append({
+                'index': len(manifest),
+                'question_id': question.id,
+                'question_number': question_number,
+                'kind': kind,
+                'url': url,
+                'size': get_media_size(url)
+            })
+
+    return manifest
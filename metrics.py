@@ -0,0 +1,310 @@
+"""
+Application metrics in the Prometheus text format
+
+Counters and histograms live in process memory. Each metric has its own
+lock, held only for the few instructions of an update, so instrumenting a
+hot path costs about as much as a dict update. GET /metrics renders them in
+the text exposition format (version 0.0.4) for a Prometheus scrape.
+
+Under gunicorn every worker has its own counters, and a scrape reaches only
+one of them. With METRICS_MULTIPROC_DIR set, each worker writes its values
+to <dir>/metrics-<pid>.json (at most every METRICS_FLUSH_INTERVAL seconds,
+after a request) and /metrics adds up the files of all workers. Files of
+exited workers are kept, so counters never go backwards when a worker is
+recycled; clear the directory when the whole server restarts.
+
+The metrics of the app are defined at the bottom of this module, so they are
+all listed in one place:
+
+    from nihongo.metrics import ANSWERS_SAVED
+    ANSWERS_SAVED.inc()
+"""
+
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import current_app, g, request
+from nihongo.query_counter import init_request_queries, request_queries
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FILE_PREFIX = 'metrics-'
+
+REGISTRY = []
+
+
+class Metric:
+    """Base of Counter and Histogram: a name, help text and label names"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # tuple of label values -> value
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} takes the labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        """Copy of the values as [[label values], value] pairs"""
+        with self._lock:
+            return [[list(key), self._copy(value)] for key, value in self._values.items()]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def samples(self, key, value):
+        yield self.name, key, value
+
+
+class Histogram(Metric):
+    """Observations counted into buckets, with their count and sum"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)  # len(buckets) is the +Inf bucket
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1]]
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return [list(value[0]), value[1]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+    def samples(self, key, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (None,), value[0]):
+            cumulative += count
+            le = '+Inf' if bound is None else _format_value(bound)
+            yield f'{self.name}_bucket', key + (('le', le),), cumulative
+        yield f'{self.name}_sum', key, value[1]
+        yield f'{self.name}_count', key, cumulative
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return f'{value:.1f}'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render(snapshots):
+    """
+    Text exposition of metric values.
+
+    Args:
+        snapshots: {metric name: [[label values], value]} as returned by
+            collect()
+
+    Returns:
+        str: The metrics in the Prometheus text format
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for label_values, value in sorted(snapshots.get(metric.name, [])):
+            key = tuple(zip(metric.labelnames, label_values))
+            for name, labels, sample in metric.samples(key, value):
+                label_text = ','.join(f'{label}="{_escape(text)}"' for label, text in labels)
+                lines.append(f'{name}{{{label_text}}} {_format_value(sample)}' if label_text
+                             else f'{name} {_format_value(sample)}')
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot_all():
+    """Values of every metric of this process, by metric name"""
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def write_process_file(directory):
+    """Write this process's values to its file in the multi-process directory"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{FILE_PREFIX}{os.getpid()}.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot_all(), f)
+    os.replace(tmp_path, path)  # Readers never see a half-written file
+
+
+def collect(directory=None):
+    """
+    Values to expose: this process's own, or the sum over all worker files.
+
+    Args:
+        directory: Multi-process directory, None for a single process
+
+    Returns:
+        dict: {metric name: [[label values], value]}
+    """
+    if directory is None:
+        return snapshot_all()
+
+    write_process_file(directory)
+    merged = {metric.name: {} for metric in REGISTRY}
+    merge = {metric.name: metric.merge for metric in REGISTRY}
+    for name in os.listdir(directory):
+        if not (name.startswith(FILE_PREFIX) and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric_name, pairs in values.items():
+            if metric_name not in merged:
+                continue  # Written by an older release
+            totals = merged[metric_name]
+            for label_values, value in pairs:
+                key = tuple(label_values)
+                totals[key] = merge[metric_name](totals.get(key), value)
+    return {name: [[list(key), value] for key, value in totals.items()] for name, totals in merged.items()}
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def record_request(app, endpoint, method, status, seconds):
+    """Count and time one request, and write this process's file when it is due"""
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=method, status=status)
+    HTTP_REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+
+    directory = app.config['METRICS_MULTIPROC_DIR']
+    if directory:
+        state = app.extensions['metrics']
+        now = time.monotonic()
+        if now - state['flushed_at'] >= app.config['METRICS_FLUSH_INTERVAL']:
+            state['flushed_at'] = now
+            write_process_file(directory)
+
+
+def _record_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None or request.endpoint == 'metrics':
+        return response
+    endpoint = request.endpoint or 'none'
+    queries = request_queries()
+    if queries is not None and queries.count:
+        DB_STATEMENTS.inc(queries.count, endpoint=endpoint)
+        DB_STATEMENT_SECONDS.inc(queries.seconds, endpoint=endpoint)
+    record_request(current_app, endpoint, request.method, response.status_code,
+                   time.perf_counter() - start)
+    return response
+
+
+def metrics_view():
+    """GET /metrics, behind a bearer token when METRICS_TOKEN is set"""
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return 'Unauthorized\n', 401, {'WWW-Authenticate': 'Bearer'}
+    body = render(collect(current_app.config['METRICS_MULTIPROC_DIR'] or None))
+    return body, 200, {'Content-Type': CONTENT_TYPE, 'Cache-Control': 'no-store'}
+
+
+def init_metrics(app):
+    """Register the request timing hooks, the request SQL counter and GET /metrics"""
+    state = {'flushed_at': 0.0}
+    app.extensions['metrics'] = state
+    if not app.config['METRICS_ENABLED']:
+        return state
+
+    init_request_queries(app)
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    return state
+
+
+# Metrics of the app
+
+HTTP_REQUESTS = Counter(
+    'nihongo_http_requests_total', 'HTTP requests by endpoint, method and status',
+    ('endpoint', 'method', 'status'))
+HTTP_REQUEST_SECONDS = Histogram(
+    'nihongo_http_request_duration_seconds', 'Time spent handling a request, by endpoint', ('endpoint',))
+DB_STATEMENTS = Counter(
+    'nihongo_db_statements_total', 'SQL statements executed by requests, by endpoint', ('endpoint',))
+DB_STATEMENT_SECONDS = Counter(
+    'nihongo_db_statement_seconds_total', 'Time spent executing SQL statements in requests, by endpoint', ('endpoint',))
+CACHE_LOOKUPS = Counter(
+    'nihongo_cache_lookups_total', 'Cache lookups by cache and result (hit or miss)', ('cache', 'result'))
+ANSWERS_SAVED = Counter(
+    'nihongo_answers_saved_total', 'Answers saved while taking a test')
+ANSWER_ROWS_WRITTEN = Counter(
+    'nihongo_answer_buffer_rows_written_total', 'test_answers rows upserted by write-behind flushes')
+TESTS_STARTED = Counter(
+    'nihongo_tests_started_total', 'Tests started, by kind (exam, random, adaptive or review)', ('kind',))
+TESTS_SUBMITTED = Counter(
+    'nihongo_tests_submitted_total', 'Tests submitted for scoring')
+EXAM_IMPORTS = Counter(
+    'nihongo_exam_imports_total', 'Exam imports from JSON, by result (success or error)', ('result',))
+EXAM_IMPORT_SECONDS = Histogram(
+    'nihongo_exam_import_duration_seconds', 'Time spent importing an exam from JSON',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+CONTENT_CHANGES = Counter(
+    'nihongo_content_changes_total', 'Changes to user content, by kind and action', ('kind', 'action'))
@@ -9,6 +9,7 @@ class Exam(db.Model):
     name = db.Column(db.String(200), nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    is_generated = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)  # Random, adaptive or review exam of one student
     
     # Relationships
     exam_sections = db.relationship('ExamSection', backref='exam', lazy=True, cascade='all, delete-orphan')
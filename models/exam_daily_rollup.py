@@ -0,0 +1,17 @@
+from nihongo.models import db
+
+
+class ExamDailyRollup(db.Model):
+    """Completed tests of an exam aggregated per day (see rollups.py)"""
+    __tablename__ = 'exam_daily_rollups'
+    
+    day = db.Column(db.Date, primary_key=True)  # UTC date of completed_at
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id', ondelete='CASCADE'), primary_key=True)
+    tests_completed = db.Column(db.Integer, nullable=False, default=0)
+    tests_passed = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of percentages
+    questions_total = db.Column(db.Integer, nullable=False, default=0)
+    correct_total = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ExamDailyRollup {self.day} exam={self.exam_id} tests={self.tests_completed}>'
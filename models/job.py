@@ -0,0 +1,44 @@
+from nihongo.models import db
+from datetime import datetime
+import json
+
+
+class Job(db.Model):
+    """Background job run by the jobs worker (see jobs.py)"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)  # Handler name, e.g. 'import_exam'
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON arguments of the handler
+    result = db.Column(db.Text, nullable=True)  # JSON value returned by the handler
+    error = db.Column(db.Text, nullable=True)  # Last error, kept when a retry succeeds
+    progress = db.Column(db.Float, nullable=False, default=0.0)  # 0.0 to 1.0
+    progress_message = db.Column(db.String(255), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Retries wait until then
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Last sign of life of the worker running it
+    worker = db.Column(db.String(64), nullable=True)  # host:pid of the worker that claimed it
+
+    @property
+    def payload_data(self):
+        return json.loads(self.payload)
+
+    @property
+    def result_data(self):
+        return json.loads(self.result) if self.result else None
+
+    @property
+    def finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
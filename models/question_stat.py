@@ -0,0 +1,52 @@
+from nihongo.models import db
+from datetime import datetime
+import math
+
+
+class QuestionStat(db.Model):
+    """Aggregated answer statistics of a question over completed tests (see item_stats.py)"""
+    __tablename__ = 'question_stats'
+    
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id', ondelete='CASCADE'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # Completed tests that included the question
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    picks_1 = db.Column(db.Integer, nullable=False, default=0)
+    picks_2 = db.Column(db.Integer, nullable=False, default=0)
+    picks_3 = db.Column(db.Integer, nullable=False, default=0)
+    picks_4 = db.Column(db.Integer, nullable=False, default=0)
+    # Running sums of the test score (fraction correct) for point-biserial discrimination
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    score_sq_sum = db.Column(db.Float, nullable=False, default=0.0)
+    correct_score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    @property
+    def difficulty(self):
+        """Proportion of attempts answered correctly (p-value), None without attempts"""
+        if not self.attempts:
+            return None
+        return self.correct_count / self.attempts
+    
+    @property
+    def unanswered(self):
+        return self.attempts - (self.picks_1 + self.picks_2 + self.picks_3 + self.picks_4)
+    
+    @property
+    def discrimination(self):
+        """Point-biserial correlation between answering correctly and the test score"""
+        n = self.attempts
+        correct = self.correct_count
+        if not n or correct == 0 or correct == n:
+            return None
+        
+        variance = self.score_sq_sum / n - (self.score_sum / n) ** 2
+        if variance <= 1e-12:
+            return None
+        
+        mean_correct = self.correct_score_sum / correct
+        mean_incorrect = (self.score_sum - self.correct_score_sum) / (n - correct)
+        p = correct / n
+        return (mean_correct - mean_incorrect) / math.sqrt(variance) * math.sqrt(p * (1 - p))
+    
+    def __repr__(self):
+        return f'<QuestionStat question={self.question_id} attempts={self.attempts}>'
@@ -0,0 +1,21 @@
+from nihongo.models import db
+
+
+class ReviewCard(db.Model):
+    """Spaced-repetition state of a question for a user (see srs.py)"""
+    __tablename__ = 'review_cards'
+    __table_args__ = (
+        db.Index('ix_review_cards_user_due', 'user_id', 'due_at'),
+    )
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id', ondelete='CASCADE'), primary_key=True)
+    ease = db.Column(db.Float, nullable=False, default=2.5)
+    interval_days = db.Column(db.Float, nullable=False, default=0.0)
+    repetitions = db.Column(db.Integer, nullable=False, default=0)  # Correct answers in a row
+    lapses = db.Column(db.Integer, nullable=False, default=0)
+    due_at = db.Column(db.DateTime, nullable=False)
+    last_reviewed_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<ReviewCard user={self.user_id} question={self.question_id} due={self.due_at}>'
@@ -7,6 +7,7 @@ class Section(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     number_of_questions = db.Column(db.Integer, nullable=False)
+    is_generated = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)  # Part of a random, adaptive or review exam
     
     # Relationships
     section_questions = db.relationship('SectionQuestion', backref='section', lazy=True, cascade='all, delete-orphan')
@@ -0,0 +1,14 @@
+from nihongo.models import db
+
+
+class SectionDailyRollup(db.Model):
+    """Answers per section name aggregated per day (see rollups.py)"""
+    __tablename__ = 'section_daily_rollups'
+    
+    day = db.Column(db.Date, primary_key=True)  # UTC date of completed_at
+    section_name = db.Column(db.String(200), primary_key=True)
+    questions_total = db.Column(db.Integer, nullable=False, default=0)
+    correct_total = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SectionDailyRollup {self.day} {self.section_name} questions={self.questions_total}>'
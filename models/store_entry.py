@@ -0,0 +1,13 @@
+from nihongo.models import db
+
+
+class StoreEntry(db.Model):
+    """Key-value entry used by the SQL backend of the shared store (sessions, caches)"""
+    __tablename__ = 'store_entries'
+    
+    key = db.Column(db.String(255), primary_key=True)
+    value = db.Column(db.LargeBinary, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    
+    def __repr__(self):
+        return f'<StoreEntry {self.key}>'
@@ -10,6 +10,9 @@ class Test(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     completed_at = db.Column(db.DateTime, nullable=True)
+    answers_packed = db.Column(db.LargeBinary, nullable=True)  # Archived answers (see answer_vector.py), replaces test_answers rows
+    correct_count = db.Column(db.Integer, nullable=True)  # Stored score, set on submit (see scoring.py)
+    total_questions = db.Column(db.Integer, nullable=True)
     
     # Relationships
     test_answers = db.relationship('TestAnswer', backref='test', lazy=True, cascade='all, delete-orphan')
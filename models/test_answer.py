@@ -4,6 +4,9 @@ from datetime import datetime
 
 class TestAnswer(db.Model):
     __tablename__ = 'test_answers'
+    __table_args__ = (
+        db.Index('uq_test_answers_test_question', 'test_id', 'question_id', unique=True),  # Upsert key
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     test_id = db.Column(db.Integer, db.ForeignKey('tests.id'), nullable=False)
@@ -0,0 +1,16 @@
+from nihongo.models import db
+
+
+class UserQuestionMastery(db.Model):
+    """How well a user knows a question, from their completed tests (see adaptive.py)"""
+    __tablename__ = 'user_question_mastery'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id', ondelete='CASCADE'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    last_correct = db.Column(db.Boolean, nullable=False, default=False)
+    last_seen_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<UserQuestionMastery user={self.user_id} question={self.question_id} {self.correct_count}/{self.attempts}>'
@@ -3,6 +3,27 @@ Utility functions for models
 """
 import json
 from flask import session
+from sqlalchemy.dialects import postgresql, sqlite
+from nihongo.models import db
+
+_UPSERT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def upsert_insert(table, dialect=None):
+    """
+    INSERT statement of the database in use, with on_conflict_do_nothing and on_conflict_do_update.
+
+    Args:
+        table: Table (or model) to insert into
+        dialect: Dialect name ('sqlite', 'postgresql'), default that of db.engine
+
+    Returns:
+        sqlite or postgresql Insert
+    """
+    return _UPSERT_INSERTS[dialect or db.engine.dialect.name](table)
 
 
 def get_explanation(explanation_field, language=None):
@@ -2,8 +2,12 @@
 Custom routes for /mycontent using app's regular styling (not Flask-Admin)
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file
+from flask import (
+    Blueprint, render_template, request, redirect, url_for, flash, send_file, send_from_directory, Response,
+    stream_with_context, current_app, abort
+)
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload, selectinload
 from nihongo.models import db
 from nihongo.models.question import Question
 from nihongo.models.section import Section
@@ -11,7 +15,13 @@ from nihongo.models.exam import Exam
 from nihongo.models.section_question import SectionQuestion
 from nihongo.models.exam_section import ExamSection
 from nihongo.models.utils import parse_explanation, set_explanation
-from nihongo.import_exam import import_exam_from_json
+from nihongo.import_exam import validate_exam_json
+from nihongo.export_exam import iter_exam_json
+from nihongo.item_stats import get_question_stats
+from nihongo.metrics import CONTENT_CHANGES
+from nihongo.jobs import enqueue_job, retry_job
+from nihongo.models.job import Job
+from nihongo.replicas import replica_read
 import json
 from io import BytesIO
 
@@ -34,10 +44,12 @@ def index():
 
 @mycontent_bp.route('/questions')
 @login_required
+@replica_read
 def questions():
     """List user's questions"""
     my_questions = Question.query.filter_by(created_by=current_user.id).order_by(Question.created_at.desc()).all()
-    return render_template('mycontent/questions.html', questions=my_questions)
+    question_stats = get_question_stats(question.id for question in my_questions)
+    return render_template('mycontent/questions.html', questions=my_questions, question_stats=question_stats)
 
 
 @mycontent_bp.route('/questions/new', methods=['GET', 'POST'])
@@ -87,6 +99,7 @@ def new_question():
             db.session.add(question)
             db.session.commit()
             
+            CONTENT_CHANGES.inc(kind='question', action='create')
             flash('✅ Question created successfully!', 'success')
             return redirect(url_for('mycontent.questions'))
             
@@ -127,6 +140,7 @@ def edit_question(id):
             
             db.session.commit()
             
+            CONTENT_CHANGES.inc(kind='question', action='update')
             flash('✅ Question updated successfully!', 'success')
             return redirect(url_for('mycontent.questions'))
             
@@ -157,6 +171,7 @@ def delete_question(id):
     try:
         db.session.delete(question)
         db.session.commit()
+        CONTENT_CHANGES.inc(kind='question', action='delete')
         flash('✅ Question deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -189,14 +204,13 @@ def import_exam():
             json_content = file.read().decode('utf-8')
             json_data = json.loads(json_content)
             
-            # Import the exam
-            success, message, exam = import_exam_from_json(json_data, current_user.id)
-            
-            if success:
-                flash(f'✅ {message}', 'success')
-                return redirect(url_for('mycontent.index'))
+            # Check the structure now, import in the background
+            valid, errors = validate_exam_json(json_data)
+            if valid:
+                job = enqueue_job('import_exam', {'exam': json_data}, user_id=current_user.id)
+                return redirect(url_for('mycontent.job', id=job.id))
             else:
-                flash(f'❌ {message}', 'danger')
+                flash(f"❌ {'; '.join(errors[:5])}", 'danger')
                 
         except json.JSONDecodeError as e:
             flash(f'Invalid JSON format: {str(e)}', 'danger')
@@ -231,9 +245,13 @@ def download_example():
 
 @mycontent_bp.route('/sections')
 @login_required
+@replica_read
 def sections():
     """List all sections (not filtered by user since sections don't have created_by)"""
-    all_sections = Section.query.order_by(Section.name).all()
+    all_sections = Section.query.options(
+        selectinload(Section.exam_sections).joinedload(ExamSection.exam),
+        selectinload(Section.section_questions)
+    ).filter(Section.is_generated.is_(False)).order_by(Section.name).all()
     return render_template('mycontent/sections.html', sections=all_sections)
 
 
@@ -258,6 +276,7 @@ def new_section():
             db.session.add(section)
             db.session.commit()
             
+            CONTENT_CHANGES.inc(kind='section', action='create')
             flash('✅ Section created successfully!', 'success')
             return redirect(url_for('mycontent.sections'))
             
@@ -315,6 +334,7 @@ def edit_section(id):
                     db.session.add(section_question)
                     db.session.commit()
                     
+                    CONTENT_CHANGES.inc(kind='section', action='update')
                     flash('✅ Question created and added to section!', 'success')
                     return redirect(url_for('mycontent.edit_section', id=section.id))
             
@@ -342,6 +362,7 @@ def edit_section(id):
                         db.session.add(section_question)
                         db.session.commit()
                         
+                        CONTENT_CHANGES.inc(kind='section', action='update')
                         flash('✅ Question added to section!', 'success')
                     
                     return redirect(url_for('mycontent.edit_section', id=section.id))
@@ -354,6 +375,7 @@ def edit_section(id):
                 if section_question and section_question.section_id == section.id:
                     db.session.delete(section_question)
                     db.session.commit()
+                    CONTENT_CHANGES.inc(kind='section', action='update')
                     flash('✅ Question removed from section!', 'success')
                 
                 return redirect(url_for('mycontent.edit_section', id=section.id))
@@ -367,6 +389,7 @@ def edit_section(id):
                 if section_question and section_question.section_id == section.id:
                     section_question.order = new_order
                     db.session.commit()
+                    CONTENT_CHANGES.inc(kind='section', action='update')
                     flash('✅ Question order updated!', 'success')
                 
                 return redirect(url_for('mycontent.edit_section', id=section.id))
@@ -376,6 +399,7 @@ def edit_section(id):
                 section.name = request.form.get('name')
                 section.number_of_questions = int(request.form.get('number_of_questions', 0))
                 db.session.commit()
+                CONTENT_CHANGES.inc(kind='section', action='update')
                 flash('✅ Section updated successfully!', 'success')
                 return redirect(url_for('mycontent.sections'))
             
@@ -405,6 +429,7 @@ def delete_section(id):
     try:
         db.session.delete(section)
         db.session.commit()
+        CONTENT_CHANGES.inc(kind='section', action='delete')
         flash('✅ Section deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -419,18 +444,22 @@ def delete_section(id):
 
 @mycontent_bp.route('/exams')
 @login_required
+@replica_read
 def exams():
     """List user's exams"""
     my_exams = Exam.query.filter_by(created_by=current_user.id).order_by(Exam.created_at.desc()).all()
     
-    # Get section counts for each exam
-    exam_data = []
-    for exam in my_exams:
-        section_count = ExamSection.query.filter_by(exam_id=exam.id).count()
-        exam_data.append({
-            'exam': exam,
-            'section_count': section_count
-        })
+    # Section counts of all the exams in one query
+    section_counts = dict(
+        db.session.query(ExamSection.exam_id, db.func.count(ExamSection.id))
+        .join(Exam, Exam.id == ExamSection.exam_id)
+        .filter(Exam.created_by == current_user.id)
+        .group_by(ExamSection.exam_id)
+    )
+    exam_data = [
+        {'exam': exam, 'section_count': section_counts.get(exam.id, 0)}
+        for exam in my_exams
+    ]
     
     return render_template('mycontent/exams.html', exam_data=exam_data)
 
@@ -455,6 +484,7 @@ def new_exam():
             db.session.add(exam)
             db.session.commit()
             
+            CONTENT_CHANGES.inc(kind='exam', action='create')
             flash('✅ Exam created successfully!', 'success')
             return redirect(url_for('mycontent.exams'))
             
@@ -502,6 +532,7 @@ def edit_exam(id):
                     db.session.add(exam_section)
                     db.session.commit()
                     
+                    CONTENT_CHANGES.inc(kind='exam', action='update')
                     flash(f'✅ Section "{section_name}" created and added to exam!', 'success')
                     return redirect(url_for('mycontent.edit_exam', id=exam.id))
             
@@ -530,6 +561,7 @@ def edit_exam(id):
                         db.session.commit()
                         
                         section = Section.query.get(section_id)
+                        CONTENT_CHANGES.inc(kind='exam', action='update')
                         flash(f'✅ Section "{section.name}" added to exam!', 'success')
                     
                     return redirect(url_for('mycontent.edit_exam', id=exam.id))
@@ -542,6 +574,7 @@ def edit_exam(id):
                 if exam_section and exam_section.exam_id == exam.id:
                     db.session.delete(exam_section)
                     db.session.commit()
+                    CONTENT_CHANGES.inc(kind='exam', action='update')
                     flash('✅ Section removed from exam!', 'success')
                 
                 return redirect(url_for('mycontent.edit_exam', id=exam.id))
@@ -555,6 +588,7 @@ def edit_exam(id):
                 if exam_section and exam_section.exam_id == exam.id:
                     exam_section.order = new_order
                     db.session.commit()
+                    CONTENT_CHANGES.inc(kind='exam', action='update')
                     flash('✅ Order updated!', 'success')
                 
                 return redirect(url_for('mycontent.edit_exam', id=exam.id))
@@ -563,6 +597,7 @@ def edit_exam(id):
             else:
                 exam.name = request.form.get('name')
                 db.session.commit()
+                CONTENT_CHANGES.inc(kind='exam', action='update')
                 flash('✅ Exam updated successfully!', 'success')
                 return redirect(url_for('mycontent.exams'))
             
@@ -571,10 +606,12 @@ def edit_exam(id):
             flash(f'❌ Error: {str(e)}', 'danger')
     
     # Get all sections for the dropdown
-    all_sections = Section.query.order_by(Section.name).all()
+    all_sections = Section.query.filter(Section.is_generated.is_(False)).order_by(Section.name).all()
     
     # Get current exam sections with their details
-    exam_sections = ExamSection.query.filter_by(exam_id=exam.id).order_by(ExamSection.order).all()
+    exam_sections = ExamSection.query.filter_by(exam_id=exam.id).options(
+        joinedload(ExamSection.section).selectinload(Section.section_questions).joinedload(SectionQuestion.question)
+    ).order_by(ExamSection.order).all()
     
     return render_template('mycontent/exam_form.html', 
                          exam=exam,
@@ -582,6 +619,25 @@ def edit_exam(id):
                          exam_sections=exam_sections)
 
 
+@mycontent_bp.route('/exams/<int:id>/export')
+@login_required
+def export_exam(id):
+    """Download an exam as JSON in the import format (streamed)"""
+    exam = Exam.query.get_or_404(id)
+    
+    # Verify ownership
+    if exam.created_by != current_user.id:
+        flash('You can only export your own exams', 'danger')
+        return redirect(url_for('mycontent.exams'))
+    
+    chunks = (chunk.encode('utf-8') for chunk in iter_exam_json(exam))
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/json',
+        headers={'Content-Disposition': f'attachment; filename=exam-{exam.id}.json'}
+    )
+
+
 @mycontent_bp.route('/exams/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_exam(id):
@@ -596,6 +652,7 @@ def delete_exam(id):
     try:
         db.session.delete(exam)
         db.session.commit()
+        CONTENT_CHANGES.inc(kind='exam', action='delete')
         flash('✅ Exam deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -603,3 +660,64 @@ def delete_exam(id):
     
     return redirect(url_for('mycontent.exams'))
 
+
+@mycontent_bp.route('/jobs')
+@login_required
+def jobs():
+    """List the user's background jobs"""
+    my_jobs = Job.query.filter_by(created_by=current_user.id).order_by(Job.id.desc()).limit(50).all()
+    return render_template('mycontent/jobs.html', jobs=my_jobs)
+
+
+def _get_own_job(id):
+    job = Job.query.get_or_404(id)
+    if job.created_by != current_user.id and not current_user.is_admin:
+        abort(404)
+    return job
+
+
+@mycontent_bp.route('/jobs/<int:id>')
+@login_required
+def job(id):
+    """Status page of a background job, refreshed until it finishes"""
+    return render_template('mycontent/job.html', job=_get_own_job(id))
+
+
+@mycontent_bp.route('/jobs/<int:id>/status')
+@login_required
+def job_status(id):
+    """Status of a background job as JSON"""
+    job = _get_own_job(id)
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.progress_message,
+        'attempts': job.attempts,
+        'error': job.error,
+        'result': job.result_data,
+    }
+
+
+@mycontent_bp.route('/jobs/<int:id>/retry', methods=['POST'])
+@login_required
+def retry_failed_job(id):
+    """Queue a failed job again"""
+    job = _get_own_job(id)
+    if job.status == 'failed':
+        retry_job(job)
+        flash('✅ Job queued again', 'success')
+    return redirect(url_for('mycontent.job', id=job.id))
+
+
+@mycontent_bp.route('/jobs/<int:id>/download')
+@login_required
+def job_download(id):
+    """File written by a finished export job"""
+    job = _get_own_job(id)
+    result = job.result_data or {}
+    if job.status != 'succeeded' or 'file' not in result:
+        abort(404)
+    return send_from_directory(current_app.config['JOB_OUTPUT_DIR'], result['file'], as_attachment=True,
+                               mimetype='application/json')
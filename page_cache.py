@@ -0,0 +1,111 @@
+"""
+Full-page response cache
+
+Pages that render the same bytes for every anonymous visitor (login,
+register) are rendered once per locale and then served from memory. The
+cache is per process, bounded by total body size (least recently used
+pages are evicted first) and entries expire after PAGE_CACHE_TTL seconds.
+
+A request is served from and stored in the cache only if it is a GET or
+HEAD from an anonymous user with no pending flash messages, and only 200
+responses are stored. Everything else goes straight to the view.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session
+from flask_login import current_user
+from nihongo.i18n import get_locale_name
+from nihongo.metrics import CACHE_LOOKUPS
+
+
+class PageCache:
+    """Byte-bounded in-process LRU of rendered responses with a time to live"""
+
+    def __init__(self, max_bytes=4 * 1024 * 1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._pages = OrderedDict()  # key -> (body, mimetype, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                return None
+            if time.monotonic() - page[2] > self.ttl:
+                self._remove(key)
+                return None
+            self._pages.move_to_end(key)
+            return page
+
+    def put(self, key, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._pages:
+                self._remove(key)
+            self._pages[key] = (body, mimetype, time.monotonic())
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._pages)))
+
+    def _remove(self, key):
+        body, _, _ = self._pages.pop(key)
+        self.size -= len(body)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+
+def init_page_cache(app):
+    """Create the per-process page cache"""
+    cache = PageCache(
+        app.config.get('PAGE_CACHE_MAX_BYTES', 4 * 1024 * 1024),
+        app.config.get('PAGE_CACHE_TTL', 300)
+    )
+    app.extensions['page_cache'] = cache
+    return cache
+
+
+def cached_page(view):
+    """
+    Serve an anonymous GET of the view from the page cache, one variant per locale.
+
+    Usage:
+        @app.route('/login', methods=['GET', 'POST'])
+        @cached_page
+        def login():
+            ...
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if (request.method not in ('GET', 'HEAD') or current_user.is_authenticated
+                or session.get('_flashes')):
+            return view(*args, **kwargs)
+
+        cache = current_app.extensions['page_cache']
+        key = (request.endpoint, get_locale_name(), request.query_string)
+        page = cache.get(key)
+        CACHE_LOOKUPS.inc(cache='page', result='miss' if page is None else 'hit')
+        if page is not None:
+            body, mimetype, _ = page
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.headers['X-Page-Cache'] = 'hit'
+            return response
+
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed and not session.get('_flashes'):
+            cache.put(key, response.get_data(), response.mimetype)
+            response.headers['X-Page-Cache'] = 'miss'
+        return response
+
+    return wrapper
@@ -0,0 +1,224 @@
+"""
+On-demand request profiling
+
+An admin adds ?_profile=1 to a URL (or sends the header X-Profile: 1) and
+that one request runs under a sampling profiler. A background thread records
+the request thread's Python stack every PROFILE_INTERVAL seconds. SQL time
+is taken from the request's statement counter (query_counter.py), so the
+profile shows how much of the request was spent waiting on the database.
+
+Each profile is saved as a JSON file in PROFILE_DIR. Only the newest
+PROFILE_KEEP files are kept. Profiles are listed in the admin under
+Profiles, and each one can be downloaded in collapsed-stack format
+("frame;frame;frame count" lines), which flamegraph.pl, speedscope and
+inferno read directly.
+
+Requests from anyone other than a logged-in admin ignore the trigger.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlencode
+from flask import current_app, g, request
+from flask_login import current_user
+from nihongo.query_counter import init_request_queries, request_queries
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+TOP_STATEMENTS = 10
+
+
+class StackSampler:
+    """Samples the call stack of one thread from a background thread"""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()  # 'outer;...;inner' -> samples
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+
+def collapse_stack(frame):
+    """Stack of a frame as 'outer;...;inner', each frame as file:function"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class ProfileStore:
+    """Profiles as JSON files in a directory, newest PROFILE_KEEP kept"""
+
+    def __init__(self, directory, keep=50):
+        self.directory = directory
+        self.keep = keep
+
+    def _path(self, profile_id):
+        return os.path.join(self.directory, f'{profile_id}.json')
+
+    def save(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(profile['id']), 'w', encoding='utf-8') as f:
+            json.dump(profile, f)
+        for stale in self.ids()[self.keep:]:
+            try:
+                os.remove(self._path(stale))
+            except FileNotFoundError:
+                pass
+
+    def ids(self):
+        """Profile ids, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name[:-5] for name in os.listdir(self.directory) if name.endswith('.json')), reverse=True)
+
+    def load(self, profile_id):
+        """
+        Read one profile.
+
+        Returns:
+            dict or None: The profile, None if it does not exist
+        """
+        if not all(c.isalnum() or c == '-' for c in profile_id):
+            return None
+        try:
+            with open(self._path(profile_id), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def recent(self):
+        """Summaries of the kept profiles, newest first (without the stacks)"""
+        profiles = []
+        for profile_id in self.ids():
+            profile = self.load(profile_id)
+            if profile:
+                profile.pop('stacks', None)
+                profiles.append(profile)
+        return profiles
+
+
+def folded(profile):
+    """Collapsed-stack text of a profile, one 'stack count' line per stack"""
+    return ''.join(f'{stack} {count}\n' for stack, count in profile['stacks'])
+
+
+def top_frames(profile, limit=20):
+    """
+    Frames that the most samples were in.
+
+    Returns:
+        list: (frame, self samples, total samples), by total samples descending
+    """
+    own, total = Counter(), Counter()
+    for stack, count in profile['stacks']:
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return [(frame, own[frame], count) for frame, count in total.most_common(limit)]
+
+
+def _profiled_path():
+    args = [(key, value) for key, value in request.args.items(multi=True) if key != PROFILE_PARAM]
+    return request.path + (f'?{urlencode(args)}' if args else '')
+
+
+def _requested():
+    return request.args.get(PROFILE_PARAM) == '1' or request.headers.get(PROFILE_HEADER) == '1'
+
+
+def _start_profile():
+    if not _requested() or not (current_user.is_authenticated and current_user.is_admin):
+        return
+    first_statement = request_queries().count  # Statements from here on are profiled
+    sampler = StackSampler(threading.get_ident(), current_app.config['PROFILE_INTERVAL']).start()
+    g.profile = (time.perf_counter(), datetime.utcnow(), first_statement, sampler)
+
+
+def _stop_profile():
+    started, started_at, first_statement, sampler = g.pop('profile')
+    sampler.stop()
+    timings = request_queries().timings[first_statement:]
+    return time.perf_counter() - started, started_at, timings, sampler
+
+
+def _finish_profile(response):
+    if 'profile' not in g:
+        return response
+    seconds, started_at, timings, sampler = _stop_profile()
+
+    by_statement = {}
+    for statement, statement_seconds in timings:
+        entry = by_statement.setdefault(statement, [0, 0.0])
+        entry[0] += 1
+        entry[1] += statement_seconds
+    top = sorted(by_statement.items(), key=lambda item: item[1][1], reverse=True)[:TOP_STATEMENTS]
+
+    profile_id = f"{started_at.strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:8]}"
+    current_app.extensions['profiles'].save({
+        'id': profile_id,
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'method': request.method,
+        'path': _profiled_path(),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'user': current_user.email,
+        'duration_ms': seconds * 1000,
+        'sql_ms': sum(statement_seconds for _, statement_seconds in timings) * 1000,
+        'sql_count': len(timings),
+        'statements': [
+            {'statement': statement, 'count': count, 'ms': statement_seconds * 1000}
+            for statement, (count, statement_seconds) in top
+        ],
+        'interval_ms': sampler.interval * 1000,
+        'samples': sampler.samples,
+        'stacks': sampler.stacks.most_common(),
+    })
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def _abandon_profile(exc):
+    # The view raised before after_request ran: stop sampling, keep nothing
+    if 'profile' in g:
+        _stop_profile()
+
+
+def init_profiling(app):
+    """Register the profiling hooks and the profile store"""
+    store = ProfileStore(app.config['PROFILE_DIR'], app.config['PROFILE_KEEP'])
+    app.extensions['profiles'] = store
+    if app.config['PROFILING_ENABLED']:
+        init_request_queries(app)
+        app.before_request(_start_profile)
+        app.after_request(_finish_profile)
+        app.teardown_request(_abandon_profile)
+    return store
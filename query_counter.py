@@ -0,0 +1,157 @@
+"""
+SQL statement counting
+
+One pair of engine-wide listeners times every SQL statement and hands it to:
+- the counter of the current request (request_queries), which the request
+  log (structured_log.py), the metrics (metrics.py) and the request
+  profiler (profiling.py) all read, so a statement is timed once however
+  many of them are enabled;
+- the open QueryCounter blocks. The route query budgets
+  (tests/test_query_budgets.py), the route benchmark and the exam importer
+  use these to count the statements of a block of code, and to spot N+1
+  regressions: a page whose statement count grows with the data is issuing
+  a query per row.
+
+The start time of a statement is kept on its connection until the statement
+completes or raises (handle_error), so failed statements do not leave start
+times behind on pooled connections.
+"""
+
+import threading
+import time
+from flask import g, has_app_context, request_started
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+REQUEST_KEY = 'sql_queries'
+_START_KEY = 'query_counter_start'
+
+_counters = ()  # Open QueryCounter blocks, replaced (not mutated) under _lock
+_lock = threading.Lock()
+_listening = []
+
+
+class QueryCounter:
+    """
+    Context manager collecting the SQL statements executed on an engine.
+
+    Usage:
+        with QueryCounter(db.engine) as queries:
+            client.get('/exams')
+        print(queries.count, queries.seconds, queries.statements)
+
+    Args:
+        engine: SQLAlchemy engine to record (None: every engine)
+        current_thread: Only record statements run by the thread that
+            created the counter (for use inside a multi-threaded server)
+    """
+
+    def __init__(self, engine=None, current_thread=False):
+        self.engine = engine
+        self.thread_id = threading.get_ident() if current_thread else None
+        self.timings = []  # (statement, seconds) of each executed statement
+
+    @property
+    def statements(self):
+        return [statement for statement, _ in self.timings]
+
+    @property
+    def count(self):
+        return len(self.timings)
+
+    @property
+    def seconds(self):
+        return sum(seconds for _, seconds in self.timings)
+
+    def _recorded(self, conn):
+        return ((self.engine is None or conn.engine is self.engine)
+                and (self.thread_id is None or threading.get_ident() == self.thread_id))
+
+    def __enter__(self):
+        global _counters
+        install_listeners()
+        with _lock:
+            _counters = _counters + (self,)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _counters
+        with _lock:
+            _counters = tuple(counter for counter in _counters if counter is not self)
+        return False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_START_KEY, []).append((cursor, time.perf_counter()))
+
+
+def _finish(conn, cursor, statement):
+    starts = conn.info.get(_START_KEY)
+    if not starts or starts[-1][0] is not cursor:
+        return  # Not started by this cursor (e.g. an error while fetching rows)
+    timing = (statement, time.perf_counter() - starts.pop()[1])
+
+    if has_app_context():
+        queries = g.get(REQUEST_KEY)
+        if queries is not None:
+            queries.timings.append(timing)
+    for counter in _counters:
+        if counter._recorded(conn):
+            counter.timings.append(timing)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish(conn, cursor, statement)
+
+
+def _handle_error(context):
+    # after_cursor_execute does not run for a statement that raised
+    cursor = getattr(context.execution_context, 'cursor', None)
+    if context.connection is not None and cursor is not None:
+        _finish(context.connection, cursor, context.statement)
+
+
+def install_listeners():
+    """Register the engine-wide timing listeners, once per process"""
+    with _lock:
+        if _listening:
+            return
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening.append(True)
+
+
+def request_queries():
+    """
+    Counter of the statements run by the current request.
+
+    Returns:
+        QueryCounter or None: None outside a request, or when
+        init_request_queries was not called for the app
+    """
+    return g.get(REQUEST_KEY) if has_app_context() else None
+
+
+def _start_request_queries(app, **extra):
+    g.sql_queries = QueryCounter()
+
+
+def _end_request_queries(exc):
+    g.pop(REQUEST_KEY, None)
+
+
+def init_request_queries(app):
+    """
+    Count the statements of each request of app (see request_queries).
+
+    Called by every module that reads the counter; the hooks are only
+    registered once per app. The counter starts with request_started, so
+    it also covers the before_request hooks.
+    """
+    install_listeners()
+    if app.extensions.get('request_queries'):
+        return
+    app.extensions['request_queries'] = True
+    request_started.connect(_start_request_queries, app, weak=False)
+    app.teardown_request(_end_request_queries)
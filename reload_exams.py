@@ -23,6 +23,10 @@ if _parent not in sys.path:
 from nihongo.app import app, db  # noqa: E402
 from nihongo.import_exam import reload_exam_from_file, import_exam_from_file  # noqa: E402
 from nihongo.models.user import User  # noqa: E402
+from nihongo.structured_log import get_logger, log_event  # noqa: E402
+import time  # noqa: E402
+
+logger = get_logger('reload')
 
 
 def reload_all_standard_exams(create=False):
@@ -61,20 +65,21 @@ def reload_all_standard_exams(create=False):
         ]
         
         results = []
+        start = time.perf_counter()
         for file_name, exam_name in exam_files:
             file_path = os.path.join(os.path.dirname(__file__), file_name)
             
             if not os.path.exists(file_path):
-                print(f"⚠️  File not found: {file_name}")
+                log_event(logger, 'exam_reload_skipped', file=file_name, reason='file not found')
                 results.append((file_name, False, "File not found"))
                 continue
             
-            print(f"🔄 Reloading {exam_name}...")
+            # reload_exam_from_file logs an exam_reload event with its phase timings
             success, message, exam = reload_exam_from_file(file_path, exam_name, admin.id)
             
             # If reload failed because exam doesn't exist and create flag is True, try importing
             if not success and create and "not found" in message.lower():
-                print("📝 Exam not found, creating new exam...")
+                log_event(logger, 'exam_reload_create', file=file_name, exam=exam_name)
                 success, message, exam = import_exam_from_file(file_path, admin.id)
             
             if success:
@@ -97,6 +102,8 @@ def reload_all_standard_exams(create=False):
         
         print(f"\nTotal: {successful} succeeded, {failed} failed")
         print("="*60)
+        log_event(logger, 'exam_reload_batch', succeeded=successful, failed=failed,
+                  duration_ms=round((time.perf_counter() - start) * 1000, 2))
         
         return results
 
@@ -125,7 +132,6 @@ def reload_single_exam(file_path, exam_name):
         if not admin:
             return False, "No users found in database", None
         
-        print(f"🔄 Reloading exam from {file_path}...")
         success, message, exam = reload_exam_from_file(file_path, exam_name, admin.id)
         
         if success:
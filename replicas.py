@@ -0,0 +1,179 @@
+"""
+Read replicas
+
+With DATABASE_REPLICA_URLS set, the pure-read pages (exam list, results,
+history, the mycontent lists) run their SELECTs on a replica, so they do
+not compete with autosaves and submits for the primary. Every other route,
+and every write, uses the primary (SQLALCHEMY_DATABASE_URI) as before.
+
+Routing happens in RoutingSession.get_bind, the session class of db, for
+views decorated with @replica_read:
+- A SELECT (without FOR UPDATE) goes to the replica picked for the request;
+  flushes, DML and anything else go to the primary.
+- Once the session writes, the rest of the request reads from the primary.
+- Read-your-writes: after a request commits a write, the user's requests
+  read from the primary for REPLICA_STICKY_SECONDS (a timestamp in the
+  session), long enough for the replicas to catch up.
+- Fallback: a database error on a replica takes it out of rotation for
+  REPLICA_RETRY_AFTER seconds, and the view is run again on the primary.
+
+Cached catalogue entries are always loaded from the primary (primary_reads),
+so a lagging replica never stores stale content under a new generation.
+
+For local testing, point DATABASE_REPLICA_URLS at one or more SQLite files
+and copy the primary into them with `flask replicas-sync`.
+
+Usage:
+    @app.route('/my-exams')
+    @login_required
+    @replica_read
+    def my_exam_history():
+        ...
+"""
+
+import logging
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
+from nihongo.structured_log import get_logger, log_event
+
+STICKY_KEY = '_db_primary_until'
+
+logger = get_logger('replicas')
+
+
+class Replica:
+    """A replica database: its engine and when it may be used again after a failure"""
+
+    def __init__(self, url, retry_after=30, engine_options=None):
+        self.engine = create_engine(url, **(engine_options or {}))
+        self.retry_after = retry_after
+        self.down_until = 0.0
+        event.listen(self.engine, 'handle_error', self._on_error)
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+    def _on_error(self, context):
+        self.down_until = time.monotonic() + self.retry_after
+        if has_app_context():
+            g.db_replica_failed = True
+        log_event(logger, 'replica_failed', level=logging.WARNING,
+                  replica=self.engine.url.render_as_string(hide_password=True),
+                  error=str(context.original_exception), retry_after=self.retry_after)
+
+
+def _is_read(clause):
+    # A SELECT that takes no row locks
+    return getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None
+
+
+class RoutingSession(Session):
+    """
+    Session that runs the reads of @replica_read views on a replica.
+
+    Writes, and reads after the session wrote, go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['db_wrote'] = True
+            elif not self.info.get('db_wrote') and _is_read(clause) and has_app_context():
+                replica = g.get('db_replica')
+                if replica is not None:
+                    return replica.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(db_session):
+    if not db_session.info.pop('db_wrote', False) or not has_app_context():
+        return
+    g.pop('db_replica', None)  # The replica does not have this commit yet
+    if has_request_context() and current_app.extensions.get('replicas'):
+        session[STICKY_KEY] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_writes(db_session):
+    db_session.info.pop('db_wrote', None)
+
+
+def choose_replica():
+    """
+    Replica for the reads of this request.
+
+    Returns:
+        Replica or None: None to read from the primary (no replica configured
+        or available, or the user wrote recently)
+    """
+    replicas = current_app.extensions.get('replicas')
+    if not replicas:
+        return None
+    if session.get(STICKY_KEY, 0) > time.time():
+        return None
+    available = [replica for replica in replicas if replica.available]
+    return random.choice(available) if available else None
+
+
+def replica_read(view):
+    """
+    Run a read-only view's queries on a replica, falling back to the primary.
+
+    Goes beneath @login_required, so the current user is loaded from the primary.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        replica = choose_replica()
+        if replica is None:
+            return view(*args, **kwargs)
+        g.db_replica = replica
+        try:
+            return view(*args, **kwargs)
+        except DBAPIError:
+            if not g.pop('db_replica_failed', False):
+                raise
+            # The replica failed (see Replica._on_error): read everything again from the primary
+            current_app.extensions['sqlalchemy'].session.rollback()
+            g.pop('db_replica', None)
+            return view(*args, **kwargs)
+        finally:
+            g.pop('db_replica', None)
+            g.pop('db_replica_failed', None)
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, even in a @replica_read view"""
+    replica = g.pop('db_replica', None) if has_app_context() else None
+    try:
+        yield
+    finally:
+        if replica is not None:
+            g.db_replica = replica
+
+
+def init_replicas(app):
+    """
+    Create the engines of the DATABASE_REPLICA_URLS replicas.
+
+    Args:
+        app: Flask application
+
+    Returns:
+        list: Replica objects (empty: every query uses the primary)
+    """
+    replicas = [
+        Replica(url, app.config['REPLICA_RETRY_AFTER'], app.config.get('SQLALCHEMY_ENGINE_OPTIONS'))
+        for url in app.config['DATABASE_REPLICA_URLS']
+    ]
+    app.extensions['replicas'] = replicas
+    return replicas
@@ -0,0 +1,279 @@
+"""
+Daily analytics rollups
+
+Completed tests are aggregated per (day, exam) and per (day, section name)
+into the exam_daily_rollups and section_daily_rollups tables. The admin
+analytics view reads only these tables, so pass rates over any date range
+cost a GROUP BY over a few rows per day instead of a scan of tests and
+test_answers.
+
+- record_test_rollups() adds one submitted test (incremental, in submit_exam).
+- recompute_rollups() rebuilds a date range from the completed tests.
+- exam_summary(), section_summary() and daily_trend() are the dashboard queries.
+"""
+
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.exam import Exam
+from nihongo.models.section import Section
+from nihongo.models.exam_daily_rollup import ExamDailyRollup
+from nihongo.models.section_daily_rollup import SectionDailyRollup
+from nihongo.models.utils import upsert_insert
+from nihongo.scoring import get_answer_key
+
+
+def _increment(model, key, values):
+    """
+    Add values to the columns of a rollup row, creating the row if needed.
+
+    One INSERT ... ON CONFLICT DO UPDATE SET column = column + excluded.column,
+    so the first submits of a day do not race to insert the same row.
+    """
+    table = model.__table__
+    insert = upsert_insert(table).values(**key, **values)
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=list(key),
+        set_={column: table.c[column] + insert.excluded[column] for column in values},
+    ))
+
+
+def is_pass(percentage):
+    return percentage >= current_app.config['PASS_PERCENTAGE']
+
+
+def record_test_rollups(test, question_ids, section_names, answer_dict, answer_key=None):
+    """
+    Add one completed test to the daily rollups. The caller commits.
+
+    Args:
+        test: Completed Test (completed_at set)
+        question_ids: Ordered question ids of the test's exam
+        section_names: Section name of each entry of question_ids
+        answer_dict: {question_id: selected_answer}
+        answer_key: {question_id: correct_answer} (loaded when not given)
+    """
+    day = test.completed_at.date()
+
+    # A question counts once per test, in the first section it appears in
+    sections_by_question = {}
+    for question_id, section_name in zip(question_ids, section_names):
+        sections_by_question.setdefault(question_id, section_name)
+
+    correct_answers = answer_key if answer_key is not None else get_answer_key(sections_by_question)
+
+    section_totals = {}
+    for question_id, section_name in sections_by_question.items():
+        if question_id not in correct_answers:
+            continue
+        totals = section_totals.setdefault(section_name, [0, 0])
+        totals[0] += 1
+        totals[1] += answer_dict.get(question_id) == correct_answers[question_id]
+
+    total = sum(totals[0] for totals in section_totals.values())
+    correct = sum(totals[1] for totals in section_totals.values())
+    percentage = (correct / total * 100) if total > 0 else 0
+
+    _increment(ExamDailyRollup, {'day': day, 'exam_id': test.exam_id}, {
+        'tests_completed': 1,
+        'tests_passed': int(is_pass(percentage)),
+        'score_sum': percentage,
+        'questions_total': total,
+        'correct_total': correct,
+    })
+    for section_name, (section_total, section_correct) in sorted(section_totals.items()):  # One lock order
+        _increment(SectionDailyRollup, {'day': day, 'section_name': section_name}, {
+            'questions_total': section_total,
+            'correct_total': section_correct,
+        })
+
+
+def filter_completed_days(query, start_day, end_day):
+    """Restrict a Test query to tests completed on UTC days [start_day, end_day] (None = unbounded)"""
+    if start_day is not None:
+        query = query.filter(Test.completed_at >= datetime.combine(start_day, datetime.min.time()))
+    if end_day is not None:
+        query = query.filter(Test.completed_at < datetime.combine(end_day + timedelta(days=1), datetime.min.time()))
+    return query
+
+
+def _rollup_bounds(query, model, start_day, end_day):
+    if start_day is not None:
+        query = query.filter(model.day >= start_day)
+    if end_day is not None:
+        query = query.filter(model.day <= end_day)
+    return query
+
+
+def recompute_rollups(start_day=None, end_day=None, batch_size=1000):
+    """
+    Rebuild the rollups of a date range from the completed tests.
+
+    Args:
+        start_day: First day to rebuild (date, None = from the first test)
+        end_day: Last day to rebuild, inclusive (date, None = up to today)
+        batch_size: Tests exported per batch
+
+    Returns:
+        tuple: (tests_processed: int, exam_rows: int, section_rows: int)
+    """
+    import numpy as np
+    from nihongo.item_stats import export_answer_arrays
+
+    pass_percentage = current_app.config['PASS_PERCENTAGE']
+    exam_totals = {}     # (day, exam_id) -> [tests, passed, score_sum, questions, correct]
+    section_totals = {}  # (day, section_name) -> [questions, correct]
+    section_names = {}
+    tests_processed = 0
+
+    last_id = 0
+    while True:
+        query = Test.query.filter(Test.completed_at.isnot(None), Test.id > last_id)
+        tests = filter_completed_days(query, start_day, end_day).order_by(Test.id).limit(batch_size).all()
+        if not tests:
+            break
+        last_id = tests[-1].id
+        tests_processed += len(tests)
+
+        arrays = export_answer_arrays(tests)
+        is_correct = (arrays['selected'] == arrays['correct']).astype(np.int64)
+        test_index = arrays['test_index']
+
+        # Per-test score
+        lengths = np.bincount(test_index, minlength=len(tests))
+        correct = np.bincount(test_index, weights=is_correct, minlength=len(tests)).astype(np.int64)
+        percentages = np.divide(correct, lengths, out=np.zeros(len(tests)), where=lengths > 0) * 100
+
+        days = [test.completed_at.date() for test in tests]
+        for i, test in enumerate(tests):
+            totals = exam_totals.setdefault((days[i], test.exam_id), [0, 0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += int(percentages[i] >= pass_percentage)
+            totals[2] += float(percentages[i])
+            totals[3] += int(lengths[i])
+            totals[4] += int(correct[i])
+
+        # Per (test, section) counts, then folded into (day, section name)
+        section_ids = arrays['section_ids']
+        missing = set(np.unique(section_ids).tolist()) - set(section_names)
+        if missing:
+            section_names.update(
+                Section.query.filter(Section.id.in_(list(missing))).with_entities(Section.id, Section.name)
+            )
+        section_base = int(section_ids.max(initial=0)) + 1
+        pair_keys, pair_index = np.unique(test_index * section_base + section_ids, return_inverse=True)
+        pair_questions = np.bincount(pair_index)
+        pair_correct = np.bincount(pair_index, weights=is_correct).astype(np.int64)
+        for key, questions, correct_count in zip(pair_keys.tolist(), pair_questions.tolist(), pair_correct.tolist()):
+            test_position, section_id = divmod(key, section_base)
+            totals = section_totals.setdefault((days[test_position], section_names[section_id]), [0, 0])
+            totals[0] += questions
+            totals[1] += correct_count
+
+    _rollup_bounds(ExamDailyRollup.query, ExamDailyRollup, start_day, end_day).delete(synchronize_session=False)
+    _rollup_bounds(SectionDailyRollup.query, SectionDailyRollup, start_day, end_day).delete(synchronize_session=False)
+    if exam_totals:
+        db.session.execute(db.insert(ExamDailyRollup), [
+            {'day': day, 'exam_id': exam_id, 'tests_completed': tests, 'tests_passed': passed,
+             'score_sum': score_sum, 'questions_total': questions, 'correct_total': correct}
+            for (day, exam_id), (tests, passed, score_sum, questions, correct) in exam_totals.items()
+        ])
+    if section_totals:
+        db.session.execute(db.insert(SectionDailyRollup), [
+            {'day': day, 'section_name': section_name, 'questions_total': questions, 'correct_total': correct}
+            for (day, section_name), (questions, correct) in section_totals.items()
+        ])
+    db.session.commit()
+
+    return tests_processed, len(exam_totals), len(section_totals)
+
+
+def _rate(part, whole):
+    return (part / whole * 100) if whole else 0
+
+
+def exam_summary(start_day=None, end_day=None):
+    """
+    Pass rate and average score per exam over a date range.
+
+    Returns:
+        list: Dicts with exam_id, exam_name, tests, passed, pass_rate, average_score, correct_rate
+    """
+    query = db.session.query(
+        ExamDailyRollup.exam_id,
+        Exam.name,
+        func.sum(ExamDailyRollup.tests_completed),
+        func.sum(ExamDailyRollup.tests_passed),
+        func.sum(ExamDailyRollup.score_sum),
+        func.sum(ExamDailyRollup.questions_total),
+        func.sum(ExamDailyRollup.correct_total),
+    ).join(Exam, Exam.id == ExamDailyRollup.exam_id)
+    rows = _rollup_bounds(query, ExamDailyRollup, start_day, end_day).group_by(
+        ExamDailyRollup.exam_id, Exam.name
+    ).order_by(Exam.name).all()
+
+    return [
+        {
+            'exam_id': exam_id,
+            'exam_name': name,
+            'tests': tests,
+            'passed': passed,
+            'pass_rate': _rate(passed, tests),
+            'average_score': (score_sum / tests) if tests else 0,
+            'correct_rate': _rate(correct, questions),
+        }
+        for exam_id, name, tests, passed, score_sum, questions, correct in rows
+    ]
+
+
+def section_summary(start_day=None, end_day=None):
+    """
+    Share of correct answers per section name over a date range.
+
+    Returns:
+        list: Dicts with section_name, questions, correct, correct_rate
+    """
+    query = db.session.query(
+        SectionDailyRollup.section_name,
+        func.sum(SectionDailyRollup.questions_total),
+        func.sum(SectionDailyRollup.correct_total),
+    )
+    rows = _rollup_bounds(query, SectionDailyRollup, start_day, end_day).group_by(
+        SectionDailyRollup.section_name
+    ).order_by(SectionDailyRollup.section_name).all()
+
+    return [
+        {'section_name': name, 'questions': questions, 'correct': correct, 'correct_rate': _rate(correct, questions)}
+        for name, questions, correct in rows
+    ]
+
+
+def daily_trend(start_day=None, end_day=None):
+    """
+    Tests and pass rate per day over a date range, all exams combined.
+
+    Returns:
+        list: Dicts with day, tests, passed, pass_rate, average_score (oldest first)
+    """
+    query = db.session.query(
+        ExamDailyRollup.day,
+        func.sum(ExamDailyRollup.tests_completed),
+        func.sum(ExamDailyRollup.tests_passed),
+        func.sum(ExamDailyRollup.score_sum),
+    )
+    rows = _rollup_bounds(query, ExamDailyRollup, start_day, end_day).group_by(
+        ExamDailyRollup.day
+    ).order_by(ExamDailyRollup.day).all()
+
+    return [
+        {
+            'day': day,
+            'tests': tests,
+            'passed': passed,
+            'pass_rate': _rate(passed, tests),
+            'average_score': (score_sum / tests) if tests else 0,
+        }
+        for day, tests, passed, score_sum in rows
+    ]
@@ -0,0 +1,140 @@
+"""
+Stored test scores
+
+A completed test keeps its score in tests.correct_count / tests.total_questions
+so the exam history does not replay every test's answers. The score is set
+when the test is submitted; after an answer key is fixed, rescore_tests()
+recomputes the affected tests in one vectorized pass and writes the new
+scores back in bulk (flask rescore).
+"""
+
+import time
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.question import Question
+from nihongo.models.exam_section import ExamSection
+from nihongo.models.section_question import SectionQuestion
+
+
+def get_answer_key(question_ids):
+    """
+    Get the correct answers of several questions in one query.
+
+    Args:
+        question_ids: Iterable of question ids
+
+    Returns:
+        dict: {question_id: correct_answer}
+    """
+    question_ids = list(set(question_ids))
+    if not question_ids:
+        return {}
+    return dict(
+        Question.query.filter(Question.id.in_(question_ids)).with_entities(Question.id, Question.correct_answer)
+    )
+
+
+def score_answers(question_ids, answer_dict, answer_key):
+    """
+    Score a test against an answer key.
+
+    Args:
+        question_ids: Question ids of the test's exam (each counted once)
+        answer_dict: {question_id: selected_answer}
+        answer_key: {question_id: correct_answer}
+
+    Returns:
+        tuple: (correct: int, total: int)
+    """
+    question_ids = [question_id for question_id in dict.fromkeys(question_ids) if question_id in answer_key]
+    correct = sum(1 for question_id in question_ids if answer_dict.get(question_id) == answer_key[question_id])
+    return correct, len(question_ids)
+
+
+def get_percentage(test):
+    """Stored score of a test as a percentage"""
+    return (test.correct_count / test.total_questions * 100) if test.total_questions else 0
+
+
+def _affected_tests_query(question_ids=None, exam_ids=None, start_day=None, end_day=None):
+    """Completed tests matching the rescore scope"""
+    from nihongo.rollups import filter_completed_days
+
+    query = Test.query.filter(Test.completed_at.isnot(None))
+    if question_ids:
+        containing_exams = db.session.query(ExamSection.exam_id).join(
+            SectionQuestion, SectionQuestion.section_id == ExamSection.section_id
+        ).filter(SectionQuestion.question_id.in_(question_ids))
+        query = query.filter(Test.exam_id.in_(containing_exams))
+    if exam_ids:
+        query = query.filter(Test.exam_id.in_(exam_ids))
+    return filter_completed_days(query, start_day, end_day)
+
+
+def rescore_tests(question_ids=None, exam_ids=None, start_day=None, end_day=None, batch_size=2000, progress=None):
+    """
+    Recompute the stored scores of completed tests against the current answer keys.
+
+    Each batch is exported as columnar arrays (see item_stats.export_answer_arrays),
+    scored with one bincount and written back with a single executemany UPDATE.
+
+    Args:
+        question_ids: Only tests whose exam contains one of these questions
+        exam_ids: Only tests of these exams
+        start_day: Only tests completed on or after this UTC date
+        end_day: Only tests completed on or before this UTC date
+        batch_size: Tests scored per batch
+        progress: Called as progress(fraction, message) after each batch
+
+    Returns:
+        dict: tests (scored), changed (score differs from the stored one),
+              first_day / last_day (completion dates of changed tests, None if none changed),
+              seconds (elapsed)
+    """
+    import numpy as np
+    from nihongo.item_stats import export_answer_arrays
+
+    started = time.perf_counter()
+    tests_scored = 0
+    changed = 0
+    first_day = last_day = None
+    total = _affected_tests_query(question_ids, exam_ids, start_day, end_day).count() if progress else None
+
+    last_id = 0
+    while True:
+        tests = _affected_tests_query(question_ids, exam_ids, start_day, end_day).filter(
+            Test.id > last_id
+        ).order_by(Test.id).limit(batch_size).all()
+        if not tests:
+            break
+        last_id = tests[-1].id
+        tests_scored += len(tests)
+
+        arrays = export_answer_arrays(tests)
+        is_correct = (arrays['selected'] == arrays['correct']).astype(np.int64)
+        totals = np.bincount(arrays['test_index'], minlength=len(tests))
+        corrects = np.bincount(arrays['test_index'], weights=is_correct, minlength=len(tests)).astype(np.int64)
+
+        updates = []
+        for test, correct, total in zip(tests, corrects.tolist(), totals.tolist()):
+            if (test.correct_count, test.total_questions) == (correct, total):
+                continue
+            updates.append({'id': test.id, 'correct_count': correct, 'total_questions': total})
+            day = test.completed_at.date()
+            first_day = day if first_day is None else min(first_day, day)
+            last_day = day if last_day is None else max(last_day, day)
+
+        if updates:
+            db.session.execute(db.update(Test), updates)
+            changed += len(updates)
+        db.session.commit()
+        if progress:
+            progress(tests_scored / total if total else 1.0, f'{tests_scored} of {total} tests scored')
+
+    return {
+        'tests': tests_scored,
+        'changed': changed,
+        'first_day': first_day,
+        'last_day': last_day,
+        'seconds': time.perf_counter() - started,
+    }
@@ -0,0 +1,225 @@
+"""
+Server-side sessions
+
+Keeps session data in a shared store (see stores.py) instead of a signed
+cookie. The cookie only carries a random session id, session data is encoded
+in a compact binary format, and a session is only read from the store the
+first time a request actually touches it.
+
+Session ids are only ever issued by the server: a cookie whose id the store
+does not know starts a new session with a fresh id, and logging in or out
+moves the session to a new id, so a session id planted in a victim's browser
+(session fixation) never becomes a logged-in session.
+
+Enable with SESSION_BACKEND = 'memory', 'sql' or 'redis' (default 'cookie'
+keeps Flask's signed-cookie sessions).
+"""
+
+import re
+import secrets
+import zlib
+from flask import session as current_session
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from flask_login import user_logged_in, user_logged_out, user_loaded_from_cookie
+from nihongo.stores import create_store
+
+SESSION_KEY_PREFIX = 'session:'
+_SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{32,64}$')
+
+
+class SessionSerializer:
+    """
+    Compact binary encoding for session data.
+
+    Tagged JSON (same type support as Flask's cookie sessions: tuples, bytes,
+    datetimes, Markup) prefixed with a one-byte format marker, zlib-compressed
+    when that makes the payload smaller.
+    """
+
+    PLAIN = b'\x00'
+    ZLIB = b'\x01'
+
+    def __init__(self, compress_threshold=128):
+        self.compress_threshold = compress_threshold
+        self.tagged_json = TaggedJSONSerializer()
+
+    def dumps(self, data):
+        payload = self.tagged_json.dumps(data).encode('utf-8')
+        if len(payload) >= self.compress_threshold:
+            compressed = zlib.compress(payload)
+            if len(compressed) < len(payload):
+                return self.ZLIB + compressed
+        return self.PLAIN + payload
+
+    def loads(self, data):
+        marker, payload = data[:1], data[1:]
+        if marker == self.ZLIB:
+            payload = zlib.decompress(payload)
+        elif marker != self.PLAIN:
+            raise ValueError('Unknown session encoding')
+        return self.tagged_json.loads(payload.decode('utf-8'))
+
+
+class ServerSideSession(SessionMixin):
+    """Session whose data is fetched from the store on first access"""
+
+    def __init__(self, loader, sid=None):
+        self.sid = sid
+        self.previous_sid = None  # Deleted from the store on save, after regenerate()
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self._loader = loader
+        self._data = None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def _load(self):
+        self.accessed = True
+        if self._data is None:
+            data = self._loader(self.sid) if self.sid else None
+            if data is None:
+                # Unknown id: start a new session rather than adopt an id the client chose
+                self.sid = None
+                self.new = True
+                data = {}
+            self._data = data
+        return self._data
+
+    def regenerate(self):
+        """Keep the data but move it to a new id when saved (on login and logout)"""
+        self._load()
+        if self.sid is not None:
+            self.previous_sid = self.sid
+            self.sid = None
+        self.modified = True
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def clear(self):
+        self._data = {}
+        self.accessed = True
+        self.modified = True
+
+    def to_dict(self):
+        return dict(self._load())
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface storing session data in a shared store"""
+
+    def __init__(self, store, serializer=None):
+        self.store = store
+        self.serializer = serializer or SessionSerializer()
+
+    def _load_data(self, sid):
+        """Session data, or None when the store does not know the id"""
+        data = self.store.get(SESSION_KEY_PREFIX + sid)
+        if data is None:
+            return None
+        try:
+            return self.serializer.loads(data)
+        except (ValueError, zlib.error):
+            return None
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not _SESSION_ID_RE.match(sid):
+            sid = None
+        return ServerSideSession(self._load_data, sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        # Untouched or unchanged sessions cost nothing (no store read or write)
+        if not session.modified and not (session.loaded and self.should_set_cookie(app, session)):
+            return
+
+        if session.previous_sid:
+            self.store.delete(SESSION_KEY_PREFIX + session.previous_sid)
+
+        if not session.to_dict():
+            if session.sid or session.previous_sid:
+                if session.sid:
+                    self.store.delete(SESSION_KEY_PREFIX + session.sid)
+                response.delete_cookie(
+                    name, domain=domain, path=path, secure=secure,
+                    samesite=samesite, httponly=httponly
+                )
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+        self.store.set(SESSION_KEY_PREFIX + session.sid, self.serializer.dumps(session.to_dict()), ttl=ttl)
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite
+        )
+
+
+def _regenerate_session(sender, **extra):
+    # Flask-Login signals: the user behind the session changed
+    if isinstance(current_session._get_current_object(), ServerSideSession):
+        current_session.regenerate()
+
+
+user_logged_in.connect(_regenerate_session)
+user_loaded_from_cookie.connect(_regenerate_session)
+user_logged_out.connect(_regenerate_session)
+
+
+def init_server_sessions(app):
+    """
+    Install server-side sessions if SESSION_BACKEND selects a store.
+
+    Args:
+        app: Flask application
+
+    Returns:
+        The session store, or None when signed-cookie sessions are kept
+    """
+    backend = app.config.get('SESSION_BACKEND', 'cookie')
+    if backend == 'cookie':
+        return None
+
+    store = create_store(backend, app)
+    app.session_interface = ServerSideSessionInterface(store)
+    return store
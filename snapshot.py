@@ -0,0 +1,362 @@
+"""
+Content snapshots
+
+A snapshot holds the content tables (questions, sections, exams and their
+links) in one compact binary file, so a fresh or test database can be
+filled with a few bulk INSERTs instead of parsing JSON files and building
+ORM objects one by one. Snapshots are made from a live database or
+directly from exam JSON files.
+
+Format (little-endian):
+    header  b'NHSNAP' + uint16 version + uint16 table count
+    table   uint16 name length + name, uint32 row count, uint16 column count
+    column  uint16 name length + name, 1 byte type, uint32 payload length,
+            zlib-compressed payload
+
+Column types:
+    q - int64 array (integers without NULLs)
+    t - int64 array of microseconds since 1970-01-01 (naive UTC datetimes)
+    j - JSON array (text and nullable columns)
+"""
+
+import json
+import struct
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from nihongo.models import db
+from nihongo.models.question import Question
+from nihongo.models.user import User
+from nihongo.models.section import Section
+from nihongo.models.exam import Exam
+from nihongo.models.exam_section import ExamSection
+from nihongo.models.section_question import SectionQuestion
+from nihongo.import_exam import validate_exam_json
+from nihongo.catalogue import bump_content_generation
+
+SNAPSHOT_MAGIC = b'NHSNAP'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MODELS = (Question, Section, Exam, ExamSection, SectionQuestion)  # Insert order
+LOAD_BATCH_SIZE = 5000
+
+# Foreign keys rewritten on load: {table: {column: referenced table}}
+_REFERENCES = {
+    'exam_sections': {'exam_id': 'exams', 'section_id': 'sections'},
+    'section_questions': {'section_id': 'sections', 'question_id': 'questions'},
+}
+_EPOCH = datetime(1970, 1, 1)
+_HEADER = struct.Struct('<6sHH')
+_TABLE = struct.Struct('<IH')
+_COLUMN = struct.Struct('<cI')
+
+
+def _column_type(column):
+    if column.nullable:
+        return b'j'
+    if isinstance(column.type, db.Integer):
+        return b'q'
+    if isinstance(column.type, db.DateTime):
+        return b't'
+    return b'j'
+
+
+def _pack_name(name):
+    data = name.encode('utf-8')
+    return struct.pack('<H', len(data)) + data
+
+
+def _unpack_name(data, offset):
+    (length,) = struct.unpack_from('<H', data, offset)
+    offset += 2
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+
+def write_snapshot(tables, out):
+    """
+    Write tables to a binary stream.
+
+    Args:
+        tables: {table name: {column name: list of values}}, in insert order
+        out: Writable binary stream
+    """
+    columns_by_table = {model.__tablename__: model.__table__.columns for model in SNAPSHOT_MODELS}
+    out.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(tables)))
+    for name, columns in tables.items():
+        row_count = len(next(iter(columns.values()))) if columns else 0
+        out.write(_pack_name(name) + _TABLE.pack(row_count, len(columns)))
+        for column_name, values in columns.items():
+            kind = _column_type(columns_by_table[name][column_name])
+            if kind == b'q':
+                payload = array('q', values).tobytes()
+            elif kind == b't':
+                payload = array('q', [(value - _EPOCH) // timedelta(microseconds=1) for value in values]).tobytes()
+            else:
+                payload = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            payload = zlib.compress(payload, 6)
+            out.write(_pack_name(column_name) + _COLUMN.pack(kind, len(payload)) + payload)
+
+
+def read_snapshot(data):
+    """
+    Parse a snapshot.
+
+    Args:
+        data: Snapshot bytes
+
+    Returns:
+        dict: {table name: {column name: list of values}}
+
+    Raises:
+        ValueError: If data is not a snapshot of a supported version
+    """
+    magic, version, table_count = _HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError('Not a content snapshot')
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f'Unsupported snapshot version: {version}')
+
+    offset = _HEADER.size
+    tables = {}
+    for _ in range(table_count):
+        name, offset = _unpack_name(data, offset)
+        row_count, column_count = _TABLE.unpack_from(data, offset)
+        offset += _TABLE.size
+        columns = {}
+        for _ in range(column_count):
+            column_name, offset = _unpack_name(data, offset)
+            kind, length = _COLUMN.unpack_from(data, offset)
+            offset += _COLUMN.size
+            payload = zlib.decompress(data[offset:offset + length])
+            offset += length
+            if kind in (b'q', b't'):
+                values = array('q')
+                values.frombytes(payload)
+                values = values.tolist()
+                if kind == b't':
+                    values = [_EPOCH + timedelta(microseconds=value) for value in values]
+            else:
+                values = json.loads(payload.decode('utf-8'))
+            if len(values) != row_count:
+                raise ValueError(f'Column {name}.{column_name} has {len(values)} values, expected {row_count}')
+            columns[column_name] = values
+        tables[name] = columns
+    return tables
+
+
+def snapshot_from_db():
+    """
+    Read the content tables of the current database.
+
+    Returns:
+        dict: Tables in the write_snapshot layout
+    """
+    tables = {}
+    for model in SNAPSHOT_MODELS:
+        table = model.__table__
+        rows = db.session.execute(db.select(*table.columns).order_by(table.c.id)).all()
+        names = [column.name for column in table.columns]
+        values = list(zip(*rows)) if rows else [()] * len(names)
+        tables[table.name] = {name: list(column) for name, column in zip(names, values)}
+    return tables
+
+
+def snapshot_from_exam_json(exams, user_id=0):
+    """
+    Build snapshot tables from exam JSON documents (import format), without a database.
+
+    Args:
+        exams: List of exam dicts
+        user_id: created_by of the content (0 = none, load_snapshot must then be given a user)
+
+    Returns:
+        dict: Tables in the write_snapshot layout
+
+    Raises:
+        ValueError: If a document is not a valid exam
+    """
+    tables = {
+        model.__tablename__: {column.name: [] for column in model.__table__.columns}
+        for model in SNAPSHOT_MODELS
+    }
+    questions, sections, exam_rows = tables['questions'], tables['sections'], tables['exams']
+    exam_sections, section_questions = tables['exam_sections'], tables['section_questions']
+    now = datetime.utcnow()
+
+    def add(columns, **values):
+        for name, column in columns.items():
+            column.append(values.get(name))
+        return len(columns['id'])
+
+    for json_data in exams:
+        valid, errors = validate_exam_json(json_data)
+        if not valid:
+            raise ValueError(f"Invalid exam '{json_data.get('name', '?')}': {'; '.join(errors)}")
+
+        exam_id = add(exam_rows, id=len(exam_rows['id']) + 1, name=json_data['name'],
+                      created_by=user_id, created_at=now, is_generated=False)
+        for section_order, section_data in enumerate(json_data['sections'], start=1):
+            section_id = add(sections, id=len(sections['id']) + 1, name=section_data['name'],
+                             number_of_questions=len(section_data['questions']), is_generated=False)
+            add(exam_sections, id=len(exam_sections['id']) + 1, exam_id=exam_id,
+                section_id=section_id, order=section_order)
+            for question_order, question_data in enumerate(section_data['questions'], start=1):
+                explanation = question_data.get('explanation')
+                if isinstance(explanation, dict):
+                    explanation = json.dumps(explanation, ensure_ascii=False)
+                question_id = add(
+                    questions, id=len(questions['id']) + 1,
+                    question_text=question_data['question_text'],
+                    question_image=question_data.get('question_image'),
+                    question_audio=question_data.get('question_audio'),
+                    answer_1=question_data['answer_1'], answer_2=question_data['answer_2'],
+                    answer_3=question_data['answer_3'], answer_4=question_data['answer_4'],
+                    correct_answer=question_data['correct_answer'], explanation=explanation,
+                    created_by=user_id, created_at=now, updated_at=now
+                )
+                add(section_questions, id=len(section_questions['id']) + 1, section_id=section_id,
+                    question_id=question_id, order=question_order)
+    return tables
+
+
+def reset_id_sequences(models):
+    """Move PostgreSQL id sequences past rows inserted with explicit ids"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    # Explicit ids do not advance the serial sequences
+    for model in models:
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{model.__tablename__}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {model.__tablename__}))"
+        ))
+
+
+def _keep_rows(columns, keep):
+    return {name: [value for value, kept in zip(values, keep) if kept] for name, values in columns.items()}
+
+
+def _skip_existing_exams(tables):
+    """Drop exams whose name already exists, with the sections and questions only they use"""
+    existing = {name for (name,) in db.session.query(Exam.name)}
+    exams = tables['exams']
+    dropped_exams = {exam_id for exam_id, name in zip(exams['id'], exams['name']) if name in existing}
+    if not dropped_exams:
+        return tables, 0
+
+    exam_sections = tables['exam_sections']
+    kept_links = [exam_id not in dropped_exams for exam_id in exam_sections['exam_id']]
+    used_sections = {section_id for section_id, kept in zip(exam_sections['section_id'], kept_links) if kept}
+    dropped_sections = {
+        section_id for section_id, kept in zip(exam_sections['section_id'], kept_links) if not kept
+    } - used_sections
+
+    section_questions = tables['section_questions']
+    kept_questions_links = [section_id not in dropped_sections for section_id in section_questions['section_id']]
+    used_questions = {
+        question_id for question_id, kept in zip(section_questions['question_id'], kept_questions_links) if kept
+    }
+    dropped_questions = {
+        question_id for question_id, kept in zip(section_questions['question_id'], kept_questions_links) if not kept
+    } - used_questions
+
+    filtered = dict(tables)
+    filtered['exams'] = _keep_rows(exams, [exam_id not in dropped_exams for exam_id in exams['id']])
+    filtered['exam_sections'] = _keep_rows(exam_sections, kept_links)
+    filtered['sections'] = _keep_rows(
+        tables['sections'], [section_id not in dropped_sections for section_id in tables['sections']['id']]
+    )
+    filtered['section_questions'] = _keep_rows(section_questions, kept_questions_links)
+    filtered['questions'] = _keep_rows(
+        tables['questions'], [question_id not in dropped_questions for question_id in tables['questions']['id']]
+    )
+    return filtered, len(dropped_exams)
+
+
+def load_snapshot(tables, user_id=None, skip_existing=False):
+    """
+    Bulk-insert snapshot tables into the current database and commit.
+
+    Ids are shifted past the highest id already in each table, so a
+    snapshot can be loaded into an empty or a populated database.
+
+    Args:
+        tables: Tables from read_snapshot or snapshot_from_*
+        user_id: Assign all content to this user (default: keep created_by)
+        skip_existing: Leave out exams whose name already exists
+
+    Returns:
+        dict: Rows inserted per table, plus 'skipped_exams'
+
+    Raises:
+        ValueError: If no user_id is given and the snapshot has no owner, or
+            its creators are not users of this database
+    """
+    if user_id is None and any(0 in tables[name]['created_by'] for name in ('exams', 'questions') if name in tables):
+        raise ValueError('Snapshot content has no owner (built from JSON files), pass a user')
+
+    skipped = 0
+    if skip_existing:
+        tables, skipped = _skip_existing_exams(tables)
+
+    if user_id is None:
+        creators = {
+            creator for table in tables.values() for creator in table.get('created_by', ())
+        }
+        known = set(db.session.scalars(db.select(User.id).where(User.id.in_(creators)))) if creators else set()
+        missing = sorted(creators - known)
+        if missing:
+            raise ValueError(
+                f"Snapshot creators are not users of this database (ids {', '.join(map(str, missing))}), pass a user"
+            )
+
+    offsets = {
+        model.__tablename__: db.session.query(func.coalesce(func.max(model.id), 0)).scalar()
+        for model in SNAPSHOT_MODELS
+    }
+
+    counts = {}
+    for model in SNAPSHOT_MODELS:
+        table = model.__table__
+        columns = {name: values for name, values in tables.get(table.name, {}).items() if name in table.c}
+        row_count = len(columns['id']) if 'id' in columns else 0
+        counts[table.name] = row_count
+        if not row_count:
+            continue
+
+        columns['id'] = [value + offsets[table.name] for value in columns['id']]
+        for column_name, referenced in _REFERENCES.get(table.name, {}).items():
+            columns[column_name] = [value + offsets[referenced] for value in columns[column_name]]
+        if user_id is not None and 'created_by' in columns:
+            columns['created_by'] = [user_id] * row_count
+
+        names = list(columns)
+        rows = [dict(zip(names, values)) for values in zip(*columns.values())]
+        for start in range(0, row_count, LOAD_BATCH_SIZE):
+            db.session.execute(table.insert(), rows[start:start + LOAD_BATCH_SIZE])
+
+    reset_id_sequences(SNAPSHOT_MODELS)
+    db.session.commit()
+    # Core inserts bypass the ORM events that keep the catalogue cache current
+    bump_content_generation()
+
+    counts['skipped_exams'] = skipped
+    return counts
+
+
+def create_snapshot_file(file_path, exams_json=None):
+    """
+    Write a snapshot of the database, or of exam JSON documents, to a file.
+
+    Returns:
+        dict: Rows written per table
+    """
+    tables = snapshot_from_exam_json(exams_json) if exams_json is not None else snapshot_from_db()
+    with open(file_path, 'wb') as f:
+        write_snapshot(tables, f)
+    return {name: len(columns['id']) for name, columns in tables.items()}
+
+
+def load_snapshot_file(file_path, user_id=None, skip_existing=False):
+    """Load a snapshot file (see load_snapshot)"""
+    with open(file_path, 'rb') as f:
+        return load_snapshot(read_snapshot(f.read()), user_id=user_id, skip_existing=skip_existing)
@@ -0,0 +1,126 @@
+"""
+Spaced-repetition review queue
+
+A question gets a review card for a user the first time they answer it
+wrong. From then on every answer to it (in any test, including review
+sessions) reschedules the card with a binary SM-2 variant:
+
+    correct: interval = 1 day, then 6 days, then interval * ease
+    wrong:   ease -= 0.2 (not below 1.3), repetitions reset, due again now
+
+Cards are indexed on (user_id, due_at), so the review queue of a user is a
+single index range scan however long their history is. Cards are updated
+when a test is submitted; /review turns the due queue into a practice test.
+"""
+
+from datetime import timedelta
+from types import SimpleNamespace
+from nihongo.models import db
+from nihongo.models.review_card import ReviewCard
+from nihongo.models.utils import upsert_insert
+
+MIN_EASE = 1.3
+LAPSE_EASE_PENALTY = 0.2
+
+
+def schedule(card, correct, now):
+    """
+    Apply one answer to a card's schedule (in place).
+
+    Args:
+        card: ReviewCard or any object with the scheduling attributes
+        correct: Whether the answer was correct
+        now: Time of the answer
+    """
+    if correct:
+        if card.repetitions == 0:
+            card.interval_days = 1.0
+        elif card.repetitions == 1:
+            card.interval_days = 6.0
+        else:
+            card.interval_days = card.interval_days * card.ease
+        card.repetitions += 1
+        card.due_at = now + timedelta(days=card.interval_days)
+    else:
+        card.ease = max(MIN_EASE, card.ease - LAPSE_EASE_PENALTY)
+        card.interval_days = 0.0
+        card.repetitions = 0
+        card.lapses += 1
+        card.due_at = now
+    card.last_reviewed_at = now
+
+
+def record_reviews(user_id, question_ids, answer_dict, answer_key, answered_at):
+    """
+    Update a user's review cards from a completed test. The caller commits.
+
+    Questions answered wrong get a fresh card if they have none (one INSERT
+    ... ON CONFLICT DO NOTHING), then the test's cards are loaded and locked
+    in question id order and written back with one executemany UPDATE. Two
+    tests of the same user submitted at once neither collide on a new card
+    nor overwrite each other's schedule.
+
+    Args:
+        user_id: ID of the user
+        question_ids: Question ids of the test's exam
+        answer_dict: {question_id: selected_answer}
+        answer_key: {question_id: correct_answer}
+        answered_at: Completion time of the test
+    """
+    outcomes = {
+        question_id: answer_dict.get(question_id) == answer_key[question_id]
+        for question_id in dict.fromkeys(question_ids)
+        if question_id in answer_key
+    }
+    if not outcomes:
+        return
+
+    wrong = sorted(question_id for question_id, correct in outcomes.items() if not correct)
+    if wrong:
+        # Scheduled below like any card: the wrong answer is its first lapse
+        insert = upsert_insert(ReviewCard.__table__)
+        db.session.execute(
+            insert.on_conflict_do_nothing(index_elements=['user_id', 'question_id']),
+            [{'user_id': user_id, 'question_id': question_id, 'ease': 2.5, 'interval_days': 0.0,
+              'repetitions': 0, 'lapses': 0, 'due_at': answered_at, 'last_reviewed_at': answered_at}
+             for question_id in wrong]
+        )
+
+    columns = ('question_id', 'ease', 'interval_days', 'repetitions', 'lapses', 'due_at', 'last_reviewed_at')
+    cards = [
+        SimpleNamespace(**row._mapping)
+        for row in db.session.execute(
+            db.select(*(getattr(ReviewCard, column) for column in columns))
+            .where(ReviewCard.user_id == user_id, ReviewCard.question_id.in_(list(outcomes)))
+            .order_by(ReviewCard.question_id)
+            .with_for_update()
+        )
+    ]
+
+    for card in cards:
+        schedule(card, outcomes[card.question_id], answered_at)
+    if cards:
+        db.session.execute(db.update(ReviewCard), [dict(vars(card), user_id=user_id) for card in cards])
+
+
+def due_query(user_id, now):
+    """Cards of a user due at now, soonest first (range scan on ix_review_cards_user_due)"""
+    return ReviewCard.query.filter(
+        ReviewCard.user_id == user_id,
+        ReviewCard.due_at <= now
+    ).order_by(ReviewCard.due_at)
+
+
+def get_due_question_ids(user_id, now, limit):
+    """
+    Question ids of the user's next review session.
+
+    Returns:
+        list: Up to limit question ids, most overdue first
+    """
+    rows = due_query(user_id, now).with_entities(ReviewCard.question_id).limit(limit).all()
+    return [question_id for (question_id,) in rows]
+
+
+def count_due(user_id, now):
+    return due_query(user_id, now).order_by(None).count()
@@ -0,0 +1,219 @@
+"""
+Shared key-value stores
+
+Byte-oriented key-value backends with per-key expiry. They back server-side
+sessions and any other state that has to be shared between gunicorn workers.
+
+Backends:
+    memory - in-process dict (single worker, tests)
+    sql    - the store_entries table in the application database
+    redis  - any server speaking the Redis protocol (Redis, Valkey, KeyDB...)
+"""
+
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from flask import has_app_context
+from nihongo.models import db
+from nihongo.models.store_entry import StoreEntry
+from nihongo.models.utils import upsert_insert
+
+
+class MemoryStore:
+    """In-process store, also used as the fake store in tests"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (bytes(value), expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def sweep(self):
+        """Remove expired entries. Returns the number of entries removed."""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._data.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+
+class SQLStore:
+    """Store backed by the store_entries table"""
+
+    def __init__(self, app):
+        self.app = app
+        self.table = StoreEntry.__table__
+
+    def _engine(self):
+        if has_app_context():
+            return db.engine
+        with self.app.app_context():
+            return db.engine
+
+    def get(self, key):
+        # Uses its own connection so it never interferes with the request's ORM session
+        with self._engine().connect() as conn:
+            row = conn.execute(
+                db.select(self.table.c.value, self.table.c.expires_at).where(self.table.c.key == key)
+            ).first()
+        if row is None:
+            return None
+        if row.expires_at is not None and row.expires_at <= datetime.utcnow():
+            return None
+        return row.value
+
+    def set(self, key, value, ttl=None):
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl) if ttl else None
+        values = {'value': bytes(value), 'expires_at': expires_at}
+        engine = self._engine()
+        # One upsert, so two workers setting a new key at once do not collide on it
+        insert = upsert_insert(self.table, engine.dialect.name).values(key=key, **values)
+        with engine.begin() as conn:
+            conn.execute(insert.on_conflict_do_update(index_elements=['key'], set_=values))
+
+    def delete(self, key):
+        with self._engine().begin() as conn:
+            conn.execute(self.table.delete().where(self.table.c.key == key))
+
+    def sweep(self):
+        """Remove expired entries. Returns the number of entries removed."""
+        with self._engine().begin() as conn:
+            result = conn.execute(
+                self.table.delete().where(self.table.c.expires_at <= datetime.utcnow())
+            )
+        return result.rowcount
+
+
+class RedisProtocolError(Exception):
+    """Error reply or malformed data from a Redis-protocol server"""
+
+
+class RedisStore:
+    """Store backed by a Redis-protocol server (expiry is handled by the server)"""
+
+    def __init__(self, url, timeout=5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.database = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = (sock, sock.makefile('rb'))
+            self._local.conn = conn
+            if self.password:
+                self._command('AUTH', self.password)
+            if self.database:
+                self._command('SELECT', self.database)
+        return conn
+
+    def _close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn[1].close()
+            conn[0].close()
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Connection closed by server')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            raise RedisProtocolError(payload.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self._read_reply(reader) for _ in range(count)]
+        raise RedisProtocolError(f'Unknown reply type: {kind!r}')
+
+    def _command(self, *args):
+        sock, reader = self._connection()
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode('utf-8')
+            elif isinstance(arg, int):
+                arg = str(arg).encode('ascii')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        try:
+            sock.sendall(b''.join(parts))
+            return self._read_reply(reader)
+        except OSError:
+            # Drop the connection on transport errors so the next call reconnects
+            self._close()
+            raise
+
+    def get(self, key):
+        return self._command('GET', key)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self._command('SET', key, bytes(value), 'PX', int(ttl * 1000))
+        else:
+            self._command('SET', key, bytes(value))
+
+    def delete(self, key):
+        self._command('DEL', key)
+
+    def sweep(self):
+        """Expiry is enforced by the server, nothing to sweep."""
+        return 0
+
+
+def create_store(backend, app):
+    """
+    Create a store for the given backend name.
+
+    Args:
+        backend: 'memory', 'sql' or 'redis'
+        app: Flask application (used for the database and STORE_REDIS_URL)
+
+    Returns:
+        Store instance
+    """
+    if backend == 'memory':
+        return MemoryStore()
+    if backend == 'sql':
+        return SQLStore(app)
+    if backend == 'redis':
+        return RedisStore(app.config['STORE_REDIS_URL'])
+    raise ValueError(f"Unknown store backend: {backend}")
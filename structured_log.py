@@ -0,0 +1,187 @@
+"""
+Structured logging
+
+Every request is logged as one line with its endpoint, status, duration,
+SQL statement count and time, and user id, and exam imports and reloads log
+the timing of their phases. Lines are JSON by default (LOG_FORMAT='json'),
+one object per line, or 'event key=value' text for reading in a terminal
+(LOG_FORMAT='text').
+
+Records are formatted in the thread that logs them and put on an in-memory
+queue; a QueueListener thread does the writing, so a slow disk or a full
+pipe never holds up a request. The listener is restarted in a worker that
+was forked after it started (gunicorn --preload), since threads do not
+survive a fork.
+
+Usage:
+    from nihongo.structured_log import get_logger, log_event
+    log_event(get_logger('import'), 'exam_import', exam_id=3, duration_ms=41.2)
+"""
+
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request, session
+from nihongo.query_counter import init_request_queries, request_queries
+
+LOGGER_NAME = 'nihongo'
+
+_handler = None
+
+
+def get_logger(name=None):
+    """Logger under the app's 'nihongo' logger"""
+    return logging.getLogger(f'{LOGGER_NAME}.{name}' if name else LOGGER_NAME)
+
+
+def log_event(logger, name, level=logging.INFO, **fields):
+    """
+    Log one structured event.
+
+    Args:
+        logger: Logger to write to (see get_logger)
+        name: Event name, e.g. 'request' or 'exam_import'
+        level: Logging level
+        **fields: JSON-serializable values logged with the event
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, name, extra={'fields': fields})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, event and the event's fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """'time level event key=value ...' lines"""
+
+    def format(self, record):
+        stamp = datetime.fromtimestamp(record.created).strftime('%H:%M:%S')
+        fields = ' '.join(f'{key}={value}' for key, value in getattr(record, 'fields', {}).items())
+        line = f'{stamp} {record.levelname:<7} {record.getMessage()} {fields}'.rstrip()
+        if record.exc_info:
+            line = f'{line}\n{self.formatException(record.exc_info)}'
+        return line
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Formats records in the caller's thread and hands them to a writer thread.
+
+    The queued record's message is the formatted line (QueueHandler.prepare),
+    so the target handler only writes it.
+
+    Args:
+        target: Handler that does the writing, in the listener thread
+    """
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._start_listener()
+
+    def _start_listener(self):
+        self.pid = os.getpid()
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def enqueue(self, record):
+        if self.pid != os.getpid():
+            self._start_listener()  # Forked after the listener thread started
+        self.queue.put_nowait(record)
+
+    def close(self):
+        # Also called by logging.shutdown at exit, which flushes the queue
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+        self.target.close()
+        super().close()
+
+
+def _start_request():
+    g.request_log_start = time.perf_counter()
+
+
+def _log_request(response):
+    start = g.pop('request_log_start', None)
+    if start is None:
+        return response
+    queries = request_queries()
+    log_event(
+        get_logger('request'), 'request',
+        method=request.method,
+        path=request.path,
+        endpoint=request.endpoint,
+        status=response.status_code,
+        duration_ms=round((time.perf_counter() - start) * 1000, 2),
+        sql_count=queries.count if queries else 0,
+        sql_ms=round(queries.seconds * 1000, 2) if queries else 0.0,
+        # From the session: current_user may be expired by a commit and reload with a query
+        user_id=session.get('_user_id'),
+    )
+    return response
+
+
+@contextmanager
+def timed_phase(phases, name):
+    """
+    Add the duration of a with-block to phases[f'{name}_ms'].
+
+    Usage:
+        phases = {}
+        with timed_phase(phases, 'commit'):
+            db.session.commit()
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        key = f'{name}_ms'
+        phases[key] = round(phases.get(key, 0) + (time.perf_counter() - start) * 1000, 2)
+
+
+def init_logging(app):
+    """
+    Send the app's log records through a background writer and log each request.
+
+    Writes to LOG_FILE, or stderr when it is not set.
+    """
+    global _handler
+    if _handler is not None:
+        get_logger().removeHandler(_handler)
+        _handler.close()
+
+    log_file = app.config['LOG_FILE']
+    target = logging.FileHandler(log_file, encoding='utf-8') if log_file else logging.StreamHandler(sys.stderr)
+    _handler = BackgroundHandler(target)
+    _handler.setFormatter(TextFormatter() if app.config['LOG_FORMAT'] == 'text' else JsonFormatter())
+
+    logger = get_logger()
+    logger.setLevel(app.config['LOG_LEVEL'])
+    logger.propagate = False
+    logger.addHandler(_handler)
+
+    if app.config['REQUEST_LOG_ENABLED']:
+        init_request_queries(app)
+        app.before_request(_start_request)
+        app.after_request(_log_request)
+    return logger
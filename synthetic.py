@@ -0,0 +1,275 @@
+"""
+Synthetic dataset generator
+
+Fills the database with production-sized volumes of made-up users, exams,
+sections, questions (with <ruby> furigana), tests and answers, for
+benchmarks and query-plan checks. Rows go in with bulk INSERTs and explicit
+ids (see snapshot.py), never through the ORM.
+
+The same seed and end day always give the same rows. The one exception is
+the password hash, which has a random salt.
+
+Answers follow a simple item-response model. Each student has an ability
+and each question has a difficulty. The chance of a correct answer is
+25% guessing plus a logistic term in (ability - difficulty), so strong
+students score high, hard questions stay hard, and wrong answers are spread
+over the distractors.
+"""
+
+import math
+import random
+from datetime import datetime, time, timedelta
+from sqlalchemy import func
+from nihongo.models import db
+from nihongo.models.user import User
+from nihongo.models.question import Question
+from nihongo.models.section import Section
+from nihongo.models.exam import Exam
+from nihongo.models.exam_section import ExamSection
+from nihongo.models.section_question import SectionQuestion
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.models.utils import set_explanation
+from nihongo.snapshot import reset_id_sequences
+from nihongo.catalogue import bump_content_generation
+
+SECTION_NAMES = ('Vocabulary', 'Grammar', 'Reading', 'Listening', 'Kanji')
+SYNTHETIC_PASSWORD = 'synthetic'
+INSERT_BATCH_SIZE = 5000
+
+# (kanji, reading, English, Spanish)
+WORDS = (
+    ('私', 'わたし', 'I', 'yo'),
+    ('毎日', 'まいにち', 'every day', 'todos los días'),
+    ('学校', 'がっこう', 'school', 'escuela'),
+    ('先生', 'せんせい', 'teacher', 'profesor'),
+    ('電車', 'でんしゃ', 'train', 'tren'),
+    ('友達', 'ともだち', 'friend', 'amigo'),
+    ('日本語', 'にほんご', 'Japanese', 'japonés'),
+    ('図書館', 'としょかん', 'library', 'biblioteca'),
+    ('天気', 'てんき', 'weather', 'clima'),
+    ('映画', 'えいが', 'movie', 'película'),
+    ('今日', 'きょう', 'today', 'hoy'),
+    ('駅', 'えき', 'station', 'estación'),
+    ('水', 'みず', 'water', 'agua'),
+    ('山', 'やま', 'mountain', 'montaña'),
+    ('会社', 'かいしゃ', 'company', 'empresa'),
+    ('病院', 'びょういん', 'hospital', 'hospital'),
+)
+# (particle, English use, Spanish use)
+PARTICLES = (
+    ('に', 'destination or time', 'destino o tiempo'),
+    ('を', 'direct object', 'objeto directo'),
+    ('で', 'place of an action', 'lugar de una acción'),
+    ('が', 'subject', 'sujeto'),
+)
+# (verb, particle it takes)
+VERBS = (('いきます', 'に'), ('よみます', 'を'), ('べんきょうします', 'で'), ('あります', 'が'))
+
+SYNTHETIC_MODELS = (User, Question, Section, Exam, ExamSection, SectionQuestion, Test, TestAnswer)
+
+
+def ruby(kanji, reading):
+    return f'<ruby>{kanji}<rt>{reading}</rt></ruby>'
+
+
+def make_question(rng, section_name, created_by, created_at):
+    """One synthetic question row for a section (kanji readings or particles)"""
+    if section_name == 'Kanji':
+        word = rng.choice(WORDS)
+        distractors = rng.sample([w[1] for w in WORDS if w is not word], 3)
+        answer = word[1]
+        options = distractors + [answer]
+        text = f'「{word[0]}」の よみかたは どれですか。'
+        explanation = set_explanation(f'{ruby(word[0], word[1])} means "{word[2]}".',
+                                      f'{ruby(word[0], word[1])} significa "{word[3]}".')
+    else:
+        subject, place = rng.sample(WORDS, 2)
+        verb, particle = rng.choice(VERBS)
+        correct = next(p for p in PARTICLES if p[0] == particle)
+        answer = particle
+        options = [p[0] for p in PARTICLES if p is not correct] + [answer]
+        text = f'{ruby(*subject[:2])}は {ruby(*place[:2])}___{verb}。'
+        explanation = set_explanation(f'{particle} marks the {correct[1]}.',
+                                      f'{particle} marca el {correct[2]}.')
+    rng.shuffle(options)
+    correct_answer = options.index(answer) + 1
+    return {
+        'question_text': text,
+        'question_image': None,
+        'question_audio': f'https://example.com/audio/{rng.randrange(10 ** 6)}.mp3' if section_name == 'Listening' else None,
+        'answer_1': options[0], 'answer_2': options[1], 'answer_3': options[2], 'answer_4': options[3],
+        'correct_answer': correct_answer,
+        'explanation': explanation,
+        'created_by': created_by,
+        'created_at': created_at,
+        'updated_at': created_at,
+    }
+
+
+def p_correct(ability, difficulty):
+    """Chance of a correct answer: 25% guessing floor plus a logistic ability term"""
+    return 0.25 + 0.75 / (1 + math.exp(-1.7 * (ability - difficulty)))
+
+
+class _BulkWriter:
+    """Buffers rows per model and INSERTs them in batches, parents first"""
+
+    def __init__(self):
+        self.rows = {model: [] for model in SYNTHETIC_MODELS}
+        self.counts = {model.__tablename__: 0 for model in SYNTHETIC_MODELS}
+
+    def add(self, model, row):
+        self.rows[model].append(row)
+        if len(self.rows[model]) >= INSERT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        for model in SYNTHETIC_MODELS:
+            rows = self.rows[model]
+            if rows:
+                db.session.execute(model.__table__.insert(), rows)
+                self.counts[model.__tablename__] += len(rows)
+                rows.clear()
+
+
+def generate_synthetic(users=100, exams=10, sections_per_exam=5, questions_per_section=40,
+                       tests_per_user=5, completed_ratio=0.9, days=90, seed=0, end_day=None):
+    """
+    Bulk-insert a synthetic dataset and commit.
+
+    Users are synthetic-<seed>-<n>@example.com with the password
+    'synthetic'. The first one owns the generated exams and questions.
+
+    Args:
+        users: Students to create
+        exams: Exams to create, each with its own sections and questions
+        sections_per_exam: Sections per exam (names cycle through SECTION_NAMES)
+        questions_per_section: Questions per section
+        tests_per_user: Tests started by each student
+        completed_ratio: Share of tests that were submitted; the rest are in progress
+        days: Tests are spread over this many days before end_day
+        seed: Random seed
+        end_day: Last day of activity (date, default today UTC)
+
+    Returns:
+        dict: Rows inserted per table, plus 'first_day' and 'last_day' of completed tests
+
+    Raises:
+        ValueError: If this seed was already generated into the database
+    """
+    if users < 1:
+        raise ValueError('At least one user is needed to own the content')
+    email_prefix = f'synthetic-{seed}-'
+    if User.query.filter_by(email=f'{email_prefix}0@example.com').first():
+        raise ValueError(f'Seed {seed} was already generated into this database')
+
+    rng = random.Random(seed)
+    end = datetime.combine(end_day or datetime.utcnow().date(), time())
+    start = end - timedelta(days=days)
+    next_id = {
+        model: db.session.query(func.coalesce(func.max(model.id), 0)).scalar() + 1
+        for model in SYNTHETIC_MODELS
+    }
+
+    def new_id(model):
+        next_id[model] += 1
+        return next_id[model] - 1
+
+    writer = _BulkWriter()
+
+    # Users (one hash for all: scrypt per user would dominate the run)
+    template = User()
+    template.set_password(SYNTHETIC_PASSWORD)
+    password_hash = template.password_hash
+    user_ids, abilities = [], []
+    for n in range(users):
+        user_ids.append(new_id(User))
+        abilities.append(rng.gauss(0, 1))
+        writer.add(User, {'id': user_ids[-1], 'email': f'{email_prefix}{n}@example.com',
+                          'password_hash': password_hash, 'is_admin': False})
+    owner_id = user_ids[0]
+
+    # Content: exam -> sections -> questions, each question in one section
+    exam_questions = []  # Per exam: [(question_id, correct_answer, difficulty)] in exam order
+    exam_ids = []
+    for e in range(exams):
+        created_at = start - timedelta(days=rng.randint(1, 30))
+        exam_id = new_id(Exam)
+        exam_ids.append(exam_id)
+        writer.add(Exam, {'id': exam_id, 'name': f'Synthetic Exam {seed}-{e}',
+                          'created_by': owner_id, 'created_at': created_at})
+        questions = []
+        for s in range(sections_per_exam):
+            section_name = SECTION_NAMES[s % len(SECTION_NAMES)]
+            section_id = new_id(Section)
+            writer.add(Section, {'id': section_id, 'name': section_name,
+                                 'number_of_questions': questions_per_section})
+            writer.add(ExamSection, {'id': new_id(ExamSection), 'exam_id': exam_id,
+                                     'section_id': section_id, 'order': s})
+            for q in range(questions_per_section):
+                row = make_question(rng, section_name, owner_id, created_at)
+                row['id'] = new_id(Question)
+                writer.add(Question, row)
+                writer.add(SectionQuestion, {'id': new_id(SectionQuestion), 'section_id': section_id,
+                                             'question_id': row['id'], 'order': q})
+                questions.append((row['id'], row['correct_answer'], rng.gauss(0, 1)))
+        exam_questions.append(questions)
+
+    # Tests and answers
+    first_day = last_day = None
+    for user_id, ability in zip(user_ids, abilities):
+        in_progress = set()
+        for _ in range(tests_per_user if exams else 0):
+            exam_index = rng.randrange(exams)
+            completed = rng.random() < completed_ratio
+            if not completed and exam_index in in_progress:
+                completed = True  # At most one unfinished test per exam, like start_exam
+            started_at = start + timedelta(seconds=rng.uniform(0, days * 86400))
+            questions = exam_questions[exam_index]
+            if completed:
+                answered = questions
+            else:
+                in_progress.add(exam_index)
+                answered = questions[:rng.randrange(len(questions) + 1)]
+
+            test_id = new_id(Test)
+            answers = []
+            correct_count = 0
+            answer_time = started_at
+            for question_id, correct_answer, difficulty in answered:
+                answer_time += timedelta(seconds=rng.uniform(5, 40))
+                if completed and rng.random() < 0.02:
+                    continue  # Left blank
+                if rng.random() < p_correct(ability, difficulty):
+                    selected = correct_answer
+                    correct_count += 1
+                else:
+                    selected = rng.choice([a for a in (1, 2, 3, 4) if a != correct_answer])
+                answers.append({'id': new_id(TestAnswer), 'test_id': test_id, 'user_id': user_id,
+                                'question_id': question_id, 'selected_answer': selected,
+                                'answered_at': answer_time})
+
+            completed_at = None
+            if completed:
+                completed_at = answer_time + timedelta(seconds=rng.uniform(30, 600))
+                first_day = min(first_day or completed_at.date(), completed_at.date())
+                last_day = max(last_day or completed_at.date(), completed_at.date())
+            writer.add(Test, {
+                'id': test_id, 'exam_id': exam_ids[exam_index], 'user_id': user_id,
+                'started_at': started_at, 'completed_at': completed_at, 'answers_packed': None,
+                'correct_count': correct_count if completed else None,
+                'total_questions': len(questions) if completed else None,
+            })
+            for answer in answers:
+                writer.add(TestAnswer, answer)
+
+    writer.flush()
+    reset_id_sequences(SYNTHETIC_MODELS)
+    db.session.commit()
+    # Core inserts bypass the ORM events that keep the catalogue cache current
+    bump_content_generation()
+
+    counts = dict(writer.counts)
+    counts['first_day'], counts['last_day'] = first_day, last_day
+    return counts
@@ -0,0 +1,281 @@
+"""
+In-progress test state cache
+
+Keeps, per started test, the ordered question ids of its exam and the
+student's current answers, so reloading take_exam and autosaving answers do
+not re-query the exam structure and test_answers on every request.
+
+Autosave is write-through: the answer is written to test_answers (or to the
+write-behind buffer, see answer_buffer.py) and to the cached state in the
+same request. The state is dropped when the test is submitted.
+
+Backends (TEST_STATE_BACKEND):
+    local            - bounded in-process LRU (single worker)
+    memory/sql/redis - shared store from stores.py, for several workers
+"""
+
+import json
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from flask import current_app
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.models.question import Question
+from nihongo.models.exam_section import ExamSection
+from nihongo.models.section import Section
+from nihongo.models.section_question import SectionQuestion
+from nihongo.stores import create_store
+from nihongo.metrics import CACHE_LOOKUPS
+
+TEST_STATE_KEY_PREFIX = 'test-state:'
+_HEADER = struct.Struct('<BIIII')
+_FORMAT_VERSION = 1
+
+
+class TestState:
+    """Ordered question ids and answers (0 = unanswered) of one in-progress test"""
+
+    __test__ = False  # Not a pytest test class
+
+    def __init__(self, test_id, user_id, exam_id, question_ids, sections, answers=None):
+        self.test_id = test_id
+        self.user_id = user_id
+        self.exam_id = exam_id
+        self.question_ids = array('I', question_ids)
+        self.sections = [tuple(section) for section in sections]  # [(name, question_count), ...]
+        self.answers = bytearray(answers if answers is not None else len(self.question_ids))
+        self._positions = {question_id: i for i, question_id in enumerate(self.question_ids)}
+
+    def position(self, question_id):
+        """Index of a question in the test, or None if it is not part of it"""
+        return self._positions.get(question_id)
+
+    def set_answer(self, question_id, selected_answer):
+        self.answers[self._positions[question_id]] = selected_answer
+
+    def answer_dict(self):
+        """Answers as {question_id: selected_answer}, like the test_answers rows"""
+        return {
+            question_id: answer
+            for question_id, answer in zip(self.question_ids, self.answers)
+            if answer
+        }
+
+    def summary(self):
+        """Saved answers and progress, as served by GET /test/<id>/state"""
+        answers = self.answer_dict()
+        return {
+            'test_id': self.test_id,
+            'answers': {str(question_id): answer for question_id, answer in answers.items()},
+            'answered': len(answers),
+            'total': len(self.question_ids),
+        }
+
+    def section_names(self):
+        """Section name for each question, in test order"""
+        names = []
+        for name, count in self.sections:
+            names.extend([name] * count)
+        return names
+
+    def to_bytes(self):
+        sections = json.dumps(self.sections, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return b''.join([
+            _HEADER.pack(_FORMAT_VERSION, self.test_id, self.user_id, self.exam_id, len(self.question_ids)),
+            self.question_ids.tobytes(),
+            bytes(self.answers),
+            sections
+        ])
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, test_id, user_id, exam_id, count = _HEADER.unpack_from(data)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f'Unsupported test state format: {version}')
+
+        offset = _HEADER.size
+        question_ids = array('I')
+        question_ids.frombytes(data[offset:offset + count * question_ids.itemsize])
+        offset += count * question_ids.itemsize
+        answers = data[offset:offset + count]
+        sections = json.loads(data[offset + count:].decode('utf-8'))
+        return cls(test_id, user_id, exam_id, question_ids, sections, answers)
+
+    @classmethod
+    def from_db(cls, test):
+        """Build the state of a test from the exam structure and saved answers"""
+        exam_sections = db.session.query(
+            ExamSection.section_id, Section.name
+        ).join(
+            Section, Section.id == ExamSection.section_id
+        ).filter(
+            ExamSection.exam_id == test.exam_id
+        ).order_by(ExamSection.order).all()
+
+        rows = SectionQuestion.query.filter(
+            SectionQuestion.section_id.in_([section_id for section_id, _ in exam_sections])
+        ).order_by(
+            SectionQuestion.order, SectionQuestion.id
+        ).with_entities(
+            SectionQuestion.section_id, SectionQuestion.question_id
+        ).all()
+
+        section_question_ids = {}
+        for section_id, question_id in rows:
+            section_question_ids.setdefault(section_id, []).append(question_id)
+
+        question_ids = []
+        sections = []
+        for section_id, name in exam_sections:
+            ids = section_question_ids.get(section_id, [])
+            question_ids.extend(ids)
+            sections.append((name, len(ids)))
+
+        state = cls(test.id, test.user_id, test.exam_id, question_ids, sections)
+
+        saved_answers = TestAnswer.query.filter_by(test_id=test.id).with_entities(
+            TestAnswer.question_id, TestAnswer.selected_answer
+        ).all()
+        for question_id, selected_answer in saved_answers:
+            if selected_answer and state.position(question_id) is not None:
+                state.set_answer(question_id, selected_answer)
+
+        return state
+
+
+class LocalTestStateCache:
+    """Bounded in-process LRU of TestState objects"""
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, test_id):
+        with self._lock:
+            state = self._states.get(test_id)
+            if state is not None:
+                self._states.move_to_end(test_id)
+            return state
+
+    def put(self, state):
+        with self._lock:
+            self._states[state.test_id] = state
+            self._states.move_to_end(state.test_id)
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+
+    def discard(self, test_id):
+        with self._lock:
+            self._states.pop(test_id, None)
+
+    def __len__(self):
+        return len(self._states)
+
+
+class SharedTestStateCache:
+    """TestState objects kept in a shared store, visible to every worker"""
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+
+    def get(self, test_id):
+        data = self.store.get(f'{TEST_STATE_KEY_PREFIX}{test_id}')
+        if data is None:
+            return None
+        try:
+            return TestState.from_bytes(data)
+        except (ValueError, struct.error):
+            return None
+
+    def put(self, state):
+        self.store.set(f'{TEST_STATE_KEY_PREFIX}{state.test_id}', state.to_bytes(), ttl=self.ttl)
+
+    def discard(self, test_id):
+        self.store.delete(f'{TEST_STATE_KEY_PREFIX}{test_id}')
+
+
+def init_test_state_cache(app):
+    """
+    Create the test state cache selected by TEST_STATE_BACKEND.
+
+    Args:
+        app: Flask application
+
+    Returns:
+        LocalTestStateCache or SharedTestStateCache
+    """
+    backend = app.config.get('TEST_STATE_BACKEND', 'local')
+    if backend == 'local':
+        cache = LocalTestStateCache(app.config.get('TEST_STATE_CACHE_SIZE', 1024))
+    else:
+        cache = SharedTestStateCache(create_store(backend, app), app.config.get('TEST_STATE_TTL', 6 * 3600))
+    app.extensions['test_state_cache'] = cache
+    return cache
+
+
+def get_test_state(test_id, test=None):
+    """
+    Get the state of an in-progress test, building it from the database on a miss.
+
+    Args:
+        test_id: ID of the test
+        test: Already loaded Test, if the caller has one
+
+    Returns:
+        TestState, or None if the test does not exist or is already completed
+    """
+    cache = current_app.extensions['test_state_cache']
+    state = cache.get(test_id)
+    CACHE_LOOKUPS.inc(cache='test_state', result='miss' if state is None else 'hit')
+    if state is not None:
+        return state
+
+    # Answers autosaved through the write-behind buffer are not all in test_answers yet
+    answer_buffer = current_app.extensions.get('answer_buffer')
+    if answer_buffer is not None:
+        answer_buffer.flush_test(test_id)
+
+    if test is None:
+        test = Test.query.get(test_id)
+    if test is None or test.completed_at:
+        return None
+
+    state = TestState.from_db(test)
+    cache.put(state)
+    return state
+
+
+def save_test_state(state):
+    """Write a modified state back to the cache (no-op copy for the local LRU)"""
+    current_app.extensions['test_state_cache'].put(state)
+
+
+def discard_test_state(test_id):
+    """Drop the cached state of a test (on submit)"""
+    current_app.extensions['test_state_cache'].discard(test_id)
+
+
+def load_state_questions(state):
+    """
+    Load the questions of a test state in one query.
+
+    Args:
+        state: TestState
+
+    Returns:
+        list: Dicts with 'section' and 'question', in test order (same shape as get_exam_questions)
+    """
+    questions_by_id = {
+        question.id: question
+        for question in Question.query.filter(Question.id.in_(list(state.question_ids))).all()
+    }
+    return [
+        {'section': section_name, 'question': questions_by_id[question_id]}
+        for question_id, section_name in zip(state.question_ids, state.section_names())
+        if question_id in questions_by_id
+    ]
@@ -16,6 +16,10 @@ from nihongo.models.user import User  # noqa: E402
 from nihongo.models.question import Question  # noqa: E402
 from nihongo.models.section import Section  # noqa: E402
 from nihongo.models.exam import Exam  # noqa: E402
+from nihongo.test_state import init_test_state_cache  # noqa: E402
+from nihongo.adaptive import init_sampler_cache  # noqa: E402
+from nihongo.catalogue import init_catalogue  # noqa: E402
+from nihongo.page_cache import init_page_cache  # noqa: E402
 
 
 @pytest.fixture
@@ -29,6 +33,12 @@ def app():
     flask_app.config['WTF_CSRF_ENABLED'] = False
     flask_app.config['SECRET_KEY'] = 'test-secret-key'
     
+    # Fresh in-process caches (ids are reused between test databases)
+    init_test_state_cache(flask_app)
+    init_sampler_cache(flask_app)
+    init_catalogue(flask_app)
+    init_page_cache(flask_app)
+    
     # Create tables
     with flask_app.app_context():
         db.create_all()
@@ -0,0 +1,165 @@
+"""
+Tests for adaptive practice
+"""
+import random
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.question import Question
+from nihongo.models.section import Section
+from nihongo.models.exam_section import ExamSection
+from nihongo.models.section_question import SectionQuestion
+from nihongo.models.user_question_mastery import UserQuestionMastery
+from nihongo.adaptive import (
+    FenwickTree, AdaptiveSampler, mastery_weight, record_mastery, get_sampler, WEIGHT_FLOOR
+)
+
+
+@pytest.fixture
+def grammar_pool(app, test_user):
+    """Create a 'Grammar' section with ten questions (correct answer 1)"""
+    with app.app_context():
+        section = Section(name='Grammar', number_of_questions=10)
+        db.session.add(section)
+        db.session.flush()
+        question_ids = []
+        for i in range(10):
+            question = Question(question_text=f'G{i}', answer_1='a', answer_2='b', answer_3='c', answer_4='d',
+                                correct_answer=1, created_by=test_user['id'])
+            db.session.add(question)
+            db.session.flush()
+            db.session.add(SectionQuestion(section_id=section.id, question_id=question.id, order=i))
+            question_ids.append(question.id)
+        db.session.commit()
+        return question_ids
+
+
+@pytest.mark.models
+def test_fenwick_find_and_update():
+    """Test prefix-sum search follows point updates"""
+    tree = FenwickTree([1.0, 0.0, 2.0, 3.0, 0.5])
+    assert tree.total() == pytest.approx(6.5)
+    assert [tree.find(value) for value in (0.0, 0.99, 1.0, 2.99, 3.0, 5.99, 6.0)] == [0, 0, 2, 2, 3, 3, 4]
+
+    tree.set(2, 0.0)
+    assert tree.total() == pytest.approx(4.5)
+    assert tree.find(1.0) == 3
+
+
+@pytest.mark.models
+def test_sampler_draws_distinct_weighted_questions():
+    """Test samples have no repeats and follow the weights"""
+    sampler = AdaptiveSampler(range(100), [10.0 if i < 5 else 0.1 for i in range(100)])
+    rng = random.Random(7)
+
+    counts = {}
+    for _ in range(300):
+        drawn = sampler.sample(5, rng)
+        assert len(set(drawn)) == 5
+        for question_id in drawn:
+            counts[question_id] = counts.get(question_id, 0) + 1
+
+    # 5% of the pool holds 84% of the weight
+    heavy = sum(counts.get(i, 0) for i in range(5))
+    assert heavy > 0.7 * 300 * 5
+    # Weights are restored after sampling
+    assert sampler.weight(0) == 10.0
+    assert sorted(sampler.sample(500, rng)) == list(range(100))
+
+
+@pytest.mark.models
+def test_mastery_weight():
+    """Test unseen and missed questions outweigh mastered and recently seen ones"""
+    now = datetime(2026, 3, 10)
+    unseen = mastery_weight(0, 0, None, now, 3)
+    missed = mastery_weight(4, 0, now - timedelta(days=30), now, 3)
+    mastered = mastery_weight(4, 4, now - timedelta(days=30), now, 3)
+    just_missed = mastery_weight(4, 0, now, now, 3)
+
+    assert missed > unseen > mastered > WEIGHT_FLOOR
+    assert just_missed == pytest.approx(WEIGHT_FLOOR)
+
+
+@pytest.mark.models
+def test_record_mastery_updates_rows_and_samplers(app, test_user, grammar_pool):
+    """Test mastery rows are updated incrementally and cached pools follow"""
+    user_id = test_user['id']
+    answer_key = {question_id: 1 for question_id in grammar_pool}
+    seen_at = datetime.utcnow() - timedelta(days=30)
+    with app.app_context():
+        sampler = get_sampler(user_id, 'Grammar')
+        assert len(sampler) == 10
+
+        for answer in (2, 1):
+            record_mastery(user_id, grammar_pool[:2], {grammar_pool[0]: answer}, answer_key, seen_at)
+        db.session.commit()
+
+        first = db.session.get(UserQuestionMastery, (user_id, grammar_pool[0]))
+        second = db.session.get(UserQuestionMastery, (user_id, grammar_pool[1]))
+        assert (first.attempts, first.correct_count, first.last_correct) == (2, 1, True)
+        assert (second.attempts, second.correct_count, second.last_correct) == (2, 0, False)
+
+        assert get_sampler(user_id, 'Grammar') is sampler
+        assert sampler.weight(grammar_pool[1]) > sampler.weight(grammar_pool[2]) > sampler.weight(grammar_pool[0])
+
+
+@pytest.mark.models
+def test_record_mastery_with_concurrent_submit(app, test_user, grammar_pool):
+    """Test rows inserted by another submit while this one records are updated, not inserted twice"""
+    user_id = test_user['id']
+    answer_key = {question_id: 1 for question_id in grammar_pool}
+    seen_at = datetime.utcnow()
+    with app.app_context():
+        engine = db.engine
+        other_submit = []
+
+        def insert_first(conn, cursor, statement, parameters, context, executemany):
+            # Another worker commits the same user's first attempt just before this statement
+            if statement.startswith('INSERT INTO user_question_mastery') and not other_submit:
+                other_submit.append(True)
+                with engine.begin() as other:
+                    other.execute(db.insert(UserQuestionMastery).values(
+                        user_id=user_id, question_id=grammar_pool[0], attempts=1, correct_count=0,
+                        last_correct=False, last_seen_at=seen_at
+                    ))
+
+        event.listen(engine, 'before_cursor_execute', insert_first)
+        try:
+            record_mastery(user_id, grammar_pool[:1], {grammar_pool[0]: 1}, answer_key, seen_at)
+            db.session.commit()
+        finally:
+            event.remove(engine, 'before_cursor_execute', insert_first)
+
+        row = db.session.get(UserQuestionMastery, (user_id, grammar_pool[0]))
+        assert (row.attempts, row.correct_count, row.last_correct) == (2, 1, True)
+
+
+@pytest.mark.routes
+def test_adaptive_exam_prefers_weak_questions(auth_client, app, test_user, grammar_pool):
+    """Test the adaptive generator favours questions the user keeps missing"""
+    user_id = test_user['id']
+    answer_key = {question_id: 1 for question_id in grammar_pool}
+    weak = set(grammar_pool[:3])
+    with app.app_context():
+        # Everything answered long ago: three questions always missed, the rest always right
+        answers = {question_id: (2 if question_id in weak else 1) for question_id in grammar_pool}
+        for _ in range(5):
+            record_mastery(user_id, grammar_pool, answers, answer_key, datetime.utcnow() - timedelta(days=60))
+        db.session.commit()
+
+    random.seed(3)
+    picked = []
+    for _ in range(20):
+        response = auth_client.post('/exam/random/create', data={'section_Grammar': 3, 'adaptive': 'on'})
+        assert response.status_code == 302
+        with app.app_context():
+            test = Test.query.order_by(Test.id.desc()).first()
+            assert test.exam.name.startswith('Adaptive Practice Exam')
+            section_id = ExamSection.query.filter_by(exam_id=test.exam_id).one().section_id
+            picked.extend(sq.question_id for sq in SectionQuestion.query.filter_by(section_id=section_id))
+
+    # Uniform sampling would give 30% weak questions
+    assert len(picked) == 60
+    assert sum(question_id in weak for question_id in picked) > 24
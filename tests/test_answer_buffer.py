@@ -0,0 +1,118 @@
+"""
+Tests for the write-behind answer buffer
+"""
+import os
+from datetime import datetime, timedelta
+import pytest
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.answer_buffer import (
+    AnswerBuffer, encode_record, read_segment, replay_segments, segment_paths, write_answers
+)
+
+
+@pytest.fixture
+def started_test(app, test_user, test_exam):
+    """Create an in-progress test for test_user"""
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+        return test.id
+
+
+@pytest.fixture
+def answer_buffer(app, tmp_path):
+    """Enable the buffer; flushes only run when a test calls them"""
+    buffer = AnswerBuffer(app, str(tmp_path), flush_interval=3600)
+    app.extensions['answer_buffer'] = buffer
+    yield buffer
+    buffer.close()
+    app.extensions['answer_buffer'] = None
+
+
+def saved_answers(test_id):
+    rows = TestAnswer.query.filter_by(test_id=test_id).all()
+    return {row.question_id: row.selected_answer for row in rows}
+
+
+@pytest.mark.caching
+def test_autosave_is_written_behind(app, auth_client, started_test, test_question, answer_buffer, tmp_path):
+    """Test autosaves are logged, then coalesced into one row per question by a flush"""
+    for answer in (1, 2, 4):
+        response = auth_client.post(f'/test/{started_test}/answer', data={
+            'question_id': test_question, 'selected_answer': answer
+        })
+        assert response.get_json() == {'success': True}
+
+    with app.app_context():
+        assert saved_answers(started_test) == {}
+        [segment] = segment_paths(str(tmp_path))
+        assert [record[3] for record in read_segment(segment)] == [1, 2, 4]
+
+        assert answer_buffer.flush() == 1
+        assert saved_answers(started_test) == {test_question: 4}
+        assert not os.path.exists(segment)
+        assert answer_buffer.flush() == 0
+
+
+@pytest.mark.caching
+def test_submit_writes_answers_of_other_workers(app, auth_client, started_test, test_question,
+                                                answer_buffer, tmp_path):
+    """Test submit first writes the test's answers from every segment in the directory"""
+    auth_client.get(f'/test/{started_test}')
+    auth_client.post(f'/test/{started_test}/answer', data={'question_id': test_question, 'selected_answer': 2})
+    other_worker = AnswerBuffer(app, str(tmp_path), flush_interval=3600)
+    other_worker.append(started_test, 1, test_question, 1, datetime.utcnow())
+
+    auth_client.post(f'/test/{started_test}/submit')
+    other_worker.close()
+    with app.app_context():
+        assert saved_answers(started_test) == {test_question: 1}
+
+        # A late flush of the completed test leaves its answers alone
+        assert answer_buffer.flush() == 0
+        assert saved_answers(started_test) == {test_question: 1}
+
+
+
+@pytest.mark.caching
+def test_failing_flushes_reuse_the_segment(app, started_test, test_user, test_question, answer_buffer,
+                                           tmp_path, monkeypatch):
+    """Test retries during a database outage do not open a segment per flush"""
+    def database_down(answers):
+        raise ConnectionError('database is down')
+
+    answer_buffer.append(started_test, test_user['id'], test_question, 1, datetime.utcnow())
+    monkeypatch.setattr('nihongo.answer_buffer.write_answers', database_down)
+    for answer in (2, 3, 4):
+        assert answer_buffer.flush() == 0
+        answer_buffer.append(started_test, test_user['id'], test_question, answer, datetime.utcnow())
+    assert answer_buffer.flush() == 0
+    assert len(segment_paths(str(tmp_path))) == 2
+
+    monkeypatch.undo()
+    with app.app_context():
+        assert answer_buffer.flush() == 1
+        assert saved_answers(started_test) == {test_question: 4}
+    assert len(segment_paths(str(tmp_path))) == 1
+
+@pytest.mark.caching
+def test_replay_after_crash(app, started_test, test_user, test_question, tmp_path):
+    """Test segments of a dead process are replayed, ignoring a torn last record"""
+    answered_at = datetime(2026, 10, 18, 9, 30)
+    segment = tmp_path / 'answers-999999-deadbeef-000001.log'
+    segment.write_bytes(
+        encode_record(started_test, test_user['id'], test_question, 3, answered_at)
+        + encode_record(started_test, test_user['id'], test_question, 4, answered_at)[:10]
+    )
+
+    with app.app_context():
+        assert replay_segments(str(tmp_path)) == (1, 1)
+        assert saved_answers(started_test) == {test_question: 3}
+        assert not segment.exists()
+
+        # An older answer does not overwrite a newer one
+        write_answers({(started_test, test_question): (test_user['id'], 1, answered_at - timedelta(seconds=1))})
+        assert saved_answers(started_test) == {test_question: 3}
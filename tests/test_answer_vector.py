@@ -0,0 +1,147 @@
+"""
+Tests for compact answer vector storage
+"""
+import pytest
+from datetime import datetime
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.answer_vector import (
+    pack_answers, unpack_answers, get_test_answers, compact_completed_tests
+)
+
+
+@pytest.fixture
+def completed_test(app, test_user, test_exam, test_question):
+    """Create a completed test with one answer row"""
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'], completed_at=datetime.utcnow())
+        db.session.add(test)
+        db.session.flush()
+        db.session.add(TestAnswer(
+            test_id=test.id, user_id=test_user['id'],
+            question_id=test_question, selected_answer=1
+        ))
+        db.session.commit()
+        return test.id
+
+
+@pytest.mark.models
+def test_pack_roundtrip():
+    """Test packing and unpacking preserves answers"""
+    answers = {5: 1, 6: 4, 7: 2, 300: 3, 100000: 4, 8: None}
+    packed = pack_answers(answers)
+
+    assert unpack_answers(packed) == {5: 1, 6: 4, 7: 2, 300: 3, 100000: 4}
+    assert unpack_answers(pack_answers({})) == {}
+
+
+@pytest.mark.models
+def test_pack_is_compact():
+    """Test a 140-question test with consecutive ids packs to ~1.25 bytes per answer"""
+    answers = {1000 + i: i % 4 + 1 for i in range(140)}
+    packed = pack_answers(answers)
+
+    # version + count + first id + 139 one-byte deltas + 35 bytes of codes
+    assert len(packed) == 1 + 2 + 2 + 139 + 35
+    assert unpack_answers(packed) == answers
+
+
+@pytest.mark.models
+def test_pack_rejects_invalid_answer():
+    """Test answers outside 1-4 cannot be packed"""
+    with pytest.raises(ValueError):
+        pack_answers({1: 5})
+
+
+@pytest.mark.models
+def test_compaction_moves_rows_to_vector(app, completed_test, test_question):
+    """Test compaction replaces answer rows with the packed column"""
+    with app.app_context():
+        assert compact_completed_tests() == (1, 1)
+        assert compact_completed_tests() == (0, 0)
+
+        test = db.session.get(Test, completed_test)
+        assert test.answers_packed is not None
+        assert TestAnswer.query.filter_by(test_id=completed_test).count() == 0
+        assert get_test_answers(test) == {test_question: 1}
+
+
+@pytest.mark.models
+def test_compaction_skips_in_progress_tests(app, test_user, test_exam, test_question):
+    """Test tests that are not completed keep their rows"""
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.flush()
+        db.session.add(TestAnswer(
+            test_id=test.id, user_id=test_user['id'],
+            question_id=test_question, selected_answer=2
+        ))
+        db.session.commit()
+
+        assert compact_completed_tests() == (0, 0)
+        assert TestAnswer.query.filter_by(test_id=test.id).count() == 1
+
+
+@pytest.mark.models
+def test_compaction_leaves_invalid_answers_unpacked(app, completed_test, test_user, test_exam, test_question):
+    """Test a legacy answer outside 1-4 keeps its test's rows without stopping later tests"""
+    with app.app_context():
+        legacy = Test(exam_id=test_exam, user_id=test_user['id'], completed_at=datetime.utcnow())
+        db.session.add(legacy)
+        db.session.flush()
+        db.session.add(TestAnswer(
+            test_id=legacy.id, user_id=test_user['id'],
+            question_id=test_question, selected_answer=7
+        ))
+        later = Test(exam_id=test_exam, user_id=test_user['id'], completed_at=datetime.utcnow())
+        db.session.add(later)
+        db.session.flush()
+        db.session.add(TestAnswer(
+            test_id=later.id, user_id=test_user['id'],
+            question_id=test_question, selected_answer=3
+        ))
+        db.session.commit()
+        legacy_id, later_id = legacy.id, later.id
+
+        assert compact_completed_tests(batch_size=1) == (2, 2)
+        assert compact_completed_tests(batch_size=1) == (0, 0)
+
+        assert db.session.get(Test, legacy_id).answers_packed is None
+        assert TestAnswer.query.filter_by(test_id=legacy_id).count() == 1
+        assert get_test_answers(db.session.get(Test, later_id)) == {test_question: 3}
+
+
+@pytest.mark.routes
+def test_results_read_either_representation(auth_client, app, runner, completed_test):
+    """Test results and history render the same before and after compaction"""
+    results_before = auth_client.get(f'/test/{completed_test}/results').data
+    history_before = auth_client.get('/my-exams').data
+
+    result = runner.invoke(args=['compact-answers'])
+    assert 'Compacted 1 test(s)' in result.output
+
+    assert auth_client.get(f'/test/{completed_test}/results').data == results_before
+    assert auth_client.get('/my-exams').data == history_before
+    assert b'100' in history_before
+
+
+@pytest.mark.routes
+def test_submit_can_store_packed_answers(auth_client, app, test_user, test_exam, test_question, monkeypatch):
+    """Test COMPACT_ANSWERS_ON_SUBMIT archives answers at submission"""
+    monkeypatch.setitem(app.config, 'COMPACT_ANSWERS_ON_SUBMIT', True)
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+        test_id = test.id
+
+    auth_client.post(f'/test/{test_id}/answer', data={'question_id': test_question, 'selected_answer': 3})
+    auth_client.post(f'/test/{test_id}/submit')
+
+    with app.app_context():
+        test = db.session.get(Test, test_id)
+        assert test.completed_at is not None
+        assert TestAnswer.query.filter_by(test_id=test_id).count() == 0
+        assert get_test_answers(test) == {test_question: 3}
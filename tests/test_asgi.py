@@ -0,0 +1,175 @@
+"""
+Tests for the ASGI serving mode (needs requirements-asgi.txt)
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+import pytest
+from sqlalchemy import event
+
+pytest.importorskip('a2wsgi')
+pytest.importorskip('aiosqlite')
+pytest.importorskip('greenlet')
+
+from nihongo.asgi import AutosaveASGI, async_database_url  # noqa: E402
+from nihongo.models import db  # noqa: E402
+from nihongo.models.test import Test  # noqa: E402
+from nihongo.models.test_answer import TestAnswer  # noqa: E402
+from nihongo.test_state import init_test_state_cache  # noqa: E402
+
+
+async def call(application, method, path, cookie=None, form=None):
+    """Send one HTTP request to an ASGI application; returns (status, headers, body)"""
+    body = urlencode(form).encode() if form is not None else b''
+    headers = [(b'host', b'localhost')]
+    if cookie:
+        headers.append((b'cookie', f'session={cookie}'.encode()))
+    if form is not None:
+        headers.append((b'content-type', b'application/x-www-form-urlencoded'))
+        headers.append((b'content-length', str(len(body)).encode()))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '', 'headers': headers,
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await application(scope, receive, send)
+    start = sent[0]
+    return start['status'], dict(start['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+
+
+def serve(scenario):
+    """
+    Run an async scenario in another thread, like a server would: outside the
+    test's app context, whose g (and Flask-Login's cached user) the requests
+    would otherwise share
+    """
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, scenario()).result()
+
+
+@pytest.fixture
+def started_test(app, auth_client, test_exam):
+    """An in-progress test of test_user, with its state cached by a take_exam visit"""
+    response = auth_client.post(f'/exam/{test_exam}/start')
+    test_id = int(response.headers['Location'].rstrip('/').split('/')[-1])
+    auth_client.get(f'/test/{test_id}')
+    return test_id
+
+
+@pytest.fixture
+def sync_statements(app):
+    """SQL statements run by the Flask (sync) engine"""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.mark.routes
+def test_autosave_runs_async(app, auth_client, started_test, test_question, sync_statements):
+    """Test autosave and test state are served by the async handlers, not Flask"""
+    application = AutosaveASGI(app)
+    cookie = auth_client.get_cookie('session').value
+
+    async def scenario():
+        try:
+            for answer in (2, 4):
+                status, _, body = await call(application, 'POST', f'/test/{started_test}/answer', cookie,
+                                             {'question_id': test_question, 'selected_answer': answer})
+                assert (status, json.loads(body)) == (200, {'success': True})
+            status, _, body = await call(application, 'GET', f'/test/{started_test}/state', cookie)
+            assert json.loads(body)['answers'] == {str(test_question): 4}
+
+            status, _, body = await call(application, 'POST', f'/test/{started_test}/answer', cookie,
+                                         {'question_id': test_question, 'selected_answer': 9})
+            assert (status, json.loads(body)) == (400, {'error': 'Invalid data'})
+        finally:
+            await application.close()
+
+    serve(scenario)
+    assert not [s for s in sync_statements if 'test_answers' in s]
+    with app.app_context():
+        rows = TestAnswer.query.filter_by(test_id=started_test).all()
+        assert [(row.question_id, row.selected_answer) for row in rows] == [(test_question, 4)]
+
+
+@pytest.mark.routes
+def test_uncommon_requests_go_to_flask(app, auth_client, started_test, test_question, test_admin):
+    """Test anonymous requests, cache misses and other users get Flask's answers"""
+    application = AutosaveASGI(app)
+    form = {'question_id': test_question, 'selected_answer': 3}
+    owner = auth_client.get_cookie('session').value
+    auth_client.get('/logout')
+    auth_client.post('/login', data={'email': test_admin['email'], 'password': test_admin['password']})
+    other = auth_client.get_cookie('session').value
+    init_test_state_cache(app)  # Empty cache: the next autosave is a miss
+
+    async def scenario():
+        try:
+            status, headers, _ = await call(application, 'POST', f'/test/{started_test}/answer', None, form)
+            assert status == 302 and '/login' in headers[b'location'].decode()
+
+            status, _, body = await call(application, 'POST', f'/test/{started_test}/answer', owner, form)
+            assert (status, json.loads(body)) == (200, {'success': True})
+            assert app.extensions['test_state_cache'].get(started_test) is not None
+
+            status, _, _ = await call(application, 'POST', f'/test/{started_test}/answer', other, form)
+            assert status == 403
+        finally:
+            await application.close()
+
+    serve(scenario)
+    with app.app_context():
+        assert TestAnswer.query.filter_by(test_id=started_test).one().selected_answer == 3
+
+
+@pytest.mark.routes
+def test_autosave_after_submit_elsewhere(app, auth_client, started_test, test_question):
+    """Test a cached state of a test graded by another worker accepts no answer"""
+    application = AutosaveASGI(app)
+    cookie = auth_client.get_cookie('session').value
+    with app.app_context():
+        db.session.get(Test, started_test).completed_at = datetime.utcnow()
+        db.session.commit()
+
+    async def scenario():
+        try:
+            return await call(application, 'POST', f'/test/{started_test}/answer', cookie,
+                              {'question_id': test_question, 'selected_answer': 2})
+        finally:
+            await application.close()
+
+    status, _, body = serve(scenario)
+    assert (status, json.loads(body)) == (400, {'error': 'Test already completed'})
+    assert app.extensions['test_state_cache'].get(started_test) is None
+    with app.app_context():
+        assert TestAnswer.query.filter_by(test_id=started_test).count() == 0
+
+
+def test_async_database_url():
+    """Test database URLs map to their async drivers"""
+    assert async_database_url('sqlite:////srv/jlpt.db').drivername == 'sqlite+aiosqlite'
+    assert async_database_url('postgresql://u:p@db/jlpt').drivername == 'postgresql+asyncpg'
+    assert async_database_url('postgresql+psycopg2://u:p@db/jlpt').drivername == 'postgresql+asyncpg'
+    with pytest.raises(ValueError):
+        async_database_url('sqlite:///:memory:')
+    with pytest.raises(ValueError):
+        async_database_url('mysql://u:p@db/jlpt')
@@ -0,0 +1,114 @@
+"""
+Tests for the exam catalogue cache
+"""
+import pytest
+from sqlalchemy import event
+from nihongo.models import db
+from nihongo.models.exam import Exam
+from nihongo.models.section import Section
+from nihongo.stores import MemoryStore
+from nihongo.catalogue import Catalogue, get_section_pool
+
+
+@pytest.mark.models
+def test_entries_are_loaded_once_per_generation():
+    """Test a bump makes the next read reload the entry"""
+    catalogue = Catalogue()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {'value': len(loads)}
+
+    assert catalogue.get('entry', loader) == {'value': 1}
+    assert catalogue.get('entry', loader) == {'value': 1}
+    catalogue.bump()
+    assert catalogue.get('entry', loader) == {'value': 2}
+    assert len(loads) == 2
+
+
+@pytest.mark.models
+def test_shared_store_serves_other_processes():
+    """Test one process's load and bump are seen through the shared store"""
+    store = MemoryStore()
+    first = Catalogue(store, check_interval=0)
+    second = Catalogue(store, check_interval=0)
+
+    assert first.get('entry', lambda: ['loaded']) == ['loaded']
+    assert second.get('entry', lambda: ['not used']) == ['loaded']
+
+    second.bump()
+    assert first.get('entry', lambda: ['reloaded']) == ['reloaded']
+
+
+@pytest.mark.models
+def test_content_commits_bump_generation(app, test_section):
+    """Test committed content writes start a new generation and rollbacks do not"""
+    with app.app_context():
+        catalogue = app.extensions['catalogue']
+        assert get_section_pool('Test Section')
+        generation = catalogue.generation()
+
+        section = db.session.get(Section, test_section)
+        section.name = 'Renamed'
+        db.session.flush()
+        db.session.rollback()
+        assert catalogue.generation() == generation
+
+        section = db.session.get(Section, test_section)
+        section.name = 'Renamed'
+        db.session.commit()
+        assert catalogue.generation() != generation
+        assert get_section_pool('Test Section') == []
+        assert get_section_pool('Renamed')
+
+
+@pytest.mark.routes
+def test_dashboard_reads_only_user_data_when_warm(auth_client, app, test_exam):
+    """Test a warm /exams request does not query exams or sections"""
+    auth_client.get('/exams')
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = auth_client.get('/exams')
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert b'Test Exam' in response.data
+    assert b'Test Section' in response.data
+    content_tables = ('FROM exams', 'FROM sections', 'FROM section_questions', 'JOIN sections')
+    assert not [statement for statement in statements if any(table in statement for table in content_tables)]
+
+    # Creating an exam shows up on the next request
+    with app.app_context():
+        db.session.add(Exam(name='Fresh Exam', created_by=1))
+        db.session.commit()
+    assert b'Fresh Exam' in auth_client.get('/exams').data
+
+
+@pytest.mark.routes
+def test_generated_exams_do_not_bump_generation(auth_client, app, test_exam):
+    """Test a student's random exam stays out of the catalogue and keeps its generation"""
+    auth_client.get('/exams')
+    with app.app_context():
+        generation = app.extensions['catalogue'].generation()
+
+    response = auth_client.post('/exam/random/create', data={'section_Test Section': '1'})
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert app.extensions['catalogue'].generation() == generation
+        exam = Exam.query.filter(Exam.name.like('Random Practice Exam - %')).one()
+        assert exam.is_generated
+        assert [section.is_generated for section in Section.query.filter_by(name='Test Section')] == [False, True]
+        assert get_section_pool('Test Section')
+
+    # Still listed for its owner until it is finished
+    assert exam.name.encode() in auth_client.get('/exams').data
@@ -0,0 +1,89 @@
+"""
+Tests for exam export functionality
+"""
+import copy
+import io
+import json
+import pytest
+from nihongo.import_exam import import_exam_from_json
+from nihongo.export_exam import export_exam_to_json, iter_exam_json
+from nihongo.models.exam import Exam
+
+
+@pytest.fixture
+def bilingual_exam_json(sample_exam_json):
+    """Sample exam with a multi-language explanation and media fields"""
+    data = copy.deepcopy(sample_exam_json)
+    question = data['sections'][0]['questions'][0]
+    question['explanation'] = {'EN': 'Time particle に', 'ES': 'Partícula de tiempo に'}
+    question['question_audio'] = 'https://example.com/audio.mp3'
+    return data
+
+
+@pytest.mark.exam_import
+def test_export_round_trips_import_format(app, test_user, bilingual_exam_json):
+    """Test an imported exam exports to the same document and imports again"""
+    with app.app_context():
+        success, _, exam = import_exam_from_json(bilingual_exam_json, test_user['id'])
+        assert success
+
+        out = io.StringIO()
+        success, message, _ = export_exam_to_json(exam.id, out)
+        assert success
+        exported = json.loads(out.getvalue())
+        assert exported == bilingual_exam_json
+
+        success, _, copy_exam = import_exam_from_json(exported, test_user['id'])
+        assert success
+        out = io.StringIO()
+        export_exam_to_json(copy_exam.id, out)
+        assert json.loads(out.getvalue()) == bilingual_exam_json
+
+
+@pytest.mark.exam_import
+def test_export_streams_chunks(app, test_user, sample_exam_json):
+    """Test the document is produced in pieces and empty exams are valid JSON"""
+    with app.app_context():
+        _, _, exam = import_exam_from_json(sample_exam_json, test_user['id'])
+        chunks = list(iter_exam_json(exam))
+        assert len(chunks) > 5
+        assert json.loads(''.join(chunks))['name'] == 'Test Import Exam'
+
+        empty = Exam(name='Empty', created_by=test_user['id'])
+        assert json.loads(''.join(iter_exam_json(empty))) == {'name': 'Empty', 'sections': []}
+
+        assert export_exam_to_json('No such exam', io.StringIO())[0] is False
+
+
+@pytest.mark.exam_import
+def test_export_exams_command(app, runner, test_user, sample_exam_json, tmp_path):
+    """Test flask export-exams writes one importable file per exam"""
+    with app.app_context():
+        _, _, exam = import_exam_from_json(sample_exam_json, test_user['id'])
+        exam_id = exam.id
+
+    result = runner.invoke(args=['export-exams', '--output-dir', str(tmp_path)])
+    assert result.exit_code == 0
+    assert 'Exported 1 exam(s)' in result.output
+    with open(tmp_path / f'exam-{exam_id}.json', encoding='utf-8') as f:
+        assert json.load(f) == sample_exam_json
+
+    result = runner.invoke(args=['export-exams', '--exam', 'Missing', '--output-dir', str(tmp_path)])
+    assert "Exam 'Missing' not found" in result.output
+
+
+@pytest.mark.routes
+def test_export_download(auth_client, app, test_user, test_admin, sample_exam_json):
+    """Test owners download their exam and others are refused"""
+    with app.app_context():
+        _, _, own = import_exam_from_json(sample_exam_json, test_user['id'])
+        _, _, other = import_exam_from_json(sample_exam_json, test_admin['id'])
+        own_id, other_id = own.id, other.id
+
+    response = auth_client.get(f'/mycontent/exams/{own_id}/export')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert f'filename=exam-{own_id}.json' in response.headers['Content-Disposition']
+    assert json.loads(response.data) == sample_exam_json
+
+    assert auth_client.get(f'/mycontent/exams/{other_id}/export').status_code == 302
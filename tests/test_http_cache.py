@@ -0,0 +1,119 @@
+"""
+Tests for HTTP conditional GET (which pages are cacheable and when they change)
+"""
+import pytest
+from flask import session
+from sqlalchemy import event
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.question import Question
+from nihongo.http_cache import CACHE_CONTROL, results_validators
+
+
+@pytest.fixture
+def completed_test(auth_client, app, test_user, test_exam, test_question):
+    """Take and submit a test through the routes, returns its id"""
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+        test_id = test.id
+    auth_client.post(f'/test/{test_id}/answer', data={'question_id': test_question, 'selected_answer': 1})
+    auth_client.post(f'/test/{test_id}/submit')
+    auth_client.get('/exams')  # Consume the submit flash message
+    return test_id
+
+
+def _revisit(client, url):
+    first = client.get(url)
+    assert first.status_code == 200
+    return first, client.get(url, headers={'If-None-Match': first.headers['ETag'].strip('"')})
+
+
+@pytest.mark.routes
+@pytest.mark.parametrize('url', ['/test/{test_id}/results', '/my-exams'])
+def test_cacheable_routes(auth_client, completed_test, url):
+    """Test results and history carry validators and revisits get 304"""
+    first, second = _revisit(auth_client, url.format(test_id=completed_test))
+    assert first.headers['Cache-Control'] == CACHE_CONTROL
+    assert first.headers['Last-Modified']
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == first.headers['ETag']
+
+    # Last-Modified alone also validates
+    third = auth_client.get(url.format(test_id=completed_test),
+                            headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert third.status_code == 304
+
+
+@pytest.mark.routes
+@pytest.mark.parametrize('url', ['/exams', '/test/{test_id}', '/mycontent/'])
+def test_uncacheable_routes(auth_client, app, test_user, test_exam, url):
+    """Test pages with live state never carry validators"""
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+        test_id = test.id
+    response = auth_client.get(url.format(test_id=test_id))
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert 'Last-Modified' not in response.headers
+
+
+@pytest.mark.routes
+def test_not_modified_skips_question_loading(auth_client, app, completed_test):
+    """Test a 304 is answered before answers and questions are loaded"""
+    url = f'/test/{completed_test}/results'
+    etag = auth_client.get(url).headers['ETag']
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = auth_client.get(url, headers={'If-None-Match': etag})
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert response.status_code == 304
+    assert not [statement for statement in statements if 'FROM test_answers' in statement]
+    assert not [statement for statement in statements if 'questions.question_text' in statement]
+
+
+@pytest.mark.routes
+def test_validators_change_with_content(auth_client, app, completed_test, test_question):
+    """Test a question edit or a rescore invalidate the pages"""
+    results_url = f'/test/{completed_test}/results'
+    etag = auth_client.get(results_url).headers['ETag']
+
+    with app.app_context():
+        question = db.session.get(Question, test_question)
+        question.explanation = 'Edited explanation'
+        db.session.commit()
+    edited = auth_client.get(results_url, headers={'If-None-Match': etag})
+    assert edited.status_code == 200
+    assert edited.headers['ETag'] != etag
+
+    history_etag = auth_client.get('/my-exams').headers['ETag']
+    with app.app_context():
+        test = db.session.get(Test, completed_test)
+        test.correct_count = 0  # As after flask rescore
+        db.session.commit()
+    assert auth_client.get('/my-exams', headers={'If-None-Match': history_etag}).status_code == 200
+
+
+@pytest.mark.i18n
+def test_validators_depend_on_locale(app, completed_test):
+    """Test each language gets its own ETag"""
+    etags = set()
+    for language in ('es', 'en'):
+        with app.app_context(), app.test_request_context():
+            session['language'] = language
+            etags.add(results_validators(db.session.get(Test, completed_test)).etag)
+    assert len(etags) == 2
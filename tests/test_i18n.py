@@ -0,0 +1,59 @@
+"""
+Tests for translation catalogue loading and locale selection
+"""
+import pytest
+from flask import session
+from nihongo.i18n import get_catalogues, gettext, get_locale_name
+
+
+@pytest.mark.i18n
+def test_catalogues_loaded_once(app):
+    """Test catalogues are loaded once per process and are read-only"""
+    with app.app_context():
+        catalogues = get_catalogues()
+        assert get_catalogues() is catalogues
+        assert 'es' in catalogues
+        assert catalogues['es']['Exams'] == 'Exámenes'
+
+        with pytest.raises(TypeError):
+            catalogues['es']['Exams'] = 'Exams'
+
+
+@pytest.mark.i18n
+def test_gettext_uses_session_language(app):
+    """Test gettext translates to the selected language"""
+    with app.app_context(), app.test_request_context():
+        session['language'] = 'es'
+        assert get_locale_name() == 'es'
+        assert gettext('Language changed successfully') == 'Idioma cambiado exitosamente'
+
+    with app.app_context(), app.test_request_context():
+        session['language'] = 'en'
+        assert gettext('Language changed successfully') == 'Language changed successfully'
+
+
+@pytest.mark.i18n
+def test_gettext_interpolates_variables(app):
+    """Test gettext applies %-formatting after translation"""
+    with app.app_context(), app.test_request_context():
+        session['language'] = 'en'
+        assert gettext('Error creating random exam: %(error)s', error='boom') == 'Error creating random exam: boom'
+
+
+@pytest.mark.i18n
+def test_browser_locale_memoized_in_session(client):
+    """Test Accept-Language is resolved once and then read from the session"""
+    client.get('/login', headers={'Accept-Language': 'en-US,en;q=0.9'})
+    with client.session_transaction() as sess:
+        assert sess['browser_language'] == 'en'
+
+    response = client.get('/login', headers={'Accept-Language': 'es'})
+    assert b'<html lang="en">' in response.data
+
+
+@pytest.mark.i18n
+def test_language_choice_overrides_browser(client):
+    """Test an explicit language choice wins over the browser preference"""
+    client.get('/language/es')
+    response = client.get('/login', headers={'Accept-Language': 'en'})
+    assert b'<html lang="es">' in response.data
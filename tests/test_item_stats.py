@@ -0,0 +1,208 @@
+"""
+Tests for per-question item statistics
+"""
+import math
+import pytest
+from datetime import datetime
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.models.question import Question
+from nihongo.models.section import Section
+from nihongo.models.exam import Exam
+from nihongo.models.exam_section import ExamSection
+from nihongo.models.section_question import SectionQuestion
+from nihongo.models.question_stat import QuestionStat
+from nihongo.answer_vector import store_packed_answers
+from nihongo.item_stats import export_answer_arrays, record_test_stats, rebuild_question_stats
+
+# Answers of five test takers to a three-question exam (correct answers: 1, 2, 3)
+RESPONSES = [
+    [1, 2, 3],
+    [1, 2, 4],
+    [1, 3, None],
+    [2, 2, 3],
+    [4, None, None],
+]
+
+
+@pytest.fixture
+def stats_exam(app, test_user):
+    """Create a three-question exam and return (exam_id, question_ids)"""
+    with app.app_context():
+        questions = [
+            Question(question_text=f'Q{i}', answer_1='a', answer_2='b', answer_3='c', answer_4='d',
+                     correct_answer=i + 1, created_by=test_user['id'])
+            for i in range(3)
+        ]
+        section = Section(name='Stats Section', number_of_questions=3)
+        exam = Exam(name='Stats Exam', created_by=test_user['id'])
+        db.session.add_all(questions + [section, exam])
+        db.session.flush()
+        for order, question in enumerate(questions):
+            db.session.add(SectionQuestion(section_id=section.id, question_id=question.id, order=order))
+        db.session.add(ExamSection(exam_id=exam.id, section_id=section.id, order=1))
+        db.session.commit()
+        return exam.id, [question.id for question in questions]
+
+
+def _complete_tests(exam_id, user_id, question_ids, packed=False):
+    """Store RESPONSES as completed tests and record them incrementally"""
+    for picks in RESPONSES:
+        answer_dict = {qid: pick for qid, pick in zip(question_ids, picks) if pick}
+        test = Test(exam_id=exam_id, user_id=user_id, completed_at=datetime.utcnow())
+        db.session.add(test)
+        db.session.flush()
+        if packed:
+            store_packed_answers(test, answer_dict)
+        else:
+            for qid, pick in answer_dict.items():
+                db.session.add(TestAnswer(test_id=test.id, user_id=user_id, question_id=qid, selected_answer=pick))
+        record_test_stats(question_ids, answer_dict)
+    db.session.commit()
+
+
+def _snapshot():
+    columns = ('attempts', 'correct_count', 'picks_1', 'picks_2', 'picks_3', 'picks_4')
+    return {
+        stat.question_id: (
+            tuple(getattr(stat, column) for column in columns),
+            tuple(round(value, 9) for value in (stat.score_sum, stat.score_sq_sum, stat.correct_score_sum))
+        )
+        for stat in QuestionStat.query.all()
+    }
+
+
+@pytest.mark.models
+@pytest.mark.parametrize('packed', [False, True])
+def test_rebuild_matches_incremental(app, test_user, stats_exam, packed):
+    """Test the vectorized rebuild reproduces the incremental counters"""
+    exam_id, question_ids = stats_exam
+    with app.app_context():
+        _complete_tests(exam_id, test_user['id'], question_ids, packed=packed)
+        incremental = _snapshot()
+
+        assert rebuild_question_stats() == (5, 3)
+        db.session.expire_all()
+        assert _snapshot() == incremental
+
+
+
+@pytest.mark.models
+@pytest.mark.parametrize('dangling', [0, 2])
+def test_export_leaves_out_deleted_questions(app, test_user, stats_exam, dangling):
+    """Test a section question whose question is gone is not exported with another question's key"""
+    exam_id, question_ids = stats_exam
+    with app.app_context():
+        _complete_tests(exam_id, test_user['id'], question_ids)
+        db.session.execute(db.delete(Question).where(Question.id == question_ids[dangling]))
+        db.session.commit()
+
+        arrays = export_answer_arrays()
+        kept = [qid for qid in question_ids if qid != question_ids[dangling]]
+        assert sorted(set(arrays['question_ids'].tolist())) == kept
+        assert len(arrays['correct']) == len(arrays['selected']) == len(arrays['test_index']) == 10
+        keys = {qid: index + 1 for index, qid in enumerate(question_ids)}
+        assert arrays['correct'].tolist() == [keys[qid] for qid in arrays['question_ids'].tolist()]
+
+@pytest.mark.models
+def test_difficulty_and_discrimination(app, test_user, stats_exam):
+    """Test p-value and point-biserial against a direct computation"""
+    exam_id, question_ids = stats_exam
+    with app.app_context():
+        _complete_tests(exam_id, test_user['id'], question_ids)
+
+        correct_keys = [1, 2, 3]
+        scores = [sum(p == k for p, k in zip(picks, correct_keys)) / 3 for picks in RESPONSES]
+        for index, question_id in enumerate(question_ids):
+            stat = db.session.get(QuestionStat, question_id)
+            flags = [float(picks[index] == correct_keys[index]) for picks in RESPONSES]
+
+            assert stat.attempts == 5
+            assert stat.difficulty == pytest.approx(sum(flags) / 5)
+
+            # Pearson correlation of the correct flag with the test score
+            mean_f, mean_s = sum(flags) / 5, sum(scores) / 5
+            covariance = sum((f - mean_f) * (s - mean_s) for f, s in zip(flags, scores)) / 5
+            sd_f = math.sqrt(sum((f - mean_f) ** 2 for f in flags) / 5)
+            sd_s = math.sqrt(sum((s - mean_s) ** 2 for s in scores) / 5)
+            assert stat.discrimination == pytest.approx(covariance / (sd_f * sd_s))
+
+        first = db.session.get(QuestionStat, question_ids[0])
+        assert (first.picks_1, first.picks_2, first.picks_3, first.picks_4) == (3, 1, 0, 1)
+        third = db.session.get(QuestionStat, question_ids[2])
+        assert third.unanswered == 2
+
+
+@pytest.mark.routes
+def test_submit_records_stats(auth_client, app, test_user, test_exam, test_question):
+    """Test submitting a test updates the question's statistics"""
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+        test_id = test.id
+
+    auth_client.post(f'/test/{test_id}/answer', data={'question_id': test_question, 'selected_answer': 1})
+    auth_client.post(f'/test/{test_id}/submit')
+
+    with app.app_context():
+        stat = db.session.get(QuestionStat, test_question)
+        assert (stat.attempts, stat.correct_count, stat.picks_1) == (1, 1, 1)
+
+    response = auth_client.get('/mycontent/questions')
+    assert response.status_code == 200
+    assert b'question-stats' in response.data
+    assert b'100%' in response.data
+
+
+class _OtherWorkerSubmits:
+    """Answer buffer stand-in: another worker completes the test while this submit runs"""
+
+    def flush_test(self, test_id):
+        with db.engine.begin() as conn:
+            conn.execute(db.update(Test).where(Test.id == test_id).values(completed_at=datetime.utcnow()))
+
+
+@pytest.mark.routes
+def test_concurrent_submit_counts_once(auth_client, app, test_user, test_exam, test_question):
+    """Test a submit that loses the race to complete the test adds nothing to the statistics"""
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+        test_id = test.id
+
+    app.extensions['answer_buffer'] = _OtherWorkerSubmits()
+    try:
+        response = auth_client.post(f'/test/{test_id}/submit')
+    finally:
+        app.extensions['answer_buffer'] = None
+    assert response.headers['Location'].endswith(f'/test/{test_id}/results')
+
+    with app.app_context():
+        assert db.session.get(QuestionStat, test_question) is None
+        assert db.session.get(Test, test_id).total_questions is None
+
+
+def test_stat_rows_inserted_once(app, stats_exam):
+    """Test recording over existing and missing rows inserts only the missing ones"""
+    _, question_ids = stats_exam
+    with app.app_context():
+        record_test_stats(question_ids[:1], {question_ids[0]: 1})
+        record_test_stats(question_ids, {question_ids[0]: 1})
+        db.session.commit()
+        assert [db.session.get(QuestionStat, qid).attempts for qid in question_ids] == [2, 1, 1]
+
+
+@pytest.mark.routes
+def test_rebuild_command(app, runner, test_user, stats_exam):
+    """Test flask rebuild-question-stats reports what it wrote"""
+    exam_id, question_ids = stats_exam
+    with app.app_context():
+        _complete_tests(exam_id, test_user['id'], question_ids)
+        QuestionStat.query.delete()
+        db.session.commit()
+
+    result = runner.invoke(args=['rebuild-question-stats'])
+    assert 'Rebuilt statistics for 3 question(s) from 5 completed test(s)' in result.output
@@ -0,0 +1,208 @@
+"""
+Tests for background jobs
+"""
+import json
+import time
+from io import BytesIO
+import pytest
+from nihongo.models import db
+from nihongo.models.exam import Exam
+from nihongo.models.job import Job
+from nihongo.jobs import JOB_HANDLERS, JobFailed, enqueue_job, job_handler, run_next_job, claim_next_job, _claim
+
+
+@pytest.fixture
+def queued(app, tmp_path):
+    """Jobs wait for a worker, and retries are due right away"""
+    saved = {key: app.config[key] for key in ('JOBS_INLINE', 'JOB_RETRY_DELAY', 'JOB_OUTPUT_DIR')}
+    app.config.update(JOBS_INLINE=False, JOB_RETRY_DELAY=0, JOB_OUTPUT_DIR=str(tmp_path))
+    yield
+    app.config.update(saved)
+
+
+@pytest.fixture
+def flaky_handler():
+    """A handler that fails on its first run, or for good with payload {'fatal': true}"""
+    runs = []
+
+    @job_handler('flaky')
+    def flaky(job, payload, progress):
+        runs.append(job.attempts)
+        if payload.get('fatal'):
+            raise JobFailed('bad input')
+        if len(runs) == 1:
+            raise RuntimeError('database went away')
+        progress(0.5, 'halfway')
+        return {'runs': len(runs)}
+
+    yield runs
+    del JOB_HANDLERS['flaky']
+
+
+@pytest.mark.exam_import
+def test_import_upload_runs_as_job(app, auth_client, test_user, sample_exam_json, queued):
+    """Test an upload is queued, then imported by a worker with progress and a status page"""
+    response = auth_client.post('/mycontent/import', data={
+        'file': (BytesIO(json.dumps(sample_exam_json).encode('utf-8')), 'exam.json')
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+    job_url = response.headers['Location']
+    status_url = f'{job_url}/status'
+    assert auth_client.get(status_url).get_json()['status'] == 'queued'
+    assert b'queued' in auth_client.get(job_url).data
+
+    with app.app_context():
+        assert Exam.query.filter_by(name=sample_exam_json['name']).count() == 0
+        job = run_next_job('test-worker')
+        assert job.status == 'succeeded'
+        assert run_next_job('test-worker') is None
+        exam_id = Exam.query.filter_by(name=sample_exam_json['name']).one().id
+
+    status = auth_client.get(status_url).get_json()
+    assert status['status'] == 'succeeded'
+    assert status['progress'] == 1.0
+    assert status['result']['exam_id'] == exam_id
+    assert f'/mycontent/exams/{exam_id}/edit'.encode() in auth_client.get(job_url).data
+
+
+@pytest.mark.exam_import
+def test_invalid_upload_is_not_queued(app, auth_client, test_user, queued):
+    """Test structural errors are reported right away instead of queueing a job"""
+    response = auth_client.post('/mycontent/import', data={
+        'file': (BytesIO(b'{"name": "No sections"}'), 'exam.json')
+    }, content_type='multipart/form-data', follow_redirects=True)
+    assert b"Missing required field: &#39;sections&#39;" in response.data
+    with app.app_context():
+        assert Job.query.count() == 0
+
+
+@pytest.mark.integration
+def test_retry_and_permanent_failure(app, auth_client, test_user, queued, flaky_handler):
+    """Test failures are retried until they succeed, and JobFailed fails for good"""
+    with app.app_context():
+        job_id = enqueue_job('flaky', {}, user_id=test_user['id']).id
+
+        job = run_next_job()
+        assert (job.status, job.attempts, job.error) == ('queued', 1, 'database went away')
+        job = run_next_job()
+        assert (job.status, job.attempts) == ('succeeded', 2)
+        assert job.result_data == {'runs': 2}
+        assert job.error == 'database went away'  # Kept for the record
+
+        fatal_id = enqueue_job('flaky', {'fatal': True}, user_id=test_user['id']).id
+        job = run_next_job()
+        assert (job.id, job.status, job.attempts) == (fatal_id, 'failed', 1)
+        assert run_next_job() is None
+
+    # A failed job can be queued again from its status page
+    auth_client.post(f'/mycontent/jobs/{fatal_id}/retry')
+    with app.app_context():
+        job = db.session.get(Job, fatal_id)
+        assert (job.status, job.attempts) == ('queued', 0)
+        assert db.session.get(Job, job_id).status == 'succeeded'
+
+
+@pytest.mark.integration
+def test_job_is_claimed_once(app, test_user, queued, flaky_handler):
+    """Test a job cannot be claimed by a second worker"""
+    with app.app_context():
+        job_id = enqueue_job('flaky', {}).id
+        assert claim_next_job('worker-a').id == job_id
+        assert not _claim(job_id, 'worker-b')
+        assert claim_next_job('worker-b') is None
+        assert db.session.get(Job, job_id).worker == 'worker-a'
+
+
+@pytest.mark.integration
+def test_export_job_and_inline_mode(app, auth_client, test_user, test_admin, test_exam, queued):
+    """Test an inline export job writes a file only its owner can download"""
+    app.config['JOBS_INLINE'] = True
+    with app.app_context():
+        job = enqueue_job('export_exam', {'exam_id': test_exam}, user_id=test_user['id'])
+        assert job.status == 'succeeded'
+        job_id = job.id
+
+    response = auth_client.get(f'/mycontent/jobs/{job_id}/download')
+    assert response.status_code == 200
+    assert json.loads(response.data)['name'] == 'Test Exam'
+
+    auth_client.get('/logout')
+    auth_client.post('/login', data={'email': test_admin['email'], 'password': test_admin['password']})
+    assert auth_client.get(f'/mycontent/jobs/{job_id}/download').status_code == 404
+
+
+@pytest.fixture
+def requeued_handler(app):
+    """A handler whose job is requeued and claimed by another worker while it runs"""
+    @job_handler('requeued')
+    def requeued(job, payload, progress):
+        with db.engine.begin() as conn:
+            conn.execute(db.update(Job).where(Job.id == job.id).values(status='queued', worker=None))
+        assert _claim(job.id, 'worker-b')
+        return {'done': True}
+
+    yield
+    del JOB_HANDLERS['requeued']
+
+
+@pytest.mark.integration
+def test_superseded_run_does_not_finish_job(app, test_user, queued, requeued_handler):
+    """Test a worker whose job was requeued meanwhile leaves the new run's status alone"""
+    with app.app_context():
+        job_id = enqueue_job('requeued', {}).id
+        job = run_next_job('worker-a')
+        assert (job.id, job.status, job.worker, job.attempts) == (job_id, 'running', 'worker-b', 2)
+        assert job.result is None
+
+
+@pytest.mark.integration
+def test_heartbeat_while_job_runs(app, test_user, queued):
+    """Test a running job's heartbeat is written from its own thread"""
+    app.config['JOB_HEARTBEAT_INTERVAL'] = 0.02
+    beats = []
+
+    @job_handler('slow')
+    def slow(job, payload, progress):
+        start = db.session.get(Job, job.id).heartbeat_at
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            with db.engine.connect() as conn:
+                heartbeat_at = conn.execute(db.select(Job.heartbeat_at).where(Job.id == job.id)).scalar()
+            if heartbeat_at > start:
+                beats.append(heartbeat_at)
+                break
+            time.sleep(0.01)
+        return {}
+
+    try:
+        with app.app_context():
+            enqueue_job('slow', {})
+            assert run_next_job('worker-a').status == 'succeeded'
+    finally:
+        del JOB_HANDLERS['slow']
+        app.config['JOB_HEARTBEAT_INTERVAL'] = 60
+    assert beats
+
+
+@pytest.mark.exam_import
+def test_rejected_import_fails_without_retry(app, sample_exam_json, queued):
+    """Test an import the importer rejects (here: its user is gone) is not retried"""
+    with app.app_context():
+        enqueue_job('import_exam', {'exam': sample_exam_json}, user_id=None)
+        job = run_next_job('worker-a')
+        assert (job.status, job.attempts) == ('failed', 1)
+        assert 'not found' in job.error
+
+
+@pytest.mark.integration
+def test_inline_retry_runs_job(app, auth_client, test_user, queued, flaky_handler):
+    """Test retrying a failed job with JOBS_INLINE runs it again right away"""
+    app.config['JOBS_INLINE'] = True
+    with app.app_context():
+        job_id = enqueue_job('flaky', {'fatal': True}, user_id=test_user['id']).id
+
+    auth_client.post(f'/mycontent/jobs/{job_id}/retry')
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.attempts) == ('failed', 1)
+    assert len(flaky_handler) == 2
@@ -0,0 +1,106 @@
+"""
+Tests for the take_exam media manifest
+"""
+import pytest
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.question import Question
+from nihongo.models.section import Section
+from nihongo.models.section_question import SectionQuestion
+from nihongo.models.exam import Exam
+from nihongo.models.exam_section import ExamSection
+from nihongo.media_manifest import build_media_manifest, get_media_size
+
+
+@pytest.fixture
+def media_test(app, test_user):
+    """Create a started test whose exam has audio and image questions"""
+    with app.app_context():
+        section = Section(name='Listening', number_of_questions=3)
+        exam = Exam(name='Listening Exam', created_by=test_user['id'])
+        db.session.add_all([section, exam])
+        db.session.flush()
+
+        media = [
+            (None, '/static/audio/q1.mp3'),
+            ('https://example.com/q2.png', None),
+            ('/static/img/q3.png', 'https://example.com/q3.mp3'),
+        ]
+        for order, (image, audio) in enumerate(media, start=1):
+            question = Question(
+                question_text=f'Listening Q{order}',
+                question_image=image,
+                question_audio=audio,
+                answer_1='A', answer_2='B', answer_3='C', answer_4='D',
+                correct_answer=1,
+                created_by=test_user['id']
+            )
+            db.session.add(question)
+            db.session.flush()
+            db.session.add(SectionQuestion(section_id=section.id, question_id=question.id, order=order))
+
+        db.session.add(ExamSection(exam_id=exam.id, section_id=section.id, order=1))
+        test = Test(exam_id=exam.id, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+
+        return test.id
+
+
+@pytest.mark.routes
+def test_media_manifest_order(auth_client, media_test):
+    """Test manifest lists media in page order, image before audio within a question"""
+    response = auth_client.get(f'/test/{media_test}/media-manifest')
+    assert response.status_code == 200
+
+    items = response.get_json()['items']
+    assert [(item['question_number'], item['kind']) for item in items] == [
+        (1, 'audio'), (2, 'image'), (3, 'image'), (3, 'audio')
+    ]
+    assert [item['index'] for item in items] == [0, 1, 2, 3]
+    assert items[3]['url'] == 'https://example.com/q3.mp3'
+
+
+@pytest.mark.routes
+def test_media_manifest_sizes(app, test_user, tmp_path, monkeypatch):
+    """Test sizes are reported for local static files only"""
+    audio_dir = tmp_path / 'audio'
+    audio_dir.mkdir()
+    (audio_dir / 'q1.mp3').write_bytes(b'x' * 1234)
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    monkeypatch.setattr(app, 'static_url_path', '/static')
+
+    with app.test_request_context():
+        assert get_media_size('/static/audio/q1.mp3') == 1234
+        assert get_media_size('/static/audio/missing.mp3') is None
+        assert get_media_size('/static/../secret.mp3') is None
+        assert get_media_size('https://example.com/q1.mp3') is None
+
+
+@pytest.mark.routes
+def test_media_manifest_skips_questions_without_media(app, test_question):
+    """Test questions without audio or image are not in the manifest"""
+    with app.app_context():
+        question = db.session.get(Question, test_question)
+        assert build_media_manifest([{'section': 'Test', 'question': question}]) == []
+
+
+@pytest.mark.routes
+def test_media_manifest_requires_owner(client, app, test_admin, media_test):
+    """Test users cannot read another user's media manifest"""
+    client.post('/login', data={
+        'email': test_admin['email'],
+        'password': test_admin['password']
+    })
+
+    response = client.get(f'/test/{media_test}/media-manifest')
+    assert response.status_code == 403
+
+
+@pytest.mark.routes
+def test_take_exam_embeds_manifest(auth_client, media_test):
+    """Test take_exam embeds the manifest and defers audio loading"""
+    response = auth_client.get(f'/test/{media_test}')
+    assert response.status_code == 200
+    assert b'const mediaManifest = [' in response.data
+    assert b'preload="none"' in response.data
@@ -0,0 +1,115 @@
+"""
+Tests for the Prometheus metrics endpoint
+"""
+import json
+import os
+import pytest
+from nihongo.metrics import (
+    Counter, Histogram, REGISTRY, render, collect, write_process_file,
+    HTTP_REQUESTS, HTTP_REQUEST_SECONDS, DB_STATEMENTS, CACHE_LOOKUPS, ANSWERS_SAVED,
+    TESTS_STARTED, EXAM_IMPORTS, EXAM_IMPORT_SECONDS
+)
+from nihongo.import_exam import import_exam_from_json
+
+
+@pytest.fixture
+def scratch_metrics():
+    """Metrics created by a test, removed from the registry afterwards"""
+    created = []
+    yield created
+    for metric in created:
+        REGISTRY.remove(metric)
+
+
+@pytest.mark.routes
+def test_text_exposition_and_multiprocess_sum(scratch_metrics, tmp_path):
+    """Test counters and histograms render in the text format and sum across worker files"""
+    requests = Counter('test_requests_total', 'Requests', ('path',))
+    latency = Histogram('test_latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    scratch_metrics.extend([requests, latency])
+    requests.inc(path='/a "quoted"')
+    requests.inc(2, path='/a "quoted"')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3)
+
+    text = render(collect())
+    assert '# TYPE test_requests_total counter' in text
+    assert 'test_requests_total{path="/a \\"quoted\\""} 3' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count 3' in text
+    assert 'test_latency_seconds_sum 3.55' in text
+
+    # Another worker's file (an exited worker's file counts too)
+    write_process_file(str(tmp_path))
+    own = tmp_path / f'metrics-{os.getpid()}.json'
+    (tmp_path / 'metrics-1.json').write_text(own.read_text())
+    text = render(collect(str(tmp_path)))
+    assert 'test_requests_total{path="/a \\"quoted\\""} 6' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 6' in text
+    assert json.loads(own.read_text())['test_requests_total'] == [[['/a "quoted"'], 3]]
+
+    with pytest.raises(ValueError):
+        requests.inc()
+
+
+@pytest.mark.routes
+def test_requests_are_instrumented(app, auth_client, test_exam):
+    """Test request, SQL, cache and answer metrics move and /metrics exposes them"""
+    requests_before = HTTP_REQUESTS.value(endpoint='exams', method='GET', status=200)
+    timed_before = HTTP_REQUEST_SECONDS.count(endpoint='exams')
+    statements_before = DB_STATEMENTS.value(endpoint='exams')
+    catalogue_before = sum(CACHE_LOOKUPS.value(cache='catalogue', result=result) for result in ('hit', 'miss'))
+    started_before = TESTS_STARTED.value(kind='exam')
+    answers_before = ANSWERS_SAVED.value()
+
+    assert auth_client.get('/exams').status_code == 200
+    assert HTTP_REQUESTS.value(endpoint='exams', method='GET', status=200) == requests_before + 1
+    assert HTTP_REQUEST_SECONDS.count(endpoint='exams') == timed_before + 1
+    assert DB_STATEMENTS.value(endpoint='exams') > statements_before
+    assert sum(CACHE_LOOKUPS.value(cache='catalogue', result=result) for result in ('hit', 'miss')) > catalogue_before
+
+    response = auth_client.post(f'/exam/{test_exam}/start')
+    test_id = int(response.headers['Location'].rstrip('/').split('/')[-1])
+    assert TESTS_STARTED.value(kind='exam') == started_before + 1
+    with app.app_context():
+        from nihongo.models.question import Question
+        question_id = Question.query.first().id
+    auth_client.post(f'/test/{test_id}/answer', data={'question_id': question_id, 'selected_answer': 1})
+    assert ANSWERS_SAVED.value() == answers_before + 1
+
+    response = auth_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    assert 'nihongo_http_requests_total{endpoint="exams",method="GET",status="200"}' in text
+    assert 'nihongo_http_request_duration_seconds_bucket{endpoint="exams",le="+Inf"}' in text
+    assert 'nihongo_answers_saved_total ' in text
+
+
+@pytest.mark.routes
+def test_metrics_token(app, client):
+    """Test scrapes need the bearer token when METRICS_TOKEN is set"""
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    try:
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+    finally:
+        app.config['METRICS_TOKEN'] = None
+
+
+@pytest.mark.exam_import
+def test_exam_imports_are_counted(app, test_user, sample_exam_json):
+    """Test imports are timed and counted by result"""
+    success_before = EXAM_IMPORTS.value(result='success')
+    error_before = EXAM_IMPORTS.value(result='error')
+    timed_before = EXAM_IMPORT_SECONDS.count()
+    with app.app_context():
+        assert import_exam_from_json(sample_exam_json, test_user['id'])[0]
+        assert not import_exam_from_json({'name': 'No sections'}, test_user['id'])[0]
+    assert EXAM_IMPORTS.value(result='success') == success_before + 1
+    assert EXAM_IMPORTS.value(result='error') == error_before + 1
+    assert EXAM_IMPORT_SECONDS.count() == timed_before + 2
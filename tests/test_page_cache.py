@@ -0,0 +1,73 @@
+"""
+Tests for the full-page response cache
+"""
+import json
+import time
+import pytest
+from flask import session
+from nihongo.page_cache import PageCache
+from nihongo.app import EXAMPLE_EXAM, EXAMPLE_EXAM_JSON
+
+
+@pytest.mark.models
+def test_page_cache_bounds_and_expiry():
+    """Test the cache evicts least recently used pages by size and expires old ones"""
+    cache = PageCache(max_bytes=10, ttl=60)
+    cache.put('a', b'aaaa', 'text/html')
+    cache.put('b', b'bbbb', 'text/html')
+    assert cache.get('a') is not None
+    cache.put('c', b'cccc', 'text/html')
+    assert cache.get('b') is None
+    assert (len(cache), cache.size) == (2, 8)
+
+    cache.put('huge', b'x' * 11, 'text/html')
+    assert cache.get('huge') is None
+
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get('a') is None
+    assert cache.size == 4
+
+
+@pytest.mark.routes
+def test_login_page_served_from_cache(client):
+    """Test the second anonymous GET of /login comes from the cache with the same body"""
+    first = client.get('/login')
+    second = client.get('/login')
+    assert first.headers['X-Page-Cache'] == 'miss'
+    assert second.headers['X-Page-Cache'] == 'hit'
+    assert second.data == first.data
+    assert second.mimetype == 'text/html'
+
+
+@pytest.mark.routes
+def test_pages_with_flash_or_user_bypass_cache(client, test_user):
+    """Test flash messages are never cached and logged-in users still get redirected"""
+    client.get('/exams')  # Redirects to login with a flash message
+    flashed = client.get('/login')
+    assert 'X-Page-Cache' not in flashed.headers
+    assert client.get('/login').headers['X-Page-Cache'] == 'miss'
+    assert client.get('/login').headers['X-Page-Cache'] == 'hit'
+
+    client.post('/login', data={'email': test_user['email'], 'password': test_user['password']})
+    assert client.get('/login').status_code == 302
+
+
+@pytest.mark.i18n
+def test_page_variants_per_locale(app):
+    """Test each language gets its own cached page"""
+    bodies = []
+    for language in ('es', 'en', 'es'):
+        with app.app_context(), app.test_request_context('/login'):
+            session['language'] = language
+            bodies.append(app.make_response(app.view_functions['login']()).get_data())
+    assert len(app.extensions['page_cache']) == 2
+    assert bodies[0] == bodies[2] != bodies[1]
+
+
+@pytest.mark.routes
+def test_example_json_precomputed(auth_client):
+    """Test the example download sends the bytes serialized at startup"""
+    response = auth_client.get('/download-example-json')
+    assert response.data == EXAMPLE_EXAM_JSON
+    assert json.loads(response.data) == EXAMPLE_EXAM
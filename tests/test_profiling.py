@@ -0,0 +1,68 @@
+"""
+Tests for on-demand request profiling
+"""
+import pytest
+from nihongo.models import db
+from nihongo.models.user import User
+from nihongo.profiling import ProfileStore, top_frames
+
+
+@pytest.fixture
+def profiles(app, tmp_path):
+    """Profile store in a temporary directory"""
+    store = ProfileStore(str(tmp_path), keep=2)
+    app.extensions['profiles'] = store
+    return store
+
+
+@pytest.fixture
+def admin_client(app, client, test_admin):
+    """Client logged in as an admin"""
+    with app.app_context():
+        db.session.get(User, test_admin['id']).is_admin = True
+        db.session.commit()
+    client.post('/login', data={'email': test_admin['email'], 'password': test_admin['password']})
+    return client
+
+
+@pytest.mark.admin
+def test_admin_request_is_profiled(admin_client, profiles, test_exam):
+    """Test ?_profile=1 saves a profile with SQL time and collapsed stacks"""
+    response = admin_client.get('/exams?days=7&_profile=1')
+    assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+
+    profile = profiles.load(profile_id)
+    assert profile['path'] == '/exams?days=7'
+    assert profile['endpoint'] == 'exams'
+    assert profile['sql_count'] > 0
+    assert profile['statements'][0]['count'] >= 1
+    assert sum(count for _, count in profile['stacks']) == profile['samples']
+    if profile['samples']:
+        assert top_frames(profile)[0][2] == profile['samples']
+
+    response = admin_client.get(f'/admin/profiles/{profile_id}/folded')
+    assert response.mimetype == 'text/plain'
+    for line in response.get_data(as_text=True).splitlines():
+        stack, count = line.rsplit(' ', 1)
+        assert ';' in stack and int(count) > 0
+
+    assert profile_id.encode() in admin_client.get('/admin/profiles/').data
+    assert admin_client.get(f'/admin/profiles/{profile_id}').status_code == 200
+    assert admin_client.get('/admin/profiles/../secret').status_code == 404
+
+    # Header trigger, and only the newest profiles are kept
+    admin_client.get('/exams', headers={'X-Profile': '1'})
+    admin_client.get('/exams', headers={'X-Profile': '1'})
+    assert len(profiles.ids()) == 2
+    assert profile_id not in profiles.ids()
+
+
+@pytest.mark.admin
+def test_non_admin_requests_are_not_profiled(auth_client, profiles):
+    """Test the trigger is ignored for regular users"""
+    response = auth_client.get('/exams?_profile=1')
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    assert profiles.ids() == []
+    assert auth_client.get('/admin/profiles/').status_code == 302
@@ -0,0 +1,100 @@
+"""
+SQL statement budgets for the main routes
+
+Each route is requested against a small and a larger synthetic dataset, and
+must stay within its statement budget on both. A budget is a fixed number,
+so a page that starts issuing a query per row (an N+1) fails on the larger
+dataset. Lower a budget when a route gets cheaper; raising one needs a
+reason in the commit.
+"""
+from datetime import date
+import pytest
+from flask import url_for
+from nihongo.models import db
+from nihongo.models.user import User
+from nihongo.models.exam import Exam
+from nihongo.models.question import Question
+from nihongo.models.test import Test
+from nihongo.synthetic import generate_synthetic, SYNTHETIC_PASSWORD
+from nihongo.query_counter import QueryCounter
+
+DATASETS = {
+    'small': dict(users=5, exams=2, sections_per_exam=2, questions_per_section=3, tests_per_user=2),
+    'large': dict(users=25, exams=21, sections_per_exam=5, questions_per_section=6, tests_per_user=8),
+}
+
+# route -> (method, url built from the seeded ids, statement budget)
+ROUTE_BUDGETS = {
+    'exams': ('GET', lambda ids: '/exams', 6),
+    'take_exam': ('GET', lambda ids: f"/test/{ids['open_test']}", 7),
+    'test_results': ('GET', lambda ids: f"/test/{ids['completed_test']}/results", 7),
+    'my_exam_history': ('GET', lambda ids: '/my-exams', 3),
+    'create_random_exam': ('POST', lambda ids: '/exam/random/create', 16),
+    'mycontent.index': ('GET', lambda ids: '/mycontent/', 3),
+    'mycontent.questions': ('GET', lambda ids: '/mycontent/questions', 3),
+    'mycontent.edit_question': ('GET', lambda ids: f"/mycontent/questions/{ids['question']}/edit", 2),
+    'mycontent.sections': ('GET', lambda ids: '/mycontent/sections', 4),
+    'mycontent.exams': ('GET', lambda ids: '/mycontent/exams', 3),
+    'mycontent.edit_exam': ('GET', lambda ids: f"/mycontent/exams/{ids['exam']}/edit", 5),
+    # Admin lists still load relations per row; budgets are for a full page of 20 rows
+    'admin_users.index_view': ('GET', None, 3),
+    'admin_questions.index_view': ('GET', None, 4),
+    'admin_sections.index_view': ('GET', None, 23),
+    'admin_exams.index_view': ('GET', None, 23),
+    'admin_tests.index_view': ('GET', None, 17),
+    'admin_exam_sections.index_view': ('GET', None, 43),
+    'admin_section_questions.index_view': ('GET', None, 43),
+    'analytics.index': ('GET', None, 4),
+}
+RANDOM_EXAM_FORM = {'section_Vocabulary': '3', 'section_Grammar': '3'}
+
+
+def _request(app, client, method, url, data=None):
+    """One request in its own app context, so no session or g state is shared"""
+    with app.app_context():
+        return client.open(url, method=method, data=data)
+
+
+@pytest.fixture(params=list(DATASETS))
+def seeded(request, app, client):
+    """A synthetic dataset and a logged-in admin who owns its content"""
+    with app.app_context():
+        generate_synthetic(seed=1, end_day=date(2026, 1, 31), **DATASETS[request.param])
+        user = User.query.filter_by(email='synthetic-1-0@example.com').one()
+        user.is_admin = True
+        db.session.commit()
+        exam = Exam.query.filter_by(created_by=user.id).order_by(Exam.id).first()
+        ids = {
+            'exam': exam.id,
+            'question': Question.query.filter_by(created_by=user.id).first().id,
+            'completed_test': Test.query.filter(Test.user_id == user.id, Test.completed_at.isnot(None)).first().id,
+        }
+        email = user.email
+
+    _request(app, client, 'POST', '/login', {'email': email, 'password': SYNTHETIC_PASSWORD})
+    response = _request(app, client, 'POST', f"/exam/{ids['exam']}/start")
+    ids['open_test'] = int(response.headers['Location'].rstrip('/').split('/')[-1])
+    return ids
+
+
+@pytest.mark.routes
+def test_route_query_budgets(app, client, seeded):
+    """Test every main route stays within its SQL statement budget"""
+    over_budget = {}
+    for endpoint, (method, build_url, budget) in ROUTE_BUDGETS.items():
+        if build_url is None:
+            with app.test_request_context():
+                url = url_for(endpoint)
+        else:
+            url = build_url(seeded)
+        data = RANDOM_EXAM_FORM if endpoint == 'create_random_exam' else None
+
+        with QueryCounter(db.engine) as queries:
+            response = _request(app, client, method, url, data)
+        assert response.status_code in (200, 302), f'{endpoint}: HTTP {response.status_code}'
+        if endpoint == 'create_random_exam':
+            assert '/test/' in response.headers['Location']
+        if queries.count > budget:
+            over_budget[endpoint] = f'{queries.count} statements (budget {budget})'
+
+    assert not over_budget, over_budget
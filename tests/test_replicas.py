@@ -0,0 +1,74 @@
+"""
+Tests for read-replica routing, with a second SQLite file as the replica
+"""
+import pytest
+from nihongo.replicas import STICKY_KEY, init_replicas
+
+
+@pytest.fixture
+def replica(app, tmp_path):
+    """A replica file, synced from the primary by each call of sync()"""
+    path = tmp_path / 'replica.db'
+    app.config['DATABASE_REPLICA_URLS'] = [f'sqlite:///{path}']
+    [replica] = init_replicas(app)
+    yield replica
+    replica.engine.dispose()
+    app.config['DATABASE_REPLICA_URLS'] = []
+    init_replicas(app)
+
+
+def sync(runner):
+    result = runner.invoke(args=['replicas-sync'])
+    assert '✅ Copied' in result.output
+
+
+def history_links(client, test_id):
+    """Whether the exam history page links to a test's results"""
+    return f'/test/{test_id}/results'.encode() in client.get('/my-exams').data
+
+
+def submit_test(client, exam_id):
+    response = client.post(f'/exam/{exam_id}/start')
+    test_id = int(response.headers['Location'].rstrip('/').split('/')[-1])
+    client.post(f'/test/{test_id}/submit')
+    return test_id
+
+
+@pytest.mark.integration
+def test_reads_follow_replica_except_after_own_write(app, auth_client, runner, test_exam, replica):
+    """Test history reads come from the replica, but from the primary right after the user's own write"""
+    sync(runner)
+    test_id = submit_test(auth_client, test_exam)
+    assert history_links(auth_client, test_id)  # Sticky: the replica has not seen the submit yet
+
+    with auth_client.session_transaction() as session:
+        session[STICKY_KEY] = 0
+    assert not history_links(auth_client, test_id)  # Served by the stale replica
+
+    sync(runner)
+    assert history_links(auth_client, test_id)
+
+
+@pytest.mark.integration
+def test_failed_replica_falls_back_to_primary(app, auth_client, runner, test_exam, replica):
+    """Test a replica without tables is taken out of rotation and the page is read from the primary"""
+    test_id = submit_test(auth_client, test_exam)
+    with auth_client.session_transaction() as session:
+        session.pop(STICKY_KEY)
+
+    assert history_links(auth_client, test_id)
+    assert not replica.available
+
+    response = auth_client.get('/exams')
+    assert response.status_code == 200
+    assert b'Test Exam' in response.data
+
+
+def test_sync_refuses_non_sqlite(app, runner):
+    """Test replicas-sync only copies SQLite files"""
+    app.config['DATABASE_REPLICA_URLS'] = ['postgresql://u:p@replica/jlpt']
+    try:
+        result = runner.invoke(args=['replicas-sync'])
+    finally:
+        app.config['DATABASE_REPLICA_URLS'] = []
+    assert '❌' in result.output
@@ -0,0 +1,177 @@
+"""
+Tests for the daily analytics rollups
+"""
+import pytest
+from datetime import datetime, date
+from nihongo.models import db
+from nihongo.models.user import User
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.models.question import Question
+from nihongo.models.section import Section
+from nihongo.models.exam import Exam
+from nihongo.models.exam_section import ExamSection
+from nihongo.models.section_question import SectionQuestion
+from nihongo.models.exam_daily_rollup import ExamDailyRollup
+from nihongo.models.section_daily_rollup import SectionDailyRollup
+from nihongo.rollups import (
+    record_test_rollups, recompute_rollups, exam_summary, section_summary, daily_trend
+)
+
+# (completed_at, picks for the four questions; correct answers are 1, 2, 3, 4)
+SUBMISSIONS = [
+    (datetime(2026, 3, 1, 9), [1, 2, 3, 4]),
+    (datetime(2026, 3, 1, 23), [1, 2, 1, 1]),
+    (datetime(2026, 3, 2, 8), [1, 1, 1, None]),
+    (datetime(2026, 3, 3, 12), [1, 2, 3, 1]),
+]
+
+
+@pytest.fixture
+def rollup_exam(app, test_user):
+    """Create an exam with a Grammar and a Vocabulary section of two questions each"""
+    with app.app_context():
+        questions = [
+            Question(question_text=f'Q{i}', answer_1='a', answer_2='b', answer_3='c', answer_4='d',
+                     correct_answer=i + 1, created_by=test_user['id'])
+            for i in range(4)
+        ]
+        grammar = Section(name='Grammar', number_of_questions=2)
+        vocabulary = Section(name='Vocabulary', number_of_questions=2)
+        exam = Exam(name='Rollup Exam', created_by=test_user['id'])
+        db.session.add_all(questions + [grammar, vocabulary, exam])
+        db.session.flush()
+        for order, question in enumerate(questions):
+            section = grammar if order < 2 else vocabulary
+            db.session.add(SectionQuestion(section_id=section.id, question_id=question.id, order=order))
+        db.session.add(ExamSection(exam_id=exam.id, section_id=grammar.id, order=1))
+        db.session.add(ExamSection(exam_id=exam.id, section_id=vocabulary.id, order=2))
+        db.session.commit()
+        return exam.id, [question.id for question in questions]
+
+
+def _submit_all(exam_id, user_id, question_ids):
+    section_names = ['Grammar', 'Grammar', 'Vocabulary', 'Vocabulary']
+    for completed_at, picks in SUBMISSIONS:
+        test = Test(exam_id=exam_id, user_id=user_id, completed_at=completed_at)
+        db.session.add(test)
+        db.session.flush()
+        answer_dict = {qid: pick for qid, pick in zip(question_ids, picks) if pick}
+        for qid, pick in answer_dict.items():
+            db.session.add(TestAnswer(test_id=test.id, user_id=user_id, question_id=qid, selected_answer=pick))
+        record_test_rollups(test, question_ids, section_names, answer_dict)
+    db.session.commit()
+
+
+def _snapshot():
+    exams = {
+        (row.day, row.exam_id): (row.tests_completed, row.tests_passed, round(row.score_sum, 6),
+                                 row.questions_total, row.correct_total)
+        for row in ExamDailyRollup.query.all()
+    }
+    sections = {
+        (row.day, row.section_name): (row.questions_total, row.correct_total)
+        for row in SectionDailyRollup.query.all()
+    }
+    return exams, sections
+
+
+@pytest.mark.models
+def test_incremental_rollups(app, test_user, rollup_exam):
+    """Test submissions are aggregated per day, exam and section name"""
+    exam_id, question_ids = rollup_exam
+    with app.app_context():
+        _submit_all(exam_id, test_user['id'], question_ids)
+        exams, sections = _snapshot()
+
+        assert exams[(date(2026, 3, 1), exam_id)] == (2, 1, 150.0, 8, 6)
+        assert exams[(date(2026, 3, 2), exam_id)] == (1, 0, 25.0, 4, 1)
+        assert sections[(date(2026, 3, 1), 'Grammar')] == (4, 4)
+        assert sections[(date(2026, 3, 1), 'Vocabulary')] == (4, 2)
+
+
+@pytest.mark.models
+def test_recompute_matches_incremental(app, test_user, rollup_exam):
+    """Test a full and a partial recompute reproduce the incremental rollups"""
+    exam_id, question_ids = rollup_exam
+    with app.app_context():
+        _submit_all(exam_id, test_user['id'], question_ids)
+        incremental = _snapshot()
+
+        assert recompute_rollups() == (4, 3, 6)
+        assert _snapshot() == incremental
+
+        # Rebuilding one day leaves the other days untouched
+        ExamDailyRollup.query.filter_by(day=date(2026, 3, 2)).update({'tests_completed': 99})
+        db.session.commit()
+        assert recompute_rollups(date(2026, 3, 2), date(2026, 3, 2)) == (1, 1, 2)
+        assert _snapshot() == incremental
+
+
+@pytest.mark.models
+def test_summary_queries(app, test_user, rollup_exam):
+    """Test the dashboard queries aggregate the rollups over a range"""
+    exam_id, question_ids = rollup_exam
+    with app.app_context():
+        _submit_all(exam_id, test_user['id'], question_ids)
+
+        [summary] = exam_summary(date(2026, 3, 1), date(2026, 3, 2))
+        assert (summary['tests'], summary['passed']) == (3, 1)
+        assert summary['average_score'] == pytest.approx(175 / 3)
+
+        sections = {row['section_name']: row['correct_rate'] for row in section_summary()}
+        assert sections == {'Grammar': pytest.approx(87.5), 'Vocabulary': pytest.approx(37.5)}
+
+        assert [row['tests'] for row in daily_trend()] == [2, 1, 1]
+
+
+@pytest.mark.routes
+def test_submit_updates_rollups(auth_client, app, test_user, test_exam, test_question):
+    """Test submitting a test adds it to today's rollups"""
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+        test_id = test.id
+
+    auth_client.post(f'/test/{test_id}/answer', data={'question_id': test_question, 'selected_answer': 1})
+    auth_client.post(f'/test/{test_id}/submit')
+
+    with app.app_context():
+        row = db.session.get(ExamDailyRollup, (datetime.utcnow().date(), test_exam))
+        assert (row.tests_completed, row.tests_passed, row.correct_total) == (1, 1, 1)
+        assert SectionDailyRollup.query.filter_by(section_name='Test Section').count() == 1
+
+
+@pytest.mark.admin
+def test_analytics_view(client, app, test_user, test_exam, test_question):
+    """Test the analytics dashboard is admin only and lists rollup data"""
+    response = client.get('/admin/analytics/')
+    assert response.status_code == 302
+    assert '/login' in response.location
+
+    with app.app_context():
+        db.session.get(User, test_user['id']).is_admin = True
+        test = Test(exam_id=test_exam, user_id=test_user['id'], completed_at=datetime.utcnow())
+        db.session.add(test)
+        db.session.flush()
+        record_test_rollups(test, [test_question], ['Test Section'], {test_question: 1})
+        db.session.commit()
+
+    client.post('/login', data={'email': test_user['email'], 'password': test_user['password']})
+    response = client.get('/admin/analytics/?days=7')
+    assert response.status_code == 200
+    assert b'Test Exam' in response.data
+    assert b'Test Section' in response.data
+    assert b'100.0%' in response.data
+
+
+@pytest.mark.routes
+def test_recompute_command(app, runner, test_user, rollup_exam):
+    """Test flask recompute-rollups rebuilds a date range"""
+    exam_id, question_ids = rollup_exam
+    with app.app_context():
+        _submit_all(exam_id, test_user['id'], question_ids)
+
+    result = runner.invoke(args=['recompute-rollups', '--from', '2026-03-01', '--to', '2026-03-01'])
+    assert 'Rebuilt 1 exam and 2 section rollup row(s) from 2 completed test(s)' in result.output
@@ -0,0 +1,129 @@
+"""
+Tests for stored test scores and bulk rescoring
+"""
+import re
+import pytest
+from datetime import datetime, date
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.models.question import Question
+from nihongo.models.exam_daily_rollup import ExamDailyRollup
+from nihongo.rollups import recompute_rollups
+from nihongo.scoring import rescore_tests, score_answers, get_percentage
+
+
+def _completed_test(user_id, exam_id, question_id, answer, completed_at):
+    test = Test(exam_id=exam_id, user_id=user_id, completed_at=completed_at)
+    db.session.add(test)
+    db.session.flush()
+    db.session.add(TestAnswer(test_id=test.id, user_id=user_id, question_id=question_id, selected_answer=answer))
+    return test
+
+
+@pytest.mark.models
+def test_score_answers():
+    """Test scoring counts each exam question once"""
+    assert score_answers([1, 2, 3, 2], {1: 1, 2: 4}, {1: 1, 2: 2, 3: 3}) == (1, 3)
+    assert score_answers([], {}, {}) == (0, 0)
+
+
+@pytest.mark.routes
+def test_submit_stores_score(auth_client, app, test_user, test_exam, test_question):
+    """Test submitting stores the score and the history uses it"""
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+        test_id = test.id
+
+    auth_client.post(f'/test/{test_id}/answer', data={'question_id': test_question, 'selected_answer': 1})
+    auth_client.post(f'/test/{test_id}/submit')
+
+    with app.app_context():
+        test = db.session.get(Test, test_id)
+        assert (test.correct_count, test.total_questions) == (1, 1)
+        assert get_percentage(test) == 100
+
+    assert b'100.0%' in auth_client.get('/my-exams').data
+
+
+@pytest.mark.routes
+def test_results_show_stored_score(auth_client, app, test_user, test_exam, test_question):
+    """Test the results page shows the stored score, like the history, until a rescore"""
+    with app.app_context():
+        test = _completed_test(test_user['id'], test_exam, test_question, 1, datetime.utcnow())
+        test.correct_count, test.total_questions = 1, 1
+        db.session.commit()
+        test_id = test.id
+
+    def results_percentage():
+        page = auth_client.get(f'/test/{test_id}/results').data
+        return int(re.search(rb'score-circle">\s*(\d+)%', page).group(1))
+
+    assert results_percentage() == 100
+    with app.app_context():
+        db.session.get(Question, test_question).correct_answer = 2
+        db.session.commit()
+    assert results_percentage() == 100
+
+    with app.app_context():
+        rescore_tests(question_ids=[test_question])
+    assert results_percentage() == 0
+
+
+@pytest.mark.models
+def test_rescore_after_key_fix(app, test_user, test_exam, test_question):
+    """Test rescoring updates stale scores and the affected rollups"""
+    with app.app_context():
+        first = _completed_test(test_user['id'], test_exam, test_question, 2, datetime(2026, 3, 1, 10))
+        second = _completed_test(test_user['id'], test_exam, test_question, 1, datetime(2026, 3, 2, 10))
+        db.session.commit()
+
+        # Backfill scores and rollups with the original key (correct answer 1)
+        assert rescore_tests()['changed'] == 2
+        recompute_rollups()
+
+        db.session.get(Question, test_question).correct_answer = 2
+        db.session.commit()
+
+        result = rescore_tests(question_ids=[test_question])
+        assert (result['tests'], result['changed']) == (2, 2)
+        assert (result['first_day'], result['last_day']) == (date(2026, 3, 1), date(2026, 3, 2))
+
+        assert db.session.get(Test, first.id).correct_count == 1
+        assert db.session.get(Test, second.id).correct_count == 0
+
+        # Nothing left to change
+        assert rescore_tests(question_ids=[test_question])['changed'] == 0
+
+
+@pytest.mark.models
+def test_rescore_scope(app, test_user, test_exam, test_question):
+    """Test rescoring can be limited by exam and completion date"""
+    with app.app_context():
+        _completed_test(test_user['id'], test_exam, test_question, 1, datetime(2026, 3, 1, 10))
+        _completed_test(test_user['id'], test_exam, test_question, 1, datetime(2026, 3, 5, 10))
+        db.session.commit()
+
+        assert rescore_tests(exam_ids=[test_exam + 1])['tests'] == 0
+        assert rescore_tests(question_ids=[test_question + 1])['tests'] == 0
+        assert rescore_tests(start_day=date(2026, 3, 2))['tests'] == 1
+        assert rescore_tests(end_day=date(2026, 3, 1), exam_ids=[test_exam])['tests'] == 1
+
+
+@pytest.mark.routes
+def test_rescore_command(app, runner, test_user, test_exam, test_question):
+    """Test flask rescore reports throughput and refreshes the rollups"""
+    with app.app_context():
+        _completed_test(test_user['id'], test_exam, test_question, 1, datetime(2026, 3, 1, 10))
+        db.session.commit()
+
+    result = runner.invoke(args=['rescore', '--exam', str(test_exam)])
+    assert 'Rescored 1 test(s)' in result.output
+    assert 'tests/s' in result.output
+    assert '1 score(s) changed' in result.output
+
+    with app.app_context():
+        row = db.session.get(ExamDailyRollup, (date(2026, 3, 1), test_exam))
+        assert (row.tests_completed, row.correct_total) == (1, 1)
@@ -0,0 +1,220 @@
+"""
+Tests for server-side sessions and the shared stores
+"""
+import socketserver
+import threading
+import time
+import pytest
+from flask import session
+from nihongo.stores import MemoryStore, SQLStore, RedisStore
+from nihongo.server_sessions import (
+    ServerSideSessionInterface, SessionSerializer, SESSION_KEY_PREFIX
+)
+
+
+class CountingStore(MemoryStore):
+    """Memory store that counts reads"""
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get(self, key):
+        self.reads += 1
+        return super().get(key)
+
+
+@pytest.fixture
+def session_store(app):
+    """Switch the app to server-side sessions backed by an in-process store"""
+    store = CountingStore()
+    original_interface = app.session_interface
+    app.session_interface = ServerSideSessionInterface(store)
+    yield store
+    app.session_interface = original_interface
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Minimal Redis-protocol server supporting GET, SET [PX], DEL"""
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+
+            command = args[0].upper()
+            if command == b'GET':
+                entry = data.get(args[1])
+                if entry is None or (entry[1] and entry[1] <= time.time()):
+                    self.wfile.write(b'$-1\r\n')
+                else:
+                    self.wfile.write(b'$%d\r\n%s\r\n' % (len(entry[0]), entry[0]))
+            elif command == b'SET':
+                expires_at = None
+                if len(args) == 5 and args[3].upper() == b'PX':
+                    expires_at = time.time() + int(args[4]) / 1000
+                data[args[1]] = (args[2], expires_at)
+                self.wfile.write(b'+OK\r\n')
+            elif command == b'DEL':
+                self.wfile.write(b':%d\r\n' % (1 if data.pop(args[1], None) else 0))
+            else:
+                self.wfile.write(b'-ERR unknown command\r\n')
+
+
+@pytest.fixture
+def fake_redis():
+    """Run a fake Redis-protocol server on a local port"""
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeRedisHandler)
+    server.daemon_threads = True
+    server.data = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'redis://127.0.0.1:{server.server_address[1]}/0'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.sessions
+def test_serializer_roundtrip():
+    """Test session data survives encoding, including tuples and compression"""
+    serializer = SessionSerializer(compress_threshold=16)
+    data = {'language': 'es', '_flashes': [('success', 'Saved! ' * 20)]}
+
+    encoded = serializer.dumps(data)
+    assert encoded[:1] == SessionSerializer.ZLIB
+    assert serializer.loads(encoded) == data
+    assert serializer.loads(SessionSerializer().dumps({'a': 1})) == {'a': 1}
+
+
+@pytest.mark.sessions
+def test_login_stores_session_server_side(client, test_user, session_store):
+    """Test the cookie only carries an id and the data lives in the store"""
+    client.post('/login', data={
+        'email': test_user['email'],
+        'password': test_user['password']
+    })
+
+    cookie = client.get_cookie('session')
+    assert cookie is not None
+    stored = session_store.get(SESSION_KEY_PREFIX + cookie.value)
+    assert stored is not None
+    assert SessionSerializer().loads(stored)['_user_id'] == str(test_user['id'])
+
+    response = client.get('/exams')
+    assert response.status_code == 200
+
+
+@pytest.mark.sessions
+def test_language_choice_persists(client, session_store):
+    """Test session changes are written back and read on the next request"""
+    client.get('/language/en')
+    response = client.get('/login')
+    assert b'<html lang="en">' in response.data
+
+
+@pytest.mark.sessions
+def test_untouched_session_is_never_read(app, session_store):
+    """Test a request that does not use the session does not hit the store"""
+    session_store.set(SESSION_KEY_PREFIX + 'a' * 43, SessionSerializer().dumps({'language': 'en'}))
+    interface = app.session_interface
+
+    with app.test_request_context(headers={'Cookie': 'session=' + 'a' * 43}) as ctx:
+        response = app.response_class()
+        interface.save_session(app, ctx.session, response)
+        assert session_store.reads == 0
+        assert 'Set-Cookie' not in response.headers
+
+        assert session['language'] == 'en'
+        assert session_store.reads == 1
+
+
+@pytest.mark.sessions
+def test_emptied_session_is_deleted(app, session_store):
+    """Test clearing the session removes it from the store"""
+    sid = 'b' * 43
+    session_store.set(SESSION_KEY_PREFIX + sid, SessionSerializer().dumps({'language': 'en'}))
+
+    with app.test_request_context(headers={'Cookie': 'session=' + sid}) as ctx:
+        session.clear()
+        app.session_interface.save_session(app, ctx.session, app.response_class())
+
+    assert session_store.get(SESSION_KEY_PREFIX + sid) is None
+
+
+@pytest.mark.sessions
+def test_unknown_session_id_is_not_adopted(client, session_store):
+    """Test a made-up session id cookie is replaced, never stored or sent back"""
+    planted = 'c' * 43
+    client.set_cookie('session', planted)
+
+    response = client.get('/language/en')
+    assert planted not in response.headers.get('Set-Cookie', '')
+    assert client.get_cookie('session').value != planted
+    assert session_store.get(SESSION_KEY_PREFIX + planted) is None
+
+
+@pytest.mark.sessions
+def test_login_and_logout_issue_new_session_ids(client, test_user, session_store):
+    """Test the session id changes on login and logout, and the old ids are deleted"""
+    client.get('/language/en')
+    anonymous = client.get_cookie('session').value
+
+    client.post('/login', data={'email': test_user['email'], 'password': test_user['password']})
+    logged_in = client.get_cookie('session').value
+    assert logged_in != anonymous
+    assert session_store.get(SESSION_KEY_PREFIX + anonymous) is None
+    assert b'<html lang="en">' in client.get('/exams').data  # Data moved with the id
+
+    client.get('/logout')
+    cookie = client.get_cookie('session')
+    assert cookie is None or cookie.value != logged_in
+    assert session_store.get(SESSION_KEY_PREFIX + logged_in) is None
+
+
+@pytest.mark.sessions
+def test_memory_store_expiry_sweep():
+    """Test expired entries are swept from the memory store"""
+    store = MemoryStore()
+    store.set('old', b'x', ttl=0.01)
+    store.set('new', b'y', ttl=60)
+    store.set('forever', b'z')
+    time.sleep(0.02)
+
+    assert store.sweep() == 1
+    assert store.get('old') is None
+    assert store.get('new') == b'y'
+    assert store.get('forever') == b'z'
+
+
+@pytest.mark.sessions
+def test_sql_store(app):
+    """Test the SQL store upserts, expires and sweeps entries"""
+    store = SQLStore(app)
+    store.set('k', b'one', ttl=60)
+    store.set('k', b'two', ttl=60)
+    assert store.get('k') == b'two'
+
+    store.set('expired', b'x', ttl=-1)
+    assert store.get('expired') is None
+    assert store.sweep() == 1
+
+    store.delete('k')
+    assert store.get('k') is None
+
+
+@pytest.mark.sessions
+def test_redis_store(fake_redis):
+    """Test the Redis-protocol store against a local fake server"""
+    store = RedisStore(fake_redis)
+    store.set('k', b'\x00binary\r\n', ttl=60)
+    assert store.get('k') == b'\x00binary\r\n'
+
+    store.delete('k')
+    assert store.get('k') is None
+    assert store.sweep() == 0
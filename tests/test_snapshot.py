@@ -0,0 +1,110 @@
+"""
+Tests for content snapshots
+"""
+import io
+import json
+import pytest
+from nihongo.import_exam import import_exam_from_json
+from nihongo.export_exam import export_exam_to_json
+from nihongo.models.exam import Exam
+from nihongo.models.question import Question
+from nihongo.snapshot import (
+    write_snapshot, read_snapshot, snapshot_from_db, snapshot_from_exam_json, load_snapshot
+)
+
+
+def _pack(tables):
+    out = io.BytesIO()
+    write_snapshot(tables, out)
+    return out.getvalue()
+
+
+def _export(exam_id):
+    out = io.StringIO()
+    export_exam_to_json(exam_id, out)
+    return json.loads(out.getvalue())
+
+
+@pytest.mark.exam_import
+def test_snapshot_round_trip(app, test_user, sample_exam_json):
+    """Test a database snapshot survives the binary format unchanged"""
+    with app.app_context():
+        import_exam_from_json(sample_exam_json, test_user['id'])
+        tables = snapshot_from_db()
+        assert read_snapshot(_pack(tables)) == tables
+
+        with pytest.raises(ValueError):
+            read_snapshot(b'NOTSNAP' + bytes(10))
+
+
+@pytest.mark.exam_import
+def test_load_json_snapshot_matches_import(app, test_user, sample_exam_json):
+    """Test a snapshot built from JSON loads into the same exam the importer creates"""
+    with app.app_context():
+        tables = read_snapshot(_pack(snapshot_from_exam_json([sample_exam_json])))
+        with pytest.raises(ValueError):
+            load_snapshot(tables)
+
+        counts = load_snapshot(tables, user_id=test_user['id'])
+        assert (counts['exams'], counts['sections'], counts['questions']) == (1, 2, 3)
+        exam = Exam.query.filter_by(name=sample_exam_json['name']).one()
+        assert exam.created_by == test_user['id']
+        assert _export(exam.id) == sample_exam_json
+
+
+@pytest.mark.exam_import
+def test_load_into_populated_database(app, test_user, test_exam, sample_exam_json):
+    """Test ids are shifted past existing rows and existing exams can be skipped"""
+    with app.app_context():
+        tables = snapshot_from_exam_json([sample_exam_json, dict(sample_exam_json, name='Second Exam')])
+        questions_before = Question.query.count()
+
+        counts = load_snapshot(tables, user_id=test_user['id'])
+        assert counts['exams'] == 2
+        assert Question.query.count() == questions_before + 6
+        for exam in Exam.query.filter(Exam.name != 'Test Exam'):
+            assert _export(exam.id)['sections'] == sample_exam_json['sections']
+
+        counts = load_snapshot(tables, user_id=test_user['id'], skip_existing=True)
+        assert (counts['exams'], counts['questions'], counts['skipped_exams']) == (0, 0, 2)
+
+
+@pytest.mark.exam_import
+def test_load_requires_user_for_unknown_creators(app, test_user, sample_exam_json):
+    """Test a database snapshot whose creators are not users here is refused without a user"""
+    with app.app_context():
+        import_exam_from_json(sample_exam_json, test_user['id'])
+        tables = snapshot_from_db()
+        tables['exams']['created_by'] = [test_user['id'] + 1000] * len(tables['exams']['id'])
+        exams_before = Exam.query.count()
+
+        with pytest.raises(ValueError, match='not users of this database'):
+            load_snapshot(tables)
+        assert Exam.query.count() == exams_before
+
+        assert load_snapshot(tables, user_id=test_user['id'])['exams'] == 1
+
+
+@pytest.mark.exam_import
+def test_snapshot_commands(app, runner, test_user, sample_exam_json, tmp_path):
+    """Test flask snapshot-create from JSON files, snapshot-load and init-db --snapshot"""
+    json_path = tmp_path / 'exam.json'
+    json_path.write_text(json.dumps(sample_exam_json, ensure_ascii=False), encoding='utf-8')
+    snapshot_path = tmp_path / 'content.snap'
+
+    result = runner.invoke(args=['snapshot-create', str(snapshot_path), '--from-json', str(json_path)])
+    assert result.exit_code == 0
+    assert 'Wrote 1 exam(s)' in result.output
+
+    result = runner.invoke(args=['snapshot-load', str(snapshot_path)])
+    assert 'no owner' in result.output
+
+    result = runner.invoke(args=['snapshot-load', str(snapshot_path), '--user', test_user['email']])
+    assert 'Loaded 1 exam(s) and 3 question(s)' in result.output
+    with app.app_context():
+        assert Exam.query.filter_by(name=sample_exam_json['name']).count() == 1
+
+    # init-db assigns the content to the default user and skips existing exams
+    result = runner.invoke(args=['init-db', '--snapshot', str(snapshot_path)])
+    assert 'Loaded 0 exam(s)' in result.output
+    assert '1 exam(s) already existed' in result.output
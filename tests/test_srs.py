@@ -0,0 +1,141 @@
+"""
+Tests for the spaced-repetition review queue
+"""
+import pytest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import event, text
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.review_card import ReviewCard
+from nihongo.catalogue import get_section_catalogue, get_section_pool
+from nihongo.srs import schedule, record_reviews, due_query, get_due_question_ids, count_due, MIN_EASE
+
+
+def _card(**overrides):
+    values = dict(ease=2.5, interval_days=0.0, repetitions=0, lapses=0, due_at=None, last_reviewed_at=None)
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+@pytest.mark.models
+def test_schedule_intervals():
+    """Test correct answers grow the interval and a lapse resets it"""
+    now = datetime(2026, 3, 1)
+    card = _card()
+    intervals = []
+    for _ in range(4):
+        schedule(card, True, now)
+        intervals.append(card.interval_days)
+    assert intervals == [1.0, 6.0, 15.0, 37.5]
+    assert card.due_at == now + timedelta(days=37.5)
+
+    schedule(card, False, now)
+    assert (card.repetitions, card.lapses, card.interval_days, card.due_at) == (0, 1, 0.0, now)
+    assert card.ease == pytest.approx(2.3)
+
+    for _ in range(10):
+        schedule(card, False, now)
+    assert card.ease == MIN_EASE
+
+
+@pytest.mark.models
+def test_record_reviews(app, test_user, test_question):
+    """Test wrong answers create cards and later answers reschedule them"""
+    user_id = test_user['id']
+    key = {test_question: 1}
+    now = datetime(2026, 3, 1, 12)
+    with app.app_context():
+        # A correct answer to a question without a card creates nothing
+        record_reviews(user_id, [test_question], {test_question: 1}, key, now)
+        assert ReviewCard.query.count() == 0
+
+        record_reviews(user_id, [test_question], {test_question: 2}, key, now)
+        db.session.commit()
+        assert get_due_question_ids(user_id, now, 10) == [test_question]
+
+        record_reviews(user_id, [test_question], {test_question: 1}, key, now + timedelta(hours=1))
+        db.session.commit()
+        card = db.session.get(ReviewCard, (user_id, test_question))
+        assert (card.repetitions, card.lapses, card.interval_days) == (1, 1, 1.0)
+        assert count_due(user_id, now + timedelta(hours=2)) == 0
+        assert count_due(user_id, now + timedelta(days=1, hours=2)) == 1
+
+
+@pytest.mark.models
+def test_record_reviews_with_concurrent_submit(app, test_user, test_question):
+    """Test a card created by another submit while this one records is rescheduled, not inserted twice"""
+    user_id = test_user['id']
+    now = datetime(2026, 3, 1, 12)
+    with app.app_context():
+        engine = db.engine
+        other_submit = []
+
+        def insert_first(conn, cursor, statement, parameters, context, executemany):
+            # Another worker commits the same user's first lapse just before this statement
+            if statement.startswith('INSERT INTO review_cards') and not other_submit:
+                other_submit.append(True)
+                with engine.begin() as other:
+                    other.execute(db.insert(ReviewCard).values(
+                        user_id=user_id, question_id=test_question, ease=2.3, interval_days=0.0,
+                        repetitions=0, lapses=1, due_at=now, last_reviewed_at=now
+                    ))
+
+        event.listen(engine, 'before_cursor_execute', insert_first)
+        try:
+            record_reviews(user_id, [test_question], {test_question: 2}, {test_question: 1}, now)
+            db.session.commit()
+        finally:
+            event.remove(engine, 'before_cursor_execute', insert_first)
+
+        card = db.session.get(ReviewCard, (user_id, test_question))
+        assert (card.lapses, card.ease) == (2, pytest.approx(2.1))
+
+
+@pytest.mark.models
+def test_due_queue_uses_index(app):
+    """Test the due queue is an index range scan on (user_id, due_at)"""
+    with app.app_context():
+        query = due_query(1, datetime(2026, 3, 1)).with_entities(ReviewCard.question_id).limit(20)
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = ' '.join(str(row) for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')))
+        assert 'ix_review_cards_user_due' in plan
+
+
+@pytest.mark.routes
+def test_review_flow(auth_client, app, test_user, test_exam, test_question):
+    """Test a wrong answer shows up in the review queue and /review starts a session"""
+    response = auth_client.post('/review')
+    assert response.status_code == 302
+    assert response.location.endswith('/exams')
+
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+        test_id = test.id
+
+    auth_client.post(f'/test/{test_id}/answer', data={'question_id': test_question, 'selected_answer': 3})
+    auth_client.post(f'/test/{test_id}/submit')
+
+    assert b'action="/review"' in auth_client.get('/exams').data
+
+    response = auth_client.post('/review')
+    assert response.status_code == 302
+    review_test_id = int(response.location.rstrip('/').split('/')[-1])
+
+    with app.app_context():
+        review_test = db.session.get(Test, review_test_id)
+        assert review_test.exam.name.startswith('Review Session')
+
+    # The review's section stays out of the section list and the random exam pools
+    assert b'Review' not in auth_client.get('/mycontent/sections').data
+    with app.app_context():
+        assert 'Review' not in get_section_catalogue()
+        assert get_section_pool('Review') == []
+
+    # Answering correctly in the review pushes the card out of the queue
+    auth_client.post(f'/test/{review_test_id}/answer', data={'question_id': test_question, 'selected_answer': 1})
+    auth_client.post(f'/test/{review_test_id}/submit')
+    with app.app_context():
+        assert count_due(test_user['id'], datetime.utcnow()) == 0
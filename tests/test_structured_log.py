@@ -0,0 +1,104 @@
+"""
+Tests for structured request and import logs
+"""
+import json
+import logging
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from nihongo.models import db
+from nihongo.metrics import DB_STATEMENTS
+from nihongo.query_counter import QueryCounter
+from nihongo.structured_log import BackgroundHandler, JsonFormatter, get_logger
+from nihongo.import_exam import import_exam_from_file
+
+
+class ListHandler(logging.Handler):
+    """Collects the written lines"""
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+@pytest.fixture
+def log_lines():
+    """JSON log lines of the app, written through a background handler"""
+    target = ListHandler()
+    handler = BackgroundHandler(target)
+    handler.setFormatter(JsonFormatter())
+    logger = get_logger()
+    level = logger.level
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+
+    def read():
+        handler.listener.stop()  # Drains the queue
+        handler.listener.start()
+        return [json.loads(line) for line in target.lines]
+
+    yield read
+    logger.removeHandler(handler)
+    logger.setLevel(level)
+    handler.close()
+
+
+@pytest.mark.routes
+def test_request_log_line(auth_client, test_user, test_exam, log_lines):
+    """Test each request is logged with endpoint, status, duration, SQL count and user"""
+    assert auth_client.get('/exams').status_code == 200
+    entry = [e for e in log_lines() if e['event'] == 'request'][-1]
+    assert entry['logger'] == 'nihongo.request'
+    assert entry['endpoint'] == 'exams'
+    assert entry['path'] == '/exams'
+    assert entry['status'] == 200
+    assert entry['duration_ms'] >= entry['sql_ms'] >= 0
+    assert entry['sql_count'] > 0
+    assert entry['user_id'] == str(test_user['id'])
+
+
+@pytest.mark.routes
+def test_request_log_and_metrics_share_sql_count(auth_client, test_exam, log_lines):
+    """Test the request log and the metrics report the same statements of a request"""
+    statements_before = DB_STATEMENTS.value(endpoint='exams')
+    assert auth_client.get('/exams').status_code == 200
+    entry = [e for e in log_lines() if e['event'] == 'request'][-1]
+    assert DB_STATEMENTS.value(endpoint='exams') - statements_before == entry['sql_count']
+
+
+def test_failed_statement_leaves_no_start_time(app):
+    """Test a statement that raises is counted and its start time is not left on the connection"""
+    with app.app_context(), db.engine.connect() as conn:
+        with QueryCounter(db.engine) as queries:
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM no_such_table'))
+            conn.execute(text('SELECT 1'))
+        assert queries.count == 2
+        assert not conn.info.get('query_counter_start')
+
+
+@pytest.mark.exam_import
+def test_import_phases_are_logged(app, test_user, sample_exam_json, tmp_path, log_lines):
+    """Test imports log their read and commit phases, and failures are warnings"""
+    path = tmp_path / 'exam.json'
+    path.write_text(json.dumps(sample_exam_json, ensure_ascii=False), encoding='utf-8')
+    with app.app_context():
+        success, _, exam = import_exam_from_file(str(path), test_user['id'])
+        exam_id = exam.id
+        import_exam_from_file(str(path), 999999)
+    assert success
+
+    imported, failed = [e for e in log_lines() if e['event'] == 'exam_import']
+    assert imported['level'] == 'info'
+    assert imported['result'] == 'success'
+    assert imported['exam_id'] == exam_id
+    assert imported['sections'] == len(sample_exam_json['sections'])
+    assert imported['sql_count'] > 0
+    assert imported['read_ms'] >= 0 and imported['commit_ms'] >= 0
+    assert imported['duration_ms'] >= imported['commit_ms']
+    assert failed['level'] == 'warning'
+    assert failed['result'] == 'error'
+    assert 'not found' in failed['error']
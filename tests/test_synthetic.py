@@ -0,0 +1,85 @@
+"""
+Tests for the synthetic dataset generator
+"""
+from datetime import date
+import pytest
+from nihongo.models import db
+from nihongo.models.user import User
+from nihongo.models.question import Question
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.models.exam_daily_rollup import ExamDailyRollup
+from nihongo.synthetic import generate_synthetic, SYNTHETIC_PASSWORD, SYNTHETIC_MODELS
+
+SMALL = dict(users=12, exams=2, sections_per_exam=3, questions_per_section=10,
+             tests_per_user=3, end_day=date(2026, 1, 31))
+
+
+def _dump():
+    """All generated rows except the salted password hashes"""
+    return {
+        model.__tablename__: [
+            {key: value for key, value in row._mapping.items() if key != 'password_hash'}
+            for row in db.session.execute(db.select(model.__table__).order_by(model.__table__.c.id))
+        ]
+        for model in SYNTHETIC_MODELS
+    }
+
+
+@pytest.mark.models
+def test_same_seed_same_rows(app):
+    """Test a seed regenerates identical rows and another seed does not"""
+    with app.app_context():
+        counts = generate_synthetic(seed=7, **SMALL)
+        assert (counts['users'], counts['exams'], counts['questions'], counts['tests']) == (12, 2, 60, 36)
+        first = _dump()
+
+        with pytest.raises(ValueError):
+            generate_synthetic(seed=7, **SMALL)
+
+        for model in reversed(SYNTHETIC_MODELS):
+            db.session.execute(model.__table__.delete())
+        db.session.commit()
+        generate_synthetic(seed=7, **SMALL)
+        assert _dump() == first
+
+        generate_synthetic(seed=8, **SMALL)
+        texts = [row['question_text'] for row in _dump()['questions']]
+        assert texts[60:] != texts[:60]
+
+
+@pytest.mark.models
+def test_synthetic_scores_and_content(app):
+    """Test stored scores match the answers and questions carry furigana"""
+    with app.app_context():
+        generate_synthetic(seed=1, **SMALL)
+
+        user = User.query.filter_by(email='synthetic-1-0@example.com').one()
+        assert user.check_password(SYNTHETIC_PASSWORD)
+        assert Question.query.filter(Question.question_text.contains('<rt>')).count() > 0
+
+        percentages = []
+        for test in Test.query.filter(Test.completed_at.isnot(None)):
+            correct = sum(
+                answer.selected_answer == answer.question.correct_answer
+                for answer in TestAnswer.query.filter_by(test_id=test.id)
+            )
+            assert test.correct_count == correct
+            assert test.total_questions == 30
+            percentages.append(correct / test.total_questions)
+        assert 0.3 < sum(percentages) / len(percentages) < 0.9
+        assert max(percentages) - min(percentages) > 0.2
+
+
+@pytest.mark.models
+def test_seed_synthetic_command(app, runner):
+    """Test flask seed-synthetic inserts data and fills the rollups"""
+    result = runner.invoke(args=['seed-synthetic', '--users', '5', '--exams', '1', '--questions', '5',
+                                 '--end-day', '2026-01-31'])
+    assert result.exit_code == 0
+    assert 'Generated 5 user(s), 1 exam(s), 25 question(s)' in result.output
+    with app.app_context():
+        assert ExamDailyRollup.query.count() > 0
+
+    result = runner.invoke(args=['seed-synthetic', '--users', '5'])
+    assert 'already generated' in result.output
@@ -0,0 +1,222 @@
+"""
+Tests for the in-progress test state cache
+"""
+import re
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+from nihongo.models import db
+from nihongo.models.test import Test
+from nihongo.models.test_answer import TestAnswer
+from nihongo.stores import MemoryStore
+from nihongo.test_state import (
+    TestState, LocalTestStateCache, SharedTestStateCache, get_test_state
+)
+
+
+@pytest.fixture
+def started_test(app, test_user, test_exam):
+    """Create an in-progress test for test_user"""
+    with app.app_context():
+        test = Test(exam_id=test_exam, user_id=test_user['id'])
+        db.session.add(test)
+        db.session.commit()
+        return test.id
+
+
+@pytest.fixture
+def statements(app):
+    """Record SQL statements executed while the fixture is active"""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.mark.caching
+def test_reload_does_not_query_answers(auth_client, started_test, statements):
+    """Test take_exam reloads are served from the cached state"""
+    auth_client.get(f'/test/{started_test}')
+    statements.clear()
+
+    response = auth_client.get(f'/test/{started_test}')
+    assert response.status_code == 200
+    assert not [s for s in statements if 'test_answers' in s]
+    assert not [s for s in statements if 'exam_sections' in s]
+
+
+@pytest.mark.caching
+def test_autosave_writes_through(auth_client, app, started_test, test_question):
+    """Test autosave updates both the database and the cached state"""
+    for answer in (2, 3):
+        response = auth_client.post(f'/test/{started_test}/answer', data={
+            'question_id': test_question,
+            'selected_answer': answer
+        })
+        assert response.status_code == 200
+
+    with app.app_context():
+        rows = TestAnswer.query.filter_by(test_id=started_test).all()
+        assert [(row.question_id, row.selected_answer) for row in rows] == [(test_question, 3)]
+        assert get_test_state(started_test).answer_dict() == {test_question: 3}
+
+    response = auth_client.get(f'/test/{started_test}')
+    assert re.search(rb'value="3"\s+checked', response.data)
+
+
+@pytest.mark.caching
+def test_autosave_rejects_foreign_question(auth_client, started_test, test_question):
+    """Test answers for questions outside the test are rejected"""
+    response = auth_client.post(f'/test/{started_test}/answer', data={
+        'question_id': test_question + 1000,
+        'selected_answer': 1
+    })
+    assert response.status_code == 400
+
+
+@pytest.mark.caching
+def test_submit_discards_state(auth_client, app, started_test, test_question):
+    """Test submitting a test drops its cached state"""
+    auth_client.post(f'/test/{started_test}/answer', data={
+        'question_id': test_question,
+        'selected_answer': 1
+    })
+    auth_client.post(f'/test/{started_test}/submit')
+
+    assert app.extensions['test_state_cache'].get(started_test) is None
+    response = auth_client.post(f'/test/{started_test}/answer', data={
+        'question_id': test_question,
+        'selected_answer': 2
+    })
+    assert response.status_code == 400
+
+
+@pytest.mark.caching
+def test_autosave_upserts_concurrent_answer(auth_client, app, started_test, test_question, test_user):
+    """Test an autosave racing another one for the same question updates its row instead of failing"""
+    auth_client.get(f'/test/{started_test}')
+    with app.app_context():
+        # Inserted by a concurrent request after this one's state was read
+        db.session.add(TestAnswer(test_id=started_test, user_id=test_user['id'], question_id=test_question,
+                                  selected_answer=1))
+        db.session.commit()
+
+    response = auth_client.post(f'/test/{started_test}/answer', data={
+        'question_id': test_question,
+        'selected_answer': 3
+    })
+    assert response.get_json() == {'success': True}
+    with app.app_context():
+        [row] = TestAnswer.query.filter_by(test_id=started_test).all()
+        assert row.selected_answer == 3
+
+
+@pytest.mark.caching
+def test_autosave_after_submit_on_another_worker(auth_client, app, started_test, test_question):
+    """Test a state still cached after another worker graded the test accepts no answer"""
+    auth_client.get(f'/test/{started_test}')
+    with app.app_context():
+        db.session.get(Test, started_test).completed_at = datetime.utcnow()
+        db.session.commit()
+
+    response = auth_client.post(f'/test/{started_test}/answer', data={
+        'question_id': test_question,
+        'selected_answer': 2
+    })
+    assert response.get_json() == {'error': 'Test already completed'}
+    assert app.extensions['test_state_cache'].get(started_test) is None
+    with app.app_context():
+        assert TestAnswer.query.filter_by(test_id=started_test).count() == 0
+
+
+@pytest.mark.caching
+def test_submit_grades_answers_saved_through_another_worker(auth_client, app, started_test, test_question, test_user):
+    """Test a submit is graded from test_answers, not from this worker's stale cached state"""
+    auth_client.get(f'/test/{started_test}')
+    with app.app_context():
+        db.session.add(TestAnswer(
+            test_id=started_test, user_id=test_user['id'],
+            question_id=test_question, selected_answer=1
+        ))
+        db.session.commit()
+
+    auth_client.post(f'/test/{started_test}/submit')
+    with app.app_context():
+        test = db.session.get(Test, started_test)
+        assert (test.correct_count, test.total_questions) == (1, 1)
+
+
+@pytest.mark.caching
+def test_saved_state_endpoint(auth_client, started_test, test_question, test_admin):
+    """Test GET /test/<id>/state returns the saved answers to the test's owner only"""
+    auth_client.post(f'/test/{started_test}/answer', data={'question_id': test_question, 'selected_answer': 2})
+    response = auth_client.get(f'/test/{started_test}/state')
+    assert response.get_json() == {
+        'test_id': started_test, 'answers': {str(test_question): 2}, 'answered': 1, 'total': 1
+    }
+
+    auth_client.get('/logout')
+    auth_client.post('/login', data={'email': test_admin['email'], 'password': test_admin['password']})
+    assert auth_client.get(f'/test/{started_test}/state').status_code == 403
+
+
+@pytest.mark.caching
+def test_state_built_from_saved_answers(app, started_test, test_user, test_question):
+    """Test a cache miss rebuilds the state from test_answers"""
+    with app.app_context():
+        db.session.add(TestAnswer(
+            test_id=started_test, user_id=test_user['id'],
+            question_id=test_question, selected_answer=4
+        ))
+        db.session.commit()
+
+        state = get_test_state(started_test)
+        assert list(state.question_ids) == [test_question]
+        assert state.sections == [('Test Section', 1)]
+        assert state.answer_dict() == {test_question: 4}
+
+
+@pytest.mark.caching
+def test_state_bytes_roundtrip():
+    """Test the compact encoding used by shared backends"""
+    state = TestState(7, 3, 2, [10, 11, 12], [('文法', 2), ('Vocabulary', 1)])
+    state.set_answer(11, 4)
+
+    decoded = TestState.from_bytes(state.to_bytes())
+    assert list(decoded.question_ids) == [10, 11, 12]
+    assert decoded.sections == [('文法', 2), ('Vocabulary', 1)]
+    assert decoded.answer_dict() == {11: 4}
+    assert decoded.section_names() == ['文法', '文法', 'Vocabulary']
+
+
+@pytest.mark.caching
+def test_local_cache_is_bounded():
+    """Test the local LRU evicts the least recently used state"""
+    cache = LocalTestStateCache(max_size=2)
+    for test_id in (1, 2):
+        cache.put(TestState(test_id, 1, 1, [], []))
+    cache.get(1)
+    cache.put(TestState(3, 1, 1, [], []))
+
+    assert len(cache) == 2
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+
+
+@pytest.mark.caching
+def test_shared_cache():
+    """Test states round-trip through a shared store"""
+    cache = SharedTestStateCache(MemoryStore(), ttl=60)
+    state = TestState(5, 1, 1, [1, 2], [('Grammar', 2)])
+    state.set_answer(2, 1)
+    cache.put(state)
+
+    assert cache.get(5).answer_dict() == {2: 1}
+    cache.discard(5)
+    assert cache.get(5) is None